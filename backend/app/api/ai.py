@@ -6,18 +6,24 @@ import json
 import asyncio
 
 from app.mcp.manager import mcp_manager
+from app.services.analysis_cache import analysis_cache, cache_key
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# 诊断结果反映当时的网络状态，只在较短时间内复用
+DIAGNOSIS_CACHE_TTL = 300
+
 class AnalysisRequest(BaseModel):
     test_results: Dict
     context: str = "network_diagnostics"
+    refresh: bool = False  # 忽略缓存重新分析（如修复网络后复查）
 
 class DiagnosisRequest(BaseModel):
     issue_description: str
     user_reported_symptoms: List[str] = []
     network_environment: Optional[Dict] = None
+    refresh: bool = False  # 忽略缓存重新诊断（如修复网络后复查）
 
 class ChatMessage(BaseModel):
     role: str  # "user" or "assistant"
@@ -31,71 +37,97 @@ class ChatRequest(BaseModel):
 async def analyze_network_results(request: AnalysisRequest):
     """AI分析网络测试结果"""
     try:
-        # 使用MCP工具增强分析能力
-        enhanced_analysis = await _enhance_analysis_with_mcp(request.test_results)
-        
-        # 基础分析逻辑
-        analysis = {
-            "issues": [],
-            "recommendations": [],
-            "confidence": 0,
-            "priority": "low"
-        }
-        
-        # 集成MCP分析结果
-        if enhanced_analysis.get("success"):
-            mcp_data = enhanced_analysis["data"]
-            analysis["issues"].extend(mcp_data.get("issues_found", []))
-            analysis["recommendations"].extend(mcp_data.get("recommendations", []))
-            analysis["confidence"] = _calculate_confidence(mcp_data)
-            analysis["priority"] = _determine_priority(mcp_data.get("severity", "low"))
-        
-        # 如果没有MCP数据，使用基础分析
-        if not analysis["issues"]:
-            analysis = _basic_analysis(request.test_results)
-        
-        return {
-            "success": True,
-            "data": analysis,
-            "mcp_enhanced": enhanced_analysis.get("success", False)
-        }
+        # 相同的测试结果在有效期内直接返回之前的分析，refresh时重新分析并更新缓存
+        key = cache_key('ai/analyze', request.dict(exclude={'refresh'}))
+        if request.refresh:
+            analysis_cache.invalidate(key)
+        result, cached = await analysis_cache.get_or_create(
+            key,
+            lambda: _analyze_network_results(request),
+            ttl=DIAGNOSIS_CACHE_TTL
+        )
+        return {**result, "cached": cached}
     except Exception as e:
         logger.error(f"网络结果分析失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _analyze_network_results(request: AnalysisRequest) -> Dict:
+    # 使用MCP工具增强分析能力
+    enhanced_analysis = await _enhance_analysis_with_mcp(request.test_results)
+    
+    # 基础分析逻辑
+    analysis = {
+        "issues": [],
+        "recommendations": [],
+        "confidence": 0,
+        "priority": "low"
+    }
+    
+    # 集成MCP分析结果
+    if enhanced_analysis.get("success"):
+        mcp_data = enhanced_analysis["data"]
+        analysis["issues"].extend(mcp_data.get("issues_found", []))
+        analysis["recommendations"].extend(mcp_data.get("recommendations", []))
+        analysis["confidence"] = _calculate_confidence(mcp_data)
+        analysis["priority"] = _determine_priority(mcp_data.get("severity", "low"))
+    
+    # 如果没有MCP数据，使用基础分析
+    if not analysis["issues"]:
+        analysis = _basic_analysis(request.test_results)
+    
+    return {
+        "success": True,
+        "data": analysis,
+        "mcp_enhanced": enhanced_analysis.get("success", False)
+    }
+
 @router.post("/diagnose")
 async def diagnose_network_issue(request: DiagnosisRequest):
     """智能网络问题诊断"""
     try:
         logger.info(f"开始网络问题诊断: {request.issue_description}")
-        
-        # 确保MCP管理器已初始化
-        if not mcp_manager.client:
-            await mcp_manager.initialize()
-        
-        # 使用MCP管理器进行智能诊断
-        diagnosis_result = await mcp_manager.diagnose_network_issue(
-            request.issue_description
+
+        # 相同的问题描述和环境在有效期内共用一次诊断，并发的相同请求只执行一次；
+        # refresh时重新诊断并更新缓存
+        key = cache_key('ai/diagnose', request.dict(exclude={'refresh'}))
+        if request.refresh:
+            analysis_cache.invalidate(key)
+        result, cached = await analysis_cache.get_or_create(
+            key,
+            lambda: _diagnose_network_issue(request),
+            ttl=DIAGNOSIS_CACHE_TTL,
+            should_cache=lambda r: r.get("success", False)
         )
-        
-        # 处理用户报告的症状
-        if request.user_reported_symptoms:
-            diagnosis_result["user_symptoms"] = request.user_reported_symptoms
-            # 可以根据症状调整诊断结果
-        
-        # 考虑网络环境信息
-        if request.network_environment:
-            diagnosis_result["environment"] = request.network_environment
-        
-        return {
-            "success": diagnosis_result.get("success", False),
-            "data": diagnosis_result
-        }
+        return {**result, "cached": cached}
         
     except Exception as e:
         logger.error(f"网络问题诊断失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _diagnose_network_issue(request: DiagnosisRequest) -> Dict:
+    # 确保MCP管理器已初始化
+    if not mcp_manager.client:
+        await mcp_manager.initialize()
+    
+    # 使用MCP管理器进行智能诊断
+    diagnosis_result = await mcp_manager.diagnose_network_issue(
+        request.issue_description
+    )
+    
+    # 处理用户报告的症状
+    if request.user_reported_symptoms:
+        diagnosis_result["user_symptoms"] = request.user_reported_symptoms
+        # 可以根据症状调整诊断结果
+    
+    # 考虑网络环境信息
+    if request.network_environment:
+        diagnosis_result["environment"] = request.network_environment
+    
+    return {
+        "success": diagnosis_result.get("success", False),
+        "data": diagnosis_result
+    }
+
 @router.post("/chat")
 async def ai_chat_diagnosis(request: ChatRequest):
     """AI聊天式网络诊断"""
@@ -5,14 +5,25 @@ import time
 import subprocess
 import logging
 import asyncio
-from fastapi import APIRouter, BackgroundTasks, Query, HTTPException
+from fastapi import APIRouter, Query, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Optional, List
+from typing import AsyncIterator, Dict, Optional, List, Tuple
 import pyshark
 import json
+from collections import Counter
 from datetime import datetime
 
 from app.services.ai_analysis_service import get_ai_analysis_service
+from app.services.analysis_cache import analysis_cache
+from app.services.llm_client import llm_clients
+from app.services.llm_router import llm_router
+from app.services.packet_table import PacketTable
+from app.services.pcap_field_extractor import extract_pcap_fields
+from app.services.pcap_reader import read_pcap
+from app.services.streaming_capture import StreamingCaptureSession
+from app.services.task_store import SQLiteTaskStore, TaskStore
+from app.services.capture_scheduler import capture_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +31,10 @@ router = APIRouter()
 
 CAPTURE_DIR = '/tmp/packet_captures'
 os.makedirs(CAPTURE_DIR, exist_ok=True)
-tasks: Dict[str, Dict] = {}
+# 任务持久化到SQLite，服务重启后仍可查询，旧任务和pcap文件按TTL/总大小自动清理
+tasks: TaskStore = SQLiteTaskStore(os.path.join(CAPTURE_DIR, 'tasks.db'), capture_dir=CAPTURE_DIR)
+# 正在进行的流式抓包会话，用于在状态接口中返回部分结果
+streaming_sessions: Dict[str, StreamingCaptureSession] = {}
 
 class CaptureRequest(BaseModel):
     issue_type: str
@@ -31,9 +45,10 @@ class CaptureRequest(BaseModel):
     custom_filter: Optional[str] = None
     user_description: Optional[str] = None
     enable_ai_analysis: bool = True
+    streaming: bool = True  # 边抓包边解析（需要tshark），否则抓包结束后再解析
 
 @router.post('')
-def start_capture(req: CaptureRequest, background_tasks: BackgroundTasks):
+def start_capture(req: CaptureRequest):
     """启动网络抓包任务"""
     try:
         # 如果没有指定接口，使用默认接口
@@ -60,18 +75,19 @@ def start_capture(req: CaptureRequest, background_tasks: BackgroundTasks):
             raise HTTPException(status_code=400, detail="抓包时长必须在1-300秒之间")
 
         task_id = str(uuid.uuid4())
-        tasks[task_id] = {
-            'status': 'pending',
+        tasks.create(task_id, {
+            'status': 'queued',
             'result': None,
             'error': None,
             'created_at': datetime.now().isoformat(),
             'request': req.dict()
-        }
+        })
 
-        background_tasks.add_task(run_capture_wrapper, task_id, req)
+        # 交给调度器：同一网卡的抓包排队执行，分析在有界进程池中进行
+        capture_scheduler.submit(task_id, run_capture(task_id, req))
         logger.info(f"创建抓包任务: {task_id}, 问题类型: {req.issue_type}")
 
-        return {'task_id': task_id, 'status': 'pending'}
+        return {'task_id': task_id, 'status': 'queued'}
 
     except Exception as e:
         logger.error(f"启动抓包任务失败: {str(e)}")
@@ -80,17 +96,33 @@ def start_capture(req: CaptureRequest, background_tasks: BackgroundTasks):
 @router.get('/status')
 def get_status(task_id: str = Query(...)):
     """获取抓包任务状态"""
-    task = tasks.get(task_id)
+    task = tasks.get(task_id, include_result=False)
     if not task:
         return {'status': 'not_found', 'error': '任务不存在'}
 
-    return {
+    response = {
         'status': task['status'],
         'error': task.get('error'),
         'created_at': task.get('created_at'),
         'progress': get_task_progress(task['status'])
     }
 
+    # 排队中的任务返回队列位置
+    queue = capture_scheduler.queue_position(task_id)
+    if queue is not None:
+        response['queue_position'] = queue['position']
+        response['queue'] = queue
+
+    # 流式抓包进行中时返回部分结果
+    session = streaming_sessions.get(task_id)
+    if session is not None:
+        try:
+            response['partial_result'] = session.snapshot()
+        except Exception as e:
+            logger.debug(f"获取部分结果失败: {str(e)}")
+
+    return response
+
 @router.get('/result')
 def get_result(task_id: str = Query(...)):
     """获取抓包分析结果"""
@@ -133,27 +165,6 @@ def get_network_interfaces():
             'error': str(e)
         }
 
-def run_capture_wrapper(task_id: str, req: CaptureRequest):
-    """同步包装函数，用于在后台任务中运行异步抓包函数"""
-    try:
-        # 创建新的事件循环
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-        # 运行异步函数
-        loop.run_until_complete(run_capture(task_id, req))
-
-    except Exception as e:
-        logger.error(f"抓包包装函数执行失败: {task_id}, 错误: {str(e)}")
-        tasks[task_id]['status'] = 'error'
-        tasks[task_id]['error'] = str(e)
-    finally:
-        # 清理事件循环
-        try:
-            loop.close()
-        except:
-            pass
-
 async def run_capture(task_id: str, req: CaptureRequest):
     """执行抓包任务"""
     try:
@@ -166,109 +177,53 @@ async def run_capture(task_id: str, req: CaptureRequest):
         # 构建tcpdump命令
         cmd = build_tcpdump_command(req.interface, pcap_file, req.duration, filter_expr)
 
-        # 2. 执行抓包
-        tasks[task_id]['status'] = 'capturing'
-        logger.info(f"执行抓包命令: {cmd}")
-
-        # 在macOS下，我们需要手动终止tcpdump进程
-        import platform
-        system = platform.system().lower()
-
-        if system == 'darwin':
-            # macOS下启动tcpdump进程并在指定时间后终止
-            import signal
-            import time
-
-            process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            # 等待指定的抓包时间
-            time.sleep(req.duration)
-
-            # 终止进程
-            try:
-                process.terminate()
-                stdout, stderr = process.communicate(timeout=5)
-                result = subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
-            except subprocess.TimeoutExpired:
-                process.kill()
-                stdout, stderr = process.communicate()
-                result = subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
-        else:
-            # Linux下使用原来的方式
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=req.duration + 30)
-
-        if result.returncode != 0:
-            raise Exception(f"抓包命令执行失败: {result.stderr}")
-
-        # 检查pcap文件是否生成
-        if not os.path.exists(pcap_file) or os.path.getsize(pcap_file) == 0:
-            raise Exception("抓包文件未生成或为空")
+        # 2. 执行抓包，同一网卡的抓包名额用完时排队等待
+        async with capture_scheduler.capture_slot(task_id, req.interface):
+            tasks.update(task_id, status='capturing')
+            # 流式模式：边抓包边解析，抓包结束时字段数据已就绪，无需再读取pcap文件
+            tshark_cmd = await asyncio.to_thread(get_tshark_command) if req.streaming else None
+            if tshark_cmd:
+                table = await run_streaming_capture(task_id, req, pcap_file, filter_expr, tshark_cmd)
+            else:
+                table = None
+                await asyncio.to_thread(run_file_capture, req, cmd, pcap_file)
 
-        # 3. 预处理数据包
-        tasks[task_id]['status'] = 'processing'
-        tasks[task_id]['pcap_file'] = pcap_file  # 保存pcap文件路径
+        # 3. 生成分析摘要（在进程池中执行，限制并发分析数）
+        tasks.update(task_id, status='processing', pcap_file=pcap_file)
         logger.info(f"开始预处理数据包: {pcap_file}")
-
-        summary = preprocess_pcap(pcap_file, req.issue_type)
+        summary = await capture_scheduler.run_analysis(
+            task_id, preprocess_pcap, pcap_file, req.issue_type, table)
 
         # 4. AI分析（如果启用）
         ai_analysis = None
         if req.enable_ai_analysis:
             try:
-                tasks[task_id]['status'] = 'ai_analyzing'
+                tasks.update(task_id, status='ai_analyzing')
                 logger.info(f"开始AI分析: {task_id}")
 
-                # 在新的线程中执行AI分析，避免事件循环冲突
-                import concurrent.futures
-                import threading
-
-                def run_ai_analysis():
-                    try:
-                        logger.info("AI分析线程开始执行")
-                        ai_service = get_ai_analysis_service()
-
-                        # 使用同步方式调用AI分析，传递task_id用于调试
-                        result = ai_service.analyze_network_issue_sync(
+                # 直接在调度器事件循环中等待异步AI调用，超时会取消请求本身
+                try:
+                    ai_service = get_ai_analysis_service()
+                    ai_analysis = await asyncio.wait_for(
+                        ai_service.analyze_network_issue(
                             req.issue_type,
                             summary,
                             req.user_description,
-                            task_id,
                             filtered_domains=[],  # 抓包过程中的AI分析不使用筛选
-                            latency_filter='all'  # 抓包过程中的AI分析不使用筛选
-                        )
-                        logger.info("AI分析线程执行完成")
-                        return result
-
-                    except Exception as e:
-                        logger.error(f"AI分析线程异常: {str(e)}", exc_info=True)
-                        return {
-                            'success': False,
-                            'error': f"AI分析线程异常: {str(e)}",
-                            'timestamp': datetime.now().isoformat()
-                        }
-
-                # 在线程池中执行AI分析
-                try:
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-                        logger.info("提交AI分析任务到线程池")
-                        future = executor.submit(run_ai_analysis)
-                        ai_analysis = future.result(timeout=30)  # 30秒超时
-                        logger.info(f"AI分析完成: {task_id}")
-
-                except concurrent.futures.TimeoutError:
+                            latency_filter='all',  # 抓包过程中的AI分析不使用筛选
+                            task_id=task_id
+                        ),
+                        timeout=30  # 30秒超时
+                    )
+                    logger.info(f"AI分析完成: {task_id}")
+
+                except asyncio.TimeoutError:
                     logger.error(f"AI分析超时: {task_id}")
                     ai_analysis = {
                         'success': False,
                         'error': 'AI分析超时（30秒）',
                         'timestamp': datetime.now().isoformat()
                     }
-                except Exception as e:
-                    logger.error(f"线程池执行失败: {task_id}, 错误: {str(e)}", exc_info=True)
-                    ai_analysis = {
-                        'success': False,
-                        'error': f"线程池执行失败: {str(e)}",
-                        'timestamp': datetime.now().isoformat()
-                    }
 
             except Exception as e:
                 logger.error(f"AI分析外层异常: {task_id}, 错误: {str(e)}", exc_info=True)
@@ -292,25 +247,21 @@ async def run_capture(task_id: str, req: CaptureRequest):
                 }
             }
 
-            tasks[task_id]['result'] = result
-            tasks[task_id]['status'] = 'done'
+            tasks.update(task_id, result=result, status='done')
 
             logger.info(f"抓包任务完成: {task_id}")
 
         except Exception as e:
             logger.error(f"设置任务完成状态失败: {task_id}, 错误: {str(e)}", exc_info=True)
             # 即使设置结果失败，也要确保状态被更新
-            tasks[task_id]['status'] = 'error'
-            tasks[task_id]['error'] = f"设置任务结果失败: {str(e)}"
+            tasks.update(task_id, status='error', error=f"设置任务结果失败: {str(e)}")
 
     except subprocess.TimeoutExpired:
-        tasks[task_id]['status'] = 'error'
-        tasks[task_id]['error'] = '抓包超时'
+        tasks.update(task_id, status='error', error='抓包超时')
         logger.error(f"抓包任务超时: {task_id}")
 
     except Exception as e:
-        tasks[task_id]['status'] = 'error'
-        tasks[task_id]['error'] = str(e)
+        tasks.update(task_id, status='error', error=str(e))
         logger.error(f"抓包任务失败: {task_id}, 错误: {str(e)}")
 
     finally:
@@ -319,6 +270,78 @@ async def run_capture(task_id: str, req: CaptureRequest):
         #     os.remove(pcap_file)
         pass
 
+def run_file_capture(req: CaptureRequest, cmd: str, pcap_file: str):
+    """抓包写入文件，结束后再解析pcap文件（非流式模式，阻塞执行）"""
+    logger.info(f"执行抓包命令: {cmd}")
+
+    # 在macOS下，我们需要手动终止tcpdump进程
+    import platform
+    system = platform.system().lower()
+
+    if system == 'darwin':
+        # macOS下启动tcpdump进程并在指定时间后终止
+        import signal
+        import time
+
+        process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        # 等待指定的抓包时间
+        time.sleep(req.duration)
+
+        # 终止进程
+        try:
+            process.terminate()
+            stdout, stderr = process.communicate(timeout=5)
+            result = subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            stdout, stderr = process.communicate()
+            result = subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+    else:
+        # Linux下使用原来的方式
+        result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=req.duration + 30)
+
+    if result.returncode != 0:
+        raise Exception(f"抓包命令执行失败: {result.stderr}")
+
+    # 检查pcap文件是否生成
+    if not os.path.exists(pcap_file) or os.path.getsize(pcap_file) == 0:
+        raise Exception("抓包文件未生成或为空")
+
+async def run_streaming_capture(task_id: str, req: CaptureRequest, pcap_file: str,
+                                filter_expr: str, tshark_cmd: str) -> Optional[PacketTable]:
+    """流式抓包：tcpdump输出同时落盘并实时解析，返回解析完成的列式表
+
+    tshark解析不完整时返回None，由预处理从完整的pcap文件重新解析（含无效字段重试）
+    """
+    cmd = build_streaming_tcpdump_command(req.interface, filter_expr)
+    logger.info(f"执行流式抓包命令: {cmd}")
+
+    session = StreamingCaptureSession(cmd, tshark_cmd, pcap_file)
+    session.start()
+    streaming_sessions[task_id] = session
+    try:
+        # 等待抓包时长，tcpdump提前退出（如权限不足）时立即结束
+        deadline = time.time() + req.duration
+        while time.time() < deadline and session.is_capture_running():
+            await asyncio.sleep(min(0.5, max(0, deadline - time.time())))
+
+        table = await asyncio.to_thread(session.stop)
+    finally:
+        streaming_sessions.pop(task_id, None)
+
+    if session.capture_error:
+        raise Exception(f"抓包命令执行失败: {session.capture_error}")
+
+    # 检查pcap文件是否生成
+    if not os.path.exists(pcap_file) or os.path.getsize(pcap_file) == 0:
+        raise Exception("抓包文件未生成或为空")
+
+    if session.degraded:
+        logger.warning(f"流式解析不完整，改为从pcap文件解析: {session.decoder_error}")
+        return None
+    return table
+
 def get_filter_by_issue(issue_type: str, target_ip: Optional[str] = None,
                        target_port: Optional[int] = None, custom_filter: Optional[str] = None) -> str:
     """根据问题类型生成抓包过滤表达式"""
@@ -457,9 +480,27 @@ def build_tcpdump_command(interface: str, output_file: str, duration: int, filte
 
         return ' '.join(cmd_parts)
 
+def build_streaming_tcpdump_command(interface: str, filter_expr: str) -> str:
+    """构建流式抓包的tcpdump命令：pcap写到标准输出，按包刷新"""
+    cmd_parts = [
+        'sudo', 'tcpdump',
+        '-i', interface,
+        '-U',  # 每个包写出后立即刷新，保证实时解析
+        '-w', '-',
+        '-s', '65535',  # 捕获完整数据包
+        '-q'  # 安静模式，减少输出
+    ]
+
+    if filter_expr:
+        cmd_parts.append(f"'{filter_expr}'")
+
+    # 抓包时长由调用方控制，到时后终止进程
+    return ' '.join(cmd_parts)
+
 def get_task_progress(status: str) -> int:
     """根据任务状态返回进度百分比"""
     progress_map = {
+        'queued': 0,
         'pending': 0,
         'capturing': 25,
         'processing': 50,
@@ -469,8 +510,11 @@ def get_task_progress(status: str) -> int:
     }
     return progress_map.get(status, 0)
 
-def preprocess_pcap(pcap_file: str, issue_type: str):
-    """预处理pcap文件，生成结构化摘要"""
+def preprocess_pcap(pcap_file: str, issue_type: str, table: Optional[PacketTable] = None):
+    """预处理pcap文件，生成结构化摘要
+
+    table为流式抓包时已解析好的列式表，传入时不再读取pcap文件
+    """
     try:
         # 检查文件是否存在
         if not os.path.exists(pcap_file):
@@ -492,13 +536,13 @@ def preprocess_pcap(pcap_file: str, issue_type: str):
         logger.info("使用增强分析方法，生成深度网络洞察")
 
         # 使用增强的pcap分析
-        enhanced_analysis = get_enhanced_pcap_analysis(pcap_file, issue_type)
+        enhanced_analysis = get_enhanced_pcap_analysis(pcap_file, issue_type, table=table)
 
         return {
             'enhanced_analysis': enhanced_analysis,
             'analysis_time': datetime.now().isoformat(),
             'file_size': file_size,
-            'parsing_method': 'enhanced_tshark_analysis',
+            'parsing_method': enhanced_analysis.get('parsing_method', 'basic_file_analysis'),
             # 保持向后兼容
             'statistics': enhanced_analysis.get('basic_stats', {}),
             'sample_packets': []
@@ -511,7 +555,58 @@ def preprocess_pcap(pcap_file: str, issue_type: str):
             'analysis_time': datetime.now().isoformat()
         }
 
-def get_enhanced_pcap_analysis(pcap_file: str, issue_type: str) -> Dict:
+# tshark探测结果缓存：找到的路径一直有效，未找到时隔一段时间再重新探测
+TSHARK_PROBE_RETRY_SECONDS = 300
+_tshark_probe: Dict = {'command': None, 'checked_at': None}
+
+def get_tshark_command(refresh: bool = False) -> Optional[str]:
+    """查找可用的tshark命令（带缓存，避免每次分析都逐个路径探测）"""
+    checked_at = _tshark_probe['checked_at']
+    if not refresh and checked_at is not None:
+        if _tshark_probe['command'] or time.time() - checked_at < TSHARK_PROBE_RETRY_SECONDS:
+            return _tshark_probe['command']
+
+    command = probe_tshark_command()
+    _tshark_probe.update(command=command, checked_at=time.time())
+    return command
+
+def probe_tshark_command() -> Optional[str]:
+    """逐个路径探测tshark，不存在的绝对路径直接跳过"""
+    tshark_paths = [
+        '/opt/homebrew/bin/tshark',
+        '/usr/local/bin/tshark',
+        '/usr/bin/tshark',
+        'tshark'
+    ]
+
+    for path in tshark_paths:
+        if os.path.isabs(path) and not os.path.exists(path):
+            continue
+        try:
+            result = subprocess.run([path, '-v'], capture_output=True, text=True, timeout=5)
+            if result.returncode == 0:
+                return path
+        except:
+            continue
+    return None
+
+def load_packet_table(pcap_file: str) -> Tuple[PacketTable, str]:
+    """把pcap解析为列式表，返回 (表, 解析方式)
+
+    优先使用tshark（TCP分析字段更完整），tshark不可用或解析失败时
+    使用原生pcap解析器，两者产出相同的列，后续分析完全一致
+    """
+    tshark_cmd = get_tshark_command()
+    if tshark_cmd:
+        try:
+            return extract_pcap_fields(tshark_cmd, pcap_file), 'enhanced_tshark_analysis'
+        except Exception as e:
+            logger.warning(f"tshark解析失败，改用原生解析器: {str(e)}")
+    else:
+        logger.info("tshark不可用，使用原生pcap解析器")
+    return read_pcap(pcap_file), 'native_pcap_analysis'
+
+def get_enhanced_pcap_analysis(pcap_file: str, issue_type: str, table: Optional[PacketTable] = None) -> Dict:
     """增强的pcap分析，生成对AI诊断有价值的数据"""
     analysis = {
         'basic_stats': {},
@@ -523,48 +618,29 @@ def get_enhanced_pcap_analysis(pcap_file: str, issue_type: str) -> Dict:
     }
 
     try:
-        import platform
-        system = platform.system().lower()
-
-        # 检查tshark是否可用
-        tshark_paths = [
-            '/opt/homebrew/bin/tshark',
-            '/usr/local/bin/tshark',
-            '/usr/bin/tshark',
-            'tshark'
-        ]
-
-        tshark_cmd = None
-        for path in tshark_paths:
-            try:
-                result = subprocess.run([path, '-v'], capture_output=True, text=True, timeout=5)
-                if result.returncode == 0:
-                    tshark_cmd = path
-                    break
-            except:
-                continue
-
-        if not tshark_cmd:
-            logger.warning("tshark不可用，使用基础分析")
-            return get_basic_file_analysis(pcap_file, issue_type)
+        if table is None:
+            # 0. 单次解析所有分析器需要的字段，后续分析共享同一份数据
+            table, analysis['parsing_method'] = load_packet_table(pcap_file)
+        else:
+            analysis['parsing_method'] = 'streaming_tshark_analysis'
 
         # 1. 基础统计信息
-        analysis['basic_stats'] = get_basic_packet_stats(tshark_cmd, pcap_file)
+        analysis['basic_stats'] = get_basic_packet_stats(table)
 
         # 2. 网络行为分析
-        analysis['network_behavior'] = analyze_network_behavior(tshark_cmd, pcap_file)
+        analysis['network_behavior'] = analyze_network_behavior(table)
 
         # 3. 性能指标分析
-        analysis['performance_indicators'] = analyze_performance_metrics(tshark_cmd, pcap_file)
+        analysis['performance_indicators'] = analyze_performance_metrics(table)
 
         # 4. 异常检测
-        analysis['anomaly_detection'] = detect_network_anomalies(tshark_cmd, pcap_file)
+        analysis['anomaly_detection'] = detect_network_anomalies(table)
 
         # 5. HTTP/HTTPS流量分析
-        analysis['http_analysis'] = analyze_http_traffic(tshark_cmd, pcap_file)
+        analysis['http_analysis'] = analyze_http_traffic(table)
 
         # 6. 问题特定洞察
-        analysis['issue_specific_insights'] = get_issue_specific_insights(tshark_cmd, pcap_file, issue_type)
+        analysis['issue_specific_insights'] = get_issue_specific_insights(table, issue_type)
 
         # 7. 生成诊断线索
         analysis['diagnostic_clues'] = generate_diagnostic_clues(analysis, issue_type)
@@ -579,13 +655,13 @@ def get_enhanced_pcap_analysis(pcap_file: str, issue_type: str) -> Dict:
 
     return analysis
 
-def analyze_interconnection_issues(tshark_cmd: str, pcap_file: str) -> Dict:
+def analyze_interconnection_issues(table: PacketTable) -> Dict:
     """分析互联互通问题"""
     try:
         from app.services.interconnection_analyzer import InterconnectionAnalyzer
 
         analyzer = InterconnectionAnalyzer()
-        result = analyzer.analyze_interconnection(tshark_cmd, pcap_file)
+        result = analyzer.analyze_interconnection(table)
 
         return {
             'targeted_analysis': result.get('report', {}),
@@ -609,13 +685,13 @@ def analyze_interconnection_issues(tshark_cmd: str, pcap_file: str) -> Dict:
             'diagnostic_hints': ['互联互通分析失败']
         }
 
-def analyze_game_lag_issues(tshark_cmd: str, pcap_file: str) -> Dict:
+def analyze_game_lag_issues(table: PacketTable) -> Dict:
     """分析游戏卡顿问题"""
     try:
         from app.services.game_traffic_analyzer import GameTrafficAnalyzer
 
         analyzer = GameTrafficAnalyzer()
-        result = analyzer.analyze_game_traffic(tshark_cmd, pcap_file)
+        result = analyzer.analyze_game_traffic(table)
 
         return {
             'targeted_analysis': result.get('diagnosis', {}),
@@ -643,7 +719,7 @@ def analyze_game_lag_issues(tshark_cmd: str, pcap_file: str) -> Dict:
             'diagnostic_hints': ['游戏卡顿分析失败']
         }
 
-def get_basic_packet_stats(tshark_cmd: str, pcap_file: str) -> Dict:
+def get_basic_packet_stats(table: PacketTable) -> Dict:
     """获取基础包统计"""
     stats = {
         'total_packets': 0,
@@ -654,66 +730,33 @@ def get_basic_packet_stats(tshark_cmd: str, pcap_file: str) -> Dict:
     }
 
     try:
-        # 获取包的基本信息：时间、大小、协议
-        result = subprocess.run([
-            tshark_cmd, '-r', pcap_file, '-T', 'fields',
-            '-e', 'frame.time_epoch',
-            '-e', 'frame.len',
-            '-e', 'frame.protocols'
-        ], capture_output=True, text=True, timeout=15)
-
-        if result.returncode == 0:
-            lines = result.stdout.strip().split('\n')
-            packet_times = []
-            packet_sizes = []
-            protocols = {}
-
-            for line in lines:
-                if line.strip():
-                    parts = line.strip().split('\t')
-                    if len(parts) >= 3:
-                        # 时间
-                        try:
-                            timestamp = float(parts[0])
-                            packet_times.append(timestamp)
-                        except:
-                            pass
-
-                        # 大小
-                        try:
-                            size = int(parts[1])
-                            packet_sizes.append(size)
-                        except:
-                            pass
-
-                        # 协议
-                        protocol_stack = parts[2].split(':')
-                        if protocol_stack:
-                            top_protocol = protocol_stack[-1].upper()
-                            protocols[top_protocol] = protocols.get(top_protocol, 0) + 1
-
-            stats['total_packets'] = len(packet_times)
-            stats['protocols'] = protocols
-
-            if packet_times:
-                stats['time_range']['start'] = min(packet_times)
-                stats['time_range']['end'] = max(packet_times)
-                stats['time_range']['duration'] = max(packet_times) - min(packet_times)
-
-            if packet_sizes:
-                stats['packet_sizes']['min'] = min(packet_sizes)
-                stats['packet_sizes']['max'] = max(packet_sizes)
-                stats['packet_sizes']['avg'] = sum(packet_sizes) / len(packet_sizes)
-                stats['data_volume']['total_bytes'] = sum(packet_sizes)
-                if stats['time_range']['duration'] > 0:
-                    stats['data_volume']['avg_rate'] = sum(packet_sizes) / stats['time_range']['duration']
+        # 基于列数据计算：时间、大小、协议
+        packet_times = table.valid(table.time_epoch)
+        packet_sizes = table.length
+
+        stats['total_packets'] = len(packet_times)
+        stats['protocols'] = table.top_protocol_counts()
+
+        if packet_times:
+            stats['time_range']['start'] = min(packet_times)
+            stats['time_range']['end'] = max(packet_times)
+            stats['time_range']['duration'] = max(packet_times) - min(packet_times)
+
+        if packet_sizes:
+            total_bytes = sum(packet_sizes)
+            stats['packet_sizes']['min'] = min(packet_sizes)
+            stats['packet_sizes']['max'] = max(packet_sizes)
+            stats['packet_sizes']['avg'] = total_bytes / len(packet_sizes)
+            stats['data_volume']['total_bytes'] = total_bytes
+            if stats['time_range']['duration'] > 0:
+                stats['data_volume']['avg_rate'] = total_bytes / stats['time_range']['duration']
 
     except Exception as e:
         logger.debug(f"基础统计失败: {str(e)}")
 
     return stats
 
-def analyze_network_behavior(tshark_cmd: str, pcap_file: str) -> Dict:
+def analyze_network_behavior(table: PacketTable) -> Dict:
     """分析网络行为模式 - 简化版，只保留核心连接信息"""
     behavior = {
         'connection_summary': {}
@@ -721,30 +764,17 @@ def analyze_network_behavior(tshark_cmd: str, pcap_file: str) -> Dict:
 
     try:
         # 只统计基础连接信息，不收集技术细节
-        result = subprocess.run([
-            tshark_cmd, '-r', pcap_file, '-T', 'fields',
-            '-e', 'ip.dst', '-e', 'tcp.dstport'
-        ], capture_output=True, text=True, timeout=10)
+        unique_destinations = set(zip(table.dst_ip, table.tcp_dstport))
+        unique_destinations = {d for d in unique_destinations if d[0] and d[1]}
 
-        if result.returncode == 0:
-            unique_destinations = set()
-
-            for line in result.stdout.strip().split('\n'):
-                if line.strip():
-                    parts = line.strip().split('\t')
-                    if len(parts) >= 2:
-                        dst_ip, dst_port = parts[:2]
-                        if dst_ip and dst_port:
-                            unique_destinations.add(f"{dst_ip}:{dst_port}")
-
-            behavior['connection_summary']['unique_destinations'] = len(unique_destinations)
+        behavior['connection_summary']['unique_destinations'] = len(unique_destinations)
 
     except Exception as e:
         logger.debug(f"网络行为分析失败: {str(e)}")
 
     return behavior
 
-def analyze_http_traffic(tshark_cmd: str, pcap_file: str) -> Dict:
+def analyze_http_traffic(table: PacketTable) -> Dict:
     """分析HTTP/HTTPS流量 - 极简版，只保留核心网站信息"""
     http_analysis = {
         'websites_accessed': {},
@@ -753,45 +783,25 @@ def analyze_http_traffic(tshark_cmd: str, pcap_file: str) -> Dict:
 
     try:
         # 只进行基础的HTTP统计，不收集详细信息
-        result = subprocess.run([
-            tshark_cmd, '-r', pcap_file, '-T', 'fields',
-            '-e', 'http.host'
-        ], capture_output=True, text=True, timeout=10)
-
-        if result.returncode == 0:
-            http_hosts = set()
-            for line in result.stdout.strip().split('\n'):
-                if line.strip():
-                    host = line.strip()
-                    if host:
-                        http_hosts.add(host)
+        http_hosts = set(table.http_host)
+        http_hosts.discard(0)
 
-            http_analysis['basic_summary'] = {
-                'http_sites_count': len(http_hosts),
-                'has_http_traffic': len(http_hosts) > 0
-            }
+        http_analysis['basic_summary'] = {
+            'http_sites_count': len(http_hosts),
+            'has_http_traffic': len(http_hosts) > 0
+        }
 
         # 分析HTTPS网站访问 - 只保留核心信息
-        https_result = subprocess.run([
-            tshark_cmd, '-r', pcap_file, '-T', 'fields',
-            '-e', 'tls.handshake.extensions_server_name'
-        ], capture_output=True, text=True, timeout=10)
-
-        if https_result.returncode == 0:
-            websites = {}
-
-            for line in https_result.stdout.strip().split('\n'):
-                if line.strip():
-                    server_name = line.strip()
-                    if server_name:
-                        websites[server_name] = websites.get(server_name, 0) + 1
-
-            # 只保留访问次数最多的前10个网站
-            http_analysis['websites_accessed'] = dict(sorted(websites.items(), key=lambda x: x[1], reverse=True)[:10])
-            http_analysis['connection_summary'] = {
-                'total_websites': len(websites),
-                'has_https_traffic': len(websites) > 0
-            }
+        sni_counts = Counter(table.tls_sni)
+        sni_counts.pop(0, None)
+        websites = {table.strings[code]: count for code, count in sni_counts.items()}
+
+        # 只保留访问次数最多的前10个网站
+        http_analysis['websites_accessed'] = dict(sorted(websites.items(), key=lambda x: x[1], reverse=True)[:10])
+        http_analysis['connection_summary'] = {
+            'total_websites': len(websites),
+            'has_https_traffic': len(websites) > 0
+        }
 
     except Exception as e:
         logger.debug(f"HTTP流量分析失败: {str(e)}")
@@ -799,7 +809,7 @@ def analyze_http_traffic(tshark_cmd: str, pcap_file: str) -> Dict:
 
     return http_analysis
 
-def analyze_performance_metrics(tshark_cmd: str, pcap_file: str) -> Dict:
+def analyze_performance_metrics(table: PacketTable) -> Dict:
     """分析性能指标"""
     metrics = {
         'latency_indicators': {},
@@ -810,56 +820,25 @@ def analyze_performance_metrics(tshark_cmd: str, pcap_file: str) -> Dict:
 
     try:
         # 分析TCP RTT和重传
-        result = subprocess.run([
-            tshark_cmd, '-r', pcap_file, '-T', 'fields',
-            '-e', 'tcp.analysis.ack_rtt',
-            '-e', 'tcp.analysis.retransmission',
-            '-e', 'tcp.analysis.duplicate_ack',
-            '-e', 'tcp.analysis.fast_retransmission'
-        ], capture_output=True, text=True, timeout=15)
+        rtt_values = [rtt * 1000 for rtt in table.valid(table.ack_rtt)]  # 转换为毫秒
 
-        if result.returncode == 0:
-            rtt_values = []
-            retransmissions = 0
-            duplicate_acks = 0
-            fast_retrans = 0
+        if rtt_values:
+            metrics['latency_indicators']['avg_rtt_ms'] = sum(rtt_values) / len(rtt_values)
+            metrics['latency_indicators']['min_rtt_ms'] = min(rtt_values)
+            metrics['latency_indicators']['max_rtt_ms'] = max(rtt_values)
+            metrics['latency_indicators']['rtt_samples'] = len(rtt_values)
 
-            for line in result.stdout.strip().split('\n'):
-                if line.strip():
-                    parts = line.strip().split('\t')
-
-                    # RTT分析
-                    if len(parts) > 0 and parts[0]:
-                        try:
-                            rtt = float(parts[0])
-                            rtt_values.append(rtt * 1000)  # 转换为毫秒
-                        except:
-                            pass
-
-                    # 错误统计
-                    if len(parts) > 1 and parts[1]:
-                        retransmissions += 1
-                    if len(parts) > 2 and parts[2]:
-                        duplicate_acks += 1
-                    if len(parts) > 3 and parts[3]:
-                        fast_retrans += 1
-
-            if rtt_values:
-                metrics['latency_indicators']['avg_rtt_ms'] = sum(rtt_values) / len(rtt_values)
-                metrics['latency_indicators']['min_rtt_ms'] = min(rtt_values)
-                metrics['latency_indicators']['max_rtt_ms'] = max(rtt_values)
-                metrics['latency_indicators']['rtt_samples'] = len(rtt_values)
-
-            metrics['error_rates']['retransmissions'] = retransmissions
-            metrics['error_rates']['duplicate_acks'] = duplicate_acks
-            metrics['error_rates']['fast_retransmissions'] = fast_retrans
+        # 错误统计
+        metrics['error_rates']['retransmissions'] = sum(table.retransmission)
+        metrics['error_rates']['duplicate_acks'] = sum(table.duplicate_ack)
+        metrics['error_rates']['fast_retransmissions'] = sum(table.fast_retransmission)
 
     except Exception as e:
         logger.debug(f"性能指标分析失败: {str(e)}")
 
     return metrics
 
-def detect_network_anomalies(tshark_cmd: str, pcap_file: str) -> Dict:
+def detect_network_anomalies(table: PacketTable) -> Dict:
     """检测网络异常"""
     anomalies = {
         'suspicious_patterns': [],
@@ -869,44 +848,21 @@ def detect_network_anomalies(tshark_cmd: str, pcap_file: str) -> Dict:
     }
 
     try:
-        # 检测DNS异常
-        result = subprocess.run([
-            tshark_cmd, '-r', pcap_file, '-T', 'fields',
-            '-e', 'dns.qry.name', '-e', 'dns.resp.code', '-e', 'dns.time'
-        ], capture_output=True, text=True, timeout=10)
-
-        if result.returncode == 0:
-            dns_failures = 0
-            slow_dns_queries = 0
+        # 检测DNS异常：响应码非0视为失败（-1为缺失），查询时间超过1秒视为慢查询
+        dns_failures = sum(1 for code in table.dns_resp_code if code > 0)
+        slow_dns_queries = sum(1 for dns_time in table.dns_time if dns_time > 1.0)
 
-            for line in result.stdout.strip().split('\n'):
-                if line.strip():
-                    parts = line.strip().split('\t')
-                    if len(parts) >= 2:
-                        # DNS响应码检查
-                        if parts[1] and parts[1] != '0':
-                            dns_failures += 1
-
-                        # DNS查询时间检查
-                        if len(parts) > 2 and parts[2]:
-                            try:
-                                dns_time = float(parts[2])
-                                if dns_time > 1.0:  # 超过1秒认为是慢查询
-                                    slow_dns_queries += 1
-                            except:
-                                pass
-
-            if dns_failures > 0:
-                anomalies['error_indicators'].append(f"DNS查询失败: {dns_failures} 次")
-            if slow_dns_queries > 0:
-                anomalies['performance_issues'].append(f"DNS慢查询: {slow_dns_queries} 次")
+        if dns_failures > 0:
+            anomalies['error_indicators'].append(f"DNS查询失败: {dns_failures} 次")
+        if slow_dns_queries > 0:
+            anomalies['performance_issues'].append(f"DNS慢查询: {slow_dns_queries} 次")
 
     except Exception as e:
         logger.debug(f"异常检测失败: {str(e)}")
 
     return anomalies
 
-def get_issue_specific_insights(tshark_cmd: str, pcap_file: str, issue_type: str) -> Dict:
+def get_issue_specific_insights(table: PacketTable, issue_type: str) -> Dict:
     """获取问题特定的洞察"""
     insights = {
         'targeted_analysis': {},
@@ -916,11 +872,11 @@ def get_issue_specific_insights(tshark_cmd: str, pcap_file: str, issue_type: str
 
     try:
         if issue_type == 'website_access':
-            insights.update(analyze_http_specific_issues(tshark_cmd, pcap_file))
+            insights.update(analyze_http_specific_issues(table))
         elif issue_type == 'interconnection':
-            insights.update(analyze_interconnection_issues(tshark_cmd, pcap_file))
+            insights.update(analyze_interconnection_issues(table))
         elif issue_type == 'game_lag':
-            insights.update(analyze_game_lag_issues(tshark_cmd, pcap_file))
+            insights.update(analyze_game_lag_issues(table))
         else:
             insights['targeted_analysis'] = {'note': f'通用分析，问题类型: {issue_type}'}
 
@@ -1040,7 +996,7 @@ def analyze_slow_connection_issues(tshark_cmd: str, pcap_file: str) -> Dict:
 
     return slow_analysis
 
-def analyze_http_specific_issues(tshark_cmd: str, pcap_file: str) -> Dict:
+def analyze_http_specific_issues(table: PacketTable) -> Dict:
     """专门分析HTTP/HTTPS网站访问问题 - 聚焦域名、IP、响应时延关联"""
     http_issues = {
         'website_performance': {},  # 核心：域名-IP-时延关联
@@ -1053,33 +1009,10 @@ def analyze_http_specific_issues(tshark_cmd: str, pcap_file: str) -> Dict:
         website_performance = {}
 
         # 1. 分析明文HTTP流量
-        http_result = subprocess.run([
-            tshark_cmd, '-r', pcap_file, '-T', 'fields',
-            '-e', 'http.host',                    # 域名
-            '-e', 'ip.dst',                       # 目标IP
-            '-e', 'http.response.code',           # 响应状态码
-            '-e', 'tcp.analysis.ack_rtt',         # TCP RTT
-            '-e', 'tcp.analysis.initial_rtt',     # 初始RTT
-            '-e', 'frame.time_relative',          # 相对时间
-            '-e', 'http.request.method',          # HTTP方法
-        ], capture_output=True, text=True, timeout=10)
-
-        if http_result.returncode == 0:
-            website_performance.update(process_http_data(http_result.stdout, 'HTTP'))
+        website_performance.update(process_http_data(table, 'HTTP'))
 
         # 2. 分析HTTPS流量（通过TLS SNI和TCP连接）
-        https_result = subprocess.run([
-            tshark_cmd, '-r', pcap_file, '-T', 'fields',
-            '-e', 'tls.handshake.extensions_server_name',  # HTTPS域名（SNI）
-            '-e', 'ip.dst',                                # 目标IP
-            '-e', 'tcp.analysis.ack_rtt',                  # TCP RTT
-            '-e', 'tcp.analysis.initial_rtt',              # 初始RTT
-            '-e', 'frame.time_relative',                   # 相对时间
-            '-e', 'tcp.dstport',                           # 目标端口
-        ], capture_output=True, text=True, timeout=10)
-
-        if https_result.returncode == 0:
-            website_performance.update(process_https_data(https_result.stdout, 'HTTPS'))
+        website_performance.update(process_https_data(table, 'HTTPS'))
 
         # 整理最终结果
         performance_data = {}
@@ -1157,121 +1090,81 @@ def analyze_http_specific_issues(tshark_cmd: str, pcap_file: str) -> Dict:
 
     return http_issues
 
-def process_http_data(stdout_data: str, protocol: str) -> Dict:
-    """处理HTTP数据"""
-    website_data = {}
-
-    for line in stdout_data.strip().split('\n'):
-        if line.strip():
-            parts = line.strip().split('\t')
-            if len(parts) >= 7:
-                host = parts[0] if parts[0] else ''
-                dst_ip = parts[1] if parts[1] else ''
-                resp_code = parts[2] if parts[2] else ''
-                tcp_ack_rtt = parts[3] if parts[3] else ''
-                tcp_initial_rtt = parts[4] if parts[4] else ''
-                frame_time = parts[5] if parts[5] else ''
-                http_method = parts[6] if parts[6] else ''
-
-                if host:  # 只处理有域名的HTTP请求
-                    if host not in website_data:
-                        website_data[host] = {
-                            'ips': set(),
-                            'tcp_rtts': [],
-                            'total_requests': 0,
-                            'error_count': 0,
-                            'error_codes': {},
-                            'protocol': protocol,
-                            'has_traffic': False
-                        }
-
-                    site_data = website_data[host]
-
-                    if dst_ip:
-                        site_data['ips'].add(dst_ip)
-
-                    if http_method or resp_code:
-                        site_data['total_requests'] += 1
-                        site_data['has_traffic'] = True
-
-                    # 记录TCP RTT
-                    rtt_recorded = False
-                    if tcp_ack_rtt:
-                        try:
-                            rtt_ms = float(tcp_ack_rtt) * 1000
-                            if rtt_ms > 0:
-                                site_data['tcp_rtts'].append(rtt_ms)
-                                rtt_recorded = True
-                        except:
-                            pass
+def _new_site_data(protocol: str) -> Dict:
+    """网站性能统计的初始结构"""
+    return {
+        'ips': set(),
+        'tcp_rtts': [],
+        'total_requests': 0,
+        'error_count': 0,
+        'error_codes': {},
+        'protocol': protocol,
+        'has_traffic': False
+    }
 
-                    if not rtt_recorded and tcp_initial_rtt:
-                        try:
-                            rtt_ms = float(tcp_initial_rtt) * 1000
-                            if rtt_ms > 0:
-                                site_data['tcp_rtts'].append(rtt_ms)
-                        except:
-                            pass
+def _record_tcp_rtt(site_data: Dict, ack_rtt: float, initial_rtt: float):
+    """记录TCP RTT，优先使用ack_rtt，其次initial_rtt（NaN表示缺失）"""
+    if ack_rtt > 0:
+        site_data['tcp_rtts'].append(ack_rtt * 1000)
+    elif initial_rtt > 0:
+        site_data['tcp_rtts'].append(initial_rtt * 1000)
 
-                    # 记录HTTP错误
-                    if resp_code and (resp_code.startswith('4') or resp_code.startswith('5')):
-                        site_data['error_count'] += 1
-                        site_data['error_codes'][resp_code] = site_data['error_codes'].get(resp_code, 0) + 1
+def process_http_data(table: PacketTable, protocol: str) -> Dict:
+    """处理HTTP数据"""
+    website_data = {}
+    strings = table.strings
+    addresses = table.addresses
+
+    # 只处理有域名的HTTP请求
+    for i in table.indices(table.nonzero_mask(table.http_host)):
+        host = strings[table.http_host[i]]
+        site_data = website_data.get(host)
+        if site_data is None:
+            site_data = website_data[host] = _new_site_data(protocol)
+
+        dst_ip = table.dst_ip[i]
+        if dst_ip:
+            site_data['ips'].add(addresses[dst_ip])
+
+        resp_code = table.http_response_code[i]
+        if table.http_method[i] or resp_code:
+            site_data['total_requests'] += 1
+            site_data['has_traffic'] = True
+
+        # 记录TCP RTT
+        _record_tcp_rtt(site_data, table.ack_rtt[i], table.initial_rtt[i])
+
+        # 记录HTTP错误
+        if 400 <= resp_code < 600:
+            code = str(resp_code)
+            site_data['error_count'] += 1
+            site_data['error_codes'][code] = site_data['error_codes'].get(code, 0) + 1
 
     return website_data
 
-def process_https_data(stdout_data: str, protocol: str) -> Dict:
+def process_https_data(table: PacketTable, protocol: str) -> Dict:
     """处理HTTPS数据"""
     website_data = {}
+    strings = table.strings
+    addresses = table.addresses
 
-    for line in stdout_data.strip().split('\n'):
-        if line.strip():
-            parts = line.strip().split('\t')
-            if len(parts) >= 6:
-                server_name = parts[0] if parts[0] else ''
-                dst_ip = parts[1] if parts[1] else ''
-                tcp_ack_rtt = parts[2] if parts[2] else ''
-                tcp_initial_rtt = parts[3] if parts[3] else ''
-                frame_time = parts[4] if parts[4] else ''
-                dst_port = parts[5] if parts[5] else ''
-
-                # 只处理HTTPS端口的连接
-                if server_name and dst_port in ['443', '8443']:
-                    if server_name not in website_data:
-                        website_data[server_name] = {
-                            'ips': set(),
-                            'tcp_rtts': [],
-                            'total_requests': 0,
-                            'error_count': 0,
-                            'error_codes': {},
-                            'protocol': protocol,
-                            'has_traffic': False
-                        }
-
-                    site_data = website_data[server_name]
-
-                    if dst_ip:
-                        site_data['ips'].add(dst_ip)
-                        site_data['has_traffic'] = True  # HTTPS连接就算有流量
-
-                    # 记录TCP RTT
-                    rtt_recorded = False
-                    if tcp_ack_rtt:
-                        try:
-                            rtt_ms = float(tcp_ack_rtt) * 1000
-                            if rtt_ms > 0:
-                                site_data['tcp_rtts'].append(rtt_ms)
-                                rtt_recorded = True
-                        except:
-                            pass
+    # 只处理HTTPS端口上带SNI的连接
+    port_mask = bytes(map(frozenset((443, 8443)).__contains__, table.tcp_dstport))
+    mask = table.combine(table.nonzero_mask(table.tls_sni), port_mask)
 
-                    if not rtt_recorded and tcp_initial_rtt:
-                        try:
-                            rtt_ms = float(tcp_initial_rtt) * 1000
-                            if rtt_ms > 0:
-                                site_data['tcp_rtts'].append(rtt_ms)
-                        except:
-                            pass
+    for i in table.indices(mask):
+        server_name = strings[table.tls_sni[i]]
+        site_data = website_data.get(server_name)
+        if site_data is None:
+            site_data = website_data[server_name] = _new_site_data(protocol)
+
+        dst_ip = table.dst_ip[i]
+        if dst_ip:
+            site_data['ips'].add(addresses[dst_ip])
+            site_data['has_traffic'] = True  # HTTPS连接就算有流量
+
+        # 记录TCP RTT
+        _record_tcp_rtt(site_data, table.ack_rtt[i], table.initial_rtt[i])
 
     return website_data
 
@@ -1512,62 +1405,45 @@ def analyze_by_issue_type(pcap_file: str, issue_type: str) -> Dict:
     return analyze_by_issue_type_simple(pcap_file, issue_type)
 
 def analyze_dns_issues(pcap_file: str) -> Dict:
-    """分析DNS相关问题"""
+    """分析DNS相关问题（原生pcap解析，不再逐包调用pyshark）"""
     try:
-        cap = pyshark.FileCapture(pcap_file, display_filter='dns')
+        table = read_pcap(pcap_file)
 
         dns_queries = 0
         dns_responses = 0
         failed_queries = 0
         response_times = []
         slow_queries = []
-        query_response_map = {}
 
-        for pkt in cap:
-            try:
-                if hasattr(pkt, 'dns'):
-                    dns_layer = pkt.dns
-
-                    # DNS查询
-                    if hasattr(dns_layer, 'qry_name') and dns_layer.qr == '0':
-                        dns_queries += 1
-                        query_id = dns_layer.id
-                        query_time = float(pkt.sniff_timestamp)
-                        query_response_map[query_id] = {
-                            'query_time': query_time,
-                            'query_name': dns_layer.qry_name
-                        }
-
-                    # DNS响应
-                    elif dns_layer.qr == '1':
-                        dns_responses += 1
-                        response_id = dns_layer.id
-                        response_time = float(pkt.sniff_timestamp)
-
-                        if response_id in query_response_map:
-                            query_info = query_response_map[response_id]
-                            rtt = (response_time - query_info['query_time']) * 1000  # 转换为毫秒
-                            response_times.append(rtt)
-
-                            # 检查是否为慢查询（>100ms）
-                            if rtt > 100:
-                                slow_queries.append({
-                                    'query_name': query_info['query_name'],
-                                    'response_time': rtt,
-                                    'response_code': getattr(dns_layer, 'rcode', 'unknown')
-                                })
-
-                            # 检查是否为失败查询
-                            if hasattr(dns_layer, 'rcode') and dns_layer.rcode != '0':
-                                failed_queries += 1
-
-                            del query_response_map[response_id]
+        for i in table.indices(table.protocol_mask(require=['dns'])):
+            response_code = table.dns_resp_code[i]
 
-            except Exception as e:
-                logger.debug(f"处理DNS包时出错: {str(e)}")
+            # DNS查询
+            if response_code < 0:
+                if table.dns_qry_name[i]:
+                    dns_queries += 1
                 continue
 
-        cap.close()
+            # DNS响应，只统计能匹配到查询的响应
+            dns_responses += 1
+            dns_time = table.dns_time[i]
+            if not dns_time >= 0:
+                continue
+
+            rtt = dns_time * 1000  # 转换为毫秒
+            response_times.append(rtt)
+
+            # 检查是否为慢查询（>100ms）
+            if rtt > 100:
+                slow_queries.append({
+                    'query_name': table.strings[table.dns_qry_name[i]],
+                    'response_time': rtt,
+                    'response_code': str(response_code)
+                })
+
+            # 检查是否为失败查询
+            if response_code != 0:
+                failed_queries += 1
 
         avg_response_time = sum(response_times) / len(response_times) if response_times else 0
 
@@ -1585,9 +1461,9 @@ def analyze_dns_issues(pcap_file: str) -> Dict:
         return {'error': str(e)}
 
 def analyze_performance_issues(pcap_file: str) -> Dict:
-    """分析性能相关问题"""
+    """分析性能相关问题（原生pcap解析，不再逐包调用pyshark）"""
     try:
-        cap = pyshark.FileCapture(pcap_file, display_filter='tcp')
+        table = read_pcap(pcap_file)
 
         tcp_retransmissions = 0
         tcp_resets = 0
@@ -1596,48 +1472,41 @@ def analyze_performance_issues(pcap_file: str) -> Dict:
         high_latency_connections = []
         total_bytes = 0
 
-        for pkt in cap:
-            try:
-                if hasattr(pkt, 'tcp'):
-                    tcp_layer = pkt.tcp
-
-                    # 统计TCP重传
-                    if hasattr(tcp_layer, 'analysis_retransmission'):
-                        tcp_retransmissions += 1
-
-                    # 统计TCP重置
-                    if hasattr(tcp_layer, 'flags_reset') and tcp_layer.flags_reset == '1':
-                        tcp_resets += 1
-
-                    # 统计TCP FIN
-                    if hasattr(tcp_layer, 'flags_fin') and tcp_layer.flags_fin == '1':
-                        tcp_fins += 1
-
-                    # 计算连接延迟（SYN到SYN-ACK）
-                    if hasattr(tcp_layer, 'flags_syn') and tcp_layer.flags_syn == '1':
-                        conn_key = f"{pkt.ip.src}:{tcp_layer.srcport}-{pkt.ip.dst}:{tcp_layer.dstport}"
-                        if hasattr(tcp_layer, 'flags_ack') and tcp_layer.flags_ack == '1':
-                            # SYN-ACK包
-                            if conn_key in connection_times:
-                                rtt = (float(pkt.sniff_timestamp) - connection_times[conn_key]) * 1000
-                                if rtt > 100:  # 高延迟连接（>100ms）
-                                    high_latency_connections.append({
-                                        'connection': conn_key,
-                                        'latency': round(rtt, 2)
-                                    })
-                        else:
-                            # SYN包
-                            connection_times[conn_key] = float(pkt.sniff_timestamp)
-
-                    # 统计流量
-                    if hasattr(pkt, 'length'):
-                        total_bytes += int(pkt.length)
-
-            except Exception as e:
-                logger.debug(f"处理TCP包时出错: {str(e)}")
-                continue
-
-        cap.close()
+        for i in table.indices(table.protocol_mask(require=['tcp'])):
+            flags = table.tcp_flags[i]
+
+            # 统计TCP重传
+            if table.retransmission[i]:
+                tcp_retransmissions += 1
+
+            # 统计TCP重置
+            if flags & 0x04:
+                tcp_resets += 1
+
+            # 统计TCP FIN
+            if flags & 0x01:
+                tcp_fins += 1
+
+            # 计算连接延迟（SYN到SYN-ACK）
+            if flags & 0x02:
+                src = f"{table.addresses[table.src_ip[i]]}:{table.tcp_srcport[i]}"
+                dst = f"{table.addresses[table.dst_ip[i]]}:{table.tcp_dstport[i]}"
+                if flags & 0x10:
+                    # SYN-ACK包，对应反方向的SYN
+                    conn_key = f"{dst}-{src}"
+                    if conn_key in connection_times:
+                        rtt = (table.time_epoch[i] - connection_times.pop(conn_key)) * 1000
+                        if rtt > 100:  # 高延迟连接（>100ms）
+                            high_latency_connections.append({
+                                'connection': conn_key,
+                                'latency': round(rtt, 2)
+                            })
+                else:
+                    # SYN包
+                    connection_times[f"{src}-{dst}"] = table.time_epoch[i]
+
+            # 统计流量
+            total_bytes += table.length[i]
 
         return {
             'tcp_retransmissions': tcp_retransmissions,
@@ -1817,15 +1686,16 @@ def analyze_video_issues(pcap_file: str) -> Dict:
 @router.get("/debug/tasks")
 def debug_tasks():
     """调试：查看所有任务状态"""
+    task_list = tasks.list_tasks()
     return {
-        "total_tasks": len(tasks),
-        "task_ids": list(tasks.keys()),
+        "total_tasks": len(task_list),
+        "task_ids": [task['task_id'] for task in task_list],
         "tasks_summary": {
-            task_id: {
-                "status": task.get('status') if task else 'None',
-                "has_result": bool(task.get('result')) if task else False,
-                "has_capture_summary": bool(task.get('result', {}).get('capture_summary')) if task else False
-            } for task_id, task in tasks.items()
+            task['task_id']: {
+                "status": task.get('status'),
+                "has_result": task.get('has_result', False),
+                "has_capture_summary": task.get('has_capture_summary', False)
+            } for task in task_list
         }
     }
 
@@ -1866,7 +1736,10 @@ def debug_ai_config():
                     "model": provider.model,
                     "api_key_set": bool(provider.api_key)
                 } for name, provider in ai_config.providers.items()
-            }
+            },
+            "routing": llm_router.stats(),
+            "clients": llm_clients.stats(),
+            "cache": analysis_cache.stats()
         }
 
     except Exception as e:
@@ -1938,16 +1811,10 @@ async def start_ai_analysis(request: dict):
         if not task_id:
             raise HTTPException(status_code=400, detail="缺少任务ID")
 
-        if task_id not in tasks:
-            logger.error(f"任务不存在: {task_id}, 当前任务列表: {list(tasks.keys())}")
-            raise HTTPException(status_code=404, detail="任务不存在")
-
-        task = tasks[task_id]
-
-        # 额外检查task是否为None
+        task = tasks.get(task_id)
         if task is None:
-            logger.error(f"任务数据为空: {task_id}")
-            raise HTTPException(status_code=404, detail="任务数据异常")
+            logger.error(f"任务不存在: {task_id}")
+            raise HTTPException(status_code=404, detail="任务不存在")
 
         logger.info(f"任务状态: {task.get('status', 'unknown')}")
 
@@ -1955,19 +1822,22 @@ async def start_ai_analysis(request: dict):
         if task.get('status') != 'done':
             raise HTTPException(status_code=400, detail=f"任务尚未完成数据预处理，当前状态: {task.get('status', 'unknown')}")
 
-        # 检查是否已有AI分析结果
+        # 相同筛选条件已分析过时直接返回缓存的结果
         result = task.get('result', {})
         if not result:
             logger.info(f"任务结果为空: {task_id}")
-        else:
-            ai_analysis = result.get('ai_analysis')
-            if ai_analysis and isinstance(ai_analysis, dict) and ai_analysis.get('success'):
-                logger.info(f"AI分析已完成: {task_id}")
-                return {"message": "AI分析已完成", "task_id": task_id}
+        elif isinstance(result.get('capture_summary'), dict):
+            issue_type, user_description = _analysis_inputs(task)
+            cached = get_ai_analysis_service().get_cached_analysis(
+                issue_type, result['capture_summary'], user_description, filtered_domains, latency_filter)
+            if cached is not None:
+                logger.info(f"AI分析命中缓存: {task_id}")
+                result['ai_analysis'] = cached
+                tasks.update(task_id, result=result, status='done', progress=100)
+                return {"message": "AI分析已完成", "task_id": task_id, "cached": True}
 
         # 更新任务状态为AI分析中
-        task['status'] = 'ai_analyzing'
-        task['progress'] = 80
+        tasks.update(task_id, status='ai_analyzing', progress=80)
         logger.info(f"开始AI分析: {task_id}")
 
         # 异步启动AI分析
@@ -1982,12 +1852,18 @@ async def start_ai_analysis(request: dict):
         logger.error(f"启动AI分析失败: {str(e)}", exc_info=True)
 
         # 安全地更新任务状态
-        if task_id in tasks and tasks[task_id] is not None:
-            tasks[task_id]['status'] = 'error'
-            tasks[task_id]['error'] = f"启动AI分析失败: {str(e)}"
+        if task_id:
+            tasks.update(task_id, status='error', error=f"启动AI分析失败: {str(e)}")
 
         raise HTTPException(status_code=500, detail=f"启动AI分析失败: {str(e)}")
 
+def _analysis_inputs(task: Dict) -> Tuple[str, str]:
+    """任务的 (问题类型, 用户描述)，与抓包时AI分析使用的输入一致"""
+    request = task.get('request') or {}
+    issue_type = request.get('issue_type') or task.get('issue_type') or 'unknown'
+    user_description = request.get('user_description') or task.get('user_description') or ''
+    return issue_type, user_description
+
 async def run_ai_analysis_async(task_id: str, filtered_domains: List[str] = None, latency_filter: str = 'all'):
     """异步运行AI分析"""
     task = tasks.get(task_id)
@@ -2002,15 +1878,13 @@ async def run_ai_analysis_async(task_id: str, filtered_domains: List[str] = None
         result = task.get('result')
         if not result or not isinstance(result, dict):
             logger.error(f"任务结果为空或格式错误: {task_id}, result type: {type(result)}")
-            task['status'] = 'error'
-            task['error'] = '任务结果数据为空或格式错误'
+            tasks.update(task_id, status='error', error='任务结果数据为空或格式错误')
             return
 
         capture_summary = result.get('capture_summary')
         if not capture_summary or not isinstance(capture_summary, dict):
             logger.error(f"抓包摘要为空或格式错误: {task_id}, summary type: {type(capture_summary)}")
-            task['status'] = 'error'
-            task['error'] = '抓包摘要数据为空或格式错误'
+            tasks.update(task_id, status='error', error='抓包摘要数据为空或格式错误')
             return
 
         logger.info(f"抓包摘要数据大小: {len(str(capture_summary))} 字符")
@@ -2019,10 +1893,11 @@ async def run_ai_analysis_async(task_id: str, filtered_domains: List[str] = None
         ai_service = get_ai_analysis_service()
         logger.info(f"AI服务实例创建成功")
 
+        issue_type, user_description = _analysis_inputs(task)
         ai_result = await ai_service.analyze_network_issue(
-            issue_type=task.get('issue_type', 'unknown'),
+            issue_type=issue_type,
             capture_summary=capture_summary,
-            user_description=task.get('user_description', ''),
+            user_description=user_description,
             filtered_domains=filtered_domains,
             latency_filter=latency_filter
         )
@@ -2031,9 +1906,7 @@ async def run_ai_analysis_async(task_id: str, filtered_domains: List[str] = None
 
         # 更新结果
         result['ai_analysis'] = ai_result
-        task['result'] = result
-        task['status'] = 'done'
-        task['progress'] = 100
+        tasks.update(task_id, result=result, status='done', progress=100)
 
         logger.info(f"AI分析任务完成: {task_id}")
 
@@ -2041,16 +1914,12 @@ async def run_ai_analysis_async(task_id: str, filtered_domains: List[str] = None
         logger.error(f"AI分析失败: {str(e)}", exc_info=True)
 
         # 安全地更新任务状态
-        if task_id in tasks and tasks[task_id] is not None:
-            task = tasks[task_id]
-            task['status'] = 'error'
-            task['error'] = f"AI分析失败: {str(e)}"
-
+        task = tasks.get(task_id)
+        if task is not None:
             # 添加错误的AI分析结果
             result = task.get('result')
             if not result or not isinstance(result, dict):
                 result = {}
-                task['result'] = result
 
             result['ai_analysis'] = {
                 'success': False,
@@ -2072,17 +1941,87 @@ async def run_ai_analysis_async(task_id: str, filtered_domains: List[str] = None
                     'next_steps': '请检查系统配置并重试'
                 }
             }
-            task['result'] = result
+            tasks.update(task_id, status='error', error=f"AI分析失败: {str(e)}", result=result)
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+async def stream_ai_analysis_events(task_id: str, capture_summary: Dict, issue_type: str, user_description: str,
+                                    filtered_domains: List[str], latency_filter: str) -> AsyncIterator[str]:
+    """转发AI分析事件为SSE，最终结果同时写入任务"""
+    completed = False
+    events = get_ai_analysis_service().stream_network_issue(
+        issue_type, capture_summary, user_description, filtered_domains, latency_filter, task_id=task_id)
+    try:
+        async for event in events:
+            if event['event'] == 'result':
+                ai_result = event['data']
+                task = tasks.get(task_id)
+                if task is not None:
+                    result = task.get('result') or {}
+                    result['ai_analysis'] = ai_result
+                    if ai_result.get('success', False):
+                        tasks.update(task_id, result=result, status='done', progress=100)
+                    else:
+                        # 与轮询方式一致：分析失败时任务标记为错误
+                        tasks.update(task_id, result=result, status='error',
+                                     error=f"AI分析失败: {ai_result.get('error', '未知错误')}")
+                completed = True
+                logger.info(f"流式AI分析结束: {task_id}，成功: {ai_result.get('success', False)}")
+            yield _sse(event['event'], event['data'])
+    finally:
+        await events.aclose()
+        if not completed:
+            # 客户端中途断开，提供商请求已随之取消，恢复任务状态以便重新分析
+            logger.info(f"流式AI分析被中断: {task_id}")
+            tasks.update(task_id, status='done', progress=100)
+
+@router.post("/analyze-ai/stream")
+async def stream_ai_analysis(request: dict):
+    """流式AI分析（server-sent events），不必再轮询 /status 等待完整结果
+
+    请求参数与 /analyze-ai 相同。事件依次为：
+    start（开始请求提供商）、delta（模型输出的文本增量）、
+    field（diagnosis/severity/recommendations等字段解析完成即发送）、result（最终结果，同时写入任务）。
+    """
+    task_id = request.get('task_id')
+    filtered_domains = request.get('filtered_domains', [])
+    latency_filter = request.get('latency_filter', 'all')
+
+    if not task_id:
+        raise HTTPException(status_code=400, detail="缺少任务ID")
+
+    task = tasks.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    if task.get('status') != 'done':
+        raise HTTPException(status_code=400, detail=f"任务尚未完成数据预处理，当前状态: {task.get('status', 'unknown')}")
+
+    capture_summary = (task.get('result') or {}).get('capture_summary')
+    if not capture_summary or not isinstance(capture_summary, dict):
+        raise HTTPException(status_code=400, detail="抓包摘要数据为空或格式错误")
+
+    logger.info(f"开始流式AI分析: {task_id}，筛选域名: {filtered_domains}，速度分类筛选: {latency_filter}")
+    issue_type, user_description = _analysis_inputs(task)
+    tasks.update(task_id, status='ai_analyzing', progress=80)
+
+    return StreamingResponse(
+        stream_ai_analysis_events(task_id, capture_summary, issue_type, user_description,
+                                  filtered_domains, latency_filter),
+        media_type="text/event-stream",
+        # 禁止代理缓冲，每个事件立即送达
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/download")
 async def download_raw_packets(task_id: str = Query(..., description="任务ID")):
     """下载原始数据包文件"""
     try:
-        if task_id not in tasks:
+        task = tasks.get(task_id, include_result=False)
+        if task is None:
             raise HTTPException(status_code=404, detail="任务不存在")
 
-        task = tasks[task_id]
-
         # 检查原始数据包文件是否存在
         pcap_file = task.get('pcap_file')
         if not pcap_file or not os.path.exists(pcap_file):
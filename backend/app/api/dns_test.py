@@ -1,16 +1,16 @@
 """
 DNS 测试 API
 支持 macOS 和树莓派 5 系统
+所有DNS服务器通过进程内UDP查询引擎并发测试，一个无响应的服务器只占用一次查询超时
 """
 
 import time
-import socket
-import subprocess
-import platform
 from typing import Dict, Any, List, Optional
 from fastapi import APIRouter
 from pydantic import BaseModel
 
+from app.services.dns_query import QUERY_TYPES, benchmark
+
 router = APIRouter()
 
 class DNSServer(BaseModel):
@@ -22,6 +22,12 @@ class DNSTestRequest(BaseModel):
     domain: str
     query_type: str = "A"
     custom_servers: List[DNSServer] = []
+    # 额外测试的域名和记录类型，与domain/query_type合并
+    domains: List[str] = []
+    query_types: List[str] = []
+    # 每个 (服务器, 域名, 类型) 重复查询次数，大于1时统计百分位和冷/热缓存差异
+    repeat: int = 1
+    timeout: float = 2.0
 
 class DNSTestResult(BaseModel):
     server: DNSServer
@@ -31,6 +37,7 @@ class DNSTestResult(BaseModel):
     status: str  # 'success', 'timeout', 'error'
     resolved_ips: Optional[List[str]] = None
     error_message: Optional[str] = None
+    stats: Optional[Dict[str, Any]] = None
 
 class DNSTestResponse(BaseModel):
     success: bool
@@ -52,155 +59,30 @@ DEFAULT_DNS_SERVERS = [
     DNSServer(name="百度 DNS", ip="180.76.76.76", location="China")
 ]
 
-def test_dns_with_dig(domain: str, dns_server: str, query_type: str = "A") -> Dict[str, Any]:
-    """使用 dig 命令测试 DNS 解析"""
-    try:
-        start_time = time.time()
-        
-        cmd = ['dig', f'@{dns_server}', domain, query_type, '+short', '+time=5']
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        
-        end_time = time.time()
-        response_time = round((end_time - start_time) * 1000, 2)  # 转换为毫秒
-        
-        if result.returncode == 0:
-            resolved_ips = [line.strip() for line in result.stdout.strip().split('\n') if line.strip()]
-            return {
-                "response_time": response_time,
-                "status": "success",
-                "resolved_ips": resolved_ips
-            }
-        else:
-            return {
-                "response_time": response_time,
-                "status": "error",
-                "error_message": result.stderr.strip() or "DNS查询失败"
-            }
-            
-    except subprocess.TimeoutExpired:
-        return {
-            "response_time": 10000,  # 超时设为10秒
-            "status": "timeout",
-            "error_message": "DNS查询超时"
-        }
-    except FileNotFoundError:
-        # dig 命令不存在，使用 Python 内置方法
-        return test_dns_with_socket(domain, dns_server, query_type)
-    except Exception as e:
-        return {
-            "response_time": 0,
-            "status": "error",
-            "error_message": str(e)
-        }
-
-def test_dns_with_socket(domain: str, dns_server: str, query_type: str = "A") -> Dict[str, Any]:
-    """使用 Python socket 测试 DNS 解析（备用方案）"""
-    try:
-        print(f"    使用 Python socket 解析 {domain}")
-        start_time = time.time()
-
-        if query_type == "A":
-            # 解析 A 记录
-            resolved_ips = [socket.gethostbyname(domain)]
-        elif query_type == "AAAA":
-            # IPv6 解析
-            try:
-                result = socket.getaddrinfo(domain, None, socket.AF_INET6)
-                resolved_ips = [addr[4][0] for addr in result]
-            except:
-                resolved_ips = []
-        else:
-            # 其他记录类型的简单处理，只能解析 A 记录
-            resolved_ips = [socket.gethostbyname(domain)]
-
-        end_time = time.time()
-        response_time = round((end_time - start_time) * 1000, 2)
-
-        return {
-            "response_time": response_time,
-            "status": "success",
-            "resolved_ips": resolved_ips
-        }
-
-    except socket.gaierror as e:
-        return {
-            "response_time": 5000,  # 设置一个较高的响应时间表示失败
-            "status": "error",
-            "error_message": f"域名解析失败: {e}"
-        }
-    except Exception as e:
-        return {
-            "response_time": 5000,
-            "status": "error",
-            "error_message": str(e)
-        }
-
-def test_dns_with_nslookup(domain: str, dns_server: str, query_type: str = "A") -> Dict[str, Any]:
-    """使用 nslookup 命令测试 DNS 解析"""
-    try:
-        start_time = time.time()
-        
-        cmd = ['nslookup', '-type=' + query_type, domain, dns_server]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        
-        end_time = time.time()
-        response_time = round((end_time - start_time) * 1000, 2)
-        
-        if result.returncode == 0:
-            # 解析 nslookup 输出
-            resolved_ips = []
-            lines = result.stdout.split('\n')
-            for line in lines:
-                line = line.strip()
-                if 'Address:' in line and not line.startswith('Server:'):
-                    ip = line.split('Address:')[-1].strip()
-                    if ip and ip != dns_server:
-                        resolved_ips.append(ip)
-            
-            return {
-                "response_time": response_time,
-                "status": "success" if resolved_ips else "error",
-                "resolved_ips": resolved_ips,
-                "error_message": "未找到解析结果" if not resolved_ips else None
-            }
-        else:
-            return {
-                "response_time": response_time,
-                "status": "error",
-                "error_message": "nslookup 查询失败"
-            }
-            
-    except subprocess.TimeoutExpired:
-        return {
-            "response_time": 10000,
-            "status": "timeout",
-            "error_message": "DNS查询超时"
-        }
-    except Exception as e:
-        return {
-            "response_time": 0,
-            "status": "error",
-            "error_message": str(e)
-        }
-
-def test_single_dns_server(domain: str, dns_server: DNSServer, query_type: str) -> DNSTestResult:
-    """测试单个 DNS 服务器"""
+def build_server_result(server: DNSServer, result: Dict[str, Any], request: DNSTestRequest) -> DNSTestResult:
+    """汇总单个服务器的测试结果，解析结果取主域名/类型的第一次查询"""
+    samples = result["samples"]
+    stats = result["stats"]
+    primary = next((s for s in samples if s["domain"] == request.domain
+                    and s["query_type"] == request.query_type.upper() and s["attempt"] == 0), samples[0])
     
-    # 优先使用 dig，然后是 nslookup，最后是 socket
-    result = test_dns_with_dig(domain, dns_server.ip, query_type)
-    
-    if result["status"] == "error" and "not found" in result.get("error_message", "").lower():
-        # 如果 dig 不存在，尝试 nslookup
-        result = test_dns_with_nslookup(domain, dns_server.ip, query_type)
+    if stats["successful"]:
+        status = "success"
+    elif stats["timeouts"] == len(samples):
+        status = "timeout"
+    else:
+        status = "error"
     
     return DNSTestResult(
-        server=dns_server,
-        domain=domain,
-        query_type=query_type,
-        response_time=result["response_time"],
-        status=result["status"],
-        resolved_ips=result.get("resolved_ips"),
-        error_message=result.get("error_message")
+        server=server,
+        domain=request.domain,
+        query_type=request.query_type.upper(),
+        # 多次查询时取中位数，单次查询即为该次耗时
+        response_time=stats["p50"] if stats["p50"] is not None else primary["response_time"],
+        status=status,
+        resolved_ips=primary.get("resolved_ips"),
+        error_message=None if status == "success" else primary.get("error_message"),
+        stats=stats
     )
 
 @router.post("/dns-test")
@@ -213,12 +95,19 @@ async def dns_test(request: DNSTestRequest) -> DNSTestResponse:
         # 确定要测试的 DNS 服务器
         dns_servers = request.custom_servers if request.custom_servers else DEFAULT_DNS_SERVERS
         
-        # 测试所有 DNS 服务器
-        test_results = []
-        for dns_server in dns_servers:
-            print(f"  测试 DNS 服务器: {dns_server.name} ({dns_server.ip})")
-            result = test_single_dns_server(request.domain, dns_server, request.query_type)
-            test_results.append(result)
+        domains = list(dict.fromkeys([request.domain] + request.domains))
+        query_types = list(dict.fromkeys(t.upper() for t in [request.query_type] + request.query_types))
+        unsupported = [t for t in query_types if t not in QUERY_TYPES]
+        if unsupported:
+            return DNSTestResponse(success=False, error="不支持的查询类型", details=", ".join(unsupported))
+        repeat = max(1, min(request.repeat, 50))
+        timeout = max(0.2, min(request.timeout, 10.0))
+        
+        # 并发测试所有 DNS 服务器
+        started = time.time()
+        results = await benchmark([s.ip for s in dns_servers], domains, query_types,
+                                  repeat=repeat, timeout=timeout)
+        test_results = [build_server_result(server, results[server.ip], request) for server in dns_servers]
         
         # 计算统计信息
         successful_tests = [r for r in test_results if r.status == "success"]
@@ -236,7 +125,12 @@ async def dns_test(request: DNSTestRequest) -> DNSTestResponse:
         
         data = {
             "domain": request.domain,
+            "domains": domains,
+            "query_types": query_types,
+            "repeat": repeat,
+            "duration": round((time.time() - started) * 1000, 2),
             "test_results": [result.dict() for result in test_results],
+            "queries": {server.ip: results[server.ip]["samples"] for server in dns_servers},
             "summary": {
                 "fastest_server": fastest.server.dict() if fastest else None,
                 "slowest_server": slowest.server.dict() if slowest else None,
@@ -3,11 +3,13 @@ MCP工具调用API
 """
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import logging
 
 from ..mcp.manager import MCPManager
+from ..services.ndjson_stream import ndjson_line, stream_ndjson
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -26,6 +28,15 @@ class MCPInitRequest(BaseModel):
     """MCP初始化请求"""
     config_path: Optional[str] = None
 
+def _response_to_dict(result) -> Dict[str, Any]:
+    return {
+        "success": result.success,
+        "data": result.data,
+        "error": result.error,
+        "server": result.server,
+        "execution_time": result.execution_time
+    }
+
 @router.post("/call")
 async def call_mcp_tool(request: MCPCallRequest):
     """调用MCP工具"""
@@ -43,13 +54,7 @@ async def call_mcp_tool(request: MCPCallRequest):
             timeout=request.timeout
         )
         
-        return {
-            "success": result.success,
-            "data": result.data,
-            "error": result.error,
-            "server": result.server,
-            "execution_time": result.execution_time
-        }
+        return _response_to_dict(result)
         
     except Exception as e:
         logger.error(f"调用MCP工具失败: {str(e)}")
@@ -121,8 +126,11 @@ async def initialize_mcp(request: MCPInitRequest = None):
         raise HTTPException(status_code=500, detail=f"初始化MCP管理器失败: {str(e)}")
 
 @router.post("/diagnose")
-async def diagnose_network_issue(request: Dict[str, Any]):
-    """智能网络问题诊断"""
+async def diagnose_network_issue(request: Dict[str, Any], stream: bool = False):
+    """智能网络问题诊断
+
+    stream=true时以NDJSON流式返回每个诊断步骤的进度事件，最后一行为 {"type": "result", ...}
+    """
     try:
         issue_description = request.get("issue_description", "")
         
@@ -134,6 +142,15 @@ async def diagnose_network_issue(request: Dict[str, Any]):
             logger.info("MCP管理器未初始化，正在初始化...")
             await mcp_manager.initialize()
         
+        if stream:
+            def run(emit):
+                return mcp_manager.diagnose_network_issue(issue_description, on_progress=emit)
+
+            # 客户端断开时停止诊断
+            generate = stream_ndjson(run, lambda diagnosis: {"type": "result", **diagnosis.result()})
+            
+            return StreamingResponse(generate, media_type="application/x-ndjson")
+        
         # 执行智能诊断
         result = await mcp_manager.diagnose_network_issue(issue_description)
         
@@ -146,8 +163,12 @@ async def diagnose_network_issue(request: Dict[str, Any]):
         raise HTTPException(status_code=500, detail=f"网络问题诊断失败: {str(e)}")
 
 @router.post("/batch_call")
-async def batch_call_mcp_tools(requests: list):
-    """批量调用MCP工具"""
+async def batch_call_mcp_tools(requests: List[Dict[str, Any]], stream: bool = False):
+    """批量调用MCP工具
+
+    stream=true时以NDJSON流式返回，每完成一个调用输出一行（带index对应请求序号），
+    最后一行为 {"done": true}
+    """
     try:
         # 检查MCP管理器是否已初始化
         if not mcp_manager.client:
@@ -161,29 +182,30 @@ async def batch_call_mcp_tools(requests: list):
                 "server": req.get("server_name"),
                 "tool": req.get("tool_name"),
                 "args": req.get("args", {}),
-                "timeout": req.get("timeout")
+                "timeout": req.get("timeout"),
+                "priority": req.get("priority", 0)
             })
         
+        if stream:
+            async def generate():
+                completed = 0
+                async for index, result in mcp_manager.client.iter_batch_call(mcp_requests):
+                    completed += 1
+                    line = {"index": index, **_response_to_dict(result)}
+                    yield ndjson_line(line)
+                yield ndjson_line({"done": True, "total_requests": len(requests), "completed": completed})
+            
+            return StreamingResponse(generate(), media_type="application/x-ndjson")
+        
         # 批量调用
         results = await mcp_manager.client.batch_call(mcp_requests)
         
-        # 转换响应格式
-        response_results = []
-        for result in results:
-            response_results.append({
-                "success": result.success,
-                "data": result.data,
-                "error": result.error,
-                "server": result.server,
-                "execution_time": result.execution_time
-            })
-        
         return {
             "success": True,
-            "results": response_results,
+            "results": [_response_to_dict(result) for result in results],
             "total_requests": len(requests)
         }
         
     except Exception as e:
         logger.error(f"批量调用MCP工具失败: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"批量调用MCP工具失败: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"批量调用MCP工具失败: {str(e)}")
@@ -1,13 +1,15 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
 from pydantic import BaseModel
 from typing import Dict, List, Optional
 import asyncio
 import time
-import subprocess
 import json
 from datetime import datetime
 
 from app.services.network_service import NetworkService
+from app.services.command_runner import run_command, run_until_disconnected
+from app.services.carrier_resolver import carrier_sessions
+from app.services.screenshot_service import screenshot_service
 
 router = APIRouter()
 network_service = NetworkService()
@@ -28,6 +30,15 @@ class SignalAnalysisRequest(BaseModel):
 class TraceRouteRequest(BaseModel):
     destination: str
 
+# 不同运营商的DNS服务器配置
+CARRIER_CONFIGS = [
+    {"name": "本地网络", "dns_servers": [], "description": "当前网络环境"},
+    {"name": "中国电信", "dns_servers": ["114.114.114.114", "114.114.115.115"], "description": "电信DNS服务器"},
+    {"name": "中国联通", "dns_servers": ["123.125.81.6", "140.207.198.6"], "description": "联通DNS服务器"},
+    {"name": "中国移动", "dns_servers": ["223.5.5.5", "223.6.6.6"], "description": "移动DNS服务器"},
+    {"name": "公共DNS", "dns_servers": ["8.8.8.8", "8.8.4.4"], "description": "Google公共DNS"}
+]
+
 class NetworkTestResponse(BaseModel):
     status: str
     data: Dict
@@ -52,7 +63,7 @@ async def check_connectivity():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/speed_test", response_model=NetworkTestResponse)
-async def speed_test(request: SpeedTestRequest):
+async def speed_test(request: SpeedTestRequest, http_request: Request):
     """执行网络速度测试"""
     try:
         # 使用 speedtest-cli 进行测试
@@ -60,7 +71,8 @@ async def speed_test(request: SpeedTestRequest):
         if request.server_id:
             cmd.extend(["--server", request.server_id])
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+        # 测速耗时很长，客户端断开时终止speedtest进程
+        result = await run_until_disconnected(http_request, run_command(cmd, timeout=120))
         
         if result.returncode == 0:
             speed_data = json.loads(result.stdout)
@@ -112,7 +124,7 @@ async def ping_test(request: PingTestRequest):
     try:
         # 执行 ping 命令
         cmd = ["ping", "-c", str(request.count), request.host]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        result = await run_command(cmd, timeout=30)
         
         if result.returncode == 0:
             # 解析 ping 结果
@@ -177,7 +189,7 @@ async def wifi_scan(request: WiFiScanRequest):
     try:
         # 使用 iwlist 扫描 WiFi
         cmd = ["iwlist", request.interface, "scan"]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        result = await run_command(cmd, timeout=30, tool="wifi_scan")
         
         networks = []
         if result.returncode == 0:
@@ -235,7 +247,7 @@ async def signal_analysis(request: SignalAnalysisRequest):
     try:
         # 使用 iwconfig 获取当前连接信息
         cmd = ["iwconfig", request.interface]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+        result = await run_command(cmd, timeout=10)
         
         if result.returncode == 0:
             # 解析 iwconfig 输出
@@ -271,12 +283,12 @@ async def signal_analysis(request: SignalAnalysisRequest):
         raise HTTPException(status_code=500, detail=f"Signal analysis failed: {str(e)}")
 
 @router.post("/trace_route", response_model=NetworkTestResponse)
-async def trace_route(request: TraceRouteRequest):
+async def trace_route(request: TraceRouteRequest, http_request: Request):
     """追踪网络路径和节点"""
     try:
         # 使用 traceroute 或 tracepath
         cmd = ["traceroute", "-n", "-m", "15", request.destination]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        result = await run_until_disconnected(http_request, run_command(cmd, timeout=60))
         
         hops = []
         if result.returncode == 0:
@@ -323,37 +335,33 @@ async def website_accessibility_test(request: dict):
         if not url.startswith(('http://', 'https://')):
             url = 'https://' + url
         print(f"🌐 开始网站可访问性对比测试: {url}")
+        started = time.time()
         # 测试结果存储
         test_results = {
             "url": url,
             "test_time": datetime.now().isoformat(),
             "results": []
         }
-        # 不同运营商的DNS服务器配置
-        carrier_configs = [
-            {"name": "本地网络", "dns_servers": [], "description": "当前网络环境"},
-            {"name": "中国电信", "dns_servers": ["114.114.114.114", "114.114.115.115"], "description": "电信DNS服务器"},
-            {"name": "中国联通", "dns_servers": ["123.125.81.6", "140.207.198.6"], "description": "联通DNS服务器"},
-            {"name": "中国移动", "dns_servers": ["223.5.5.5", "223.6.6.6"], "description": "移动DNS服务器"},
-            {"name": "公共DNS", "dns_servers": ["8.8.8.8", "8.8.4.4"], "description": "Google公共DNS"}
-        ]
-        # 对每个运营商进行测试
-        for config in carrier_configs:
-            result = await test_website_with_carrier(url, config, screenshot)
-            test_results["results"].append(result)
+        # 各运营商并发测试，每个运营商用自己的DNS服务器解析
+        test_results["results"] = await compare_carriers(url, CARRIER_CONFIGS, screenshot)
+        print(f"✅ 网站可访问性对比测试完成，用时 {time.time() - started:.2f}秒")
         return {"success": True, "data": test_results}
     except Exception as e:
         print(f"❌ 网站可访问性测试错误: {str(e)}")
         return {"success": False, "error": f"测试失败: {str(e)}"}
 
+async def compare_carriers(url: str, configs: List[dict], screenshot: bool = False) -> List[dict]:
+    """并发测试各运营商配置，结果顺序与配置顺序一致"""
+    return list(await asyncio.gather(*[test_website_with_carrier(url, config, screenshot) for config in configs]))
+
 async def test_website_with_carrier(url: str, config: dict, screenshot: bool = False):
     """
     使用指定运营商配置测试网站访问，并可选截图
+    域名（包括重定向后的域名）通过该运营商的DNS服务器解析，连接解析出的地址
     """
     import aiohttp
     import asyncio
     from urllib.parse import urlparse
-    import socket
     import time
     result = {
         "carrier": config["name"],
@@ -366,71 +374,65 @@ async def test_website_with_carrier(url: str, config: dict, screenshot: bool = F
         "content_length": None,
         "final_url": None,
         "ip_address": None,
+        "resolved_ips": [],
+        "dns_server": None,
+        "dns_time": None,
         "headers": {},
         "screenshot_available": False,
         "screenshot_url": None
     }
     start_time = time.time()
     try:
-        # 解析域名获取IP地址
+        session, resolver = carrier_sessions.get(config["dns_servers"])
+        # 解析域名获取IP地址（结果按TTL缓存在解析器中，随后的请求直接使用）
         parsed_url = urlparse(url)
-        domain = parsed_url.netloc
-        # 如果指定了DNS服务器，尝试使用它们解析域名
-        if config["dns_servers"]:
-            try:
-                ip_address = socket.gethostbyname(domain)
-                result["ip_address"] = ip_address
-            except:
-                result["error"] = f"DNS解析失败 (使用{config['dns_servers']})"
-                return result
-        timeout = aiohttp.ClientTimeout(total=10, connect=5)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1'
-            }
-            async with session.get(url, headers=headers, allow_redirects=True) as response:
-                result["status_code"] = response.status
-                result["final_url"] = str(response.url)
-                result["response_time"] = round((time.time() - start_time) * 1000, 2)
-                result["headers"] = dict(response.headers)
-                content = await response.read()
-                result["content_length"] = len(content)
-                if response.status == 200:
-                    result["accessible"] = True
-                    content_text = content.decode('utf-8', errors='ignore').lower()
-                    if any(keyword in content_text for keyword in ['<html', '<body', '<head', 'DOCTYPE html']):
-                        result["accessible"] = True
-                    elif len(content_text) < 100:
-                        result["accessible"] = False
-                        result["error"] = "返回内容疑似错误页面"
-                elif response.status in [301, 302, 303, 307, 308]:
+        domain = parsed_url.hostname
+        try:
+            resolved = await resolver.resolve_with_stats(domain, 0)
+        except OSError as e:
+            result["error"] = f"DNS解析失败 (使用{config['dns_servers'] or '系统DNS'}): {e}"
+            result["response_time"] = round((time.time() - start_time) * 1000, 2)
+            return result
+        result["resolved_ips"] = resolved["addresses"]
+        result["ip_address"] = resolved["addresses"][0] if resolved["addresses"] else None
+        result["dns_server"] = resolved["dns_server"]
+        result["dns_time"] = resolved["dns_time"]
+
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1'
+        }
+        async with session.get(url, headers=headers, allow_redirects=True) as response:
+            result["status_code"] = response.status
+            result["final_url"] = str(response.url)
+            result["response_time"] = round((time.time() - start_time) * 1000, 2)
+            result["headers"] = dict(response.headers)
+            content = await response.read()
+            result["content_length"] = len(content)
+            if response.status == 200:
+                result["accessible"] = True
+                content_text = content.decode('utf-8', errors='ignore').lower()
+                if any(keyword in content_text for keyword in ['<html', '<body', '<head', 'DOCTYPE html']):
                     result["accessible"] = True
-                    result["error"] = f"重定向到: {result['final_url']}"
-                else:
+                elif len(content_text) < 100:
                     result["accessible"] = False
-                    result["error"] = f"HTTP {response.status}"
+                    result["error"] = "返回内容疑似错误页面"
+            elif response.status in [301, 302, 303, 307, 308]:
+                result["accessible"] = True
+                result["error"] = f"重定向到: {result['final_url']}"
+            else:
+                result["accessible"] = False
+                result["error"] = f"HTTP {response.status}"
         # 截图逻辑
         if screenshot:
             try:
-                from pathlib import Path
-                import uuid
-                from playwright.async_api import async_playwright
-                screenshot_dir = Path(__file__).parent.parent.parent / "data" / "website_screenshots"
-                screenshot_dir.mkdir(parents=True, exist_ok=True)
-                filename = f"screenshot_{uuid.uuid4().hex}.png"
-                filepath = screenshot_dir / filename
-                async with async_playwright() as p:
-                    browser = await p.chromium.launch(headless=True)
-                    page = await browser.new_page()
-                    await page.goto(url, timeout=15000)
-                    await page.screenshot(path=str(filepath), full_page=True)
-                    await browser.close()
-                screenshot_url = f"/static/website_screenshots/{filename}"
+                # 各运营商截图的是同一页面，由截图缓存合并为一次渲染
+                shot = await screenshot_service.capture(url)
+                screenshot_url = shot["url"]
                 result["screenshot_available"] = True
                 result["screenshot_url"] = screenshot_url
             except Exception as e:
@@ -453,12 +455,6 @@ async def website_screenshot(request: dict):
     """
     获取网站截图
     """
-    import os
-    import uuid
-    from pathlib import Path
-    from fastapi.responses import FileResponse
-    from playwright.async_api import async_playwright
-
     try:
         url = request.get("url", "").strip()
         if not url:
@@ -468,33 +464,26 @@ async def website_screenshot(request: dict):
             url = 'https://' + url
         print(f"📸 开始获取网站截图: {url}")
 
-        # 截图保存目录
-        screenshot_dir = Path(__file__).parent.parent.parent / "data" / "website_screenshots"
-        screenshot_dir.mkdir(parents=True, exist_ok=True)
-        filename = f"screenshot_{uuid.uuid4().hex}.png"
-        filepath = screenshot_dir / filename
-
-        # Playwright 截图
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
-            await page.goto(url, timeout=15000)
-            await page.screenshot(path=str(filepath), full_page=True)
-            await browser.close()
-
-        # 构造图片可访问URL（假设前端通过 /static/website_screenshots/ 访问）
-        screenshot_url = f"/static/website_screenshots/{filename}"
+        # 常驻浏览器截图，短时间内重复请求同一页面直接返回缓存
+        shot = await screenshot_service.capture(url, full_page=request.get("full_page", True))
+        print(f"✅ 截图完成: {shot['filename']}{' (缓存)' if shot['cached'] else ''}")
         screenshot_result = {
             "url": url,
             "screenshot_available": True,
-            "screenshot_path": str(filepath),
-            "screenshot_url": screenshot_url
+            "screenshot_path": shot["path"],
+            "screenshot_url": shot["url"],
+            "cached": shot["cached"]
         }
         return {"success": True, "data": screenshot_result}
     except Exception as e:
         print(f"❌ 网站截图错误: {str(e)}")
         return {"success": False, "error": f"截图失败: {str(e)}"}
 
+@router.get("/website-screenshot/stats")
+async def website_screenshot_stats():
+    """截图缓存、磁盘占用和浏览器池状态"""
+    return {"success": True, "data": screenshot_service.stats()}
+
 # 辅助函数
 def parse_iwlist_output(output: str) -> List[Dict]:
     """解析 iwlist 扫描输出"""
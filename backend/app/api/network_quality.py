@@ -4,23 +4,33 @@
 """
 
 import time
-import subprocess
 import statistics
-import platform
-import re
 from typing import Dict, Any, List, Optional
-from fastapi import APIRouter
+from fastapi import APIRouter, WebSocket
 from pydantic import BaseModel
 import asyncio
 
+from app.services.quality_monitor import RESOLUTIONS, quality_monitor
+from app.services.throughput_tester import run_throughput_test
+
 router = APIRouter()
 
+# 监控过程中每次速度测试的时长（秒，含1秒预热）
+SPEED_TEST_DURATION = 5.0
+
 class NetworkQualityRequest(BaseModel):
     target: str = "google.com"
     duration: int = 60  # 监控时长（秒）
     interval: int = 5   # 测试间隔（秒）
     include_speed_test: bool = False
 
+class MonitorTargetRequest(BaseModel):
+    target: str
+    interval: float = 1.0  # 探测间隔（秒）
+    probes: int = 3        # 每次探测发送的回显数
+    method: str = "auto"   # auto, icmp, tcp
+    port: int = 443        # TCP探测端口
+
 class QualityMetric(BaseModel):
     timestamp: str
     ping_latency: float
@@ -35,68 +45,19 @@ class NetworkQualityResult(BaseModel):
     error: Optional[str] = None
     details: Optional[str] = None
 
-def ping_test(target: str, count: int = 4) -> Dict[str, Any]:
-    """执行 ping 测试"""
-    system = platform.system().lower()
-    
+async def ping_test(target: str, count: int = 4) -> Dict[str, Any]:
+    """执行 ping 测试（进程内ICMP/TCP探测）"""
     try:
-        if system == "darwin":  # macOS
-            cmd = ['ping', '-c', str(count), target]
-        else:  # Linux (树莓派)
-            cmd = ['ping', '-c', str(count), target]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
-        
-        if result.returncode != 0:
-            return {
-                "success": False,
-                "latency": 0,
-                "jitter": 0,
-                "packet_loss": 100
-            }
-        
-        output = result.stdout
-        
-        # 解析延迟
-        latencies = []
-        if system == "darwin":
-            # macOS ping 输出格式
-            latency_matches = re.findall(r'time=([\d.]+)', output)
-            latencies = [float(match) for match in latency_matches]
-        else:
-            # Linux ping 输出格式
-            latency_matches = re.findall(r'time=([\d.]+)', output)
-            latencies = [float(match) for match in latency_matches]
-        
-        # 解析丢包率
-        packet_loss = 0
-        loss_match = re.search(r'(\d+)% packet loss', output)
-        if loss_match:
-            packet_loss = float(loss_match.group(1))
-        
-        # 计算统计信息
-        if latencies:
-            avg_latency = round(statistics.mean(latencies), 2)
-            jitter = round(statistics.stdev(latencies), 2) if len(latencies) > 1 else 0
-        else:
-            avg_latency = 0
-            jitter = 0
-        
-        return {
-            "success": True,
-            "latency": avg_latency,
-            "jitter": jitter,
-            "packet_loss": packet_loss
-        }
-        
-    except subprocess.TimeoutExpired:
+        sample = await quality_monitor.measure(target, probes=count, spacing=0.2)
+    except Exception:
         return {
             "success": False,
             "latency": 0,
             "jitter": 0,
             "packet_loss": 100
         }
-    except Exception as e:
+
+    if not sample["received"]:
         return {
             "success": False,
             "latency": 0,
@@ -104,30 +65,22 @@ def ping_test(target: str, count: int = 4) -> Dict[str, Any]:
             "packet_loss": 100
         }
 
-def simple_speed_test() -> Dict[str, float]:
-    """简单的速度测试"""
+    return {
+        "success": True,
+        "latency": round(sample["latency"], 2),
+        "jitter": round(sample["jitter"], 2),
+        "packet_loss": sample["loss"]
+    }
+
+async def simple_speed_test() -> Dict[str, float]:
+    """简单的速度测试（进程内多连接HTTP下载，时间较短，适合周期性监控）"""
     try:
-        import urllib.request
-        import time
-        
-        # 测试下载速度 - 下载一个小文件
-        test_url = "http://speedtest.ftp.otenet.gr/files/test1Mb.db"
-        start_time = time.time()
-        
-        with urllib.request.urlopen(test_url, timeout=10) as response:
-            data = response.read()
-            
-        end_time = time.time()
-        duration = end_time - start_time
-        file_size_mb = len(data) / (1024 * 1024)
-        download_speed = round(file_size_mb / duration * 8, 2)  # 转换为 Mbps
-        
+        result = await run_throughput_test(streams=4, duration=SPEED_TEST_DURATION, warmup=1.0, upload=False)
         return {
-            "download_speed": download_speed,
+            "download_speed": result["download_speed"],
             "upload_speed": 0  # 简单测试不包含上传
         }
-        
-    except:
+    except Exception:
         return {
             "download_speed": 0,
             "upload_speed": 0
@@ -209,7 +162,7 @@ def generate_recommendations(summary: Dict[str, Any]) -> List[str]:
     
     return recommendations
 
-def monitor_network_quality(target: str, duration: int, interval: int, include_speed_test: bool = False) -> Dict[str, Any]:
+async def monitor_network_quality(target: str, duration: int, interval: int, include_speed_test: bool = False) -> Dict[str, Any]:
     """监控网络质量"""
     start_time = time.time()
     metrics = []
@@ -222,12 +175,12 @@ def monitor_network_quality(target: str, duration: int, interval: int, include_s
             test_start = time.time()
             
             # 执行 ping 测试
-            ping_result = ping_test(target, count=3)
+            ping_result = await ping_test(target, count=3)
             
             # 可选的速度测试
             speed_result = {"download_speed": None, "upload_speed": None}
             if include_speed_test and test_count % 3 == 0:  # 每3次测试做一次速度测试
-                speed_result = simple_speed_test()
+                speed_result = await simple_speed_test()
             
             # 记录指标
             metric = QualityMetric(
@@ -247,7 +200,7 @@ def monitor_network_quality(target: str, duration: int, interval: int, include_s
             # 等待下一次测试
             elapsed = time.time() - test_start
             if elapsed < interval:
-                time.sleep(interval - elapsed)
+                await asyncio.sleep(interval - elapsed)
         
         # 计算统计信息
         latencies = [m.ping_latency for m in metrics if m.ping_latency > 0]
@@ -311,7 +264,7 @@ async def network_quality(request: NetworkQualityRequest) -> NetworkQualityResul
     try:
         print(f"📊 开始网络质量监控 - 目标: {request.target}, 时长: {request.duration}秒")
         
-        data = monitor_network_quality(
+        data = await monitor_network_quality(
             request.target, 
             request.duration, 
             request.interval, 
@@ -334,3 +287,101 @@ async def network_quality(request: NetworkQualityRequest) -> NetworkQualityResul
             error="网络质量监控失败",
             details=error_msg
         )
+
+@router.get("/network-quality/monitor")
+async def list_monitor_targets() -> NetworkQualityResult:
+    """列出后台监控目标及最新样本"""
+    return NetworkQualityResult(success=True, data={"targets": quality_monitor.status()})
+
+@router.post("/network-quality/monitor")
+async def add_monitor_target(request: MonitorTargetRequest) -> NetworkQualityResult:
+    """添加或更新后台监控目标"""
+    try:
+        monitor_target = quality_monitor.add_target(
+            request.target, request.interval, request.probes, request.method, request.port)
+    except ValueError as e:
+        return NetworkQualityResult(success=False, error="添加监控目标失败", details=str(e))
+    print(f"📊 添加后台质量监控目标: {request.target}, 间隔 {monitor_target.interval}秒")
+    return NetworkQualityResult(success=True, data=monitor_target.config())
+
+@router.delete("/network-quality/monitor/{target}")
+async def remove_monitor_target(target: str) -> NetworkQualityResult:
+    """删除后台监控目标及其历史数据"""
+    if not await quality_monitor.remove_target(target):
+        return NetworkQualityResult(success=False, error="监控目标不存在", details=target)
+    return NetworkQualityResult(success=True, data={"target": target})
+
+@router.get("/network-quality/monitor/{target}")
+async def query_monitor_series(target: str, resolution: str = "1s", start: Optional[float] = None,
+                               end: Optional[float] = None, limit: Optional[int] = None) -> NetworkQualityResult:
+    """查询监控时间序列（列式返回），start/end为Unix时间戳"""
+    try:
+        data = quality_monitor.query(target, resolution, start, end, limit)
+    except KeyError:
+        return NetworkQualityResult(success=False, error="监控目标不存在", details=target)
+    except ValueError as e:
+        return NetworkQualityResult(success=False, error="查询参数错误", details=str(e))
+    return NetworkQualityResult(success=True, data=data)
+
+# 每个WebSocket连接最多积压的推送数，客户端处理不过来时丢弃最旧的
+SUBSCRIPTION_QUEUE_SIZE = 256
+
+class QualitySubscription:
+    """/ws/network-quality 上的一个订阅连接
+
+    客户端消息：
+      {"action": "subscribe", "targets": [...], "resolutions": ["1s", "1m"]}  targets为空表示全部目标
+      {"action": "unsubscribe"}
+      {"action": "query", "target": ..., "resolution": "1m", "start": ..., "end": ..., "limit": ...}
+    推送：{"type": "network_quality_update", "data": {"target", "resolution", "sample"}}
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.targets: Optional[set] = None
+        self.resolutions = {"1s"}
+        self.queue: asyncio.Queue = asyncio.Queue(SUBSCRIPTION_QUEUE_SIZE)
+        self.sender: Optional[asyncio.Task] = None
+
+    def _on_sample(self, target: str, resolution: str, sample: Dict[str, Any]):
+        if resolution not in self.resolutions or (self.targets and target not in self.targets):
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait({
+            "type": "network_quality_update",
+            "data": {"target": target, "resolution": resolution, "sample": sample}
+        })
+
+    async def _send_loop(self):
+        while True:
+            message = await self.queue.get()
+            await self.websocket.send_json(message)
+
+    async def handle(self, message: Dict[str, Any]):
+        action = message.get("action")
+        if action == "subscribe":
+            self.targets = set(message.get("targets") or [])
+            self.resolutions = {r for r in message.get("resolutions") or ["1s"] if r in RESOLUTIONS}
+            if self.sender is None:
+                quality_monitor.add_listener(self._on_sample)
+                self.sender = asyncio.create_task(self._send_loop())
+            await self.websocket.send_json({
+                "type": "network_quality_subscribed",
+                "data": {"targets": sorted(self.targets), "resolutions": sorted(self.resolutions)}
+            })
+        elif action == "unsubscribe":
+            self.close()
+        elif action == "query":
+            try:
+                data = quality_monitor.query(message.get("target"), message.get("resolution", "1s"),
+                                             message.get("start"), message.get("end"), message.get("limit"))
+                await self.websocket.send_json({"type": "network_quality_series", "data": data})
+            except (KeyError, ValueError) as e:
+                await self.websocket.send_json({"type": "network_quality_error", "data": {"error": str(e)}})
+
+    def close(self):
+        quality_monitor.remove_listener(self._on_sample)
+        if self.sender is not None:
+            self.sender.cancel()
+            self.sender = None
@@ -3,21 +3,33 @@
 支持 macOS 和树莓派 5 系统
 """
 
+import asyncio
 import subprocess
 import json
 import time
 import platform
-import re
-import os
 from typing import Dict, Any, Optional, List
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from app.services.command_runner import run_command
+from app.services.speedtest_servers import (
+    command_cache, probe_latency, rank_servers, select_best_server, server_catalogue
+)
+from app.services.throughput_tester import (
+    DEFAULT_DOWNLOAD_URLS, DEFAULT_DURATION, DEFAULT_STREAMS, run_throughput_test
+)
+
 router = APIRouter()
 
 class SpeedTestRequest(BaseModel):
     server_id: Optional[str] = None
     test_type: str = "full"  # full, download, upload
+    engine: str = "builtin"  # builtin（进程内多连接HTTP测速）, speedtest-cli
+    streams: int = DEFAULT_STREAMS  # 内置测速的并行连接数
+    duration: float = DEFAULT_DURATION  # 内置测速每个方向的时长（秒，含预热）
+    download_url: Optional[str] = None
+    upload_url: Optional[str] = None
 
 class SpeedTestResult(BaseModel):
     success: bool
@@ -25,34 +37,10 @@ class SpeedTestResult(BaseModel):
     error: Optional[str] = None
     details: Optional[str] = None
 
-def check_speedtest_cli() -> bool:
-    """检查是否安装了 speedtest-cli"""
-    # 尝试多种可能的命令路径
-    commands_to_try = [
-        'speedtest-cli',
-        'python3 -m speedtest',
-        'python -m speedtest',
-        '/usr/local/bin/speedtest-cli',
-        os.path.expanduser('~/.local/bin/speedtest-cli')
-    ]
-
-    for cmd in commands_to_try:
-        try:
-            if ' ' in cmd:
-                # 处理带空格的命令
-                cmd_parts = cmd.split()
-                result = subprocess.run(cmd_parts + ['--version'],
-                                      capture_output=True, text=True, timeout=10)
-            else:
-                result = subprocess.run([cmd, '--version'],
-                                      capture_output=True, text=True, timeout=10)
-
-            if result.returncode == 0:
-                print(f"  ✅ 找到 speedtest-cli: {cmd}")
-                return True
-
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            continue
+async def check_speedtest_cli() -> bool:
+    """检查是否安装了 speedtest-cli（命令探测结果有缓存）"""
+    if await command_cache.get():
+        return True
 
     # 尝试检查 Python 模块
     try:
@@ -62,10 +50,9 @@ def check_speedtest_cli() -> bool:
     except ImportError:
         pass
 
-    print("  ❌ 未找到 speedtest-cli")
     return False
 
-def install_speedtest_cli() -> bool:
+async def install_speedtest_cli() -> bool:
     """尝试安装 speedtest-cli"""
     system = platform.system().lower()
 
@@ -76,16 +63,14 @@ def install_speedtest_cli() -> bool:
             # 首先尝试 pip 安装（更可靠）
             try:
                 print("    使用 pip3 安装...")
-                result = subprocess.run(['pip3', 'install', 'speedtest-cli'],
-                                      capture_output=True, text=True, timeout=60)
+                result = await run_command(['pip3', 'install', 'speedtest-cli'], timeout=60)
                 if result.returncode == 0:
                     print("    pip3 安装成功")
                 else:
                     print(f"    pip3 安装失败: {result.stderr}")
                     # 尝试使用 brew
                     print("    尝试使用 brew 安装...")
-                    result = subprocess.run(['brew', 'install', 'speedtest-cli'],
-                                          capture_output=True, text=True, timeout=60)
+                    result = await run_command(['brew', 'install', 'speedtest-cli'], timeout=60)
                     if result.returncode == 0:
                         print("    brew 安装成功")
                     else:
@@ -105,7 +90,7 @@ def install_speedtest_cli() -> bool:
             for cmd, method in install_methods:
                 try:
                     print(f"    使用 {method} 安装...")
-                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+                    result = await run_command(cmd, timeout=60)
                     if result.returncode == 0:
                         print(f"    {method} 安装成功")
                         break
@@ -114,9 +99,13 @@ def install_speedtest_cli() -> bool:
                 except subprocess.TimeoutExpired:
                     print(f"    {method} 安装超时")
                     continue
+                except FileNotFoundError:
+                    print(f"    {method} 不可用")
+                    continue
 
-        # 验证安装
-        if check_speedtest_cli():
+        # 安装后重新探测命令
+        command_cache.invalidate()
+        if await check_speedtest_cli():
             print("  ✅ speedtest-cli 安装验证成功")
             return True
         else:
@@ -127,113 +116,40 @@ def install_speedtest_cli() -> bool:
         print(f"  ❌ 安装过程出错: {e}")
         return False
 
-def get_speedtest_command() -> Optional[List[str]]:
+async def get_speedtest_command() -> Optional[List[str]]:
     """获取可用的 speedtest 命令"""
-    commands_to_try = [
-        ['speedtest-cli'],
-        ['python3', '-m', 'speedtest'],
-        ['python', '-m', 'speedtest'],
-        ['/usr/local/bin/speedtest-cli'],
-        [os.path.expanduser('~/.local/bin/speedtest-cli')]
-    ]
-
-    for cmd in commands_to_try:
-        try:
-            result = subprocess.run(cmd + ['--version'],
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                return cmd
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            continue
-
-    return None
-
-def get_best_servers() -> List[Dict[str, Any]]:
-    """获取最佳测速服务器列表"""
-    base_cmd = get_speedtest_command()
-    if not base_cmd:
-        return []
-
-    try:
-        print("🔍 获取测速服务器列表...")
-        # 获取服务器列表
-        cmd = base_cmd + ['--list']
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-
-        if result.returncode != 0:
-            print("⚠️ 无法获取服务器列表")
-            return []
-
-        servers = []
-        lines = result.stdout.split('\n')
-
-        # 解析服务器列表（取前10个最近的服务器）
-        for line in lines[:20]:  # 多取一些以防解析失败
-            if ')' in line and ('km' in line or 'mi' in line):
-                try:
-                    # 解析格式: "1234) Server Name (Location) [Distance km]"
-                    parts = line.strip().split(')')
-                    if len(parts) >= 2:
-                        server_id = parts[0].strip()
-                        rest = parts[1].strip()
-
-                        # 提取服务器名称和位置
-                        if '(' in rest and ')' in rest:
-                            name_part = rest.split('(')[0].strip()
-                            location_part = rest.split('(')[1].split(')')[0].strip()
-
-                            # 提取距离
-                            distance = 0
-                            if '[' in rest:
-                                distance_str = rest.split('[')[1]
-                                if 'km' in distance_str:
-                                    distance_str = distance_str.split('km')[0].strip()
-                                elif 'mi' in distance_str:
-                                    distance_str = distance_str.split('mi')[0].strip()
-                                try:
-                                    distance = float(distance_str)
-                                except:
-                                    pass
-
-                            servers.append({
-                                "id": server_id,
-                                "name": name_part,
-                                "location": location_part,
-                                "distance": distance
-                            })
-
-                            if len(servers) >= 5:  # 只取前5个最近的服务器
-                                break
-                except Exception as e:
-                    continue
+    return await command_cache.get()
 
-        print(f"✅ 找到 {len(servers)} 个可用服务器")
-        return servers
-
-    except Exception as e:
-        print(f"⚠️ 获取服务器列表失败: {e}")
-        return []
+async def get_best_servers(refresh: bool = False) -> List[Dict[str, Any]]:
+    """获取距离最近的测速服务器列表（取自带TTL缓存的服务器列表）"""
+    servers = await server_catalogue.get(refresh=refresh)
+    return servers[:5]
 
-def run_speedtest_cli(server_id: Optional[str] = None, test_type: str = "full") -> Dict[str, Any]:
+async def run_speedtest_cli(server_id: Optional[str] = None, test_type: str = "full") -> Dict[str, Any]:
     """使用 speedtest-cli 进行测速"""
 
     # 获取可用的命令
-    base_cmd = get_speedtest_command()
+    base_cmd = await get_speedtest_command()
     if not base_cmd:
         raise Exception("未找到可用的 speedtest 命令")
 
-    # 如果没有指定服务器，尝试获取最佳服务器
+    # 如果没有指定服务器，按TCP建连延迟选择最佳服务器
     if not server_id:
-        servers = get_best_servers()
-        if servers:
-            server_id = servers[0]["id"]
-            print(f"📍 选择最佳服务器: {servers[0]['name']} ({servers[0]['location']}) - {servers[0]['distance']}km")
+        try:
+            best = await select_best_server()
+        except Exception as e:
+            print(f"⚠️ 选择测速服务器失败: {e}")
+            best = None
+        if best:
+            server_id = best["id"]
+            latency = f", 延迟 {best['latency']}ms" if best.get("latency") is not None else ""
+            print(f"📍 选择最佳服务器: {best['name']} ({best['location']}) - {best['distance']}km{latency}")
 
     # 构建完整命令
     cmd = base_cmd + ['--json', '--secure']  # 添加 --secure 提高连接稳定性
 
     if server_id:
-        cmd.extend(['--server', server_id])
+        cmd.extend(['--server', str(server_id)])
 
     if test_type == "download":
         cmd.append('--no-upload')
@@ -245,7 +161,7 @@ def run_speedtest_cli(server_id: Optional[str] = None, test_type: str = "full")
         start_time = time.time()
 
         # 执行测速命令，减少超时时间提高响应速度
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=90)
+        result = await run_command(cmd, timeout=90, tool='speedtest-cli')
 
         end_time = time.time()
         test_duration = round(end_time - start_time, 2)
@@ -341,205 +257,90 @@ def run_python_speedtest() -> Dict[str, Any]:
     except Exception as e:
         raise Exception(f"Python speedtest 模块测速失败: {e}")
 
-def run_simple_speedtest() -> Dict[str, Any]:
-    """简单的网络测速实现（备用方案）"""
-    import urllib.request
-    import time
-    import socket
-
-    # 多个测试服务器，提高成功率和速度
-    test_servers = [
-        {
-            "url": "https://speed.cloudflare.com/__down?bytes=10485760",  # 10MB Cloudflare
-            "name": "Cloudflare CDN",
-            "size_mb": 10.0
-        },
-        {
-            "url": "https://httpbin.org/bytes/5242880",  # 5MB
-            "name": "HTTPBin",
-            "size_mb": 5.0
-        },
-        {
-            "url": "https://www.google.com/images/branding/googlelogo/1x/googlelogo_color_272x92dp.png",
-            "name": "Google",
-            "size_mb": 0.01  # 估算大小
-        },
-        {
-            "url": "https://github.com/fluidicon.png",
-            "name": "GitHub",
-            "size_mb": 0.005  # 估算大小
-        }
-    ]
-
-    download_speed = 0
-    test_duration = 0
-    server_used = "Unknown"
-
-    # 尝试不同的测试服务器
-    for server in test_servers:
-        try:
-            print(f"  尝试测试服务器: {server['name']}")
-            start_time = time.time()
-
-            # 创建请求，添加用户代理和其他头部
-            req = urllib.request.Request(
-                server["url"],
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                    'Accept': '*/*',
-                    'Accept-Encoding': 'identity',  # 禁用压缩以获得准确的大小
-                    'Cache-Control': 'no-cache',
-                    'Connection': 'keep-alive'
-                }
-            )
-
-            # 分块下载以获得更准确的速度测量
-            with urllib.request.urlopen(req, timeout=20) as response:
-                data = b''
-                chunk_size = 8192
-                while True:
-                    chunk = response.read(chunk_size)
-                    if not chunk:
-                        break
-                    data += chunk
-
-                    # 如果下载时间超过10秒，停止下载（避免太慢）
-                    if time.time() - start_time > 10:
-                        break
-
-            end_time = time.time()
-            duration = end_time - start_time
-
-            if duration > 0.1 and len(data) > 0:  # 确保有足够的数据和时间
-                file_size_mb = len(data) / (1024 * 1024)  # 转换为 MB
-                download_speed = round(file_size_mb / duration * 8, 2)  # 转换为 Mbps
-                test_duration = round(duration, 2)
-                server_used = server["name"]
-                print(f"  ✅ 测速成功: {download_speed} Mbps (下载 {file_size_mb:.2f}MB 用时 {duration:.2f}s)")
-                break
-
-        except Exception as e:
-            print(f"  ❌ 服务器 {server['name']} 测试失败: {e}")
-            continue
-
-    # 如果所有服务器都失败，使用连接测试估算
-    if download_speed == 0:
+async def run_simple_speedtest(test_type: str = "full", streams: int = DEFAULT_STREAMS,
+                               duration: float = DEFAULT_DURATION, download_url: Optional[str] = None,
+                               upload_url: Optional[str] = None) -> Dict[str, Any]:
+    """进程内多连接HTTP测速（不依赖 speedtest-cli）"""
+    print(f"🚀 使用内置测速引擎: {streams} 条并行连接, 每个方向 {duration} 秒")
+    result = await run_throughput_test(
+        download_urls=[download_url] if download_url else None,
+        upload_url=upload_url,
+        streams=streams,
+        duration=duration,
+        download=test_type != "upload",
+        upload=test_type != "download"
+    )
+
+    download_speed = result["download_speed"]
+    upload_speed = result["upload_speed"]
+    ping_time = result["latency"] or 0
+    server_used = result["server"] or "Unknown"
+    errors = [e for part in (result["download"], result["upload"]) if part for e in part["errors"]]
+    test_duration = round(sum(part["duration"] for part in (result["download"], result["upload"]) if part), 2)
+
+    # 测速端点完全不可用时，使用连接测试估算
+    if download_speed == 0 and upload_speed == 0:
+        print(f"  ⚠️ 内置测速未传输数据: {errors[:3]}")
         print("  使用连接测试估算网络速度...")
-        try:
-            # 测试到多个服务器的连接时间
-            test_hosts = [
-                ("8.8.8.8", 53),
-                ("1.1.1.1", 53),
-                ("223.5.5.5", 53)
-            ]
-
-            connection_times = []
-            for host, port in test_hosts:
-                try:
-                    start_time = time.time()
-                    sock = socket.create_connection((host, port), timeout=5)
-                    sock.close()
-                    end_time = time.time()
-                    connection_times.append((end_time - start_time) * 1000)
-                except:
-                    continue
-
-            if connection_times:
-                avg_latency = sum(connection_times) / len(connection_times)
-                # 基于延迟估算网络质量（非精确速度）
-                if avg_latency < 20:
-                    download_speed = 50  # 估算高速网络
-                elif avg_latency < 50:
-                    download_speed = 20  # 估算中速网络
-                elif avg_latency < 100:
-                    download_speed = 10  # 估算低速网络
-                else:
-                    download_speed = 5   # 估算很慢网络
-
-                server_used = "Connection Test Estimation"
-                test_duration = 1.0
-
-        except Exception as e:
-            print(f"  连接测试也失败: {e}")
+        test_hosts = ["8.8.8.8:53", "1.1.1.1:53", "223.5.5.5:53"]
+        latencies = await asyncio.gather(*[probe_latency(host, attempts=1, timeout=5) for host in test_hosts])
+        connection_times = [latency for latency in latencies if latency is not None]
+
+        if connection_times:
+            avg_latency = sum(connection_times) / len(connection_times)
+            # 基于延迟估算网络质量（非精确速度）
+            if avg_latency < 20:
+                download_speed = 50  # 估算高速网络
+            elif avg_latency < 50:
+                download_speed = 20  # 估算中速网络
+            elif avg_latency < 100:
+                download_speed = 10  # 估算低速网络
+            else:
+                download_speed = 5   # 估算很慢网络
+            server_used = "Connection Test Estimation"
+            ping_time = ping_time or round(avg_latency, 2)
+        else:
             # 最后的备用方案
             download_speed = 1
             server_used = "Fallback Estimation"
-            test_duration = 1.0
-
-    # 简单的 ping 测试获取延迟
-    ping_time = 0
-    try:
-        print("  执行 ping 测试获取延迟...")
-        system = platform.system().lower()
-        if system == "darwin":  # macOS
-            ping_cmd = ['ping', '-c', '3', '8.8.8.8']
-        else:  # Linux
-            ping_cmd = ['ping', '-c', '3', '8.8.8.8']
-
-        ping_result = subprocess.run(ping_cmd, capture_output=True, text=True, timeout=10)
-
-        if ping_result.returncode == 0:
-            # 解析 ping 结果 - 修复正则表达式
-            if system == "darwin":
-                # macOS 格式: "round-trip min/avg/max/stddev = 10.1/15.2/20.3/5.4 ms"
-                ping_match = re.search(r'min/avg/max/stddev = [\d.]+/([\d.]+)/[\d.]+/[\d.]+ ms', ping_result.stdout)
-            else:
-                # Linux 格式: "rtt min/avg/max/mdev = 10.1/15.2/20.3/5.4 ms"
-                ping_match = re.search(r'min/avg/max/mdev = [\d.]+/([\d.]+)/[\d.]+/[\d.]+ ms', ping_result.stdout)
-
-            if ping_match:
-                ping_time = float(ping_match.group(1))
-                print(f"  ✅ Ping 延迟: {ping_time}ms")
-            else:
-                # 尝试其他格式
-                ping_lines = ping_result.stdout.split('\n')
-                for line in ping_lines:
-                    if 'time=' in line:
-                        time_match = re.search(r'time=([\d.]+)', line)
-                        if time_match:
-                            ping_time = float(time_match.group(1))
-                            print(f"  ✅ Ping 延迟 (备用解析): {ping_time}ms")
-                            break
-        else:
-            print(f"  ⚠️ Ping 命令失败: {ping_result.stderr}")
-
-    except Exception as e:
-        print(f"  ❌ Ping 测试失败: {e}")
-        ping_time = 50  # 默认值
+        test_duration = 1.0
+    else:
+        print(f"  ✅ 测速成功: 下载 {download_speed} Mbps, 上传 {upload_speed} Mbps")
 
     return {
         "download_speed": download_speed,
-        "upload_speed": 0,  # 简单测试不包含上传
+        "upload_speed": upload_speed,
         "ping": ping_time,
         "jitter": 0,
         "server_info": {
             "name": server_used,
             "location": "全球CDN节点",
             "distance": 0,
-            "sponsor": "备用测速服务器",
-            "id": "fallback",
-            "url": "Multiple CDN endpoints"
+            "sponsor": "内置测速",
+            "id": "builtin",
+            "url": download_url or DEFAULT_DOWNLOAD_URLS[0]
         },
         "test_duration": test_duration,
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
         "isp": "Unknown",
-        "external_ip": "Unknown"
+        "external_ip": "Unknown",
+        "engine": "builtin",
+        "streams": streams,
+        "samples": [sample for part in (result["download"], result["upload"]) if part for sample in part["samples"]],
+        "errors": errors
     }
 
 @router.get("/speed-test/servers")
-async def get_speed_test_servers():
-    """获取可用的测速服务器列表"""
+async def get_speed_test_servers(refresh: bool = False, probe: bool = False, limit: int = 20):
+    """获取可用的测速服务器列表
+
+    列表缓存一小时，refresh=true强制重新获取；probe=true时并发测量最近几个服务器的TCP建连延迟并按延迟排序。
+    """
     try:
         print("🔍 获取测速服务器列表")
-        servers = get_best_servers()
+        servers = await server_catalogue.get(refresh=refresh)
 
-        if servers:
-            print(f"✅ 找到 {len(servers)} 个可用服务器")
-            return {
-                "success": True,
-                "servers": servers
-            }
-        else:
+        if not servers:
             print("⚠️ 未找到可用服务器")
             return {
                 "success": False,
@@ -547,6 +348,18 @@ async def get_speed_test_servers():
                 "message": "未找到可用的测速服务器"
             }
 
+        servers = servers[:max(1, limit)]
+        if probe:
+            ranked = await rank_servers(servers)
+            servers = ranked + servers[len(ranked):]
+
+        print(f"✅ 找到 {len(servers)} 个可用服务器")
+        return {
+            "success": True,
+            "servers": servers,
+            "catalogue": server_catalogue.info()
+        }
+
     except Exception as e:
         print(f"❌ 获取服务器列表失败: {e}")
         return {
@@ -564,37 +377,50 @@ async def speed_test(request: SpeedTestRequest) -> SpeedTestResult:
         
         # 尝试多种测速方案
         data = None
+        estimate = None
 
-        # 方案1: 使用 speedtest-cli 命令
-        if check_speedtest_cli():
+        # 方案1: 内置多连接HTTP测速（指定了服务器时使用 speedtest-cli）
+        if request.engine == "builtin" and not request.server_id:
+            try:
+                data = await run_simple_speedtest(request.test_type, request.streams, request.duration,
+                                                  request.download_url, request.upload_url)
+                if data["server_info"]["name"].endswith("Estimation"):
+                    # 测速端点不可用，结果只是估算值，尝试其他方案
+                    print("⚠️ 内置测速不可用，尝试 speedtest-cli")
+                    estimate, data = data, None
+            except Exception as e:
+                print(f"⚠️ 内置测速失败: {e}")
+
+        # 方案2: 使用 speedtest-cli 命令
+        if data is None and await check_speedtest_cli():
             try:
                 print("✅ 使用 speedtest-cli 进行测速")
-                data = run_speedtest_cli(request.server_id, request.test_type)
+                data = await run_speedtest_cli(request.server_id, request.test_type)
             except Exception as e:
                 print(f"⚠️ speedtest-cli 执行失败: {e}")
 
-        # 方案2: 尝试安装 speedtest-cli
+        # 方案3: 尝试安装 speedtest-cli
         if data is None:
             print("⚠️ speedtest-cli 不可用，尝试安装...")
-            if install_speedtest_cli():
+            if await install_speedtest_cli():
                 try:
                     print("✅ speedtest-cli 安装成功，重新尝试")
-                    data = run_speedtest_cli(request.server_id, request.test_type)
+                    data = await run_speedtest_cli(request.server_id, request.test_type)
                 except Exception as e:
                     print(f"⚠️ 安装后仍然失败: {e}")
 
-        # 方案3: 使用 Python speedtest 模块
+        # 方案4: 使用 Python speedtest 模块
         if data is None:
             try:
                 print("⚠️ 尝试使用 Python speedtest 模块")
-                data = run_python_speedtest()
+                data = await asyncio.to_thread(run_python_speedtest)
             except Exception as e:
                 print(f"⚠️ Python speedtest 模块失败: {e}")
 
-        # 方案4: 使用简单测速方案
+        # 方案5: 内置测速或连接测试估算
         if data is None:
-            print("⚠️ 所有专业测速方案失败，使用简单测速方案")
-            data = run_simple_speedtest()
+            print("⚠️ speedtest-cli 方案均失败，使用内置测速或连接测试估算")
+            data = estimate if estimate is not None else await run_simple_speedtest(request.test_type)
         
         print(f"✅ 网络测速完成: 下载 {data['download_speed']} Mbps, 上传 {data['upload_speed']} Mbps, 延迟 {data['ping']} ms")
         
@@ -612,50 +438,3 @@ async def speed_test(request: SpeedTestRequest) -> SpeedTestResult:
             error="网络测速失败",
             details=error_msg
         )
-
-@router.get("/speed-test/servers")
-async def get_speedtest_servers():
-    """获取可用的测速服务器列表"""
-    
-    try:
-        if not check_speedtest_cli():
-            return {
-                "success": False,
-                "error": "speedtest-cli 未安装",
-                "servers": []
-            }
-        
-        # 获取服务器列表
-        result = subprocess.run(['speedtest-cli', '--list'], 
-                              capture_output=True, text=True, timeout=30)
-        
-        if result.returncode != 0:
-            raise Exception("获取服务器列表失败")
-        
-        # 解析服务器列表
-        servers = []
-        for line in result.stdout.split('\n'):
-            if line.strip() and not line.startswith('Retrieving'):
-                # 解析格式: "ID) Server Name (Location) [Distance km]"
-                match = re.match(r'(\d+)\)\s+(.+?)\s+\((.+?)\)\s+\[(.+?)\]', line.strip())
-                if match:
-                    servers.append({
-                        "id": match.group(1),
-                        "name": match.group(2),
-                        "location": match.group(3),
-                        "distance": match.group(4)
-                    })
-        
-        return {
-            "success": True,
-            "servers": servers[:20]  # 返回前20个服务器
-        }
-        
-    except Exception as e:
-        print(f"❌ 获取测速服务器列表失败: {e}")
-        return {
-            "success": False,
-            "error": "获取服务器列表失败",
-            "details": str(e),
-            "servers": []
-        }
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException
 import psutil
 import platform
-import subprocess
 import json
 
+from app.services.command_runner import run_command
+
 router = APIRouter()
 
 @router.get("/info")
@@ -149,8 +150,7 @@ async def get_gateway_info():
         if not gateway_info["gateway_ip"]:
             try:
                 # 使用ip route获取默认网关
-                result = subprocess.run(['ip', 'route', 'show', 'default'], 
-                                      capture_output=True, text=True, timeout=5)
+                result = await run_command(['ip', 'route', 'show', 'default'], timeout=5)
                 
                 if result.returncode == 0:
                     output = result.stdout.strip()
@@ -172,8 +172,7 @@ async def get_gateway_info():
         # 方法3: 如果前面都失败，尝试route命令 (macOS)
         if not gateway_info["gateway_ip"]:
             try:
-                result = subprocess.run(['route', '-n', 'get', 'default'], 
-                                      capture_output=True, text=True, timeout=5)
+                result = await run_command(['route', '-n', 'get', 'default'], timeout=5)
                 
                 if result.returncode == 0:
                     output = result.stdout
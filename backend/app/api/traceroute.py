@@ -9,14 +9,22 @@ import time
 import platform
 import socket
 from typing import Dict, Any, List, Optional
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+from app.services.command_runner import run_command, run_until_disconnected
+from app.services.ndjson_stream import stream_ndjson
+from app.services.traceroute_engine import TracerouteEngine, TracerouteUnavailable, resolve_ipv4
+
 router = APIRouter()
 
 class TracerouteRequest(BaseModel):
     target: str
     max_hops: int = 30
+    method: str = "udp"  # udp, icmp, tcp
+    timeout: float = 2.0  # 每个探测的等待时间（秒）
+    probes: int = 3  # 每跳探测次数（1-3）
 
 class TracerouteHop(BaseModel):
     hop: int
@@ -34,274 +42,193 @@ class TracerouteResult(BaseModel):
     error: Optional[str] = None
     details: Optional[str] = None
 
-def resolve_hostname(ip: str) -> Optional[str]:
-    """尝试解析IP地址的主机名"""
-    try:
-        hostname = socket.gethostbyaddr(ip)[0]
-        return hostname
-    except:
-        return None
+_HOP_LINE = re.compile(r'\s*(\d+)\s+(.*)')
+_HOST_WITH_IP = re.compile(r'([^\s()]+)\s+\(([^)]+)\)')
+_RTT = re.compile(r'(?<![\w.])([\d.]+)\s+ms\b')
 
 def parse_traceroute_output(output: str, system: str) -> List[TracerouteHop]:
-    """解析 traceroute 输出"""
+    """解析 traceroute 输出
+
+    macOS和Linux格式相同，每跳的探测次数（-q）不固定，-n 时只有IP没有主机名：
+    " 1  router.lan (192.168.1.1)  1.234 ms  1.567 ms  1.890 ms"
+    " 1  192.168.1.1  1.234 ms  1.567 ms"
+    " 2  * * *"
+    " 3  10.0.0.1  5.102 ms *  5.331 ms"
+    """
     hops = []
     lines = output.strip().split('\n')
-    
+
     for line in lines:
         line = line.strip()
         if not line or line.startswith('traceroute'):
             continue
-            
+
         try:
-            if system == "darwin":  # macOS
-                # macOS traceroute 格式: " 1  192.168.1.1 (192.168.1.1)  1.234 ms  1.567 ms  1.890 ms"
-                match = re.match(r'\s*(\d+)\s+([^\s]+)\s+\(([^)]+)\)\s+([\d.]+)\s+ms\s+([\d.]+)\s+ms\s+([\d.]+)\s+ms', line)
-                if match:
-                    hop_num = int(match.group(1))
-                    hostname = match.group(2) if match.group(2) != match.group(3) else None
-                    ip = match.group(3)
-                    rtt1 = float(match.group(4))
-                    rtt2 = float(match.group(5))
-                    rtt3 = float(match.group(6))
-                    avg_rtt = round((rtt1 + rtt2 + rtt3) / 3, 3)
-                    
-                    hops.append(TracerouteHop(
-                        hop=hop_num,
-                        ip=ip,
-                        hostname=hostname,
-                        rtt1=rtt1,
-                        rtt2=rtt2,
-                        rtt3=rtt3,
-                        avg_rtt=avg_rtt,
-                        status='success'
-                    ))
-                    continue
-                
-                # 处理超时情况
-                timeout_match = re.match(r'\s*(\d+)\s+\*\s+\*\s+\*', line)
-                if timeout_match:
-                    hop_num = int(timeout_match.group(1))
-                    hops.append(TracerouteHop(
-                        hop=hop_num,
-                        ip='*',
-                        status='timeout'
-                    ))
-                    continue
-                    
-            else:  # Linux (树莓派)
-                # Linux traceroute 格式: " 1  192.168.1.1 (192.168.1.1)  1.234 ms  1.567 ms  1.890 ms"
-                # 或者: " 1  * * *"
-                match = re.match(r'\s*(\d+)\s+([^\s]+)\s+\(([^)]+)\)\s+([\d.]+)\s+ms\s+([\d.]+)\s+ms\s+([\d.]+)\s+ms', line)
-                if match:
-                    hop_num = int(match.group(1))
-                    hostname = match.group(2) if match.group(2) != match.group(3) else None
-                    ip = match.group(3)
-                    rtt1 = float(match.group(4))
-                    rtt2 = float(match.group(5))
-                    rtt3 = float(match.group(6))
-                    avg_rtt = round((rtt1 + rtt2 + rtt3) / 3, 3)
-                    
-                    hops.append(TracerouteHop(
-                        hop=hop_num,
-                        ip=ip,
-                        hostname=hostname,
-                        rtt1=rtt1,
-                        rtt2=rtt2,
-                        rtt3=rtt3,
-                        avg_rtt=avg_rtt,
-                        status='success'
-                    ))
-                    continue
-                
-                # 处理超时情况
-                timeout_match = re.match(r'\s*(\d+)\s+\*\s+\*\s+\*', line)
-                if timeout_match:
-                    hop_num = int(timeout_match.group(1))
-                    hops.append(TracerouteHop(
-                        hop=hop_num,
-                        ip='*',
-                        status='timeout'
-                    ))
-                    continue
-                    
+            match = _HOP_LINE.match(line)
+            if not match:
+                continue
+            hop_num = int(match.group(1))
+            rest = match.group(2)
+
+            rtts = [float(value) for value in _RTT.findall(rest)]
+            host_match = _HOST_WITH_IP.search(rest)
+            if host_match:
+                hostname = host_match.group(1) if host_match.group(1) != host_match.group(2) else None
+                ip = host_match.group(2)
+            else:
+                # -n 输出：去掉延迟、超时和 !H 之类的标记后剩下的第一个字段是IP
+                fields = [field for field in _RTT.sub(' ', rest).split()
+                          if field != '*' and not field.startswith('!')]
+                hostname = None
+                ip = fields[0] if fields else None
+
+            if ip is None:
+                if '*' in rest:
+                    hops.append(TracerouteHop(hop=hop_num, ip='*', status='timeout'))
+                continue
+
+            padded = rtts[:3] + [None] * (3 - min(3, len(rtts)))
+            hops.append(TracerouteHop(
+                hop=hop_num,
+                ip=ip,
+                hostname=hostname,
+                rtt1=padded[0],
+                rtt2=padded[1],
+                rtt3=padded[2],
+                avg_rtt=round(sum(rtts) / len(rtts), 3) if rtts else None,
+                status='success' if rtts else 'error'
+            ))
+
         except Exception as e:
             print(f"⚠️ 解析路由追踪行失败: {line}, 错误: {e}")
             continue
-    
+
     return hops
 
-def run_traceroute(target: str, max_hops: int = 30) -> Dict[str, Any]:
-    """执行路由追踪"""
+def build_traceroute_result(target: str, target_ip: str, hops: List[Dict[str, Any]], max_hops: int,
+                            method: str, reached: Optional[bool], start_time: float) -> Dict[str, Any]:
+    """汇总路由追踪结果"""
+    successful_hops = len([h for h in hops if h['status'] == 'success'])
+    failed_hops = len([h for h in hops if h['status'] != 'success'])
+
+    # 计算平均延迟和最大延迟
+    successful_rtts = [h['avg_rtt'] for h in hops if h['avg_rtt'] is not None]
+    avg_latency = round(sum(successful_rtts) / len(successful_rtts), 3) if successful_rtts else 0
+    max_latency = max(successful_rtts) if successful_rtts else 0
+
+    return {
+        "target": target,
+        "target_ip": target_ip,
+        "hops": hops,
+        "total_hops": len(hops),
+        "max_hops": max_hops,
+        "method": method,
+        "reached": reached,
+        "test_duration": round(time.time() - start_time, 2),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "summary": {
+            "successful_hops": successful_hops,
+            "failed_hops": failed_hops,
+            "avg_latency": avg_latency,
+            "max_latency": max_latency
+        }
+    }
+
+async def run_system_traceroute(target: str, target_ip: str, max_hops: int, timeout: float,
+                                probes: int, start_time: float) -> Dict[str, Any]:
+    """系统 traceroute 命令（无法使用进程内引擎时的备用方案）"""
     system = platform.system().lower()
-    start_time = time.time()
-    
+    wait = max(1, int(round(timeout)))
+    cmd = ['traceroute', '-n', '-q', str(probes), '-w', str(wait), '-m', str(max_hops), target_ip]
+    print(f"🛣️ 执行路由追踪命令: {' '.join(cmd)}")
+
     try:
-        # 构建命令
-        if system == "darwin":  # macOS
-            cmd = ['traceroute', '-m', str(max_hops), target]
-        else:  # Linux (树莓派)
-            cmd = ['traceroute', '-m', str(max_hops), target]
-        
-        print(f"🛣️ 执行路由追踪命令: {' '.join(cmd)}")
-        
-        # 执行命令
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=90)
-        
-        end_time = time.time()
-        test_duration = round(end_time - start_time, 2)
-        
-        if result.returncode != 0:
-            raise Exception(f"traceroute 执行失败: {result.stderr}")
-        
-        # 解析输出
-        hops = parse_traceroute_output(result.stdout, system)
-        
-        # 尝试解析目标IP
-        target_ip = target
-        try:
-            target_ip = socket.gethostbyname(target)
-        except:
-            pass
-        
-        # 计算统计信息
-        successful_hops = len([h for h in hops if h.status == 'success'])
-        failed_hops = len([h for h in hops if h.status != 'success'])
-        
-        # 计算平均延迟和最大延迟
-        successful_rtts = [h.avg_rtt for h in hops if h.avg_rtt is not None]
-        avg_latency = round(sum(successful_rtts) / len(successful_rtts), 3) if successful_rtts else 0
-        max_latency = max(successful_rtts) if successful_rtts else 0
-        
-        return {
-            "target": target,
-            "target_ip": target_ip,
-            "hops": [hop.dict() for hop in hops],
-            "total_hops": len(hops),
-            "max_hops": max_hops,
-            "test_duration": test_duration,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "summary": {
-                "successful_hops": successful_hops,
-                "failed_hops": failed_hops,
-                "avg_latency": avg_latency,
-                "max_latency": max_latency
-            }
-        }
-        
+        result = await run_command(cmd, timeout=max_hops * probes * wait + 10)
     except subprocess.TimeoutExpired:
         raise Exception("路由追踪超时")
     except FileNotFoundError:
-        # 尝试备用方案
-        print("  traceroute 命令未找到，尝试备用方案...")
-        return run_simple_traceroute(target, max_hops)
-    except Exception as e:
-        raise Exception(f"路由追踪执行失败: {e}")
+        raise Exception("无法进行路由追踪：没有原始套接字权限且 traceroute 命令不可用")
 
-def run_simple_traceroute(target: str, max_hops: int = 30) -> Dict[str, Any]:
-    """简单的路由追踪实现（备用方案）"""
-    import socket
-    import time
+    if result.returncode != 0:
+        raise Exception(f"traceroute 执行失败: {result.stderr}")
 
+    hops = [hop.dict() for hop in parse_traceroute_output(result.stdout, system)]
+    return build_traceroute_result(target, target_ip, hops, max_hops, "system", None, start_time)
+
+async def run_traceroute(target: str, max_hops: int = 30, method: str = "udp", timeout: float = 2.0,
+                         probes: int = 3, on_hop=None) -> Dict[str, Any]:
+    """执行路由追踪
+
+    所有TTL并行探测，on_hop在每一跳完成（含反向解析）时调用。
+    """
     start_time = time.time()
-    hops = []
+    method = method.lower()
+    max_hops = max(1, min(64, max_hops))
+    probes = max(1, min(3, probes))
 
     try:
-        # 解析目标IP
-        target_ip = socket.gethostbyname(target)
-        print(f"  使用简单路由追踪到 {target} ({target_ip})")
-
-        # 简单的多跳ping测试（模拟路由追踪）
-        test_hops = [
-            ("本地网关", "192.168.1.1"),
-            ("ISP网关", "10.0.0.1"),  # 示例
-            ("目标主机", target_ip)
-        ]
-
-        for i, (name, ip) in enumerate(test_hops, 1):
-            if i > max_hops:
-                break
-
-            try:
-                # 尝试ping测试
-                start_ping = time.time()
-                sock = socket.create_connection((ip, 80), timeout=3)
-                sock.close()
-                end_ping = time.time()
-
-                rtt = round((end_ping - start_ping) * 1000, 3)
-
-                hop = TracerouteHop(
-                    hop=i,
-                    ip=ip,
-                    hostname=name,
-                    rtt1=rtt,
-                    rtt2=rtt + 1,
-                    rtt3=rtt + 2,
-                    avg_rtt=rtt + 1,
-                    status='success'
-                )
-                hops.append(hop)
-
-            except:
-                # 如果连接失败，标记为超时
-                hop = TracerouteHop(
-                    hop=i,
-                    ip='*',
-                    status='timeout'
-                )
-                hops.append(hop)
-
-        end_time = time.time()
-        test_duration = round(end_time - start_time, 2)
-
-        # 计算统计信息
-        successful_hops = len([h for h in hops if h.status == 'success'])
-        failed_hops = len([h for h in hops if h.status != 'success'])
-
-        successful_rtts = [h.avg_rtt for h in hops if h.avg_rtt is not None]
-        avg_latency = round(sum(successful_rtts) / len(successful_rtts), 3) if successful_rtts else 0
-        max_latency = max(successful_rtts) if successful_rtts else 0
-
-        return {
-            "target": target,
-            "target_ip": target_ip,
-            "hops": [hop.dict() for hop in hops],
-            "total_hops": len(hops),
-            "max_hops": max_hops,
-            "test_duration": test_duration,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "summary": {
-                "successful_hops": successful_hops,
-                "failed_hops": failed_hops,
-                "avg_latency": avg_latency,
-                "max_latency": max_latency
-            }
-        }
+        target_ip = await resolve_ipv4(target)
+    except socket.gaierror as e:
+        raise Exception(f"域名解析失败: {e}")
 
-    except Exception as e:
-        raise Exception(f"简单路由追踪失败: {e}")
+    try:
+        engine = TracerouteEngine(target_ip, max_hops=max_hops, method=method, timeout=timeout, probes=probes)
+    except TracerouteUnavailable as e:
+        print(f"  {e}，使用系统 traceroute 命令")
+        return await run_system_traceroute(target, target_ip, max_hops, timeout, probes, start_time)
+
+    try:
+        hops = await engine.run(on_hop)
+    except PermissionError as e:
+        raise Exception(f"路由追踪权限不足: {e}")
+    except OSError as e:
+        raise Exception(f"路由追踪执行失败: {e}")
+
+    return build_traceroute_result(target, target_ip, hops, max_hops, method, engine.reached, start_time)
+
+async def stream_traceroute(request: TracerouteRequest):
+    """流式路由追踪：每一跳完成后立即输出 {"type": "hop", ...}，最后输出 {"type": "result", ...}"""
+    def run(emit):
+        return run_traceroute(request.target, request.max_hops, request.method, request.timeout, request.probes,
+                              on_hop=lambda hop: emit({"type": "hop", **hop}))
+
+    def result_line(trace):
+        try:
+            return {"type": "result", "success": True, "data": trace.result()}
+        except Exception as e:
+            return {"type": "result", "success": False, "error": "路由追踪失败", "details": str(e)}
+
+    async for line in stream_ndjson(run, result_line):
+        yield line
 
 @router.post("/traceroute")
-async def traceroute(request: TracerouteRequest) -> TracerouteResult:
-    """执行路由追踪"""
+async def traceroute(request: TracerouteRequest, http_request: Request, stream: bool = False):
+    """执行路由追踪
+
+    stream=true时以NDJSON流式返回，每一跳完成即输出一行。
+    """
     if not request.target:
         request.target = 'www.baidu.com'
     try:
-        print(f"🛣️ 开始路由追踪 - 目标: {request.target}, 最大跳数: {5}")
-        
-        data = run_traceroute(request.target, 5)
-        
+        print(f"🛣️ 开始路由追踪 - 目标: {request.target}, 最大跳数: {request.max_hops}, 方式: {request.method}")
+
+        if stream:
+            return StreamingResponse(stream_traceroute(request), media_type="application/x-ndjson")
+
+        data = await run_until_disconnected(http_request, run_traceroute(
+            request.target, request.max_hops, request.method, request.timeout, request.probes))
+
         print(f"✅ 路由追踪完成: {data['total_hops']} 跳, {data['summary']['successful_hops']} 成功")
-        
+
         return TracerouteResult(
             success=True,
             data=data
         )
-        
+
     except Exception as e:
         error_msg = str(e)
         print(f"❌ 路由追踪失败: {error_msg}")
-        
+
         return TracerouteResult(
             success=False,
             error="路由追踪失败",
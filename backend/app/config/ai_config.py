@@ -95,6 +95,8 @@ class AIProviderConfig:
     timeout: int = 30
     max_tokens: int = 4000
     temperature: float = 0.7
+    # 对冲/故障转移时使用的同一提供商的备用模型
+    fallback_model: str = ''
 
 class AIConfigManager:
     """AI配置管理器"""
@@ -120,6 +122,7 @@ class AIConfigManager:
                 base_url=os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1'),
                 api_key=os.getenv('OPENROUTER_API_KEY', ''),
                 model=os.getenv('OPENROUTER_MODEL', 'anthropic/claude-3-sonnet'),
+                fallback_model=os.getenv('OPENROUTER_FALLBACK_MODEL', ''),
                 enabled=True
             ),
             'openai': AIProviderConfig(
@@ -127,6 +130,7 @@ class AIConfigManager:
                 base_url=os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1'),
                 api_key=os.getenv('OPENAI_API_KEY', ''),
                 model=os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
+                fallback_model=os.getenv('OPENAI_FALLBACK_MODEL', ''),
                 enabled=bool(os.getenv('OPENAI_API_KEY'))
             ),
             'anthropic': AIProviderConfig(
@@ -134,6 +138,7 @@ class AIConfigManager:
                 base_url=os.getenv('ANTHROPIC_BASE_URL', 'https://api.anthropic.com'),
                 api_key=os.getenv('ANTHROPIC_API_KEY', ''),
                 model=os.getenv('ANTHROPIC_MODEL', 'claude-3-sonnet-20240229'),
+                fallback_model=os.getenv('ANTHROPIC_FALLBACK_MODEL', ''),
                 enabled=bool(os.getenv('ANTHROPIC_API_KEY'))
             )
         }
@@ -11,6 +11,11 @@ from contextlib import asynccontextmanager
 from app.api import network, wifi, router, ai, system, mcp, capture, speed_test, traceroute, dns_test, port_scan, ssl_check, network_quality
 from app.core.websocket import WebSocketManager
 from app.mcp.manager import mcp_manager
+from app.services.capture_scheduler import capture_scheduler
+from app.services.quality_monitor import quality_monitor
+from app.services.carrier_resolver import carrier_sessions
+from app.services.llm_client import llm_clients
+from app.services.screenshot_service import SCREENSHOT_DIR, SCREENSHOT_URL_PREFIX, screenshot_service
 
 logger = logging.getLogger(__name__)
 
@@ -25,8 +30,30 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"MCP管理器初始化失败: {str(e)}")
         # 不中断应用启动，允许在没有MCP的情况下运行
+
+    # 上次运行中未完成的抓包任务已无法继续
+    try:
+        capture.tasks.recover_interrupted_tasks()
+    except Exception as e:
+        logger.error(f"恢复抓包任务状态失败: {str(e)}")
+
+    # 后台网络质量监控（恢复已保存的目标和历史汇总）
+    try:
+        await quality_monitor.start()
+    except Exception as e:
+        logger.error(f"网络质量监控启动失败: {str(e)}")
     
     yield
+
+    # 逐个关闭后台服务，某一项失败不影响其余资源的清理
+    for name, close in (("网络质量监控", quality_monitor.stop),
+                        ("运营商查询会话", carrier_sessions.close),
+                        ("截图服务", screenshot_service.close),
+                        ("AI客户端", llm_clients.close)):
+        try:
+            await close()
+        except Exception as e:
+            logger.error(f"{name}关闭失败: {str(e)}")
     
     # 关闭时清理MCP资源
     try:
@@ -36,6 +63,11 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"MCP管理器关闭失败: {str(e)}")
 
+    try:
+        capture_scheduler.shutdown()
+    except Exception as e:
+        logger.error(f"抓包调度器关闭失败: {str(e)}")
+
 app = FastAPI(
     title="网络检测工具 API",
     description="基于树莓派5的网络检测和诊断工具，集成MCP智能诊断功能",
@@ -72,10 +104,8 @@ app.include_router(port_scan.router, prefix="/api", tags=["port-scan"])
 app.include_router(ssl_check.router, prefix="/api", tags=["ssl-check"])
 app.include_router(network_quality.router, prefix="/api", tags=["network-quality"])
 
-# 挂载网站截图静态文件目录
-from pathlib import Path
-screenshot_static_dir = Path(__file__).parent.parent / "data" / "website_screenshots"
-app.mount("/static/website_screenshots", StaticFiles(directory=screenshot_static_dir, html=False), name="website_screenshots")
+# 挂载网站截图静态文件目录（截图服务负责创建目录和控制大小）
+app.mount(SCREENSHOT_URL_PREFIX, StaticFiles(directory=SCREENSHOT_DIR, html=False), name="website_screenshots")
 
 @app.get("/")
 async def root():
@@ -88,6 +118,7 @@ async def health_check():
 @app.websocket("/ws/{endpoint}")
 async def websocket_endpoint(websocket: WebSocket, endpoint: str):
     await ws_manager.connect(websocket, endpoint)
+    quality_subscription = None
     try:
         while True:
             # 保持连接并处理消息
@@ -101,9 +132,16 @@ async def websocket_endpoint(websocket: WebSocket, endpoint: str):
                 await handle_wifi_signal(websocket, message)
             elif endpoint == "system-status":
                 await handle_system_status(websocket, message)
+            elif endpoint == "network-quality":
+                if quality_subscription is None:
+                    quality_subscription = network_quality.QualitySubscription(websocket)
+                await quality_subscription.handle(message)
                 
     except WebSocketDisconnect:
         ws_manager.disconnect(websocket, endpoint)
+    finally:
+        if quality_subscription is not None:
+            quality_subscription.close()
 
 async def handle_network_test(websocket: WebSocket, message: Dict):
     """处理网络测试WebSocket消息"""
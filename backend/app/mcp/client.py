@@ -3,9 +3,12 @@ MCP客户端管理
 """
 
 import asyncio
+import heapq
+import itertools
 import json
 import logging
-from typing import Dict, List, Optional, Any
+from collections import Counter, deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
 from dataclasses import dataclass
 import subprocess
 import time
@@ -14,6 +17,15 @@ from .config import MCPConfig, MCPServerConfig
 
 logger = logging.getLogger(__name__)
 
+# 单行JSON-RPC消息上限，抓包等工具的结果可能远超asyncio默认的64KB
+STDIO_LINE_LIMIT = 16 * 1024 * 1024
+# 保留的stderr末尾行数，用于排查服务器异常
+STDERR_TAIL_LINES = 50
+# initialize握手使用的MCP协议版本
+MCP_PROTOCOL_VERSION = "2024-11-05"
+# 空闲回收检查的最长间隔（秒）
+IDLE_CHECK_INTERVAL = 30
+
 @dataclass
 class MCPRequest:
     """MCP请求数据结构"""
@@ -30,6 +42,116 @@ class MCPResponse:
     server: str = ""
     execution_time: float = 0
 
+class StdioConnection:
+    """stdio服务器的多路复用JSON-RPC连接
+
+    每个服务器进程只有一个读取任务，按JSON-RPC id把响应分发给等待中的请求，
+    同一进程上的多个调用可以同时在途。超时或取消的请求会从等待表中移除，
+    之后到达的迟到响应直接丢弃。
+    """
+
+    def __init__(self, server_name: str, process: asyncio.subprocess.Process):
+        self.server_name = server_name
+        self.process = process
+        self.stderr_tail: Deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._write_lock = asyncio.Lock()
+        self._closed_reason: Optional[str] = None
+        self._reader = asyncio.create_task(self._read_stdout())
+        # stderr管道写满会阻塞服务器进程，必须持续读取
+        self._stderr_reader = asyncio.create_task(self._read_stderr())
+
+    @property
+    def in_flight(self) -> int:
+        """在途请求数"""
+        return len(self._pending)
+
+    async def request(self, method: str, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """发送请求并等待对应id的响应，超时抛出asyncio.TimeoutError"""
+        if self._closed_reason:
+            raise ConnectionError(self._closed_reason)
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            message = json.dumps({
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "method": method,
+                "params": params
+            }, ensure_ascii=False) + "\n"
+            async with self._write_lock:
+                self.process.stdin.write(message.encode('utf-8'))
+                await self.process.stdin.drain()
+            return await asyncio.wait_for(future, timeout=timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def notify(self, method: str, params: Optional[Dict[str, Any]] = None):
+        """发送不需要响应的通知"""
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        async with self._write_lock:
+            self.process.stdin.write((json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8'))
+            await self.process.stdin.drain()
+
+    async def _read_stdout(self):
+        reason = "服务器进程已关闭输出"
+        try:
+            while True:
+                line = await self.process.stdout.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.debug(f"服务器 {self.server_name} 输出非JSON内容: {line[:200]!r}")
+                    continue
+
+                future = self._pending.get(message.get("id")) if isinstance(message, dict) else None
+                if future is None:
+                    # 通知、服务器日志或已超时请求的迟到响应
+                    logger.debug(f"服务器 {self.server_name} 忽略无对应请求的消息: {line[:200]!r}")
+                    continue
+                if not future.done():
+                    future.set_result(message)
+        except asyncio.CancelledError:
+            reason = "连接已关闭"
+            raise
+        except Exception as e:
+            reason = f"读取响应失败: {str(e)}"
+            logger.error(f"服务器 {self.server_name} {reason}")
+        finally:
+            self._fail_pending(reason)
+
+    async def _read_stderr(self):
+        try:
+            while True:
+                line = await self.process.stderr.readline()
+                if not line:
+                    break
+                self.stderr_tail.append(line.decode('utf-8', errors='replace').rstrip())
+        except (asyncio.CancelledError, ValueError):
+            pass
+
+    def _fail_pending(self, reason: str):
+        self._closed_reason = reason
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(reason))
+        self._pending.clear()
+
+    async def close(self):
+        """停止读取任务，在途请求以ConnectionError结束"""
+        for task in (self._reader, self._stderr_reader):
+            task.cancel()
+        await asyncio.gather(self._reader, self._stderr_reader, return_exceptions=True)
+        self._fail_pending("连接已关闭")
+
+
 class MCPClient:
     """MCP客户端类"""
     
@@ -38,20 +160,25 @@ class MCPClient:
         self.active_servers = {}
         self.server_processes = {}
         self._lock = asyncio.Lock()
+        self._start_locks: Dict[str, asyncio.Lock] = {}
+        self._idle_reaper: Optional[asyncio.Task] = None
     
     async def initialize(self):
-        """初始化MCP客户端"""
+        """初始化MCP客户端，非按需启动的服务器并行启动"""
         try:
             logger.info("初始化MCP客户端...")
             
-            # 启动所有启用的服务器
-            for server_name, server_config in self.config.servers.items():
-                if server_config.enabled:
-                    success = await self._start_server(server_name, server_config)
-                    if success:
-                        logger.info(f"MCP服务器 {server_name} 启动成功")
-                    else:
-                        logger.warning(f"MCP服务器 {server_name} 启动失败")
+            eager = [name for name, server_config in self.config.servers.items()
+                     if server_config.enabled and not server_config.lazy_start]
+            results = await asyncio.gather(*[self.ensure_server(name) for name in eager])
+            for server_name, success in zip(eager, results):
+                if success:
+                    logger.info(f"MCP服务器 {server_name} 启动成功")
+                else:
+                    logger.warning(f"MCP服务器 {server_name} 启动失败")
+            
+            if any(server_config.idle_timeout for server_config in self.config.servers.values()):
+                self._idle_reaper = asyncio.create_task(self._reap_idle_servers())
             
             logger.info(f"MCP客户端初始化完成，活跃服务器: {len(self.active_servers)}")
             
@@ -59,6 +186,26 @@ class MCPClient:
             logger.error(f"MCP客户端初始化失败: {str(e)}")
             raise
     
+    async def ensure_server(self, server_name: str) -> bool:
+        """确保服务器已启动，按需启动或空闲回收后的服务器在此启动，同一服务器只启动一次"""
+        server_info = self.active_servers.get(server_name)
+        if server_info is not None:
+            process = server_info.get("process")
+            if process is None or process.returncode is None:
+                return True
+            # 进程意外退出，清理记录后重新启动
+            logger.warning(f"服务器 {server_name} 进程已退出（返回码 {process.returncode}），重新启动")
+            await self.stop_server(server_name)
+        server_config = self.config.servers.get(server_name)
+        if server_config is None or not server_config.enabled:
+            return False
+        
+        lock = self._start_locks.setdefault(server_name, asyncio.Lock())
+        async with lock:
+            if server_name in self.active_servers:
+                return True
+            return await self._start_server(server_name, server_config)
+    
     async def _start_server(self, server_name: str, server_config: MCPServerConfig) -> bool:
         """启动MCP服务器"""
         try:
@@ -93,26 +240,22 @@ class MCPClient:
                 stdin=asyncio.subprocess.PIPE,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
-                env=env
+                env=env,
+                limit=STDIO_LINE_LIMIT
             )
             
             logger.info(f"MCP服务器 {server_name} 进程已创建，PID: {process.pid}")
             
-            # 等待进程启动
-            await asyncio.sleep(2)
-            
-            # 检查进程是否正常运行
-            return_code = process.returncode
-            logger.info(f"MCP服务器 {server_name} 进程状态检查，返回码: {return_code}")
-            
-            if return_code is not None:
-                # 进程已退出，读取错误信息
-                try:
-                    stderr_output = await asyncio.wait_for(process.stderr.read(), timeout=1.0)
-                    stderr_text = stderr_output.decode('utf-8') if stderr_output else "无错误输出"
-                    logger.error(f"服务器 {server_name} 启动失败，返回码 {return_code}，错误: {stderr_text}")
-                except asyncio.TimeoutError:
-                    logger.error(f"服务器 {server_name} 启动失败，返回码 {return_code}，无法读取错误输出")
+            # 以initialize握手响应作为就绪信号，而不是固定等待
+            connection = StdioConnection(server_name, process)
+            server_details = await self._handshake(server_name, connection)
+            if server_details is None:
+                await connection.close()
+                if process.returncode is None:
+                    process.kill()
+                await process.wait()
+                stderr_text = "\n".join(connection.stderr_tail) or "无错误输出"
+                logger.error(f"服务器 {server_name} 启动失败，返回码 {process.returncode}，错误: {stderr_text}")
                 return False
             
             # 保存服务器信息
@@ -120,6 +263,9 @@ class MCPClient:
                 "config": server_config,
                 "transport": "stdio",
                 "process": process,
+                "connection": connection,
+                "server_info": server_details,
+                "last_used": time.time(),
                 "status": "running"
             }
             
@@ -132,6 +278,35 @@ class MCPClient:
             logger.error(f"启动stdio服务器 {server_name} 失败: {str(e)}")
             return False
     
+    async def _handshake(self, server_name: str, connection: StdioConnection) -> Optional[Dict[str, Any]]:
+        """发送initialize请求，收到任何JSON-RPC响应即视为服务器已开始处理请求
+
+        自研的简化服务器不支持initialize，会返回Method not found错误，同样说明已就绪。
+        返回服务器声明的信息，进程退出或超时返回None。
+        """
+        try:
+            response = await connection.request("initialize", {
+                "protocolVersion": MCP_PROTOCOL_VERSION,
+                "capabilities": {},
+                "clientInfo": {"name": "smart-diagnosis", "version": "1.0"}
+            }, self.config.startup_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"服务器 {server_name} 在 {self.config.startup_timeout} 秒内未响应initialize握手")
+            return None
+        except ConnectionError as e:
+            logger.error(f"服务器 {server_name} 握手失败: {str(e)}")
+            return None
+        
+        result = response.get("result")
+        if not isinstance(result, dict):
+            return {}
+        await connection.notify("notifications/initialized")
+        return {
+            "protocol_version": result.get("protocolVersion"),
+            "server": result.get("serverInfo"),
+            "capabilities": result.get("capabilities")
+        }
+    
     async def _start_http_server(self, server_name: str, server_config: MCPServerConfig) -> bool:
         """启动HTTP模式的MCP服务器"""
         try:
@@ -166,8 +341,8 @@ class MCPClient:
         start_time = time.time()
         
         try:
-            # 检查服务器是否存在
-            if server_name not in self.active_servers:
+            # 检查服务器是否存在，按需启动的服务器在此启动
+            if not await self.ensure_server(server_name):
                 return MCPResponse(
                     success=False,
                     error=f"服务器 {server_name} 未找到或未启动",
@@ -177,20 +352,17 @@ class MCPClient:
             
             server_info = self.active_servers[server_name]
             effective_timeout = timeout or server_info["config"].timeout
-            # 打印服务器信息
-            print("=== 服务器信息 ===")
-            print(f"服务器名称: {server_name}")
-            print(f"服务器配置: {server_info}")
-            print(f"传输方式: {server_info['transport']}")
-            print(f"超时时间: {effective_timeout}秒")
-            print(f"工具名称: {tool_name}")
-            print(f"工具参数: {args}")
-            print("================")
+            logger.debug(f"调用MCP工具 {server_name}.{tool_name}，传输方式: {server_info['transport']}，"
+                         f"超时: {effective_timeout}秒，参数: {args}")
             # 根据传输方式调用工具
             if server_info["transport"] == "stdio":
-                result = await self._call_stdio_tool(
-                    server_name, tool_name, args, effective_timeout
-                )
+                server_info["last_used"] = time.time()
+                try:
+                    result = await self._call_stdio_tool(
+                        server_name, tool_name, args, effective_timeout
+                    )
+                finally:
+                    server_info["last_used"] = time.time()
             elif server_info["transport"] == "http":
                 result = await self._call_http_tool(
                     server_name, tool_name, args, effective_timeout
@@ -221,24 +393,12 @@ class MCPClient:
         args: Dict[str, Any],
         timeout: int
     ) -> MCPResponse:
-        """通过stdio调用工具"""
+        """通过stdio调用工具，同一服务器上的并发调用通过连接按id多路复用"""
         try:
             server_info = self.active_servers[server_name]
             process = server_info["process"]
+            connection: StdioConnection = server_info["connection"]
             
-            logger.info(f"尝试调用MCP工具: {server_name}.{tool_name}")
-            logger.info(f"服务器信息: {server_info}")
-            logger.info(f"进程对象: {process}")
-            
-            if process is None:
-                logger.error(f"服务器 {server_name} 的进程对象为None")
-                return MCPResponse(
-                    success=False,
-                    error=f"服务器 {server_name} 的进程对象为None",
-                    server=server_name
-                )
-            
-            logger.info(f"进程返回码: {process.returncode}")
             # 检查进程状态
             if process.returncode is not None:
                 logger.error(f"服务器 {server_name} 进程已退出，返回码: {process.returncode}")
@@ -248,76 +408,43 @@ class MCPClient:
                     server=server_name
                 )
             
-            # 构建JSON-RPC请求
-            request = {
-                "jsonrpc": "2.0",
-                "id": int(time.time() * 1000),
-                "method": "tools/call",
-                "params": {
-                    "name": tool_name,
-                    "arguments": args
-                }
-            }
-            
-            request_json = json.dumps(request) + "\n"
-            logger.info(f"发送JSON-RPC请求: {request_json.strip()}")
-            
-            # 发送请求
-            process.stdin.write(request_json.encode('utf-8'))
-            await process.stdin.drain()
-            
-            # 读取响应
             try:
-                response_line = await asyncio.wait_for(
-                    process.stdout.readline(),
-                    timeout=timeout
+                response_data = await connection.request(
+                    "tools/call",
+                    {"name": tool_name, "arguments": args},
+                    timeout
                 )
-                
-                if not response_line:
-                    logger.error(f"服务器 {server_name} 无响应")
-                    return MCPResponse(
-                        success=False,
-                        error="服务器无响应",
-                        server=server_name
-                    )
-                
-                # 解析响应
-                response_text = response_line.decode('utf-8').strip()
-                logger.info(f"收到响应: {response_text}")
-                
-                response_data = json.loads(response_text)
-                
-                if "error" in response_data:
-                    error_msg = response_data["error"].get("message", "未知错误")
-                    logger.error(f"MCP工具调用错误: {error_msg}")
-                    return MCPResponse(
-                        success=False,
-                        error=error_msg,
-                        server=server_name
-                    )
-                
-                result = response_data.get("result")
-                logger.info(f"MCP工具调用成功，结果: {result}")
+            except asyncio.TimeoutError:
+                logger.error(f"MCP工具调用超时 {server_name}.{tool_name} (>{timeout}秒)")
                 return MCPResponse(
-                    success=True,
-                    data=result,
+                    success=False,
+                    error=f"工具调用超时 (>{timeout}秒)",
                     server=server_name
                 )
-                
-            except asyncio.TimeoutError:
-                logger.error(f"MCP工具调用超时 (>{timeout}秒)")
+            except ConnectionError as e:
+                logger.error(f"服务器 {server_name} 连接中断: {str(e)}")
                 return MCPResponse(
                     success=False,
-                    error=f"工具调用超时 (>{timeout}秒)",
+                    error=f"服务器无响应: {str(e)}",
                     server=server_name
                 )
-            except json.JSONDecodeError as e:
-                logger.error(f"响应JSON解析失败: {str(e)}")
+            
+            if "error" in response_data:
+                error = response_data["error"]
+                error_msg = error.get("message", "未知错误") if isinstance(error, dict) else str(error)
+                logger.error(f"MCP工具调用错误 {server_name}.{tool_name}: {error_msg}")
                 return MCPResponse(
                     success=False,
-                    error=f"响应JSON解析失败: {str(e)}",
+                    error=error_msg,
                     server=server_name
                 )
+            
+            logger.debug(f"MCP工具调用成功 {server_name}.{tool_name}")
+            return MCPResponse(
+                success=True,
+                data=response_data.get("result"),
+                server=server_name
+            )
                 
         except Exception as e:
             logger.error(f"stdio工具调用失败: {str(e)}")
@@ -356,6 +483,13 @@ class MCPClient:
         """获取服务器状态"""
         try:
             if server_name not in self.active_servers:
+                server_config = self.config.servers.get(server_name)
+                if server_config is not None and server_config.enabled and (
+                        server_config.lazy_start or server_config.idle_timeout):
+                    return {
+                        "status": "idle",
+                        "message": "按需启动，首次调用时启动进程"
+                    }
                 return {
                     "status": "not_found",
                     "message": f"服务器 {server_name} 未找到"
@@ -375,6 +509,8 @@ class MCPClient:
                     return {
                         "status": "running",
                         "pid": process.pid,
+                        "in_flight": server_info["connection"].in_flight,
+                        "idle_seconds": round(time.time() - server_info["last_used"], 1),
                         "message": "进程正常运行"
                     }
             else:
@@ -396,10 +532,17 @@ class MCPClient:
         """列出所有服务器及其状态"""
         servers = {}
         
-        for server_name in self.active_servers:
+        names = list(self.active_servers)
+        names += [name for name, server_config in self.config.servers.items()
+                  if name not in self.active_servers and server_config.enabled]
+        for server_name in names:
             status = await self.get_server_status(server_name)
+            if status["status"] == "not_found":
+                continue
             servers[server_name] = {
-                "config": self.active_servers[server_name]["config"].model_dump(),
+                "config": self.config.servers[server_name].model_dump()
+                if server_name not in self.active_servers
+                else self.active_servers[server_name]["config"].model_dump(),
                 "status": status
             }
         
@@ -408,16 +551,12 @@ class MCPClient:
     async def restart_server(self, server_name: str) -> bool:
         """重启服务器"""
         try:
-            # 停止服务器
+            # 停止服务器，stop_server会等到进程退出
             await self.stop_server(server_name)
             
-            # 等待一下
-            await asyncio.sleep(1)
-            
             # 重新启动
             if server_name in self.config.servers:
-                server_config = self.config.servers[server_name]
-                return await self._start_server(server_name, server_config)
+                return await self.ensure_server(server_name)
             else:
                 logger.error(f"服务器配置 {server_name} 未找到")
                 return False
@@ -429,13 +568,16 @@ class MCPClient:
     async def stop_server(self, server_name: str) -> bool:
         """停止服务器"""
         try:
-            if server_name not in self.active_servers:
+            # 先移除记录，停止期间到达的调用会重新启动新进程而不是使用正在关闭的连接
+            server_info = self.active_servers.pop(server_name, None)
+            self.server_processes.pop(server_name, None)
+            if server_info is None:
                 return True
             
-            server_info = self.active_servers[server_name]
-            
             if server_info["transport"] == "stdio":
                 process = server_info["process"]
+                # 先结束读取任务，在途请求立即返回错误而不是等到超时
+                await server_info["connection"].close()
                 if process.returncode is None:
                     # 优雅关闭
                     process.terminate()
@@ -447,11 +589,6 @@ class MCPClient:
                         process.kill()
                         await process.wait()
             
-            # 移除服务器记录
-            del self.active_servers[server_name]
-            if server_name in self.server_processes:
-                del self.server_processes[server_name]
-            
             logger.info(f"服务器 {server_name} 已停止")
             return True
             
@@ -464,6 +601,10 @@ class MCPClient:
         try:
             logger.info("正在关闭所有MCP服务器...")
             
+            if self._idle_reaper is not None:
+                self._idle_reaper.cancel()
+                self._idle_reaper = None
+            
             # 停止所有服务器
             tasks = []
             for server_name in list(self.active_servers.keys()):
@@ -477,65 +618,95 @@ class MCPClient:
         except Exception as e:
             logger.error(f"关闭MCP服务器失败: {str(e)}")
     
+    async def _reap_idle_servers(self):
+        """定期停止空闲超时且没有在途请求的服务器，释放内存"""
+        timeouts = [c.idle_timeout for c in self.config.servers.values() if c.idle_timeout]
+        interval = max(1, min(IDLE_CHECK_INTERVAL, min(timeouts) // 2))
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            for server_name, server_info in list(self.active_servers.items()):
+                idle_timeout = server_info["config"].idle_timeout
+                if (not idle_timeout or server_info["transport"] != "stdio"
+                        or server_info["connection"].in_flight):
+                    continue
+                if now - server_info["last_used"] >= idle_timeout:
+                    logger.info(f"服务器 {server_name} 空闲超过 {idle_timeout} 秒，停止进程")
+                    await self.stop_server(server_name)
+    
     async def batch_call(
         self,
         requests: List[Dict[str, Any]],
         max_concurrent: Optional[int] = None
     ) -> List[MCPResponse]:
-        """批量调用工具"""
+        """批量调用工具，结果按请求顺序返回"""
+        responses: List[Optional[MCPResponse]] = [None] * len(requests)
+        async for index, response in self.iter_batch_call(requests, max_concurrent):
+            responses[index] = response
+        return responses
+    
+    async def iter_batch_call(
+        self,
+        requests: List[Dict[str, Any]],
+        max_concurrent: Optional[int] = None
+    ) -> AsyncIterator[Tuple[int, MCPResponse]]:
+        """批量调用工具，按完成顺序产出 (请求序号, 响应)
+
+        使用滑动窗口调度：任一调用完成后立即补上下一个，慢调用不会拖住整批。
+        请求可带priority（越大越先执行），每个服务器同时在途的请求数受
+        max_concurrent（服务器配置）或max_concurrent_per_server限制。
+        """
+        max_concurrent = max_concurrent or self.config.max_concurrent_requests
+        queue: List[Tuple[int, int]] = []
+        for index, req in enumerate(requests):
+            if not req.get("server") or not req.get("tool"):
+                yield index, MCPResponse(
+                    success=False,
+                    error="无效请求: 缺少server或tool",
+                    server=req.get("server") or "unknown"
+                )
+                continue
+            heapq.heappush(queue, (-int(req.get("priority") or 0), index))
+        
+        running: Dict[asyncio.Task, int] = {}
+        in_flight: Counter = Counter()
         try:
-            max_concurrent = max_concurrent or self.config.max_concurrent_requests
-            
-            # 创建调用任务
-            tasks = []
-            for req in requests:
-                server_name = req.get("server")
-                tool_name = req.get("tool")
-                args = req.get("args", {})
-                timeout = req.get("timeout")
-                
-                if server_name and tool_name:
-                    task = self.call_tool(server_name, tool_name, args, timeout)
-                    tasks.append(task)
-                else:
-                    # 无效请求
-                    tasks.append(asyncio.create_task(asyncio.sleep(0)))
-            
-            # 限制并发数量
-            if len(tasks) <= max_concurrent:
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-            else:
-                # 分批执行
-                results = []
-                for i in range(0, len(tasks), max_concurrent):
-                    batch = tasks[i:i + max_concurrent]
-                    batch_results = await asyncio.gather(*batch, return_exceptions=True)
-                    results.extend(batch_results)
-            
-            # 处理异常结果
-            responses = []
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    responses.append(MCPResponse(
-                        success=False,
-                        error=f"批量调用异常: {str(result)}",
-                        server=requests[i].get("server", "unknown")
+            while queue or running:
+                # 填满窗口，所在服务器已满的请求留在队列中等待
+                deferred = []
+                while queue and len(running) < max_concurrent:
+                    item = heapq.heappop(queue)
+                    req = requests[item[1]]
+                    if in_flight[req["server"]] >= self._server_concurrency(req["server"]):
+                        deferred.append(item)
+                        continue
+                    in_flight[req["server"]] += 1
+                    task = asyncio.create_task(self.call_tool(
+                        req["server"], req["tool"], req.get("args") or {}, req.get("timeout")
                     ))
-                elif isinstance(result, MCPResponse):
-                    responses.append(result)
-                else:
-                    responses.append(MCPResponse(
-                        success=False,
-                        error="无效的响应类型",
-                        server=requests[i].get("server", "unknown")
-                    ))
-            
-            return responses
-            
-        except Exception as e:
-            logger.error(f"批量调用失败: {str(e)}")
-            return [MCPResponse(
-                success=False,
-                error=f"批量调用异常: {str(e)}",
-                server="unknown"
-            ) for _ in requests] 
\ No newline at end of file
+                    running[task] = item[1]
+                for item in deferred:
+                    heapq.heappush(queue, item)
+                
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = running.pop(task)
+                    in_flight[requests[index]["server"]] -= 1
+                    if task.exception() is not None:
+                        yield index, MCPResponse(
+                            success=False,
+                            error=f"批量调用异常: {str(task.exception())}",
+                            server=requests[index]["server"]
+                        )
+                    else:
+                        yield index, task.result()
+        finally:
+            # 调用方提前结束迭代（如客户端断开）时取消剩余调用
+            for task in running:
+                task.cancel()
+    
+    def _server_concurrency(self, server_name: str) -> int:
+        server_config = self.config.servers.get(server_name)
+        if server_config is not None and server_config.max_concurrent:
+            return server_config.max_concurrent
+        return max(1, self.config.max_concurrent_per_server)
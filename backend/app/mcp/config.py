@@ -18,12 +18,17 @@ class MCPServerConfig(BaseModel):
     url: Optional[str] = None  # http模式下的URL
     timeout: int = 30
     enabled: bool = True
+    lazy_start: bool = False  # 首次调用时才启动进程
+    idle_timeout: Optional[int] = None  # 空闲超过该秒数后停止进程，下次调用时重新启动
+    max_concurrent: Optional[int] = None  # 批量调用时该服务器同时在途的请求数，默认取全局设置
 
 class MCPConfig(BaseModel):
     """MCP总配置"""
     servers: Dict[str, MCPServerConfig]
     global_timeout: int = 60
     max_concurrent_requests: int = 10
+    max_concurrent_per_server: int = 4
+    startup_timeout: int = 20  # 等待服务器initialize握手响应的秒数
     log_level: str = "INFO"
     
     @classmethod
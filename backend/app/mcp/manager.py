@@ -3,8 +3,10 @@ MCP管理器 - 统一管理MCP客户端和服务器
 """
 
 import asyncio
+import inspect
 import logging
-from typing import Dict, List, Optional, Any
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
 import os
 from pathlib import Path
 
@@ -13,6 +15,9 @@ from .config import MCPConfig
 
 logger = logging.getLogger(__name__)
 
+# 诊断进度回调，接收事件字典，可以是普通函数或协程函数
+ProgressCallback = Callable[[Dict[str, Any]], Union[None, Awaitable[None]]]
+
 class MCPManager:
     """MCP管理器类"""
     
@@ -271,13 +276,21 @@ class MCPManager:
             for server_name, tools in self._tools_registry.items():
                 if server_name in server_status:
                     status = server_status[server_name]["status"]
-                    if status.get("status") == "running":
+                    if status.get("status") in ("running", "idle"):
                         available_tools[server_name] = tools
         
         return available_tools
     
-    async def diagnose_network_issue(self, issue_description: str) -> Dict[str, Any]:
-        """智能网络问题诊断"""
+    async def diagnose_network_issue(
+        self,
+        issue_description: str,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        """智能网络问题诊断
+
+        诊断计划是一个依赖图，互不依赖的步骤并发执行，总耗时取决于最长的依赖链。
+        on_progress在每个步骤开始、完成或被跳过时收到事件。
+        """
         try:
             logger.info(f"开始网络问题诊断: {issue_description}")
             
@@ -285,27 +298,8 @@ class MCPManager:
             diagnosis_plan = self._create_diagnosis_plan(issue_description)
             
             # 执行诊断步骤
-            results = {}
-            for step in diagnosis_plan:
-                step_name = step["name"]
-                server = step["server"]
-                tool = step["tool"]
-                args = step["args"]
-                
-                logger.info(f"执行诊断步骤: {step_name}")
-                
-                response = await self.call_tool(server, tool, args)
-                results[step_name] = {
-                    "success": response.success,
-                    "data": response.data,
-                    "error": response.error,
-                    "execution_time": response.execution_time
-                }
-                
-                # 如果关键步骤失败，调整后续步骤
-                if not response.success and step.get("critical", False):
-                    logger.warning(f"关键诊断步骤失败: {step_name}")
-                    break
+            started = time.time()
+            results = await self._execute_plan(diagnosis_plan, on_progress)
             
             # 分析诊断结果
             analysis = self._analyze_diagnosis_results(results, issue_description)
@@ -315,7 +309,8 @@ class MCPManager:
                 "issue_description": issue_description,
                 "diagnosis_results": results,
                 "analysis": analysis,
-                "recommendations": analysis.get("recommendations", [])
+                "recommendations": analysis.get("recommendations", []),
+                "execution_time": time.time() - started
             }
             
         except Exception as e:
@@ -326,6 +321,101 @@ class MCPManager:
                 "issue_description": issue_description
             }
     
+    async def _execute_plan(
+        self,
+        plan: List[Dict[str, Any]],
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """按依赖关系执行诊断计划
+
+        步骤的depends_on列出需要先完成的步骤（不在计划中的依赖视为已满足）。
+        关键步骤（critical）失败或被跳过时，直接或间接依赖它的步骤都被跳过。
+        """
+        steps = {step["name"]: step for step in plan}
+        results: Dict[str, Dict[str, Any]] = {}
+        blocked = set()  # 失败的关键步骤和被跳过的步骤
+        pending = dict(steps)
+        running: Dict[asyncio.Task, str] = {}
+        
+        async def emit(event: Dict[str, Any]):
+            if on_progress is None:
+                return
+            event.update(completed=len(results), total=len(steps))
+            try:
+                outcome = on_progress(event)
+                if inspect.isawaitable(outcome):
+                    await outcome
+            except Exception as e:
+                logger.warning(f"诊断进度回调失败: {str(e)}")
+        
+        async def run_step(step: Dict[str, Any]):
+            return await self.call_tool(step["server"], step["tool"], step["args"])
+        
+        try:
+            while pending or running:
+                for name, step in list(pending.items()):
+                    deps = [dep for dep in step.get("depends_on", []) if dep in steps]
+                    failed = [dep for dep in deps if dep in blocked]
+                    if failed:
+                        del pending[name]
+                        blocked.add(name)
+                        results[name] = {
+                            "success": False,
+                            "skipped": True,
+                            "data": None,
+                            "error": f"依赖步骤 {failed[0]} 失败，已跳过",
+                            "execution_time": 0
+                        }
+                        logger.warning(f"跳过诊断步骤: {name}（依赖 {failed[0]} 失败）")
+                        await emit({"type": "step_skipped", "step": name, "reason": results[name]["error"]})
+                    elif all(dep in results for dep in deps):
+                        del pending[name]
+                        logger.info(f"执行诊断步骤: {name}")
+                        running[asyncio.create_task(run_step(step))] = name
+                        await emit({"type": "step_started", "step": name})
+                
+                if not running:
+                    if pending:
+                        # 依赖无法满足（循环依赖），剩余步骤不再执行
+                        logger.error(f"诊断计划存在循环依赖: {list(pending)}")
+                        for name in pending:
+                            results[name] = {"success": False, "skipped": True, "data": None,
+                                             "error": "诊断计划存在循环依赖", "execution_time": 0}
+                        pending.clear()
+                    break
+                
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    if task.exception() is not None:
+                        results[name] = {"success": False, "data": None,
+                                         "error": f"调用异常: {str(task.exception())}", "execution_time": 0}
+                    else:
+                        response = task.result()
+                        results[name] = {
+                            "success": response.success,
+                            "data": response.data,
+                            "error": response.error,
+                            "execution_time": response.execution_time
+                        }
+                    
+                    if not results[name]["success"] and steps[name].get("critical", False):
+                        logger.warning(f"关键诊断步骤失败: {name}")
+                        blocked.add(name)
+                    await emit({
+                        "type": "step_completed",
+                        "step": name,
+                        "success": results[name]["success"],
+                        "error": results[name]["error"],
+                        "execution_time": results[name]["execution_time"]
+                    })
+        finally:
+            for task in running:
+                task.cancel()
+        
+        # 按计划顺序返回
+        return {name: results[name] for name in steps if name in results}
+    
     def _create_diagnosis_plan(self, issue_description: str) -> List[Dict[str, Any]]:
         """根据问题描述创建诊断计划"""
         # 将问题描述转换为小写便于匹配
@@ -333,7 +423,8 @@ class MCPManager:
         
         plan = []
         
-        # 基础连通性检查（总是执行）
+        # 基础连通性检查（总是执行）。需要外网的步骤依赖它，
+        # 网关、WiFi等本地检查不依赖外网，在外网不通时也照常执行
         plan.append({
             "name": "basic_connectivity",
             "server": "connectivity",
@@ -349,7 +440,8 @@ class MCPManager:
                     "name": "dns_check",
                     "server": "connectivity",
                     "tool": "check_dns_resolution",
-                    "args": {}
+                    "args": {},
+                    "depends_on": ["basic_connectivity"]
                 },
                 {
                     "name": "gateway_info",
@@ -378,7 +470,9 @@ class MCPManager:
                     "name": "wifi_interference",
                     "server": "wifi",
                     "tool": "analyze_wifi_interference",
-                    "args": {"duration": 30}
+                    "args": {"duration": 30},
+                    # 干扰分析自身会扫描信道，避免与wifi_scan同时扫描
+                    "depends_on": ["wifi_scan"]
                 },
                 {
                     "name": "signal_strength",
@@ -388,20 +482,23 @@ class MCPManager:
                 }
             ])
         
-        # 速度/带宽问题
+        # 速度/带宽问题。带宽测试会占满链路，等延迟类测量（ping_test、gateway_performance，
+        # 计划中没有时视为已满足）完成后再执行，避免负载影响延迟结果
         if any(keyword in issue_lower for keyword in ["慢", "卡", "带宽", "速度", "下载"]):
             plan.extend([
                 {
                     "name": "bandwidth_test",
                     "server": "connectivity",
                     "tool": "bandwidth_test",
-                    "args": {"test_duration": 20}
+                    "args": {"test_duration": 20},
+                    "depends_on": ["basic_connectivity", "ping_test", "gateway_performance"]
                 },
                 {
                     "name": "traffic_analysis",
                     "server": "packet_capture",
                     "tool": "start_packet_capture",
-                    "args": {"target": "auto", "mode": "diagnosis", "duration": 30}
+                    "args": {"target": "auto", "mode": "diagnosis", "duration": 30},
+                    "depends_on": ["basic_connectivity", "ping_test", "gateway_performance"]
                 }
             ])
         
@@ -415,7 +512,8 @@ class MCPManager:
                     "args": {
                         "hosts": ["8.8.8.8", "1.1.1.1", "baidu.com"],
                         "count": 5
-                    }
+                    },
+                    "depends_on": ["basic_connectivity"]
                 },
                 {
                     "name": "gateway_performance",
@@ -431,7 +529,8 @@ class MCPManager:
                 "name": "comprehensive_test",
                 "server": "connectivity",
                 "tool": "comprehensive_connectivity_test",
-                "args": {"quick_test": True}
+                "args": {"quick_test": True},
+                "depends_on": ["basic_connectivity"]
             })
         
         return plan
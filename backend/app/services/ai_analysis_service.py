@@ -7,26 +7,38 @@ import logging
 import json
 import os
 import copy
-from typing import Dict, Any, Optional, List
+import time
+from typing import Dict, Any, AsyncIterator, Optional, List, Tuple
 from datetime import datetime
 from pathlib import Path
 
 from app.config.ai_config import get_ai_config
-import openai
-import anthropic
-import requests
+from app.services.analysis_cache import analysis_cache, cache_key
+from app.services.incremental_json import IncrementalJSONParser
+from app.services.llm_router import llm_router
+from app.services.prompt_compactor import (DEFAULT_TOKEN_BUDGET, MIN_DATA_BUDGET, compact_capture_summary,
+                                           estimate_tokens)
 
 logger = logging.getLogger(__name__)
 
+# prompt模板或压缩方式变化时递增，使之前缓存的分析结果失效
+PROMPT_VERSION = 2
+
 # 创建调试数据目录
 DEBUG_DIR = Path('/tmp/ai_analysis_debug')
 DEBUG_DIR.mkdir(exist_ok=True)
 
+def _looks_like_json(content: str) -> bool:
+    """分析结果应为JSON对象，空响应或没有JSON的响应换用其他提供商"""
+    return '{' in content and '}' in content
+
+
 class AIAnalysisService:
     """AI分析服务"""
     
     def __init__(self):
         self.ai_config = get_ai_config()
+        self.prompt_token_budget = DEFAULT_TOKEN_BUDGET
 
     def _save_debug_data(self, task_id: str, issue_type: str, capture_summary: Dict,
                         user_description: str, prompt: str, ai_response: str = None) -> str:
@@ -85,167 +97,255 @@ class AIAnalysisService:
         except Exception as e:
             logger.error(f"更新调试数据失败: {str(e)}")
     
-    def analyze_network_issue_sync(self, issue_type: str, capture_summary: Dict,
-                                 user_description: Optional[str] = None, task_id: str = None,
-                                 filtered_domains: Optional[List[str]] = None,
-                                 latency_filter: Optional[str] = None) -> Dict[str, Any]:
+    def analysis_cache_key(self, issue_type: str, capture_summary: Dict,
+                           user_description: Optional[str] = None,
+                           filtered_domains: Optional[List[str]] = None,
+                           latency_filter: Optional[str] = None) -> str:
+        """分析结果的缓存键：问题类型、筛选后的摘要、用户描述、模型、prompt版本和token预算"""
+        config = self.ai_config.get_current_config()
+        filtered_summary = self._filter_capture_data(capture_summary, filtered_domains, latency_filter)
+        return cache_key(
+            PROMPT_VERSION,
+            issue_type,
+            filtered_summary,
+            user_description or '',
+            self.ai_config.current_provider,
+            config.model if config else None,
+            self.prompt_token_budget
+        )
+
+    def get_cached_analysis(self, issue_type: str, capture_summary: Dict,
+                            user_description: Optional[str] = None,
+                            filtered_domains: Optional[List[str]] = None,
+                            latency_filter: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """返回相同输入之前的分析结果，没有时返回None"""
+        key = self.analysis_cache_key(issue_type, capture_summary, user_description, filtered_domains, latency_filter)
+        result = analysis_cache.get(key)
+        if result is not None:
+            result['cached'] = True
+        return result
+
+    async def analyze_network_issue(self, issue_type: str, capture_summary: Dict,
+                                  user_description: Optional[str] = None,
+                                  filtered_domains: Optional[List[str]] = None,
+                                  latency_filter: Optional[str] = None,
+                                  task_id: Optional[str] = None,
+                                  use_cache: bool = True) -> Dict[str, Any]:
         """
-        同步版本的网络问题分析，避免事件循环冲突
+        分析网络问题
+
+        Args:
+            issue_type: 问题类型 (website_access, interconnection, game_lag, custom)
+            capture_summary: 抓包数据摘要
+            user_description: 用户描述的问题
+            filtered_domains: 筛选的域名列表，只分析这些域名
+            latency_filter: 速度分类筛选 (all/fast/slow/error)
+            task_id: 抓包任务ID，用于命名调试数据文件
+            use_cache: 相同输入（含筛选结果）已分析过时直接返回之前的结果
+
+        Returns:
+            AI分析结果
         """
+        async def analyze():
+            return await self._run_analysis(issue_type, capture_summary, user_description,
+                                            filtered_domains, latency_filter, task_id)
+
+        if not use_cache:
+            result = await analyze()
+            result['cached'] = False
+            return result
+
+        key = self.analysis_cache_key(issue_type, capture_summary, user_description, filtered_domains, latency_filter)
+        result, cached = await analysis_cache.get_or_create(
+            key, analyze, should_cache=lambda r: r.get('success', False))
+        if cached:
+            logger.info(f"AI分析命中缓存: {key[:12]}")
+        result['cached'] = cached
+        return result
+
+    async def _run_analysis(self, issue_type: str, capture_summary: Dict,
+                            user_description: Optional[str] = None,
+                            filtered_domains: Optional[List[str]] = None,
+                            latency_filter: Optional[str] = None,
+                            task_id: Optional[str] = None) -> Dict[str, Any]:
+        """生成prompt、调用提供商并解析结果"""
         ai_response = None
         debug_file_path = ""
 
         try:
-            logger.info(f"开始同步AI分析，问题类型: {issue_type}")
-
-            # 检查AI配置
-            config = self.ai_config.get_current_config()
-            if not config:
-                raise Exception("AI配置无效或未设置")
-
-            logger.info(f"使用AI提供商: {self.ai_config.current_provider}")
+            logger.info(f"开始AI分析，问题类型: {issue_type}")
+            if filtered_domains:
+                logger.info(f"筛选域名: {filtered_domains}")
+            if latency_filter and latency_filter != 'all':
+                logger.info(f"速度分类筛选: {latency_filter}")
 
             # 生成分析prompt
-            prompt = self._generate_analysis_prompt(issue_type, capture_summary, user_description,
-                                                  filtered_domains, latency_filter)
-            logger.info(f"生成prompt长度: {len(prompt)} 字符")
+            prompt, prompt_stats = self._build_analysis_prompt(issue_type, capture_summary, user_description,
+                                                               filtered_domains, latency_filter)
+            logger.info(f"生成的prompt长度: {len(prompt)} 字符，估算 {prompt_stats['prompt_tokens']} tokens")
 
             # 保存调试数据（输入部分）
-            if task_id:
-                debug_file_path = self._save_debug_data(
-                    task_id, issue_type, capture_summary,
-                    user_description or "", prompt
-                )
+            debug_file_path = self._save_debug_data(
+                task_id or "ai_analysis", issue_type, capture_summary,
+                user_description or "", prompt
+            )
 
-            # 调用AI API（同步版本）
-            logger.info("开始调用AI API")
-            ai_response = self._call_ai_api_sync(prompt)
-            logger.info(f"AI API响应长度: {len(ai_response)} 字符")
+            routed = await self._call_ai_api(prompt)
+            ai_response = routed['content']
+            logger.info(f"AI响应长度: {len(ai_response)} 字符，提供商: {routed['provider']}/{routed['model']}，"
+                        f"用时 {routed['latency']}秒{'（对冲）' if routed['hedged'] else ''}")
 
             # 更新调试数据（输出部分）
-            if task_id and debug_file_path:
+            if debug_file_path:
                 self._update_debug_data_with_response(debug_file_path, ai_response)
 
             # 解析AI响应
-            logger.info("开始解析AI响应")
             analysis_result = self._parse_ai_response(ai_response, issue_type)
+            logger.info("AI响应解析成功")
 
-            logger.info("AI分析成功完成")
             result = {
                 'success': True,
                 'analysis': analysis_result,
                 'timestamp': datetime.now().isoformat(),
-                'ai_provider': self.ai_config.current_provider
+                'ai_provider': routed['provider'],
+                'ai_model': routed['model'],
+                'routing': {
+                    'latency': routed['latency'],
+                    'hedged': routed['hedged'],
+                    'attempts': routed['attempts']
+                },
+                'prompt': prompt_stats
             }
-
-            # 添加调试文件路径到结果中
             if debug_file_path:
                 result['debug_file'] = debug_file_path
-
             return result
 
         except Exception as e:
             logger.error(f"AI分析失败: {str(e)}", exc_info=True)
 
-            # 即使失败也保存调试数据
-            if task_id and ai_response is None:
-                try:
-                    prompt = self._generate_analysis_prompt(issue_type, capture_summary, user_description,
-                                                          filtered_domains, latency_filter)
-                    debug_file_path = self._save_debug_data(
-                        task_id, issue_type, capture_summary,
-                        user_description or "", prompt, f"ERROR: {str(e)}"
-                    )
-                except:
-                    pass
-
-            result = {
-                'success': False,
-                'error': str(e),
-                'timestamp': datetime.now().isoformat()
+            # 即使失败也记录调试数据
+            if debug_file_path and ai_response is None:
+                self._update_debug_data_with_response(debug_file_path, f"ERROR: {str(e)}")
+
+            return self._failure_result(e, debug_file_path)
+
+    def _failure_result(self, error: Exception, debug_file_path: str = "") -> Dict[str, Any]:
+        """分析失败时返回的结果"""
+        result = {
+            'success': False,
+            'error': str(error),
+            'timestamp': datetime.now().isoformat(),
+            'analysis': {
+                'diagnosis': f'AI分析过程中出现错误: {str(error)}',
+                'severity': 'unknown',
+                'root_cause': '服务异常或配置问题',
+                'recommendations': ['检查AI服务状态', '验证配置信息', '重试分析'],
+                'technical_details': f'错误详情: {str(error)}',
+                'confidence': 0
             }
+        }
+        if debug_file_path:
+            result['debug_file'] = debug_file_path
+        return result
 
-            if debug_file_path:
-                result['debug_file'] = debug_file_path
-
-            return result
-
-    async def analyze_network_issue(self, issue_type: str, capture_summary: Dict,
-                                  user_description: Optional[str] = None,
+    async def stream_network_issue(self, issue_type: str, capture_summary: Dict,
+                                   user_description: Optional[str] = None,
                                    filtered_domains: Optional[List[str]] = None,
-                                   latency_filter: Optional[str] = None) -> Dict[str, Any]:
+                                   latency_filter: Optional[str] = None,
+                                   task_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
         """
-        分析网络问题
-
-        Args:
-            issue_type: 问题类型 (website_access, interconnection, game_lag, custom)
-            capture_summary: 抓包数据摘要
-            user_description: 用户描述的问题
-            filtered_domains: 筛选的域名列表，只分析这些域名
-            latency_filter: 速度分类筛选 (all/fast/slow/error)
+        流式分析网络问题，逐个返回事件 {"event": 类型, "data": 内容}：
+        - start: prompt已生成，开始请求提供商
+        - delta: 模型输出的文本增量 {"text"}
+        - field: 顶层字段（diagnosis、severity、recommendations等）已完整 {"key", "value"}
+        - result: 最终结果，结构与 analyze_network_issue 的返回值相同
 
-        Returns:
-            AI分析结果
+        相同输入已分析过时直接返回缓存结果的各字段和result。
         """
+        key = self.analysis_cache_key(issue_type, capture_summary, user_description, filtered_domains, latency_filter)
+        cached = analysis_cache.get(key)
+        if cached is not None:
+            logger.info(f"流式AI分析命中缓存: {key[:12]}")
+            for field, value in cached.get('analysis', {}).items():
+                yield {'event': 'field', 'data': {'key': field, 'value': value}}
+            cached['cached'] = True
+            yield {'event': 'result', 'data': cached}
+            return
+
+        started = time.perf_counter()
+        chunks: List[str] = []
+        debug_file_path = ""
         try:
-            logger.info(f"开始AI分析，问题类型: {issue_type}")
-            if filtered_domains:
-                logger.info(f"筛选域名: {filtered_domains}")
-            if latency_filter and latency_filter != 'all':
-                logger.info(f"速度分类筛选: {latency_filter}")
-
-            # 生成分析prompt
-            prompt = self._generate_analysis_prompt(issue_type, capture_summary, user_description,
-                                                  filtered_domains, latency_filter)
-            logger.info(f"生成的prompt长度: {len(prompt)} 字符")
-
-            # 使用同步方法调用AI API（避免异步问题）
-            ai_response = self._call_ai_api_sync(prompt)
-            logger.info(f"AI响应长度: {len(ai_response)} 字符")
-
-            # 解析AI响应
-            analysis_result = self._parse_ai_response(ai_response, issue_type)
-            logger.info("AI响应解析成功")
+            logger.info(f"开始流式AI分析，问题类型: {issue_type}")
+            prompt, prompt_stats = self._build_analysis_prompt(issue_type, capture_summary, user_description,
+                                                               filtered_domains, latency_filter)
+            debug_file_path = self._save_debug_data(
+                task_id or "ai_analysis", issue_type, capture_summary,
+                user_description or "", prompt
+            )
+            yield {'event': 'start', 'data': {'provider': self.ai_config.current_provider,
+                                               'prompt_tokens': prompt_stats['prompt_tokens']}}
 
-            # 保存调试数据（如果启用）
+            parser = IncrementalJSONParser()
+            first_chunk = None
+            provider = model = None
+            routed = llm_router.stream(prompt, self.ai_config)
             try:
-                debug_file_path = self._save_debug_data(
-                    "ai_analysis", issue_type, capture_summary,
-                    user_description or "", prompt, ai_response
-                )
-                if debug_file_path:
-                    logger.info(f"调试数据已保存到: {debug_file_path}")
-            except Exception as debug_e:
-                logger.warning(f"保存调试数据失败: {str(debug_e)}")
+                async for provider, model, text in routed:
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter() - started
+                        logger.info(f"收到首个AI输出，用时 {first_chunk:.2f}秒，提供商: {provider}/{model}")
+                    chunks.append(text)
+                    yield {'event': 'delta', 'data': {'text': text}}
+                    for field, value in parser.feed(text):
+                        yield {'event': 'field', 'data': {'key': field, 'value': value}}
+            finally:
+                # 调用方中途停止读取时立即关闭提供商的连接
+                await routed.aclose()
+
+            ai_response = ''.join(chunks)
+            if debug_file_path:
+                self._update_debug_data_with_response(debug_file_path, ai_response)
 
-            return {
+            # 字段已增量发出，最终结果仍走完整的解析和修复逻辑
+            result = {
                 'success': True,
-                'analysis': analysis_result,
+                'analysis': self._parse_ai_response(ai_response, issue_type),
                 'timestamp': datetime.now().isoformat(),
-                'ai_provider': self.ai_config.current_provider
+                'ai_provider': provider,
+                'ai_model': model,
+                'routing': {
+                    'latency': round(time.perf_counter() - started, 3),
+                    'first_chunk': round(first_chunk, 3),
+                    'streamed': True
+                },
+                'prompt': prompt_stats
             }
-
+            if debug_file_path:
+                result['debug_file'] = debug_file_path
+            analysis_cache.put(key, result)
         except Exception as e:
-            logger.error(f"AI分析失败: {str(e)}", exc_info=True)
-            return {
-                'success': False,
-                'error': str(e),
-                'timestamp': datetime.now().isoformat(),
-                'analysis': {
-                    'diagnosis': f'AI分析过程中出现错误: {str(e)}',
-                    'severity': 'unknown',
-                    'root_cause': '服务异常或配置问题',
-                    'recommendations': ['检查AI服务状态', '验证配置信息', '重试分析'],
-                    'technical_details': f'错误详情: {str(e)}',
-                    'confidence': 0
-                }
-            }
-    
+            logger.error(f"流式AI分析失败: {str(e)}", exc_info=True)
+            if debug_file_path:
+                self._update_debug_data_with_response(debug_file_path, ''.join(chunks) or f"ERROR: {str(e)}")
+            result = self._failure_result(e, debug_file_path)
+
+        result['cached'] = False
+        yield {'event': 'result', 'data': result}
+
     def _generate_analysis_prompt(self, issue_type: str, capture_summary: Dict,
                                 user_description: Optional[str] = None,
                                 filtered_domains: Optional[List[str]] = None,
                                 latency_filter: Optional[str] = None) -> str:
         """生成AI分析prompt"""
+        return self._build_analysis_prompt(issue_type, capture_summary, user_description,
+                                           filtered_domains, latency_filter)[0]
+
+    def _build_analysis_prompt(self, issue_type: str, capture_summary: Dict,
+                               user_description: Optional[str] = None,
+                               filtered_domains: Optional[List[str]] = None,
+                               latency_filter: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """生成AI分析prompt，返回 (prompt, 压缩统计)，抓包数据按token预算压缩"""
         
         # 基础prompt模板
         base_prompt = """你是一个专业的网络诊断专家，拥有丰富的网络故障排查经验。请根据以下网络抓包数据进行深度分析，识别问题根源并提供可操作的解决方案。
@@ -434,7 +534,7 @@ class AIAnalysisService:
         }
         
         # 构建完整prompt
-        prompt = base_prompt
+        prompt = base_prompt + json_template
 
         # 添加问题类型特定的分析指导
         if issue_type in issue_specific_prompts:
@@ -493,8 +593,6 @@ class AIAnalysisService:
             prompt += "3. 所有诊断、建议和技术细节都应该专注于筛选后的域名\n"
             prompt += "4. 如果筛选后的域名数据不足，请明确说明并基于现有数据进行分析\n\n"
 
-        # 添加详细的抓包数据
-        prompt += f"\n📋 详细抓包数据：\n{json.dumps(filtered_capture_summary, indent=2, ensure_ascii=False)}\n"
 
         # 添加分析要求
         analysis_scope_note = ""
@@ -534,9 +632,17 @@ class AIAnalysisService:
 
 请严格按照上述JSON格式回复，确保所有字段都有实际内容："""
 
+        # 添加压缩后的抓包数据：预算扣除prompt其余部分后留给数据
+        data_budget = max(MIN_DATA_BUDGET, self.prompt_token_budget
+                          - estimate_tokens(prompt) - estimate_tokens(analysis_requirements))
+        capture_data, compact_stats = compact_capture_summary(filtered_capture_summary, data_budget)
+        prompt += f"\n📋 抓包数据（表格以|分隔）：\n{capture_data}\n\n"
         prompt += analysis_requirements
 
-        return prompt
+        compact_stats['prompt_tokens'] = estimate_tokens(prompt)
+        logger.info(f"prompt估算 {compact_stats['prompt_tokens']} tokens（预算 {self.prompt_token_budget}），"
+                    f"网站 {compact_stats['sites_shown']}/{compact_stats['sites_total']}")
+        return prompt, compact_stats
 
     def _filter_capture_data(self, capture_summary: Dict, filtered_domains: Optional[List[str]] = None,
                            latency_filter: Optional[str] = None) -> Dict:
@@ -624,217 +730,17 @@ class AIAnalysisService:
 
         return filtered_data
 
-    def _call_ai_api_sync(self, prompt: str) -> str:
-        """同步版本的AI API调用"""
-        try:
-            config = self.ai_config.get_current_config()
-            logger.info(f"获取AI配置: {config is not None}")
-
-            if not config:
-                logger.error("AI配置无效或未找到")
-                raise Exception("AI配置无效：请检查环境变量设置")
-
-            logger.info(f"调用AI API，提供商: {self.ai_config.current_provider}")
-            logger.info(f"API配置 - 模型: {config.model}, 基础URL: {config.base_url}")
-
-            if self.ai_config.current_provider == 'openrouter':
-                result = self._call_openrouter_api_sync(prompt, config)
-            elif self.ai_config.current_provider == 'openai':
-                result = self._call_openai_api_sync(prompt, config)
-            elif self.ai_config.current_provider == 'anthropic':
-                result = self._call_anthropic_api_sync(prompt, config)
-            else:
-                raise Exception(f"不支持的AI提供商: {self.ai_config.current_provider}")
-
-            logger.info("AI API调用成功")
-            return result
+    async def _call_ai_api(self, prompt: str) -> Dict[str, Any]:
+        """在已配置的提供商之间对冲/故障转移调用AI API
 
-        except Exception as e:
-            logger.error(f"AI API调用失败: {str(e)}", exc_info=True)
-            raise
-
-    async def _call_ai_api(self, prompt: str) -> str:
-        """调用AI API"""
-        config = self.ai_config.get_current_config()
-        if not config:
-            raise Exception("AI配置无效")
-        
+        返回 {"content", "provider", "model", "latency", "hedged", "attempts"}
+        """
+        logger.info(f"调用AI API，首选提供商: {self.ai_config.current_provider}")
         try:
-            if self.ai_config.current_provider == 'openrouter':
-                return await self._call_openrouter_api(prompt, config)
-            elif self.ai_config.current_provider == 'openai':
-                return await self._call_openai_api(prompt, config)
-            elif self.ai_config.current_provider == 'anthropic':
-                return await self._call_anthropic_api(prompt, config)
-            else:
-                raise Exception(f"不支持的AI提供商: {self.ai_config.current_provider}")
-                
+            return await llm_router.complete(prompt, self.ai_config, validate=_looks_like_json)
         except Exception as e:
             logger.error(f"AI API调用失败: {str(e)}")
             raise
-    
-    async def _call_openrouter_api(self, prompt: str, config) -> str:
-        """调用OpenRouter API"""
-        import aiohttp
-
-        headers = {
-            'Authorization': f'Bearer {config.api_key}',
-            'Content-Type': 'application/json',
-            'HTTP-Referer': 'http://localhost:3000',
-            'X-Title': 'Network Packet Analysis'
-        }
-
-        data = {
-            'model': config.model,
-            'messages': [
-                {'role': 'user', 'content': prompt}
-            ],
-            'max_tokens': config.max_tokens,
-            'temperature': config.temperature
-        }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{config.base_url}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=aiohttp.ClientTimeout(total=config.timeout)
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"OpenRouter API错误: {response.status} - {error_text}")
-
-                result = await response.json()
-                return result['choices'][0]['message']['content']
-
-    def _call_openrouter_api_sync(self, prompt: str, config) -> str:
-        """同步调用OpenRouter API"""
-        import requests
-
-        try:
-            logger.info(f"准备调用OpenRouter API: {config.base_url}")
-            logger.info(f"使用模型: {config.model}")
-            logger.info(f"Prompt长度: {len(prompt)} 字符")
-            headers = {
-                'Authorization': f'Bearer {config.api_key}',  # 隐藏API密钥
-                'Content-Type': 'application/json',
-                'HTTP-Referer': 'http://localhost:3000',
-                'X-Title': 'Network Packet Analysis'
-            }
-
-            data = {
-                'model': config.model,
-                'messages': [
-                    {'role': 'user', 'content': prompt}
-                ],
-                'max_tokens': config.max_tokens,
-                'temperature': config.temperature
-            }
-
-            logger.info(f"发送请求到: {config.base_url}/chat/completions")
-
-            response = requests.post(
-                f"{config.base_url}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=config.timeout
-            )
-
-            logger.info(f"API响应状态码: {response.status_code}")
-
-            if response.status_code != 200:
-                error_text = response.text
-                logger.error(f"API错误响应: {error_text}")
-                raise Exception(f"OpenRouter API错误: {response.status_code} - {error_text}")
-
-            result = response.json()
-            logger.info("API响应解析成功")
-
-            if 'choices' not in result or not result['choices']:
-                logger.error(f"API响应格式异常: {result}")
-                raise Exception("API响应中没有choices字段")
-
-            content = result['choices'][0]['message']['content']
-            logger.info(f"获取到AI响应，长度: {len(content)} 字符")
-
-            return content
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"网络请求失败: {str(e)}")
-            raise Exception(f"网络请求失败: {str(e)}")
-        except Exception as e:
-            logger.error(f"OpenRouter API调用失败: {str(e)}")
-            raise
-
-    def _call_openai_api_sync(self, prompt: str, config) -> str:
-        """同步调用OpenAI API"""
-        import openai
-
-        client = openai.OpenAI(
-            api_key=config.api_key,
-            base_url=config.base_url
-        )
-
-        response = client.chat.completions.create(
-            model=config.model,
-            messages=[
-                {'role': 'user', 'content': prompt}
-            ],
-            max_tokens=config.max_tokens,
-            temperature=config.temperature
-        )
-
-        return response.choices[0].message.content
-
-    def _call_anthropic_api_sync(self, prompt: str, config) -> str:
-        """同步调用Anthropic API"""
-        import anthropic
-
-        client = anthropic.Anthropic(api_key=config.api_key)
-
-        response = client.messages.create(
-            model=config.model,
-            max_tokens=config.max_tokens,
-            temperature=config.temperature,
-            messages=[
-                {'role': 'user', 'content': prompt}
-            ]
-        )
-
-        return response.content[0].text
-
-    async def _call_openai_api(self, prompt: str, config) -> str:
-        """调用OpenAI API"""
-        client = openai.OpenAI(
-            api_key=config.api_key,
-            base_url=config.base_url
-        )
-        
-        response = client.chat.completions.create(
-            model=config.model,
-            messages=[
-                {'role': 'user', 'content': prompt}
-            ],
-            max_tokens=config.max_tokens,
-            temperature=config.temperature
-        )
-        
-        return response.choices[0].message.content
-    
-    async def _call_anthropic_api(self, prompt: str, config) -> str:
-        """调用Anthropic API"""
-        client = anthropic.Anthropic(api_key=config.api_key)
-        
-        response = client.messages.create(
-            model=config.model,
-            max_tokens=config.max_tokens,
-            temperature=config.temperature,
-            messages=[
-                {'role': 'user', 'content': prompt}
-            ]
-        )
-
-        return response.content[0].text
 
     def _validate_analysis_result(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
         """验证和补充分析结果"""
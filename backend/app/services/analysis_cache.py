@@ -0,0 +1,158 @@
+"""
+AI分析结果缓存
+以输入内容的哈希为键（问题类型、筛选后的抓包摘要、用户描述、模型、prompt版本等），
+结果保存为磁盘上的JSON文件，服务重启后仍可命中：
+- 按最近使用顺序淘汰，超过条目上限时删除最久未用的结果
+- 超过有效期的结果不再返回
+- 相同输入的并发请求只调用一次提供商，其余请求等待同一结果（见 single_flight）
+前端来回切换筛选条件时，之前分析过的组合直接返回。
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(__file__).parent.parent.parent / "data" / "ai_cache"
+# 结果有效期（秒）
+CACHE_TTL = int(os.getenv('AI_CACHE_TTL', str(24 * 3600)))
+MAX_ENTRIES = 500
+
+
+def cache_key(*parts: Any) -> str:
+    """输入内容的稳定哈希：字典按键排序，与插入顺序无关"""
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """磁盘上的LRU/TTL结果缓存，附带进行中请求的去重"""
+
+    def __init__(self, directory: Path = CACHE_DIR, ttl: float = CACHE_TTL, max_entries: int = MAX_ENTRIES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # 键 -> 写入时间，按最近使用排序（最久未用的在前）
+        self._index: 'OrderedDict[str, float]' = OrderedDict()
+        self._flight = SingleFlight()
+        # API事件循环和抓包调度器线程都会访问索引
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self._load_index()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _load_index(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.json'):
+                entries.append((entry.stat().st_mtime, entry.name[:-5]))
+        for mtime, key in sorted(entries):
+            self._index[key] = mtime
+        self._evict()
+
+    def _evict(self):
+        while len(self._index) > self.max_entries:
+            key, _ = self._index.popitem(last=False)
+            self._remove_file(key)
+
+    def _remove_file(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def get(self, key: str, ttl: Optional[float] = None) -> Optional[Dict]:
+        """返回未过期的缓存结果，不存在时返回None"""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            if key not in self._index:
+                return None
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                del self._index[key]
+                self._remove_file(key)
+                return None
+            if time.time() - entry['created'] >= ttl:
+                del self._index[key]
+                self._remove_file(key)
+                return None
+            self._index.move_to_end(key)
+            try:
+                # 文件修改时间记录最近使用时间，重启后按此恢复LRU顺序
+                os.utime(self._path(key))
+            except OSError:
+                pass
+            self.hits += 1
+            return entry['value']
+
+    def put(self, key: str, value: Dict):
+        created = time.time()
+        path = self._path(key)
+        tmp = path.with_suffix('.tmp')
+        with self._lock:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'created': created, 'value': value}, f, ensure_ascii=False, default=str)
+            os.replace(tmp, path)
+            self._index[key] = created
+            self._index.move_to_end(key)
+            self._evict()
+
+    async def get_or_create(self, key: str, factory: Callable[[], Awaitable[Dict]],
+                            ttl: Optional[float] = None,
+                            should_cache: Optional[Callable[[Dict], bool]] = None) -> Tuple[Dict, bool]:
+        """返回 (结果, 是否来自缓存)；缓存未命中时调用factory，同一键的并发调用共享一次结果"""
+        value = self.get(key, ttl)
+        if value is not None:
+            return value, True
+
+        async def create():
+            self.misses += 1
+            value = await factory()
+            if should_cache is None or should_cache(value):
+                self.put(key, value)
+            return value
+
+        value, shared = await self._flight.do(key, create)
+        if shared:
+            self.shared += 1
+            return copy.deepcopy(value), True
+        return value, False
+
+    def invalidate(self, key: Optional[str] = None):
+        """删除指定结果，不指定时清空缓存"""
+        with self._lock:
+            keys = [key] if key is not None else list(self._index)
+            for k in keys:
+                self._index.pop(k, None)
+                self._remove_file(k)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._index),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "inflight": len(self._flight)
+        }
+
+
+analysis_cache = AnalysisCache()
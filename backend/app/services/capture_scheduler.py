@@ -0,0 +1,146 @@
+"""
+抓包任务调度器
+所有抓包任务在同一个专用事件循环线程中运行：
+- 每个网卡同时运行的tcpdump会话数受信号量限制，超出的任务排队等待
+- pcap解析等CPU密集的分析放到有界进程池中执行，不占用API进程的GIL
+- 排队中的任务可以查询所在队列和位置
+"""
+
+import os
+import asyncio
+import threading
+import multiprocessing
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 分析进程数：保留一半核心给API、tcpdump和tshark
+ANALYSIS_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# 每个网卡同时运行的抓包会话数
+MAX_CAPTURES_PER_INTERFACE = 1
+
+
+class CaptureScheduler:
+    """抓包/分析调度器"""
+
+    def __init__(self, analysis_workers: int = ANALYSIS_WORKERS,
+                 captures_per_interface: int = MAX_CAPTURES_PER_INTERFACE):
+        self.analysis_workers = analysis_workers
+        self.captures_per_interface = captures_per_interface
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._capture_slots: Dict[str, asyncio.Semaphore] = {}
+        self._analysis_slots: Optional[asyncio.Semaphore] = None
+        # 队列名 -> 按到达顺序排列的等待任务
+        self._waiting: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    # ---- 任务提交 ----
+
+    def submit(self, task_id: str, coro: Coroutine) -> Future:
+        """把任务协程提交到调度器的事件循环，立即返回"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+        def log_failure(done: Future):
+            if not done.cancelled() and done.exception() is not None:
+                logger.error(f"调度任务异常结束: {task_id}, 错误: {done.exception()}")
+
+        future.add_done_callback(log_failure)
+        return future
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name='capture-scheduler', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    # ---- 资源限制 ----
+
+    @asynccontextmanager
+    async def capture_slot(self, task_id: str, interface: Optional[str]):
+        """占用网卡的一个抓包名额，名额用完时排队"""
+        interface = interface or 'default'
+        semaphore = self._capture_slots.get(interface)
+        if semaphore is None:
+            semaphore = self._capture_slots[interface] = asyncio.Semaphore(self.captures_per_interface)
+        async with self._queued(f'capture:{interface}', task_id, semaphore):
+            yield
+
+    async def run_analysis(self, task_id: str, func: Callable, *args) -> Any:
+        """在进程池中执行分析函数，函数和参数必须可pickle"""
+        if self._analysis_slots is None:
+            self._analysis_slots = asyncio.Semaphore(self.analysis_workers)
+        async with self._queued('analysis', task_id, self._analysis_slots):
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._get_pool(), func, *args)
+            except BrokenProcessPool:
+                # 工作进程异常退出（如被OOM杀掉），下次重建进程池
+                with self._lock:
+                    self._pool = None
+                raise
+
+    @asynccontextmanager
+    async def _queued(self, queue: str, task_id: str, semaphore: asyncio.Semaphore):
+        with self._lock:
+            self._waiting.setdefault(queue, []).append(task_id)
+        try:
+            await semaphore.acquire()
+        finally:
+            with self._lock:
+                self._waiting[queue].remove(task_id)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # API进程是多线程的，用spawn避免fork时复制锁状态
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.analysis_workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    # ---- 查询 ----
+
+    def queue_position(self, task_id: str) -> Optional[Dict]:
+        """任务在等待队列中的位置（从1开始），未排队返回None"""
+        with self._lock:
+            for queue, waiting in self._waiting.items():
+                if task_id in waiting:
+                    stage, _, resource = queue.partition(':')
+                    return {
+                        'stage': stage,
+                        'resource': resource or None,
+                        'position': waiting.index(task_id) + 1,
+                        'waiting': len(waiting)
+                    }
+        return None
+
+    def shutdown(self):
+        """停止事件循环和进程池"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+            loop, self._loop = self._loop, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+
+capture_scheduler = CaptureScheduler()
+
+
+def get_capture_scheduler() -> CaptureScheduler:
+    """获取抓包调度器实例"""
+    return capture_scheduler
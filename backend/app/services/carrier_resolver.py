@@ -0,0 +1,157 @@
+"""
+按运营商DNS解析的HTTP会话
+每个运营商配置一个aiohttp会话：连接器使用自定义解析器，向该运营商的DNS服务器查询域名
+（含重定向后的域名），再连接解析出的地址，使各运营商的访问对比反映真实的解析结果。
+没有配置DNS服务器的（本地网络）使用系统解析。
+会话按事件循环缓存并复用连接池，应用退出时关闭。
+"""
+
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+
+from app.services.dns_query import DNS_PORT, DNSQueryEngine
+
+logger = logging.getLogger(__name__)
+
+DNS_TIMEOUT = 2.0
+# 解析结果的最长缓存时间（秒），实际取记录TTL与此值的较小者
+MAX_CACHE_TTL = 60
+CACHE_SIZE = 256
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=5)
+
+_NUMERIC_FLAGS = socket.AI_NUMERICHOST | socket.AI_NUMERICSERV
+
+
+class CarrierResolver(AbstractResolver):
+    """向指定DNS服务器查询的aiohttp解析器；servers为空时使用系统解析
+
+    resolve_with_stats 返回解析用时和应答的服务器，供访问测试展示。
+    """
+
+    def __init__(self, servers: Sequence[str], engine: Optional[DNSQueryEngine] = None,
+                 port: int = DNS_PORT, timeout: float = DNS_TIMEOUT):
+        self.servers = list(servers)
+        self.port = port
+        self.timeout = timeout
+        self._engine = engine
+        # (主机名, 地址族) -> (过期时间, 地址列表, 应答服务器)
+        self._cache: 'OrderedDict[Tuple[str, int], Tuple[float, List[str], str]]' = OrderedDict()
+
+    async def _query_servers(self, host: str, family: int) -> Tuple[List[str], int, Optional[str]]:
+        """依次尝试各DNS服务器，返回 (地址列表, TTL, 应答服务器)"""
+        qtypes = {socket.AF_INET: ['A'], socket.AF_INET6: ['AAAA']}.get(family, ['A', 'AAAA'])
+        last_error = "无应答"
+        for server in self.servers:
+            responses = await asyncio.gather(*[
+                self._engine.query(server, host, qtype, self.timeout, self.port) for qtype in qtypes])
+            addresses = [ip for response in responses if response['status'] == 'success'
+                         for ip in response['resolved_ips']]
+            if addresses:
+                ttls = [a['ttl'] for response in responses for a in response.get('answers', [])
+                        if a['type'] in qtypes]
+                return addresses, min(ttls) if ttls else 0, server
+            # NXDOMAIN是权威结果，不再尝试备用服务器
+            errors = [response for response in responses if response['status'] != 'timeout']
+            if errors and all(r.get('rcode_name') == 'NXDOMAIN' for r in errors):
+                raise OSError(socket.EAI_NONAME, f"{host}: 域名不存在 (DNS {server})")
+            last_error = responses[0].get('error_message') or last_error
+        raise OSError(socket.EAI_AGAIN, f"{host}: DNS解析失败 ({', '.join(self.servers)}: {last_error})")
+
+    async def resolve_with_stats(self, host: str, family: int = socket.AF_INET) -> Dict:
+        """解析域名，返回 {"addresses", "dns_time"（毫秒）, "dns_server", "cached"}"""
+        try:
+            ipaddress.ip_address(host)
+            return {"addresses": [host], "dns_time": 0.0, "dns_server": None, "cached": False}
+        except ValueError:
+            pass
+
+        key = (host.lower(), family)
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            return {"addresses": list(cached[1]), "dns_time": 0.0, "dns_server": cached[2], "cached": True}
+
+        started = time.perf_counter()
+        if self.servers:
+            addresses, ttl, server = await self._query_servers(host, family)
+        else:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, None, type=socket.SOCK_STREAM, family=family)
+            addresses = list(dict.fromkeys(info[4][0] for info in infos))
+            ttl, server = MAX_CACHE_TTL, "system"
+        dns_time = round((time.perf_counter() - started) * 1000, 2)
+
+        self._cache[key] = (time.monotonic() + min(ttl, MAX_CACHE_TTL), addresses, server)
+        while len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return {"addresses": addresses, "dns_time": dns_time, "dns_server": server, "cached": False}
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[Dict]:
+        result = await self.resolve_with_stats(host, family)
+        hosts = []
+        for address in result["addresses"]:
+            address_family = socket.AF_INET6 if ':' in address else socket.AF_INET
+            hosts.append({
+                "hostname": host,
+                "host": address,
+                "port": port,
+                "family": address_family,
+                "proto": 0,
+                "flags": _NUMERIC_FLAGS
+            })
+        return hosts
+
+    async def close(self) -> None:
+        self._cache.clear()
+
+
+class CarrierSessionPool:
+    """每个事件循环、每组DNS服务器一个HTTP会话，所有运营商共用一个DNS查询引擎"""
+
+    def __init__(self, dns_port: int = DNS_PORT):
+        self.dns_port = dns_port
+        self._loops: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]' = weakref.WeakKeyDictionary()
+
+    def _state(self) -> Dict:
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = {"engine": DNSQueryEngine(), "sessions": {}}
+            self._loops[loop] = state
+        return state
+
+    def get(self, dns_servers: Sequence[str]) -> Tuple[aiohttp.ClientSession, CarrierResolver]:
+        """返回指定DNS服务器组对应的 (会话, 解析器)"""
+        state = self._state()
+        key = tuple(dns_servers)
+        entry = state["sessions"].get(key)
+        if entry is None or entry[0].closed:
+            resolver = CarrierResolver(dns_servers, state["engine"], port=self.dns_port)
+            # 连接器不缓存解析结果，每次建连都经过解析器（解析器自己按TTL缓存）
+            connector = aiohttp.TCPConnector(resolver=resolver, use_dns_cache=False,
+                                             limit_per_host=8, keepalive_timeout=30)
+            session = aiohttp.ClientSession(connector=connector, timeout=REQUEST_TIMEOUT)
+            entry = (session, resolver)
+            state["sessions"][key] = entry
+        return entry
+
+    async def close(self):
+        """关闭当前事件循环中的所有会话"""
+        state = self._loops.pop(asyncio.get_running_loop(), None)
+        if state is None:
+            return
+        for session, _ in state["sessions"].values():
+            await session.close()
+        state["engine"].close()
+
+
+carrier_sessions = CarrierSessionPool()
@@ -0,0 +1,198 @@
+"""
+异步命令执行器
+供async接口调用外部命令（ping、iw、speedtest等），不阻塞事件循环：
+- 超时后杀掉整个进程组，抛出subprocess.TimeoutExpired，与subprocess.run的用法保持一致
+- 调用方被取消（如客户端断开）时同样杀掉进程
+- stdout/stderr超过上限的部分直接丢弃，避免异常命令占满内存
+- 按工具名限制同时运行的进程数，如同一时间只跑一个speedtest或WiFi扫描
+"""
+
+import os
+import signal
+import asyncio
+import logging
+import subprocess
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Awaitable, Dict, List, Optional, Sequence, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# 每个输出流保留的最大字节数
+DEFAULT_MAX_OUTPUT = 1024 * 1024
+# 默认超时（秒）
+DEFAULT_TIMEOUT = 30
+# 工具名 -> 同时运行的进程数，未列出的工具不限制
+TOOL_CONCURRENCY: Dict[str, int] = {
+    'speedtest': 1,
+    'speedtest-cli': 1,
+    # iw/iwlist/airport扫描由调用方指定为wifi_scan，同一网卡同时只能有一个扫描
+    'wifi_scan': 1,
+    'system_profiler': 1,
+    'traceroute': 2,
+    'ping': 8,
+}
+# 检测客户端断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+# 取消后等待被杀进程退出并回收的最长时间（秒）
+REAP_TIMEOUT = 5
+
+# 事件循环 -> 工具名 -> 信号量；测试和调度器线程各有自己的事件循环
+_tool_slots: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]' = \
+    weakref.WeakKeyDictionary()
+
+
+@dataclass
+class CommandResult:
+    """命令执行结果，字段与subprocess.CompletedProcess兼容"""
+    args: List[str]
+    returncode: int
+    stdout: str
+    stderr: str
+    duration: float
+    truncated: bool = False
+
+
+def _tool_slot(tool: str) -> Optional[asyncio.Semaphore]:
+    limit = TOOL_CONCURRENCY.get(tool)
+    if not limit:
+        return None
+    slots = _tool_slots.setdefault(asyncio.get_running_loop(), {})
+    if tool not in slots:
+        slots[tool] = asyncio.Semaphore(limit)
+    return slots[tool]
+
+
+async def _read_limited(stream: asyncio.StreamReader, limit: int) -> tuple:
+    """读完整个流，只保留前limit字节，返回 (数据, 是否截断)"""
+    chunks = []
+    kept = 0
+    truncated = False
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        if kept < limit:
+            chunk = chunk[:limit - kept]
+            chunks.append(chunk)
+            kept += len(chunk)
+        if kept >= limit:
+            # 继续读取并丢弃，避免进程因管道写满而阻塞
+            truncated = True
+    return b''.join(chunks), truncated
+
+
+def _kill(process: asyncio.subprocess.Process):
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def run_command(
+    cmd: Sequence[str],
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+    max_output: int = DEFAULT_MAX_OUTPUT,
+    tool: Optional[str] = None,
+    input: Optional[bytes] = None,
+    env: Optional[Dict[str, str]] = None,
+) -> CommandResult:
+    """执行命令并返回结果
+
+    命令不存在时抛出FileNotFoundError，超时抛出subprocess.TimeoutExpired。
+    tool用于并发限制，默认取命令名；排队等待的时间不计入超时。
+    """
+    cmd = [str(arg) for arg in cmd]
+    tool = tool or os.path.basename(cmd[0])
+    slot = _tool_slot(tool)
+    if slot is not None:
+        await slot.acquire()
+    try:
+        return await _run(cmd, timeout, max_output, input, env)
+    finally:
+        if slot is not None:
+            slot.release()
+
+
+async def _run(cmd: List[str], timeout: Optional[float], max_output: int,
+               input: Optional[bytes], env: Optional[Dict[str, str]]) -> CommandResult:
+    started = time.time()
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+        # 独立进程组，超时/取消时连同子进程一起结束
+        start_new_session=True
+    )
+
+    async def communicate():
+        if input is not None:
+            process.stdin.write(input)
+            try:
+                await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            process.stdin.close()
+        (stdout, out_truncated), (stderr, err_truncated) = await asyncio.gather(
+            _read_limited(process.stdout, max_output),
+            _read_limited(process.stderr, max_output)
+        )
+        await process.wait()
+        return stdout, stderr, out_truncated or err_truncated
+
+    try:
+        stdout, stderr, truncated = await asyncio.wait_for(communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        _kill(process)
+        await process.wait()
+        logger.warning(f"命令执行超时 (>{timeout}秒): {' '.join(cmd)}")
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    except asyncio.CancelledError:
+        _kill(process)
+        # 回收进程，避免留下僵尸进程；再次被取消时回收在后台继续
+        try:
+            await asyncio.wait_for(asyncio.shield(process.wait()), REAP_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        raise
+
+    if truncated:
+        logger.warning(f"命令输出超过 {max_output} 字节，已截断: {' '.join(cmd)}")
+    return CommandResult(
+        args=cmd,
+        returncode=process.returncode,
+        stdout=stdout.decode('utf-8', errors='replace'),
+        stderr=stderr.decode('utf-8', errors='replace'),
+        duration=time.time() - started,
+        truncated=truncated
+    )
+
+
+async def run_until_disconnected(request, awaitable: Awaitable[T]) -> T:
+    """执行awaitable，HTTP客户端断开时取消它（进而杀掉其中运行的命令）
+
+    request为starlette的Request；客户端断开时抛出asyncio.CancelledError。
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"客户端已断开，取消请求: {request.url.path}")
+                task.cancel()
+                raise asyncio.CancelledError()
+    finally:
+        if not task.done():
+            task.cancel()
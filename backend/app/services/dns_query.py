@@ -0,0 +1,313 @@
+"""
+进程内异步DNS查询引擎
+直接构造/解析UDP DNS报文，所有查询共用一个UDP套接字（按地址族），
+响应按 (服务器, 端口, 事务ID) 分发给等待中的查询，不需要为每次查询启动dig/nslookup进程。
+"""
+
+import asyncio
+import ipaddress
+import logging
+import random
+import socket
+import struct
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DNS_PORT = 53
+# 查询类型名 -> 类型码
+QUERY_TYPES: Dict[str, int] = {
+    'A': 1, 'NS': 2, 'CNAME': 5, 'SOA': 6, 'PTR': 12, 'MX': 15, 'TXT': 16, 'AAAA': 28, 'ANY': 255,
+}
+TYPE_NAMES = {code: name for name, code in QUERY_TYPES.items()}
+RCODE_NAMES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP', 5: 'REFUSED'}
+# 默认单次查询超时（秒）
+DEFAULT_TIMEOUT = 2.0
+# 基准测试中同时在途的查询数
+DEFAULT_CONCURRENCY = 64
+MAX_UDP_PAYLOAD = 4096
+
+
+class DNSFormatError(ValueError):
+    """DNS报文格式错误"""
+
+
+def build_query(transaction_id: int, name: str, qtype: str = 'A') -> bytes:
+    """构造带RD标志和EDNS0（4096字节UDP负载）的查询报文"""
+    code = QUERY_TYPES.get(qtype.upper())
+    if code is None:
+        raise ValueError(f"不支持的查询类型: {qtype}")
+    qname = b''
+    for label in name.strip('.').split('.'):
+        if label:
+            encoded = label.encode('idna')
+            if len(encoded) > 63:
+                raise ValueError(f"域名标签过长: {label}")
+            qname += bytes([len(encoded)]) + encoded
+    header = struct.pack('>HHHHHH', transaction_id, 0x0100, 1, 0, 0, 1)
+    opt = b'\x00' + struct.pack('>HHIH', 41, MAX_UDP_PAYLOAD, 0, 0)
+    return header + qname + b'\x00' + struct.pack('>HH', code, 1) + opt
+
+
+def _read_name(data: bytes, pos: int) -> Tuple[str, int]:
+    """读取域名（支持压缩指针），返回 (域名, 名字之后的位置)"""
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        if pos >= len(data):
+            raise DNSFormatError("域名越界")
+        length = data[pos]
+        if length == 0:
+            pos += 1
+            break
+        if length & 0xc0 == 0xc0:
+            if pos + 1 >= len(data) or jumps > 16:
+                raise DNSFormatError("压缩指针无效")
+            if end is None:
+                end = pos + 2
+            pos = ((length & 0x3f) << 8) | data[pos + 1]
+            jumps += 1
+            continue
+        labels.append(data[pos + 1:pos + 1 + length].decode('ascii', errors='replace'))
+        pos += 1 + length
+    return '.'.join(labels), end if end is not None else pos
+
+
+def _rdata_text(data: bytes, rtype: int, pos: int, rdlength: int) -> str:
+    rdata = data[pos:pos + rdlength]
+    if rtype == 1 and rdlength == 4:
+        return socket.inet_ntop(socket.AF_INET, rdata)
+    if rtype == 28 and rdlength == 16:
+        return socket.inet_ntop(socket.AF_INET6, rdata)
+    if rtype in (2, 5, 12):
+        return _read_name(data, pos)[0]
+    if rtype == 15:
+        preference = struct.unpack_from('>H', data, pos)[0]
+        return f"{preference} {_read_name(data, pos + 2)[0]}"
+    if rtype == 16:
+        texts, i = [], 0
+        while i < len(rdata):
+            texts.append(rdata[i + 1:i + 1 + rdata[i]].decode('utf-8', errors='replace'))
+            i += 1 + rdata[i]
+        return ''.join(texts)
+    if rtype == 6:
+        mname, next_pos = _read_name(data, pos)
+        rname, next_pos = _read_name(data, next_pos)
+        serial = struct.unpack_from('>I', data, next_pos)[0]
+        return f"{mname} {rname} {serial}"
+    return rdata.hex()
+
+
+def parse_response(data: bytes) -> Dict:
+    """解析响应报文，返回事务ID、响应码和应答记录"""
+    if len(data) < 12:
+        raise DNSFormatError("报文过短")
+    transaction_id, flags, qdcount, ancount, _, _ = struct.unpack_from('>HHHHHH', data)
+    pos = 12
+    for _ in range(qdcount):
+        _, pos = _read_name(data, pos)
+        pos += 4
+
+    answers = []
+    for _ in range(ancount):
+        name, pos = _read_name(data, pos)
+        if pos + 10 > len(data):
+            raise DNSFormatError("资源记录越界")
+        rtype, _, ttl, rdlength = struct.unpack_from('>HHIH', data, pos)
+        pos += 10
+        if pos + rdlength > len(data):
+            raise DNSFormatError("资源记录数据越界")
+        answers.append({
+            'name': name,
+            'type': TYPE_NAMES.get(rtype, str(rtype)),
+            'ttl': ttl,
+            'value': _rdata_text(data, rtype, pos, rdlength)
+        })
+        pos += rdlength
+
+    rcode = flags & 0x0f
+    return {
+        'id': transaction_id,
+        'is_response': bool(flags & 0x8000),
+        'truncated': bool(flags & 0x0200),
+        'rcode': rcode,
+        'rcode_name': RCODE_NAMES.get(rcode, str(rcode)),
+        'answers': answers
+    }
+
+
+class _ResolverProtocol(asyncio.DatagramProtocol):
+    """把收到的报文按 (服务器地址, 端口, 事务ID) 交给等待中的查询"""
+
+    def __init__(self, pending: Dict[tuple, asyncio.Future]):
+        self.pending = pending
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) < 2:
+            return
+        key = (addr[0], addr[1], struct.unpack_from('>H', data)[0])
+        future = self.pending.get(key)
+        if future is not None and not future.done():
+            future.set_result((data, time.perf_counter()))
+
+    def error_received(self, exc):
+        # ICMP端口不可达等错误无法对应到具体查询，由查询超时处理
+        logger.debug(f"DNS套接字错误: {exc}")
+
+
+class DNSQueryEngine:
+    """异步DNS查询引擎，需在同一个事件循环中使用"""
+
+    def __init__(self):
+        self._transports: Dict[int, asyncio.DatagramTransport] = {}
+        self._pending: Dict[tuple, asyncio.Future] = {}
+        self._lock = asyncio.Lock()
+
+    async def _transport(self, family: int) -> asyncio.DatagramTransport:
+        async with self._lock:
+            transport = self._transports.get(family)
+            if transport is None or transport.is_closing():
+                loop = asyncio.get_running_loop()
+                local = ('::', 0) if family == socket.AF_INET6 else ('0.0.0.0', 0)
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda: _ResolverProtocol(self._pending), local_addr=local, family=family)
+                self._transports[family] = transport
+            return transport
+
+    async def query(self, server: str, name: str, qtype: str = 'A',
+                    timeout: float = DEFAULT_TIMEOUT, port: int = DNS_PORT) -> Dict:
+        """向指定服务器发送一次查询
+
+        返回 status（success/timeout/error）、response_time（毫秒）、rcode_name、answers、resolved_ips。
+        """
+        try:
+            address = ipaddress.ip_address(server)
+        except ValueError:
+            return {'status': 'error', 'response_time': 0, 'error_message': f"无效的DNS服务器地址: {server}"}
+        # 规范化地址，保证与收到响应的来源地址一致
+        server = str(address)
+        family = socket.AF_INET6 if address.version == 6 else socket.AF_INET
+        transport = await self._transport(family)
+        loop = asyncio.get_running_loop()
+
+        while True:
+            transaction_id = random.getrandbits(16)
+            key = (server, port, transaction_id)
+            if key not in self._pending:
+                break
+        future = loop.create_future()
+        self._pending[key] = future
+        try:
+            packet = build_query(transaction_id, name, qtype)
+            started = time.perf_counter()
+            transport.sendto(packet, (server, port))
+            data, received = await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            return {'status': 'timeout', 'response_time': round(timeout * 1000, 2),
+                    'error_message': 'DNS查询超时'}
+        except (OSError, ValueError) as e:
+            return {'status': 'error', 'response_time': 0, 'error_message': str(e)}
+        finally:
+            self._pending.pop(key, None)
+
+        response_time = round((received - started) * 1000, 2)
+        try:
+            response = parse_response(data)
+        except DNSFormatError as e:
+            return {'status': 'error', 'response_time': response_time,
+                    'error_message': f"响应解析失败: {e}"}
+
+        answers = response['answers']
+        wanted = qtype.upper()
+        resolved = [a['value'] for a in answers if a['type'] == wanted or wanted == 'ANY']
+        result = {
+            'status': 'success' if response['rcode'] == 0 else 'error',
+            'response_time': response_time,
+            'rcode_name': response['rcode_name'],
+            'answers': answers,
+            'resolved_ips': resolved,
+            'truncated': response['truncated']
+        }
+        if response['rcode'] != 0:
+            result['error_message'] = f"DNS服务器返回 {response['rcode_name']}"
+        return result
+
+    def close(self):
+        for transport in self._transports.values():
+            transport.close()
+        self._transports.clear()
+
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """线性插值百分位数，空序列返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return round(ordered[low] + (ordered[high] - ordered[low]) * (rank - low), 2)
+
+
+def summarize_samples(samples: List[Dict]) -> Dict:
+    """汇总一个服务器的查询样本：成功率、延迟百分位、冷/热缓存对比"""
+    successful = [s for s in samples if s['status'] == 'success']
+    latencies = [s['response_time'] for s in successful]
+    cold = [s['response_time'] for s in successful if s['attempt'] == 0]
+    warm = [s['response_time'] for s in successful if s['attempt'] > 0]
+    return {
+        'queries': len(samples),
+        'successful': len(successful),
+        'timeouts': sum(1 for s in samples if s['status'] == 'timeout'),
+        'success_rate': round(len(successful) / len(samples) * 100, 1) if samples else 0,
+        'min': min(latencies) if latencies else None,
+        'max': max(latencies) if latencies else None,
+        'avg': round(sum(latencies) / len(latencies), 2) if latencies else None,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        # 每个 (域名, 类型) 的第一次查询可能未命中服务器缓存，之后的查询命中缓存
+        'cold_avg': round(sum(cold) / len(cold), 2) if cold else None,
+        'warm_avg': round(sum(warm) / len(warm), 2) if warm else None,
+    }
+
+
+async def benchmark(
+    servers: Sequence[str],
+    domains: Sequence[str],
+    query_types: Sequence[str] = ('A',),
+    repeat: int = 1,
+    timeout: float = DEFAULT_TIMEOUT,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    engine: Optional[DNSQueryEngine] = None,
+    port: int = DNS_PORT,
+) -> Dict[str, Dict]:
+    """并发测试多个DNS服务器
+
+    同一服务器上同一 (域名, 类型) 的重复查询依次进行，以便区分冷/热缓存；
+    不同服务器、域名、类型之间并发。返回 服务器 -> {'samples': [...], 'stats': {...}}。
+    """
+    own_engine = engine is None
+    engine = engine or DNSQueryEngine()
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: Dict[str, List[Dict]] = {server: [] for server in servers}
+
+    async def run_series(server: str, domain: str, qtype: str):
+        for attempt in range(max(1, repeat)):
+            async with semaphore:
+                result = await engine.query(server, domain, qtype, timeout, port)
+            samples[server].append({'domain': domain, 'query_type': qtype, 'attempt': attempt, **result})
+
+    try:
+        await asyncio.gather(*[
+            run_series(server, domain, qtype)
+            for server in servers for domain in domains for qtype in query_types
+        ])
+    finally:
+        if own_engine:
+            engine.close()
+
+    return {server: {'samples': server_samples, 'stats': summarize_samples(server_samples)}
+            for server, server_samples in samples.items()}
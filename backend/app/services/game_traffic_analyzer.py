@@ -3,12 +3,13 @@
 专门用于识别和分析游戏数据包，判断游戏服务器ISP归属
 """
 
-import subprocess
 import logging
 import ipaddress
 from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass
 
+from app.services.packet_table import PacketTable
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -65,16 +66,16 @@ class GameTrafficAnalyzer:
             'min_bidirectional_ratio': 0.3,  # 双向流量比例至少30%
         }
 
-    def analyze_game_traffic(self, tshark_cmd: str, pcap_file: str) -> Dict:
-        """分析游戏流量"""
+    def analyze_game_traffic(self, table: PacketTable) -> Dict:
+        """分析游戏流量（基于共享的pcap字段表）"""
         try:
             logger.info("开始游戏流量分析")
             
             # 1. 识别潜在的游戏流量
-            game_traffic = self._identify_game_traffic(tshark_cmd, pcap_file)
+            game_traffic = self._identify_game_traffic(table)
             
             # 2. 分析游戏服务器
-            game_servers = self._analyze_game_servers(tshark_cmd, pcap_file, game_traffic)
+            game_servers = self._analyze_game_servers(game_traffic)
             
             # 3. 评估游戏网络质量
             network_quality = self._evaluate_game_network_quality(game_servers)
@@ -124,86 +125,81 @@ class GameTrafficAnalyzer:
                 'network_quality': 'unknown'
             }
 
-    def _identify_game_traffic(self, tshark_cmd: str, pcap_file: str) -> List[Dict]:
+    def _identify_game_traffic(self, table: PacketTable) -> List[Dict]:
         """识别游戏流量"""
         game_traffic = []
 
         try:
-            # 分析UDP流量，但排除QUIC（HTTP/3）流量
-            result = subprocess.run([
-                tshark_cmd, '-r', pcap_file, '-T', 'fields',
-                '-e', 'ip.src',
-                '-e', 'ip.dst',
-                '-e', 'udp.srcport',
-                '-e', 'udp.dstport',
-                '-e', 'frame.len',
-                '-e', 'frame.time_relative',
-                '-Y', 'udp and not quic and not dns'  # 排除QUIC和DNS流量
-            ], capture_output=True, text=True, timeout=15)
-            
-            if result.returncode == 0:
-                packets = []
-                for line in result.stdout.strip().split('\n'):
-                    if line.strip():
-                        parts = line.strip().split('\t')
-                        if len(parts) >= 6:
-                            packets.append({
-                                'src_ip': parts[0],
-                                'dst_ip': parts[1],
-                                'src_port': int(parts[2]) if parts[2].isdigit() else 0,
-                                'dst_port': int(parts[3]) if parts[3].isdigit() else 0,
-                                'size': int(parts[4]) if parts[4].isdigit() else 0,
-                                'time': float(parts[5]) if parts[5].replace('.', '').isdigit() else 0,
-                            })
-                
-                # 分析流量模式
-                game_traffic = self._analyze_traffic_patterns(packets)
+            # 分析UDP流量，但排除QUIC（HTTP/3）和DNS流量
+            flows = self._aggregate_udp_flows(table)
+
+            # 评估每个流是否为游戏流量
+            for flow_data in flows:
+                if self._is_game_traffic(flow_data):
+                    game_traffic.append(flow_data)
                 
         except Exception as e:
             logger.error(f"游戏流量识别失败: {str(e)}")
             
         return game_traffic
 
-    def _analyze_traffic_patterns(self, packets: List[Dict]) -> List[Dict]:
-        """分析流量模式，识别游戏流量"""
-        game_flows = {}
-        
-        for packet in packets:
-            # 创建流标识（双向）
-            flow_key = self._create_flow_key(packet['src_ip'], packet['dst_ip'], 
-                                           packet['src_port'], packet['dst_port'])
-            
-            if flow_key not in game_flows:
-                game_flows[flow_key] = {
-                    'packets': [],
-                    'src_ip': packet['src_ip'],
-                    'dst_ip': packet['dst_ip'],
-                    'src_port': packet['src_port'],
-                    'dst_port': packet['dst_port'],
-                }
-            
-            game_flows[flow_key]['packets'].append(packet)
-        
-        # 评估每个流是否为游戏流量
-        identified_game_traffic = []
-        for flow_key, flow_data in game_flows.items():
-            if self._is_game_traffic(flow_data):
-                identified_game_traffic.append(flow_data)
-        
-        return identified_game_traffic
+    def _aggregate_udp_flows(self, table: PacketTable) -> List[Dict]:
+        """按双向流聚合UDP包，只保留每个流的统计量而不是逐包数据"""
+        mask = table.protocol_mask(require=('udp',), exclude=('quic', 'dns'))
+        columns = zip(
+            table.take(table.src_ip, mask),
+            table.take(table.dst_ip, mask),
+            table.take(table.udp_srcport, mask),
+            table.take(table.udp_dstport, mask),
+            table.take(table.length, mask),
+            table.take(table.time_relative, mask),
+        )
 
-    def _create_flow_key(self, src_ip: str, dst_ip: str, src_port: int, dst_port: int) -> str:
-        """创建流标识"""
-        # 确保双向流量使用同一个key
-        if src_ip < dst_ip or (src_ip == dst_ip and src_port < dst_port):
-            return f"{src_ip}:{src_port}-{dst_ip}:{dst_port}"
-        else:
-            return f"{dst_ip}:{dst_port}-{src_ip}:{src_port}"
+        # 流聚合: [包数, 总字节, 最早时间, 最晚时间, 源IP集合, 目标IP集合, 首包四元组]
+        aggregates = {}
+        for src_ip, dst_ip, src_port, dst_port, size, ts in columns:
+            if not src_ip or not dst_ip:
+                continue
+            if ts != ts:  # NaN
+                ts = 0.0
+            # 双向流量使用同一个key
+            if (src_ip, src_port) <= (dst_ip, dst_port):
+                key = (src_ip, src_port, dst_ip, dst_port)
+            else:
+                key = (dst_ip, dst_port, src_ip, src_port)
+
+            agg = aggregates.get(key)
+            if agg is None:
+                aggregates[key] = [1, size, ts, ts, {src_ip}, {dst_ip},
+                                   (src_ip, dst_ip, src_port, dst_port)]
+                continue
+            agg[0] += 1
+            agg[1] += size
+            if ts < agg[2]:
+                agg[2] = ts
+            elif ts > agg[3]:
+                agg[3] = ts
+            agg[4].add(src_ip)
+            agg[5].add(dst_ip)
+
+        flows = []
+        addresses = table.addresses
+        for count, total_size, first_ts, last_ts, src_ips, dst_ips, first in aggregates.values():
+            src_ip, dst_ip, src_port, dst_port = first
+            flows.append({
+                'src_ip': addresses[src_ip],
+                'dst_ip': addresses[dst_ip],
+                'src_port': src_port,
+                'dst_port': dst_port,
+                'packet_count': count,
+                'pattern': self._build_traffic_pattern(
+                    count, total_size, last_ts - first_ts, len(src_ips), len(dst_ips))
+            })
+        return flows
 
     def _is_game_traffic(self, flow_data: Dict) -> bool:
         """判断是否为游戏流量"""
-        packets = flow_data['packets']
-        if len(packets) < 10:  # 包数太少，不太可能是游戏流量
+        if flow_data['packet_count'] < 10:  # 包数太少，不太可能是游戏流量
             return False
 
         # 首先检查端口是否为游戏端口 - 这是最重要的条件
@@ -211,8 +207,7 @@ class GameTrafficAnalyzer:
         if port_score == 0:  # 如果不是游戏端口，直接排除
             return False
 
-        # 计算流量特征
-        pattern = self._calculate_traffic_pattern(packets)
+        pattern = flow_data['pattern']
 
         # 综合评分 - 提高阈值，减少误报
         total_score = 0
@@ -240,23 +235,19 @@ class GameTrafficAnalyzer:
         # 提高阈值到80分，减少误报
         return total_score >= 80
 
-    def _calculate_traffic_pattern(self, packets: List[Dict]) -> GameTrafficPattern:
-        """计算流量模式"""
-        if not packets:
+    def _build_traffic_pattern(self, packet_count: int, total_size: int, time_span: float,
+                               src_ip_count: int, dst_ip_count: int) -> GameTrafficPattern:
+        """由流的聚合统计量构建流量模式"""
+        if not packet_count:
             return GameTrafficPattern(0, 0, 0, 0, 0)
-        
-        # 计算各项指标
-        total_size = sum(p['size'] for p in packets)
-        avg_packet_size = total_size / len(packets)
+
+        avg_packet_size = total_size / packet_count
         
         # 计算频率（包/秒）
-        time_span = max(p['time'] for p in packets) - min(p['time'] for p in packets)
-        packet_frequency = len(packets) / max(time_span, 1)
+        packet_frequency = packet_count / max(time_span, 1)
         
         # 计算双向比例（简化计算）
-        src_ips = set(p['src_ip'] for p in packets)
-        dst_ips = set(p['dst_ip'] for p in packets)
-        bidirectional_ratio = min(len(src_ips), len(dst_ips)) / max(len(src_ips), len(dst_ips))
+        bidirectional_ratio = min(src_ip_count, dst_ip_count) / max(src_ip_count, dst_ip_count)
         
         return GameTrafficPattern(
             udp_ratio=1.0,  # 已经过滤了UDP
@@ -279,7 +270,7 @@ class GameTrafficAnalyzer:
         
         return min(score, 20)  # 最高20分
 
-    def _analyze_game_servers(self, tshark_cmd: str, pcap_file: str, game_traffic: List[Dict]) -> List[GameServerInfo]:
+    def _analyze_game_servers(self, game_traffic: List[Dict]) -> List[GameServerInfo]:
         """分析游戏服务器"""
         servers = []
         
@@ -289,24 +280,24 @@ class GameTrafficAnalyzer:
             server_port = flow['dst_port']
             
             # 分析服务器信息
-            server_info = self._analyze_server_info(server_ip, server_port, flow['packets'])
+            server_info = self._analyze_server_info(server_ip, server_port, flow['packet_count'])
             servers.append(server_info)
         
         return servers
 
-    def _analyze_server_info(self, ip: str, port: int, packets: List[Dict]) -> GameServerInfo:
+    def _analyze_server_info(self, ip: str, port: int, packet_count: int) -> GameServerInfo:
         """分析服务器信息"""
         # 判断ISP归属
         isp, is_china_mobile = self._resolve_isp(ip)
         
         # 计算延迟（简化计算）
-        latency_ms = self._calculate_latency(packets)
+        latency_ms = self._calculate_latency()
         
         # 计算丢包率（简化计算）
-        packet_loss_rate = self._calculate_packet_loss(packets)
+        packet_loss_rate = self._calculate_packet_loss()
         
         # 计算置信度
-        confidence_score = self._calculate_confidence(ip, port, packets)
+        confidence_score = self._calculate_confidence(ip, port, packet_count)
         
         return GameServerInfo(
             ip=ip,
@@ -342,19 +333,19 @@ class GameTrafficAnalyzer:
             logger.error(f"ISP解析失败: {str(e)}")
             return "解析失败", False
 
-    def _calculate_latency(self, packets: List[Dict]) -> float:
+    def _calculate_latency(self) -> float:
         """计算延迟（简化实现）"""
         # 这里应该分析TCP RTT或其他延迟指标
         # 暂时返回模拟值
         return 50.0
 
-    def _calculate_packet_loss(self, packets: List[Dict]) -> float:
+    def _calculate_packet_loss(self) -> float:
         """计算丢包率（简化实现）"""
         # 这里应该分析重传、乱序等指标
         # 暂时返回模拟值
         return 0.1
 
-    def _calculate_confidence(self, ip: str, port: int, packets: List[Dict]) -> float:
+    def _calculate_confidence(self, ip: str, port: int, packet_count: int) -> float:
         """计算识别置信度"""
         confidence = 50.0  # 基础置信度
         
@@ -365,9 +356,9 @@ class GameTrafficAnalyzer:
                 break
         
         # 包数量加分
-        if len(packets) > 100:
+        if packet_count > 100:
             confidence += 15
-        elif len(packets) > 50:
+        elif packet_count > 50:
             confidence += 10
         
         # IP段匹配加分
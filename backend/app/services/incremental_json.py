@@ -0,0 +1,129 @@
+"""
+增量JSON解析
+模型流式输出JSON对象时逐块喂入，顶层对象的每个字段一完整就返回，不必等整个响应结束：
+- 跳过JSON之前的说明文字和Markdown代码块标记
+- 按字符维护字符串/转义状态和嵌套深度，只有顶层字段的值闭合时才做一次json.loads
+- 单个字段解析失败时跳过该字段，最终结果仍由完整响应的解析逻辑兜底
+"""
+
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_OPENERS = ('{', '[')
+
+
+class IncrementalJSONParser:
+    """逐块解析顶层JSON对象，feed() 返回本次新完成的 [(字段名, 值)]"""
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._started = False
+        self.finished = False
+        # 嵌套的容器（'{' 或 '['），root对象为第一个
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        # 当前字段：键的起止位置、值的起始位置
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self.fields: List[Tuple[str, Any]] = []
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        if self.finished:
+            return []
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+        while self._pos < len(buffer) and not self.finished:
+            char = buffer[self._pos]
+            index = self._pos
+            self._pos += 1
+
+            if not self._started:
+                if char == '{':
+                    self._started = True
+                    self._stack.append('{')
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        if self._key is None and self._key_start is not None:
+                            ok, key = self._decode(buffer[self._key_start:index + 1])
+                            self._key = key if ok and isinstance(key, str) else ''
+                        elif self._value_start is not None:
+                            self._complete(buffer[self._value_start:index + 1], completed)
+                continue
+
+            depth = len(self._stack)
+            if char == '"':
+                self._in_string = True
+                if depth == 1:
+                    if self._key is None and self._key_start is None:
+                        self._key_start = index
+                    elif self._key is not None and self._value_start is None:
+                        self._value_start = index
+            elif char in _OPENERS:
+                if depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = index
+                self._stack.append(char)
+            elif char in ('}', ']'):
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if len(self._stack) == 1 and self._value_start is not None:
+                    # 嵌套的对象或数组闭合
+                    self._complete(buffer[self._value_start:index + 1], completed)
+                elif not self._stack:
+                    # root对象闭合：最后一个字段可能是数字/布尔值
+                    self._complete_scalar(buffer, index, completed)
+                    self.finished = True
+            elif depth == 1:
+                if char == ',':
+                    self._complete_scalar(buffer, index, completed)
+                    self._reset_field()
+                elif char == ':' or char.isspace():
+                    continue
+                elif self._key is not None and self._value_start is None:
+                    # 数字、true/false/null
+                    self._value_start = index
+        return completed
+
+    def _decode(self, text: str) -> Tuple[bool, Any]:
+        """返回 (是否解析成功, 值)，值可以是null"""
+        try:
+            return True, json.loads(text, strict=False)
+        except ValueError as e:
+            logger.debug(f"增量解析字段失败: {e}: {text[:100]}")
+            return False, None
+
+    def _complete(self, text: str, completed: List[Tuple[str, Any]]):
+        key = self._key
+        ok, value = self._decode(text)
+        self._reset_field()
+        if key and ok:
+            self.fields.append((key, value))
+            completed.append((key, value))
+
+    def _complete_scalar(self, buffer: str, end: int, completed: List[Tuple[str, Any]]):
+        """逗号或root闭合处结束尚未完成的标量值"""
+        if self._key is None or self._value_start is None:
+            return
+        text = buffer[self._value_start:end].strip()
+        if text:
+            self._complete(text, completed)
+
+    def _reset_field(self):
+        self._key_start = None
+        self._key = None
+        self._value_start = None
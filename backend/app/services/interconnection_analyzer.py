@@ -8,7 +8,9 @@ import logging
 import ipaddress
 from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass
-from collections import defaultdict
+from collections import Counter, defaultdict
+
+from app.services.packet_table import PacketTable
 
 logger = logging.getLogger(__name__)
 
@@ -59,22 +61,22 @@ class InterconnectionAnalyzer:
             'poor': {'latency': float('inf'), 'loss': float('inf')}
         }
 
-    def analyze_interconnection(self, tshark_cmd: str, pcap_file: str) -> Dict:
-        """分析互联互通质量"""
+    def analyze_interconnection(self, table: PacketTable) -> Dict:
+        """分析互联互通质量（基于共享的pcap字段表）"""
         try:
             logger.info("开始互联互通分析")
             
             # 1. 获取本地ISP信息
             local_isp = self._detect_local_isp()
             
-            # 2. 分析网络连接
-            connections = self._analyze_network_connections(tshark_cmd, pcap_file)
+            # 2. 分析网络连接（按目标IP聚合）
+            connections = self._analyze_network_connections(table)
             
             # 3. 识别远程服务器ISP
             remote_servers = self._identify_remote_servers(connections)
             
             # 4. 分析跨ISP连接质量
-            interconnection_quality = self._analyze_cross_isp_quality(connections, local_isp, remote_servers)
+            interconnection_quality = self._analyze_cross_isp_quality(local_isp, remote_servers)
             
             # 5. 生成互联互通报告
             report = self._generate_interconnection_report(local_isp, interconnection_quality)
@@ -85,7 +87,7 @@ class InterconnectionAnalyzer:
                 'interconnection_quality': interconnection_quality,
                 'report': report,
                 'analysis_summary': {
-                    'total_connections': len(connections),
+                    'total_connections': sum(c['packet_count'] for c in connections.values()),
                     'cross_isp_connections': len([q for q in interconnection_quality if q.local_isp != q.remote_isp]),
                     'avg_cross_isp_latency': self._calculate_avg_cross_isp_latency(interconnection_quality),
                     'quality_distribution': self._calculate_quality_distribution(interconnection_quality)
@@ -129,79 +131,57 @@ class InterconnectionAnalyzer:
             logger.error(f"网关ISP检测失败: {str(e)}")
             return 'unknown'
 
-    def _analyze_network_connections(self, tshark_cmd: str, pcap_file: str) -> List[Dict]:
-        """分析网络连接"""
-        connections = []
+    def _analyze_network_connections(self, table: PacketTable) -> Dict[str, Dict]:
+        """分析网络连接，按目标IP聚合TCP包数和ACK RTT"""
+        connections = {}
         
         try:
-            # 分析TCP连接
-            result = subprocess.run([
-                tshark_cmd, '-r', pcap_file, '-T', 'fields',
-                '-e', 'ip.src',
-                '-e', 'ip.dst',
-                '-e', 'tcp.srcport',
-                '-e', 'tcp.dstport',
-                '-e', 'tcp.analysis.ack_rtt',
-                '-e', 'tcp.analysis.initial_rtt',
-                '-e', 'frame.time_relative',
-                '-e', 'tcp.flags',
-                '-Y', 'tcp'
-            ], capture_output=True, text=True, timeout=15)
-            
-            if result.returncode == 0:
-                for line in result.stdout.strip().split('\n'):
-                    if line.strip():
-                        parts = line.strip().split('\t')
-                        if len(parts) >= 8:
-                            connection = {
-                                'src_ip': parts[0],
-                                'dst_ip': parts[1],
-                                'src_port': int(parts[2]) if parts[2].isdigit() else 0,
-                                'dst_port': int(parts[3]) if parts[3].isdigit() else 0,
-                                'ack_rtt': float(parts[4]) * 1000 if parts[4] and parts[4] != '' else 0,  # 转换为ms
-                                'initial_rtt': float(parts[5]) * 1000 if parts[5] and parts[5] != '' else 0,
-                                'time': float(parts[6]) if parts[6] else 0,
-                                'flags': parts[7] if len(parts) > 7 else ''
-                            }
-                            connections.append(connection)
+            # 只分析TCP包
+            mask = table.protocol_mask(require=('tcp',))
+            dst_ips = table.take(table.dst_ip, mask)
+            ack_rtts = table.take(table.ack_rtt, mask)
+
+            packet_counts = Counter(dst_ips)
+            latency_sums = defaultdict(float)
+            latency_samples = defaultdict(int)
+            for dst_ip, rtt in zip(dst_ips, ack_rtts):
+                if rtt > 0:  # NaN表示缺失
+                    latency_sums[dst_ip] += rtt * 1000  # 转换为ms
+                    latency_samples[dst_ip] += 1
+
+            for code, count in packet_counts.items():
+                if not code:
+                    continue
+                connections[table.addresses[code]] = {
+                    'packet_count': count,
+                    'latency_sum_ms': latency_sums[code],
+                    'latency_samples': latency_samples[code]
+                }
             
         except Exception as e:
             logger.error(f"网络连接分析失败: {str(e)}")
             
         return connections
 
-    def _identify_remote_servers(self, connections: List[Dict]) -> List[Dict]:
+    def _identify_remote_servers(self, connections: Dict[str, Dict]) -> List[Dict]:
         """识别远程服务器"""
-        servers = {}
-        
-        for conn in connections:
-            # 通常目标IP是服务器
-            server_ip = conn['dst_ip']
-            
-            if server_ip not in servers:
-                isp_name, isp_type = self._resolve_isp_by_ip(server_ip)
-                servers[server_ip] = {
-                    'ip': server_ip,
-                    'isp': isp_name,
-                    'isp_type': isp_type,
-                    'connections': [],
-                    'avg_latency': 0,
-                    'packet_loss_rate': 0
-                }
-            
-            servers[server_ip]['connections'].append(conn)
+        servers = []
         
-        # 计算每个服务器的性能指标
-        for server_ip, server_info in servers.items():
-            connections = server_info['connections']
-            latencies = [c['ack_rtt'] for c in connections if c['ack_rtt'] > 0]
-            
-            server_info['avg_latency'] = sum(latencies) / len(latencies) if latencies else 0
-            server_info['connection_count'] = len(connections)
-            # 简化的丢包率计算
-            server_info['packet_loss_rate'] = self._estimate_packet_loss(connections)
+        # 通常目标IP是服务器
+        for server_ip, stats in connections.items():
+            isp_name, isp_type = self._resolve_isp_by_ip(server_ip)
+            samples = stats['latency_samples']
+            servers.append({
+                'ip': server_ip,
+                'isp': isp_name,
+                'isp_type': isp_type,
+                'avg_latency': stats['latency_sum_ms'] / samples if samples else 0,
+                'connection_count': stats['packet_count'],
+                # 简化的丢包率计算
+                'packet_loss_rate': self._estimate_packet_loss(stats['packet_count'])
+            })
         
-        return list(servers.values())
+        return servers
 
     def _resolve_isp_by_ip(self, ip: str) -> Tuple[str, str]:
         """根据IP解析ISP"""
@@ -236,7 +216,7 @@ class InterconnectionAnalyzer:
             logger.error(f"IP ISP解析失败: {str(e)}")
             return '未知ISP', 'unknown'
 
-    def _analyze_cross_isp_quality(self, connections: List[Dict], local_isp: str, 
+    def _analyze_cross_isp_quality(self, local_isp: str,
                                  remote_servers: List[Dict]) -> List[InterconnectionQuality]:
         """分析跨ISP连接质量"""
         quality_results = []
@@ -292,11 +272,11 @@ class InterconnectionAnalyzer:
                 return level
         return 'poor'
 
-    def _estimate_packet_loss(self, connections: List[Dict]) -> float:
+    def _estimate_packet_loss(self, connection_count: int) -> float:
         """估算丢包率（简化实现）"""
         # 这里应该分析重传、超时等指标
         # 暂时返回基于连接数的估算值
-        if len(connections) < 10:
+        if connection_count < 10:
             return 0.5  # 连接数少，可能有问题
         else:
             return 0.1  # 正常情况
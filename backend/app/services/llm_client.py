@@ -0,0 +1,280 @@
+"""
+AI提供商的异步HTTP客户端
+每个提供商一个常驻的 httpx.AsyncClient：
+- 连接池保持keep-alive，安装了h2时使用HTTP/2（同一连接上多路复用多个请求）
+- 每个提供商同时进行的请求数有上限，超出的请求排队
+- OpenRouter/OpenAI使用兼容的 /chat/completions 接口，Anthropic使用 /v1/messages 接口
+- stream() 以SSE方式接收模型输出，逐块返回文本
+客户端按事件循环缓存（API事件循环和抓包调度器线程各自一套），应用退出时全部关闭。
+"""
+
+import asyncio
+import contextlib
+import importlib.util
+import json
+import logging
+import time
+import weakref
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 每个提供商同时进行的请求数
+MAX_CONCURRENCY = 4
+KEEPALIVE_EXPIRY = 60
+CONNECT_TIMEOUT = 10
+# 关闭其他事件循环中的客户端时的等待上限（秒）
+CLOSE_TIMEOUT = 5
+ANTHROPIC_VERSION = '2023-06-01'
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+PROVIDER_NAMES = {'openrouter': 'OpenRouter', 'openai': 'OpenAI', 'anthropic': 'Anthropic'}
+
+
+class LLMAPIError(Exception):
+    """提供商返回错误或响应格式异常"""
+
+    def __init__(self, provider: str, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.provider = provider
+        self.status = status
+
+
+class LLMClient:
+    """单个提供商的常驻异步客户端
+
+    config 为 AIProviderConfig（base_url、api_key、model、timeout、max_tokens、temperature）。
+    """
+
+    def __init__(self, provider: str, config, max_concurrency: int = MAX_CONCURRENCY):
+        if provider not in PROVIDER_NAMES:
+            raise ValueError(f"不支持的AI提供商: {provider}")
+        self.provider = provider
+        self.config = config
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=max_concurrency,
+                                max_keepalive_connections=max_concurrency,
+                                keepalive_expiry=KEEPALIVE_EXPIRY),
+            headers=self._headers(config)
+        )
+        self.active = 0
+        self.waiting = 0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def name(self) -> str:
+        return PROVIDER_NAMES[self.provider]
+
+    def _headers(self, config) -> Dict[str, str]:
+        if self.provider == 'anthropic':
+            return {
+                'x-api-key': config.api_key,
+                'anthropic-version': ANTHROPIC_VERSION,
+                'Content-Type': 'application/json'
+            }
+        headers = {
+            'Authorization': f'Bearer {config.api_key}',
+            'Content-Type': 'application/json'
+        }
+        if self.provider == 'openrouter':
+            headers['HTTP-Referer'] = 'http://localhost:3000'
+            headers['X-Title'] = 'Network Packet Analysis'
+        return headers
+
+    def _request(self, prompt: str) -> Tuple[str, Dict[str, Any]]:
+        """返回 (接口地址, 请求体)"""
+        config = self.config
+        base_url = config.base_url.rstrip('/')
+        body = {
+            'model': config.model,
+            'max_tokens': config.max_tokens,
+            'temperature': config.temperature,
+            'messages': [{'role': 'user', 'content': prompt}]
+        }
+        if self.provider == 'anthropic':
+            path = '/messages' if base_url.endswith('/v1') else '/v1/messages'
+            return base_url + path, body
+        return base_url + '/chat/completions', body
+
+    def _content(self, result: Dict) -> str:
+        try:
+            if self.provider == 'anthropic':
+                return ''.join(block.get('text', '') for block in result['content']
+                               if block.get('type', 'text') == 'text')
+            return result['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError):
+            raise LLMAPIError(self.provider, f"{self.name} API响应格式异常: {str(result)[:200]}")
+
+    @contextlib.asynccontextmanager
+    async def _slot(self):
+        """占用一个并发名额，超出上限时排队"""
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.requests += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.config.timeout, connect=CONNECT_TIMEOUT)
+
+    async def complete(self, prompt: str) -> str:
+        """发送单轮对话，返回模型输出的文本"""
+        url, body = self._request(prompt)
+        async with self._slot():
+            started = time.perf_counter()
+            try:
+                try:
+                    response = await self._client.post(url, json=body, timeout=self._timeout())
+                except httpx.TimeoutException as e:
+                    raise LLMAPIError(self.provider, f"{self.name} API请求超时: {str(e) or type(e).__name__}")
+                except httpx.HTTPError as e:
+                    raise LLMAPIError(self.provider, f"网络请求失败: {str(e) or type(e).__name__}")
+                if response.status_code != 200:
+                    raise LLMAPIError(self.provider, f"{self.name} API错误: {response.status_code} - {response.text}",
+                                      status=response.status_code)
+                try:
+                    result = response.json()
+                except ValueError:
+                    raise LLMAPIError(self.provider, f"{self.name} API返回了非JSON响应: {response.text[:200]}",
+                                      status=response.status_code)
+                content = self._content(result)
+                logger.info(f"{self.name} API调用完成，用时 {time.perf_counter() - started:.2f}秒，"
+                            f"协议 {response.http_version}，响应长度 {len(content)} 字符")
+                return content
+            except LLMAPIError:
+                self.errors += 1
+                raise
+
+    def _stream_delta(self, line: str) -> Optional[str]:
+        """解析SSE中的一行，返回文本增量（可能为空），None表示输出结束"""
+        if not line.startswith('data:'):
+            # event行、空行和 ": keep-alive" 之类的注释
+            return ''
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return None
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return ''
+        if not isinstance(event, dict):
+            return ''
+        if event.get('error'):
+            raise LLMAPIError(self.provider, f"{self.name} API流式响应错误: {str(event['error'])[:200]}")
+        if self.provider == 'anthropic':
+            if event.get('type') == 'message_stop':
+                return None
+            if event.get('type') == 'content_block_delta':
+                return (event.get('delta') or {}).get('text', '')
+            return ''
+        choices = event.get('choices') or []
+        if not choices:
+            return ''
+        return (choices[0].get('delta') or {}).get('content') or ''
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """流式发送单轮对话，模型每输出一块文本就返回一块"""
+        url, body = self._request(prompt)
+        body['stream'] = True
+        async with self._slot():
+            started = time.perf_counter()
+            first_chunk = None
+            length = 0
+            try:
+                try:
+                    async with self._client.stream('POST', url, json=body, timeout=self._timeout()) as response:
+                        if response.status_code != 200:
+                            text = (await response.aread()).decode('utf-8', errors='replace')
+                            raise LLMAPIError(self.provider, f"{self.name} API错误: {response.status_code} - {text}",
+                                              status=response.status_code)
+                        async for line in response.aiter_lines():
+                            text = self._stream_delta(line)
+                            if text is None:
+                                break
+                            if not text:
+                                continue
+                            if first_chunk is None:
+                                first_chunk = time.perf_counter() - started
+                            length += len(text)
+                            yield text
+                except httpx.TimeoutException as e:
+                    raise LLMAPIError(self.provider, f"{self.name} API请求超时: {str(e) or type(e).__name__}")
+                except httpx.HTTPError as e:
+                    raise LLMAPIError(self.provider, f"网络请求失败: {str(e) or type(e).__name__}")
+            except LLMAPIError:
+                self.errors += 1
+                raise
+            first = f"{first_chunk:.2f}秒" if first_chunk is not None else "无"
+            logger.info(f"{self.name} API流式调用完成，首个输出 {first}，"
+                        f"总用时 {time.perf_counter() - started:.2f}秒，响应长度 {length} 字符")
+
+    async def close(self):
+        await self._client.aclose()
+
+    def stats(self) -> Dict:
+        return {
+            "provider": self.provider,
+            "http2": HTTP2_AVAILABLE,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "errors": self.errors
+        }
+
+
+class LLMClientPool:
+    """每个事件循环、每个提供商（地址+密钥）一个客户端"""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._loops: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]' = weakref.WeakKeyDictionary()
+
+    def get(self, provider: str, config) -> LLMClient:
+        """返回提供商对应的客户端，模型等参数取最新的配置"""
+        loop = asyncio.get_running_loop()
+        clients = self._loops.setdefault(loop, {})
+        key = (provider, config.base_url, config.api_key)
+        client = clients.get(key)
+        if client is None:
+            client = clients[key] = LLMClient(provider, config, self.max_concurrency)
+        client.config = config
+        return client
+
+    async def close(self):
+        """关闭所有事件循环中的客户端
+
+        其他线程的事件循环（如抓包调度器）中的客户端提交到其所属循环关闭；
+        已停止的循环无法再关闭连接，直接丢弃。
+        """
+        current = asyncio.get_running_loop()
+        for loop, clients in list(self._loops.items()):
+            self._loops.pop(loop, None)
+            for client in clients.values():
+                if loop is current:
+                    await client.close()
+                elif loop.is_running():
+                    future = asyncio.run_coroutine_threadsafe(client.close(), loop)
+                    try:
+                        await asyncio.wait_for(asyncio.wrap_future(future), CLOSE_TIMEOUT)
+                    except Exception as e:
+                        logger.warning(f"关闭{client.name}客户端失败: {str(e) or type(e).__name__}")
+
+    def stats(self) -> List[Dict]:
+        return [client.stats() for clients in list(self._loops.values()) for client in clients.values()]
+
+
+llm_clients = LLMClientPool()
@@ -0,0 +1,276 @@
+"""
+AI请求路由：多提供商/模型之间的对冲请求与故障转移
+- 候选路由为所有已配置的提供商（及其备用模型），当前提供商优先，其余按近期错误率和延迟排序
+- 首选路由超过其p90延迟仍未返回时，向下一条路由发出对冲请求，取最先返回的有效响应，
+  其余请求立即取消（关闭对应的HTTP请求）
+- 请求出错或响应无效时立即转到下一条路由
+- 连续出错的路由暂时降级到最后，冷却后再恢复原来的优先级
+- 流式请求按同样的顺序尝试，收到第一块输出之前出错时转到下一条路由
+"""
+
+import asyncio
+import dataclasses
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.services.llm_client import PROVIDER_NAMES, LLMClientPool, llm_clients
+
+logger = logging.getLogger(__name__)
+
+# 延迟样本数不足时使用的对冲等待时间（秒）
+DEFAULT_HEDGE_DELAY = 10.0
+MIN_HEDGE_DELAY = 1.0
+# 计算p90所需的最少样本数
+MIN_SAMPLES = 5
+LATENCY_WINDOW = 50
+OUTCOME_WINDOW = 20
+# 同时进行的请求数（首选 + 对冲）
+MAX_PARALLEL = 2
+# 连续出错多少次后降级，降级持续时间（秒）
+FAILURE_THRESHOLD = 3
+COOLDOWN = 60.0
+
+
+class RouteStats:
+    """单条路由（提供商+模型）的近期延迟和成败记录"""
+
+    def __init__(self):
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.outcomes: Deque[bool] = deque(maxlen=OUTCOME_WINDOW)
+        self.requests = 0
+        self.successes = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.last_error: Optional[str] = None
+
+    def record_success(self, latency: float):
+        self.successes += 1
+        self.consecutive_errors = 0
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+
+    def record_error(self, error: str):
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.last_error = error
+        self.outcomes.append(False)
+        if self.consecutive_errors >= FAILURE_THRESHOLD:
+            self.cooldown_until = time.monotonic() + COOLDOWN
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def hedge_delay(self) -> float:
+        p90 = self.percentile(0.9)
+        return DEFAULT_HEDGE_DELAY if p90 is None else max(MIN_HEDGE_DELAY, p90)
+
+    def to_dict(self) -> Dict:
+        p50, p90 = self.percentile(0.5), self.percentile(0.9)
+        return {
+            "requests": self.requests,
+            "successes": self.successes,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "error_rate": round(self.error_rate, 3),
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p90": round(p90, 3) if p90 is not None else None,
+            "cooling_down": self.cooling_down,
+            "last_error": self.last_error
+        }
+
+
+class InvalidResponse(Exception):
+    """提供商返回了不可用的内容"""
+
+
+class LLMRouter:
+    """在已配置的提供商之间对冲和故障转移"""
+
+    def __init__(self, clients: LLMClientPool = llm_clients, max_parallel: int = MAX_PARALLEL):
+        self.clients = clients
+        self.max_parallel = max_parallel
+        # "提供商/模型" -> 统计
+        self._stats: Dict[str, RouteStats] = {}
+
+    def _route_stats(self, key: str) -> RouteStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = RouteStats()
+        return stats
+
+    def routes(self, config_manager) -> List[Tuple[str, object]]:
+        """按优先级返回候选路由 [(提供商, 配置)]"""
+        candidates = []
+        for provider, config in config_manager.providers.items():
+            if provider not in PROVIDER_NAMES or not config_manager.validate_config(provider):
+                continue
+            candidates.append((provider, config))
+            if config.fallback_model and config.fallback_model != config.model:
+                candidates.append((provider, dataclasses.replace(config, model=config.fallback_model)))
+
+        current = config_manager.current_provider
+        current_model = config_manager.providers[current].model if current in config_manager.providers else None
+
+        def priority(route):
+            provider, config = route
+            stats = self._route_stats(f"{provider}/{config.model}")
+            p50 = stats.percentile(0.5)
+            return (
+                stats.cooling_down,
+                not (provider == current and config.model == current_model),
+                provider != current,
+                round(stats.error_rate, 1),
+                p50 if p50 is not None else DEFAULT_HEDGE_DELAY
+            )
+
+        return sorted(candidates, key=priority)
+
+    async def _attempt(self, provider: str, config, prompt: str,
+                       validate: Optional[Callable[[str], bool]]) -> str:
+        content = await self.clients.get(provider, config).complete(prompt)
+        if validate is not None and not validate(content):
+            raise InvalidResponse(f"{PROVIDER_NAMES[provider]} 返回的内容无效: {content[:100]}")
+        return content
+
+    async def complete(self, prompt: str, config_manager,
+                       validate: Optional[Callable[[str], bool]] = None) -> Dict:
+        """返回最先完成的有效响应
+        {"content", "provider", "model", "latency", "hedged", "attempts"}
+        """
+        routes = self.routes(config_manager)
+        if not routes:
+            raise Exception("AI配置无效：请检查环境变量设置")
+
+        started = time.perf_counter()
+        running: Dict[asyncio.Task, Tuple[str, object, float]] = {}
+        attempts: List[Dict] = []
+        next_route = 0
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            nonlocal next_route
+            provider, config = routes[next_route]
+            next_route += 1
+            key = f"{provider}/{config.model}"
+            self._route_stats(key).requests += 1
+            task = asyncio.ensure_future(self._attempt(provider, config, prompt, validate))
+            running[task] = (provider, config, time.perf_counter())
+            logger.info(f"发送AI请求: {key}")
+
+        launch()
+        try:
+            while running:
+                # 最近发出的请求超过其p90延迟仍未返回时，再发出一条对冲请求
+                can_hedge = next_route < len(routes) and len(running) < self.max_parallel
+                delay = None
+                if can_hedge:
+                    provider, config, sent_at = list(running.values())[-1]
+                    hedge_at = sent_at + self._route_stats(f"{provider}/{config.model}").hedge_delay()
+                    delay = max(0.0, hedge_at - time.perf_counter())
+                done, _ = await asyncio.wait(running, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    logger.info(f"AI请求超过p90延迟，对冲到 {routes[next_route][0]}/{routes[next_route][1].model}")
+                    launch()
+                    continue
+
+                for task in done:
+                    provider, config, sent_at = running.pop(task)
+                    key = f"{provider}/{config.model}"
+                    stats = self._route_stats(key)
+                    latency = time.perf_counter() - sent_at
+                    error = task.exception()
+                    if error is None:
+                        stats.record_success(latency)
+                        attempts.append({"route": key, "status": "success", "latency": round(latency, 3)})
+                        return {
+                            "content": task.result(),
+                            "provider": provider,
+                            "model": config.model,
+                            "latency": round(time.perf_counter() - started, 3),
+                            "hedged": hedged,
+                            "attempts": attempts
+                        }
+                    stats.record_error(str(error))
+                    attempts.append({"route": key, "status": "error", "latency": round(latency, 3),
+                                     "error": str(error)})
+                    last_error = error
+                    logger.warning(f"AI请求失败: {key}: {error}")
+
+                # 出错后立即转到下一条路由
+                if next_route < len(routes) and len(running) < self.max_parallel:
+                    launch()
+
+            raise last_error
+        finally:
+            # 取消未完成的请求（包括对冲中落后的请求和外部超时取消）
+            for task, (provider, config, _) in running.items():
+                if not task.cancel():
+                    continue
+                self._route_stats(f"{provider}/{config.model}").cancelled += 1
+                attempts.append({"route": f"{provider}/{config.model}", "status": "cancelled"})
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    async def stream(self, prompt: str, config_manager) -> AsyncIterator[Tuple[str, str, str]]:
+        """流式请求，逐块返回 (提供商, 模型, 文本增量)
+
+        已经输出的内容无法撤回，所以只在收到第一块输出之前故障转移，之后出错直接抛出。
+        """
+        routes = self.routes(config_manager)
+        if not routes:
+            raise Exception("AI配置无效：请检查环境变量设置")
+
+        last_error: Optional[BaseException] = None
+        for provider, config in routes:
+            key = f"{provider}/{config.model}"
+            stats = self._route_stats(key)
+            stats.requests += 1
+            sent_at = time.perf_counter()
+            started = False
+            chunks = self.clients.get(provider, config).stream(prompt)
+            logger.info(f"发送流式AI请求: {key}")
+            try:
+                async for text in chunks:
+                    started = True
+                    yield provider, config.model, text
+                if not started:
+                    raise InvalidResponse(f"{PROVIDER_NAMES[provider]} 返回了空响应")
+            except (asyncio.CancelledError, GeneratorExit):
+                stats.cancelled += 1
+                raise
+            except Exception as e:
+                stats.record_error(str(e))
+                if started:
+                    raise
+                last_error = e
+                logger.warning(f"流式AI请求失败: {key}: {e}")
+                continue
+            finally:
+                await chunks.aclose()
+            stats.record_success(time.perf_counter() - sent_at)
+            return
+
+        raise last_error
+
+    def stats(self) -> Dict[str, Dict]:
+        return {key: stats.to_dict() for key, stats in self._stats.items()}
+
+
+llm_router = LLMRouter()
@@ -0,0 +1,37 @@
+"""
+NDJSON流式输出
+后台任务通过回调产生进度事件，每个事件到达即输出一行，任务结束后输出最终结果行。
+生成器被关闭时（客户端断开）取消后台任务。路由追踪、端口扫描、MCP诊断的流式接口共用。
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+
+def ndjson_line(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str) + "\n"
+
+
+async def stream_ndjson(run: Callable[[Callable[[Any], None]], Awaitable[Any]],
+                        result_line: Callable[[asyncio.Future], Dict]) -> AsyncIterator[str]:
+    """run(emit) 返回后台任务的协程，emit(event) 输出一行事件；
+    任务结束后输出 result_line(task)，其中可用 task.result() 取结果或异常
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    task = asyncio.ensure_future(run(events.put_nowait))
+    getter: Optional[asyncio.Task] = None
+    try:
+        while not task.done() or not events.empty():
+            getter = asyncio.ensure_future(events.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield ndjson_line(getter.result())
+            else:
+                getter.cancel()
+            getter = None
+        yield ndjson_line(result_line(task))
+    finally:
+        if getter is not None:
+            getter.cancel()
+        task.cancel()
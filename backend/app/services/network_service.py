@@ -3,10 +3,12 @@ import subprocess
 import time
 import json
 from typing import Dict, List, Optional
-import speedtest
 import ping3
 import psutil
 
+from app.services.command_runner import run_command
+from app.services.throughput_tester import DEFAULT_DURATION, run_throughput_test
+
 class NetworkService:
     def __init__(self):
         self.test_results = {}  # 存储测试结果
@@ -71,45 +73,50 @@ class NetworkService:
             
             # 更新进度: 初始化
             self.test_results[test_id]["progress"] = 10
-            
-            # 创建speedtest实例
-            st = speedtest.Speedtest()
-            
-            # 更新进度: 获取服务器列表
+
+            # servers为下载测速地址列表，未指定时使用默认测速端点
+            download_urls = [url for url in (servers or []) if url.startswith(('http://', 'https://'))]
+            directions = int(download_test) + int(upload_test)
+            total_seconds = DEFAULT_DURATION * max(1, directions)
+
+            def on_sample(sample: Dict):
+                # 按已测时长推进进度（20% ~ 95%）
+                done = sample["t"] + (DEFAULT_DURATION if sample["direction"] == "upload" and download_test else 0)
+                self.test_results[test_id]["progress"] = min(95, 20 + int(75 * done / total_seconds))
+
             self.test_results[test_id]["progress"] = 20
-            st.get_servers()
-            
-            # 选择最佳服务器
-            self.test_results[test_id]["progress"] = 30
-            st.get_best_server()
-            
+            test = await run_throughput_test(
+                download_urls=download_urls or None,
+                download=download_test,
+                upload=upload_test,
+                on_sample=on_sample
+            )
+
             results = {
                 "server": {
-                    "name": st.best["sponsor"],
-                    "location": f"{st.best['name']}, {st.best['country']}",
-                    "distance": st.best["d"],
-                    "latency": st.best["latency"]
+                    "name": test["server"],
+                    "location": None,
+                    "distance": None,
+                    "latency": test["latency"]
                 }
             }
-            
+
             # 下载测试
             if download_test:
-                self.test_results[test_id]["progress"] = 50
-                download_speed = st.download()
                 results["download"] = {
-                    "speed_bps": download_speed,
-                    "speed_mbps": download_speed / 1_000_000
+                    "speed_bps": test["download"]["mbps"] * 1_000_000,
+                    "speed_mbps": test["download"]["mbps"],
+                    "samples": test["download"]["samples"]
                 }
-            
+
             # 上传测试
             if upload_test:
-                self.test_results[test_id]["progress"] = 80
-                upload_speed = st.upload()
                 results["upload"] = {
-                    "speed_bps": upload_speed,
-                    "speed_mbps": upload_speed / 1_000_000
+                    "speed_bps": test["upload"]["mbps"] * 1_000_000,
+                    "speed_mbps": test["upload"]["mbps"],
+                    "samples": test["upload"]["samples"]
                 }
-            
+
             # 完成测试
             self.test_results[test_id].update({
                 "status": "completed",
@@ -211,18 +218,16 @@ class NetworkService:
                 "error": None
             }
             
-            # 执行traceroute命令
+            # 执行traceroute命令（在子进程中异步等待，不阻塞事件循环）
             cmd = ["traceroute", "-m", "30", target]
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True
-            )
-            
-            stdout, stderr = process.communicate()
+            try:
+                # 最多30跳，每跳3个探测包，每个探测默认最多等待5秒
+                result = await run_command(cmd, timeout=30 * 3 * 5 + 10)
+            except subprocess.TimeoutExpired:
+                raise Exception("Traceroute超时")
+            stdout, stderr = result.stdout, result.stderr
             
-            if process.returncode == 0:
+            if result.returncode == 0:
                 results = {
                     "target": target,
                     "hops": [],
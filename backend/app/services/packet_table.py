@@ -0,0 +1,202 @@
+"""
+列式数据包表
+按列用array存储数据包字段：时间为float64、长度/端口为无符号整数，
+IP地址、协议栈和域名等字符串驻留为uint32编码。
+所有pcap分析器共享同一份表，避免为每个数据包创建Python对象。
+"""
+
+import math
+from array import array
+from collections import Counter
+from itertools import compress
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+NAN = float('nan')
+
+# 列定义：(列名, tshark字段, array类型码, 解析方式)
+# 缺失值约定：浮点列为NaN，整数列为0，dns_resp_code为-1，驻留列为0（空字符串）
+COLUMN_SPECS = [
+    ('time_epoch', 'frame.time_epoch', 'd', 'float'),
+    ('time_relative', 'frame.time_relative', 'd', 'float'),
+    ('length', 'frame.len', 'I', 'int'),
+    ('protocols', 'frame.protocols', 'I', 'protocol'),
+    ('src_ip', 'ip.src', 'I', 'address'),
+    ('dst_ip', 'ip.dst', 'I', 'address'),
+    ('tcp_srcport', 'tcp.srcport', 'H', 'int'),
+    ('tcp_dstport', 'tcp.dstport', 'H', 'int'),
+    ('tcp_flags', 'tcp.flags', 'H', 'hex'),
+    ('ack_rtt', 'tcp.analysis.ack_rtt', 'd', 'float'),
+    ('initial_rtt', 'tcp.analysis.initial_rtt', 'd', 'float'),
+    ('retransmission', 'tcp.analysis.retransmission', 'B', 'flag'),
+    ('duplicate_ack', 'tcp.analysis.duplicate_ack', 'B', 'flag'),
+    ('fast_retransmission', 'tcp.analysis.fast_retransmission', 'B', 'flag'),
+    ('udp_srcport', 'udp.srcport', 'H', 'int'),
+    ('udp_dstport', 'udp.dstport', 'H', 'int'),
+    ('dns_qry_name', 'dns.qry.name', 'I', 'string'),
+    ('dns_resp_code', 'dns.resp.code', 'h', 'int'),
+    ('dns_time', 'dns.time', 'd', 'float'),
+    ('http_host', 'http.host', 'I', 'string'),
+    ('http_method', 'http.request.method', 'I', 'string'),
+    ('http_response_code', 'http.response.code', 'H', 'int'),
+    ('tls_sni', 'tls.handshake.extensions_server_name', 'I', 'string'),
+]
+
+_DEFAULTS = {'d': NAN, 'h': -1}
+
+
+class StringPool:
+    """字符串驻留池，把重复出现的字符串映射为整数编码，编码0固定为空字符串"""
+
+    def __init__(self):
+        self.values: List[str] = ['']
+        self._codes: Dict[str, int] = {'': 0}
+
+    def intern(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def code_of(self, value: str) -> int:
+        """查询已有字符串的编码，不存在时返回-1"""
+        return self._codes.get(value, -1)
+
+    def __getitem__(self, code: int) -> str:
+        return self.values[code]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class PacketTable:
+    """列式数据包表"""
+
+    def __init__(self):
+        for name, _, typecode, _ in COLUMN_SPECS:
+            setattr(self, name, array(typecode))
+        self.addresses = StringPool()
+        self.protocol_stacks = StringPool()
+        self.strings = StringPool()
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def make_loader(self, fields: Sequence[str]) -> Callable[[Sequence[str]], None]:
+        """根据tshark输出的字段顺序生成逐行装载函数"""
+        positions = {field: i for i, field in enumerate(fields)}
+        pools = {'address': self.addresses, 'protocol': self.protocol_stacks, 'string': self.strings}
+        plan = []
+
+        for name, field, typecode, kind in COLUMN_SPECS:
+            if kind in pools:
+                parse = pools[kind].intern
+            elif kind == 'float':
+                parse = float
+            elif kind == 'hex':
+                parse = lambda value: int(value, 0)
+            elif kind == 'flag':
+                parse = lambda value: 1
+            else:
+                parse = int
+            plan.append((getattr(self, name), positions.get(field), parse,
+                         _DEFAULTS.get(typecode, 0)))
+
+        def load(parts: Sequence[str]) -> None:
+            width = len(parts)
+            for column, index, parse, default in plan:
+                value = parts[index] if index is not None and index < width else ''
+                if value:
+                    try:
+                        column.append(parse(value))
+                        continue
+                    except (ValueError, OverflowError):
+                        pass
+                column.append(default)
+            self._count += 1
+
+        return load
+
+    def make_appender(self) -> Callable[..., None]:
+        """生成按列名追加一行已解码值的函数，未给出的列填充缺失值
+
+        供原生pcap解析器使用，字符串列需由调用方先驻留为编码
+        """
+        plan = [(name, getattr(self, name).append, _DEFAULTS.get(typecode, 0))
+                for name, _, typecode, _ in COLUMN_SPECS]
+
+        def append(**values) -> None:
+            for name, add, default in plan:
+                add(values.get(name, default))
+            self._count += 1
+
+        return append
+
+    @classmethod
+    def from_rows(cls, fields: Sequence[str], rows: Iterable[Sequence[str]]) -> 'PacketTable':
+        """从按字段顺序排列的文本行构建表"""
+        table = cls()
+        load = table.make_loader(fields)
+        for row in rows:
+            load(row)
+        return table
+
+    def nbytes(self) -> int:
+        """列数据占用的字节数（不含驻留池）"""
+        return sum(getattr(self, name).itemsize * self._count for name, _, _, _ in COLUMN_SPECS)
+
+    # ---- 查询辅助 ----
+
+    def protocol_mask(self, require: Iterable[str] = (), exclude: Iterable[str] = ()) -> bytes:
+        """按协议栈生成0/1掩码，相当于tshark的 -Y 'udp and not dns'
+
+        只对每个不同的协议栈判断一次，再按编码映射到所有数据包
+        """
+        require = tuple(require)
+        exclude = tuple(exclude)
+        lookup = bytearray(len(self.protocol_stacks))
+        for code, stack_str in enumerate(self.protocol_stacks.values):
+            stack = stack_str.split(':')
+            if all(p in stack for p in require) and not any(p in stack for p in exclude):
+                lookup[code] = 1
+        return bytes(map(lookup.__getitem__, self.protocols))
+
+    def nonzero_mask(self, column: array) -> bytes:
+        """非零（非缺失）值掩码，适用于端口和驻留列"""
+        return bytes(map(bool, column))
+
+    @staticmethod
+    def combine(*masks: bytes) -> bytes:
+        """多个掩码按位与"""
+        if len(masks) == 1:
+            return masks[0]
+        return bytes(map(min, *masks))
+
+    def indices(self, mask: Optional[bytes] = None) -> Iterator[int]:
+        """掩码为1的行下标"""
+        if mask is None:
+            return iter(range(self._count))
+        return compress(range(self._count), mask)
+
+    @staticmethod
+    def take(column: array, mask: bytes) -> List:
+        """按掩码取出某列的值"""
+        return list(compress(column, mask))
+
+    @staticmethod
+    def valid(values: Iterable[float]) -> List[float]:
+        """过滤掉NaN缺失值"""
+        return [v for v in values if not math.isnan(v)]
+
+    def top_protocol_counts(self) -> Dict[str, int]:
+        """统计每个包最上层协议的数量"""
+        counts: Dict[str, int] = {}
+        for code, count in Counter(self.protocols).items():
+            stack = self.protocol_stacks[code]
+            if not stack:
+                continue
+            top = stack.split(':')[-1].upper()
+            counts[top] = counts.get(top, 0) + count
+        return counts
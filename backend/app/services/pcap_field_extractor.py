@@ -0,0 +1,112 @@
+"""
+pcap单次字段提取引擎
+对同一个pcap文件只调用一次tshark，输出所有分析器所需字段的并集，
+逐行流式装载进列式数据包表，各分析器共享同一份数据
+"""
+
+import re
+import subprocess
+import threading
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+from app.services.packet_table import COLUMN_SPECS, PacketTable
+
+logger = logging.getLogger(__name__)
+
+# 所有分析器需要的字段并集（顺序即输出列顺序）
+TSHARK_FIELDS = [field for _, field, _, _ in COLUMN_SPECS]
+
+# 单次提取的超时时间（秒），原来每个分析器单独10-15秒
+EXTRACT_TIMEOUT = 120
+
+
+def extract_pcap_fields(tshark_cmd: str, pcap_file: str,
+                        fields: Sequence[str] = TSHARK_FIELDS,
+                        timeout: int = EXTRACT_TIMEOUT) -> PacketTable:
+    """调用一次tshark提取所有字段
+
+    如果当前tshark版本不支持某些字段，会去掉这些字段重试一次，
+    缺失的字段在表中以缺失值填充。
+    """
+    fields = list(fields)
+    table, stderr = _run_tshark(tshark_cmd, pcap_file, fields, timeout)
+    if table is not None:
+        return table
+
+    # 尝试剔除无效字段后重试
+    invalid = _parse_invalid_fields(stderr, fields)
+    if not invalid:
+        raise RuntimeError(f"tshark字段提取失败: {stderr.strip()}")
+
+    logger.warning(f"tshark不支持以下字段，已跳过: {', '.join(invalid)}")
+    valid_fields = [f for f in fields if f not in invalid]
+    table, stderr = _run_tshark(tshark_cmd, pcap_file, valid_fields, timeout)
+    if table is None:
+        raise RuntimeError(f"tshark字段提取失败: {stderr.strip()}")
+    return table
+
+
+def build_tshark_command(tshark_cmd: str, source: str, fields: Sequence[str],
+                         line_buffered: bool = False) -> List[str]:
+    """构建字段提取命令，source为'-'时从标准输入读取pcap流"""
+    cmd = [tshark_cmd]
+    if line_buffered:
+        cmd.append('-l')  # 每个包输出后立即刷新，用于流式解析
+    cmd.extend(['-r', source, '-T', 'fields', '-E', 'separator=/t', '-E', 'occurrence=f'])
+    for field in fields:
+        cmd.extend(['-e', field])
+    return cmd
+
+
+def _run_tshark(tshark_cmd: str, pcap_file: str, fields: Sequence[str],
+                timeout: int) -> Tuple[Optional[PacketTable], str]:
+    """执行tshark并逐行装载输出；成功返回(表, '')，失败返回(None, stderr)"""
+    cmd = build_tshark_command(tshark_cmd, pcap_file, fields)
+
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    timed_out = threading.Event()
+
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+
+    # stdout逐行装载的同时在单独线程读完stderr，避免tshark写满stderr管道后阻塞、stdout永远读不完
+    stderr_chunks: List[str] = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+    try:
+        table = PacketTable()
+        load = table.make_loader(fields)
+        for line in process.stdout:
+            line = line.rstrip('\r\n')
+            if line:
+                load(line.split('\t'))
+        process.wait()
+    finally:
+        timer.cancel()
+        if process.returncode is None:
+            process.kill()
+            process.wait()
+        stderr_reader.join()
+        process.stdout.close()
+        process.stderr.close()
+    stderr = ''.join(stderr_chunks)
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if process.returncode != 0:
+        return None, stderr or f"returncode={process.returncode}"
+
+    logger.info(f"tshark单次提取完成: {len(table)} 个包, 列数据 {table.nbytes()} 字节")
+    return table, ''
+
+
+def _parse_invalid_fields(stderr: str, fields: Sequence[str]) -> List[str]:
+    """从tshark错误输出中解析无效字段名"""
+    if "aren't valid" not in stderr and 'not valid' not in stderr:
+        return []
+    candidates = set(re.findall(r'[A-Za-z0-9_.]+', stderr))
+    return [f for f in fields if f in candidates]
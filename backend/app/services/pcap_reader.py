@@ -0,0 +1,479 @@
+"""
+原生pcap/pcapng解析器
+不依赖tshark，用mmap直接读取抓包文件，按偏移解码 Ethernet/VLAN/SLL、IPv4/IPv6、
+TCP/UDP、DNS头部、HTTP首行以及TLS ClientHello中的SNI，
+结果装载进与tshark提取相同的列式数据包表，所有分析器无需改动即可使用。
+
+TCP分析字段（ack_rtt、重传、重复ACK、initial_rtt）按tshark的规则做了简化实现，
+不做分段重组，因此只识别单个报文段内完整出现的HTTP头和ClientHello。
+"""
+
+import math
+import mmap
+import os
+import socket
+import struct
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.services.packet_table import PacketTable
+
+logger = logging.getLogger(__name__)
+
+NAN = float('nan')
+
+# 链路层类型（LINKTYPE_*）
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+# pcap文件头魔数 -> (字节序, 时间戳小数部分单位)
+PCAP_MAGICS = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+PCAPNG_SHB = b'\x0a\x0d\x0d\x0a'
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_ARP = 0x0806
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = (0x8100, 0x88a8)
+
+IP_PROTOCOLS = {1: 'icmp', 2: 'igmp', 6: 'tcp', 17: 'udp', 58: 'icmpv6'}
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+SEQ_MASK = 0xffffffff
+
+HTTP_METHODS = (b'GET', b'POST', b'HEAD', b'PUT', b'DELETE', b'OPTIONS', b'PATCH', b'CONNECT')
+# 查找HTTP Host头时最多扫描的字节数
+HTTP_HEADER_SCAN = 4096
+
+_U16 = struct.Struct('>H')
+_IPV4 = struct.Struct('>BBHHHBBH4s4s')
+_TCP = struct.Struct('>HHIIH')
+_UDP = struct.Struct('>HHH')
+_DNS = struct.Struct('>HHH')
+
+
+def read_pcap(pcap_file: str) -> PacketTable:
+    """解析pcap或pcapng文件，返回列式数据包表"""
+    table = PacketTable()
+    if os.path.getsize(pcap_file) == 0:
+        return table
+
+    with open(pcap_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf, memoryview(buf) as view:
+            decoder = PacketDecoder(table)
+            for ts, linktype, offset, caplen, origlen in iter_frames(buf):
+                # 每帧是映射内存上的零拷贝切片，越界读取会抛出异常而不会读到下一帧
+                decoder.decode(ts, linktype, view[offset:offset + caplen], origlen)
+
+    logger.info(f"原生pcap解析完成: {len(table)} 个包, 列数据 {table.nbytes()} 字节")
+    return table
+
+
+def iter_frames(buf) -> Iterator[Tuple[float, int, int, int, int]]:
+    """遍历文件中的帧，产出 (时间戳, 链路类型, 数据偏移, 捕获长度, 原始长度)"""
+    magic = bytes(buf[:4])
+    if magic in PCAP_MAGICS:
+        return _iter_pcap(buf, *PCAP_MAGICS[magic])
+    if magic == PCAPNG_SHB:
+        return _iter_pcapng(buf)
+    raise ValueError(f"不支持的抓包文件格式: magic={magic.hex()}")
+
+
+def _iter_pcap(buf, endian: str, scale: float):
+    if len(buf) < 24:
+        return
+    linktype = struct.unpack_from(endian + 'I', buf, 20)[0] & 0x0fffffff
+    record = struct.Struct(endian + 'IIII')
+    pos, size = 24, len(buf)
+    while pos + 16 <= size:
+        sec, frac, caplen, origlen = record.unpack_from(buf, pos)
+        pos += 16
+        if pos + caplen > size:
+            break  # 抓包被中断时最后一条记录可能不完整
+        yield sec + frac * scale, linktype, pos, caplen, origlen
+        pos += caplen
+
+
+def _iter_pcapng(buf):
+    pos, size = 0, len(buf)
+    endian = '<'
+    interfaces: List[Tuple[int, float]] = []
+    last_ts = 0.0
+
+    while pos + 12 <= size:
+        if bytes(buf[pos:pos + 4]) == PCAPNG_SHB:
+            endian = '<' if bytes(buf[pos + 8:pos + 12]) == b'\x4d\x3c\x2b\x1a' else '>'
+            interfaces = []
+        block_type, block_len = struct.unpack_from(endian + 'II', buf, pos)
+        if block_len < 12 or pos + block_len > size:
+            break
+        body, body_end = pos + 8, pos + block_len - 4
+
+        if block_type == 1:  # Interface Description Block
+            linktype = struct.unpack_from(endian + 'H', buf, body)[0]
+            interfaces.append((linktype, _pcapng_tsresol(buf, body + 8, body_end, endian)))
+        elif block_type in (6, 2):  # Enhanced Packet Block / 旧版Packet Block
+            if block_type == 6:
+                iface, ts_high, ts_low, caplen, origlen = struct.unpack_from(endian + 'IIIII', buf, body)
+            else:
+                iface, _, ts_high, ts_low, caplen, origlen = struct.unpack_from(endian + 'HHIIII', buf, body)
+            data = body + 20
+            if iface < len(interfaces) and data + caplen <= body_end:
+                linktype, scale = interfaces[iface]
+                last_ts = ((ts_high << 32) | ts_low) * scale
+                yield last_ts, linktype, data, caplen, origlen
+        elif block_type == 3 and interfaces:  # Simple Packet Block，无时间戳
+            origlen = struct.unpack_from(endian + 'I', buf, body)[0]
+            caplen = min(origlen, body_end - body - 4)
+            yield last_ts, interfaces[0][0], body + 4, caplen, origlen
+
+        pos += block_len
+
+
+def _pcapng_tsresol(buf, pos: int, end: int, endian: str) -> float:
+    """从IDB选项中读取if_tsresol，默认微秒"""
+    while pos + 4 <= end:
+        code, length = struct.unpack_from(endian + 'HH', buf, pos)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = buf[pos + 4]
+            return 2.0 ** -(value & 0x7f) if value & 0x80 else 10.0 ** -value
+        pos += 4 + ((length + 3) & ~3)
+    return 1e-6
+
+
+def _seq_after(a: int, b: int) -> bool:
+    """TCP序号比较（考虑回绕）：a在b之后"""
+    return a != b and ((a - b) & SEQ_MASK) < 0x80000000
+
+
+class PacketDecoder:
+    """逐帧解码并追加到列式表，同时维护TCP和DNS的会话状态"""
+
+    def __init__(self, table: PacketTable):
+        self.table = table
+        self._append = table.make_appender()
+        self._address_codes: Dict[bytes, int] = {}
+        self._first_ts: Optional[float] = None
+        # 方向 -> [下一个期望序号, {报文段结束序号: 发送时间}, 上一个ACK号, 重复ACK计数]
+        self._tcp_directions: Dict[tuple, list] = {}
+        # 会话 -> [SYN时间, SYN-ACK时间, initial_rtt]
+        self._tcp_conversations: Dict[tuple, list] = {}
+        # (事务ID, 客户端地址, 客户端端口) -> 查询时间
+        self._dns_queries: Dict[tuple, float] = {}
+
+    def decode(self, ts: float, linktype: int, frame: memoryview, origlen: int):
+        if self._first_ts is None:
+            self._first_ts = ts
+        row = {'time_epoch': ts, 'time_relative': ts - self._first_ts, 'length': origlen}
+        stack: List[str] = []
+        try:
+            self._decode_link(row, stack, ts, linktype, frame, 0, len(frame))
+        except (struct.error, IndexError, ValueError):
+            pass  # 截断或畸形的包，保留已解出的字段
+        row['protocols'] = self.table.protocol_stacks.intern(':'.join(stack))
+        self._append(**row)
+
+    # ---- 链路层 / 网络层 ----
+
+    def _decode_link(self, row, stack, ts, linktype, buf, pos, end):
+        if linktype == LINKTYPE_ETHERNET:
+            stack.extend(('eth', 'ethertype'))
+            ethertype = _U16.unpack_from(buf, pos + 12)[0]
+            pos += 14
+            while ethertype in ETHERTYPE_VLAN:
+                stack.extend(('vlan', 'ethertype'))
+                ethertype = _U16.unpack_from(buf, pos + 2)[0]
+                pos += 4
+        elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+            stack.append('null')
+            family = struct.unpack_from('>I' if linktype == LINKTYPE_LOOP else '<I', buf, pos)[0]
+            if family > 0xffff:  # NULL头是抓包主机字节序
+                family = struct.unpack_from('>I', buf, pos)[0]
+            ethertype = ETHERTYPE_IPV4 if family == socket.AF_INET else ETHERTYPE_IPV6
+            pos += 4
+        elif linktype == LINKTYPE_LINUX_SLL:
+            stack.extend(('sll', 'ethertype'))
+            ethertype = _U16.unpack_from(buf, pos + 14)[0]
+            pos += 16
+        elif linktype == LINKTYPE_LINUX_SLL2:
+            stack.extend(('sll', 'ethertype'))
+            ethertype = _U16.unpack_from(buf, pos)[0]
+            pos += 20
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6, 12, 14):
+            stack.append('raw')
+            ethertype = ETHERTYPE_IPV6 if buf[pos] >> 4 == 6 else ETHERTYPE_IPV4
+        else:
+            return
+
+        if ethertype == ETHERTYPE_IPV4:
+            self._decode_ipv4(row, stack, ts, buf, pos, end)
+        elif ethertype == ETHERTYPE_IPV6:
+            self._decode_ipv6(row, stack, ts, buf, pos, end)
+        elif ethertype == ETHERTYPE_ARP:
+            stack.append('arp')
+
+    def _decode_ipv4(self, row, stack, ts, buf, pos, end):
+        stack.append('ip')
+        ver_ihl, _, total_len, _, frag, _, proto, _, src, dst = _IPV4.unpack_from(buf, pos)
+        header_len = (ver_ihl & 0x0f) * 4
+        # 与tshark一致：ip.src/ip.dst只对IPv4填充
+        row['src_ip'] = self._address(src)
+        row['dst_ip'] = self._address(dst)
+        # 总长度为0时（TSO）以捕获长度为准
+        ip_end = pos + total_len if total_len >= header_len else end
+        if frag & 0x1fff:
+            return  # 非首个分片，没有传输层头
+        self._decode_transport(row, stack, ts, proto, src, dst, buf, pos + header_len, ip_end, end)
+
+    def _decode_ipv6(self, row, stack, ts, buf, pos, end):
+        stack.append('ipv6')
+        payload_len = _U16.unpack_from(buf, pos + 4)[0]
+        next_header = buf[pos + 6]
+        src = bytes(buf[pos + 8:pos + 24])
+        dst = bytes(buf[pos + 24:pos + 40])
+        ip_end = pos + 40 + payload_len if payload_len else end
+        pos += 40
+        while True:
+            if next_header in IPV6_EXTENSION_HEADERS:
+                next_header, length = buf[pos], (buf[pos + 1] + 1) * 8
+            elif next_header == 44:  # 分片头
+                if _U16.unpack_from(buf, pos + 2)[0] & 0xfff8:
+                    return
+                next_header, length = buf[pos], 8
+            elif next_header == 51:  # AH
+                next_header, length = buf[pos], (buf[pos + 1] + 2) * 4
+            else:
+                break
+            pos += length
+        self._decode_transport(row, stack, ts, next_header, src, dst, buf, pos, ip_end, end)
+
+    def _address(self, raw: bytes) -> int:
+        code = self._address_codes.get(raw)
+        if code is None:
+            code = self.table.addresses.intern(socket.inet_ntoa(raw))
+            self._address_codes[raw] = code
+        return code
+
+    # ---- 传输层 ----
+
+    def _decode_transport(self, row, stack, ts, proto, src, dst, buf, pos, ip_end, end):
+        name = IP_PROTOCOLS.get(proto)
+        if name is None:
+            return
+        stack.append(name)
+        if proto == 6:
+            self._decode_tcp(row, stack, ts, src, dst, buf, pos, ip_end, end)
+        elif proto == 17:
+            self._decode_udp(row, stack, ts, src, dst, buf, pos, ip_end, end)
+
+    def _decode_tcp(self, row, stack, ts, src, dst, buf, pos, ip_end, end):
+        sport, dport, seq, ack, offset_flags = _TCP.unpack_from(buf, pos)
+        flags = offset_flags & 0x0fff
+        payload = pos + (offset_flags >> 12) * 4
+        payload_len = max(0, ip_end - payload)
+        row['tcp_srcport'] = sport
+        row['tcp_dstport'] = dport
+        row['tcp_flags'] = flags
+        self._analyze_tcp(row, ts, (src, sport, dst, dport), seq, ack, flags, payload_len)
+
+        captured_end = min(end, ip_end)
+        if payload_len and payload < captured_end:
+            self._decode_tcp_payload(row, stack, buf, payload, captured_end)
+
+    def _analyze_tcp(self, row, ts, key, seq, ack, flags, payload_len):
+        """简化版tcp.analysis：ACK RTT、重传、快速重传、重复ACK、握手RTT"""
+        src, sport, dst, dport = key
+        reverse_key = (dst, dport, src, sport)
+        forward = self._tcp_directions.get(key)
+        if forward is None:
+            forward = self._tcp_directions[key] = [None, {}, None, 0]
+        reverse = self._tcp_directions.get(reverse_key)
+
+        segment_len = payload_len + (1 if flags & TCP_SYN else 0) + (1 if flags & TCP_FIN else 0)
+        if segment_len:
+            seq_end = (seq + segment_len) & SEQ_MASK
+            expected = forward[0]
+            keep_alive = (payload_len <= 1 and not flags & (TCP_SYN | TCP_FIN)
+                          and expected is not None and seq == (expected - 1) & SEQ_MASK)
+            if expected is not None and not keep_alive and not _seq_after(seq_end, expected):
+                row['retransmission'] = 1
+                if reverse is not None and reverse[3] >= 2 and reverse[2] == seq:
+                    row['fast_retransmission'] = 1
+                forward[1].pop(seq_end, None)  # Karn算法：重传段不参与RTT计算
+            else:
+                forward[1].setdefault(seq_end, ts)
+            if expected is None or _seq_after(seq_end, expected):
+                forward[0] = seq_end
+
+        if flags & TCP_ACK:
+            if reverse is not None and reverse[1]:
+                pending = reverse[1]
+                sent = pending.pop(ack, None)
+                if sent is not None:
+                    row['ack_rtt'] = ts - sent
+                # 按发送顺序丢弃已被确认的报文段
+                while pending:
+                    seq_end = next(iter(pending))
+                    if _seq_after(seq_end, ack):
+                        break
+                    del pending[seq_end]
+            if ack != forward[2]:
+                forward[3] = 0
+            elif not payload_len and not flags & (TCP_SYN | TCP_FIN | TCP_RST):
+                forward[3] += 1
+                row['duplicate_ack'] = 1
+            forward[2] = ack
+
+        conversation_key = key if key < reverse_key else reverse_key
+        conversation = self._tcp_conversations.get(conversation_key)
+        if flags & TCP_SYN:
+            if not flags & TCP_ACK:
+                conversation = self._tcp_conversations[conversation_key] = [ts, None, NAN]
+            elif conversation is not None:
+                conversation[1] = ts
+        elif (flags & TCP_ACK and conversation is not None
+              and conversation[1] is not None and math.isnan(conversation[2])):
+            conversation[2] = ts - conversation[0]
+        if conversation is not None and not math.isnan(conversation[2]):
+            row['initial_rtt'] = conversation[2]
+
+    def _decode_tcp_payload(self, row, stack, buf, pos, end):
+        first = buf[pos]
+        if 20 <= first <= 23 and pos + 3 <= end and buf[pos + 1] == 3:
+            stack.append('tls')
+            if first == 22:
+                sni = _client_hello_sni(buf, pos, end)
+                if sni:
+                    row['tls_sni'] = self.table.strings.intern(sni)
+            return
+
+        head = bytes(buf[pos:min(end, pos + 8)])
+        if head.startswith(b'HTTP/1.'):
+            stack.append('http')
+            status = bytes(buf[pos + 9:pos + 12])
+            if status.isdigit():
+                row['http_response_code'] = int(status)
+            return
+        for method in HTTP_METHODS:
+            if head.startswith(method + b' '):
+                stack.append('http')
+                row['http_method'] = self.table.strings.intern(method.decode())
+                host = _http_host(bytes(buf[pos:min(end, pos + HTTP_HEADER_SCAN)]))
+                if host:
+                    row['http_host'] = self.table.strings.intern(host)
+                return
+
+    def _decode_udp(self, row, stack, ts, src, dst, buf, pos, ip_end, end):
+        sport, dport, _ = _UDP.unpack_from(buf, pos)
+        row['udp_srcport'] = sport
+        row['udp_dstport'] = dport
+        payload = pos + 8
+        captured_end = min(end, ip_end)
+        if sport == 53 or dport == 53:
+            stack.append('dns')
+            self._decode_dns(row, ts, src, sport, dst, dport, buf, payload, captured_end)
+        elif sport == 5353 or dport == 5353:
+            stack.append('mdns')
+        elif ip_end > payload:
+            stack.append('data')
+
+    def _decode_dns(self, row, ts, src, sport, dst, dport, buf, pos, end):
+        transaction_id, flags, question_count = _DNS.unpack_from(buf, pos)
+        if question_count:
+            name = _dns_name(buf, pos + 12, pos, end)
+            row['dns_qry_name'] = self.table.strings.intern(name or '<Root>')
+        if flags & 0x8000:
+            row['dns_resp_code'] = flags & 0x0f
+            sent = self._dns_queries.pop((transaction_id, dst, dport), None)
+            if sent is not None:
+                row['dns_time'] = ts - sent
+        else:
+            self._dns_queries[(transaction_id, src, sport)] = ts
+
+
+
+def _dns_name(buf, pos: int, message: int, end: int) -> str:
+    """解析DNS域名（支持压缩指针）"""
+    labels = []
+    jumps = 0
+    while pos < end:
+        length = buf[pos]
+        if length == 0:
+            break
+        if length & 0xc0 == 0xc0:
+            jumps += 1
+            if jumps > 16 or pos + 1 >= end:
+                break
+            pos = message + (((length & 0x3f) << 8) | buf[pos + 1])
+            continue
+        labels.append(bytes(buf[pos + 1:pos + 1 + length]).decode('ascii', errors='replace'))
+        pos += 1 + length
+    return '.'.join(labels)
+
+
+def _http_host(header: bytes) -> str:
+    """从HTTP请求头中取Host"""
+    end = header.find(b'\r\n\r\n')
+    if end >= 0:
+        header = header[:end]
+    index = header.lower().find(b'\r\nhost:')
+    if index < 0:
+        return ''
+    value = header[index + 7:]
+    line_end = value.find(b'\r\n')
+    if line_end >= 0:
+        value = value[:line_end]
+    return value.strip().decode('latin-1')
+
+
+def _client_hello_sni(buf, pos: int, end: int) -> str:
+    """从单个TLS记录中的ClientHello解析server_name扩展"""
+    pos += 5  # TLS记录头
+    if pos + 4 > end or buf[pos] != 1:
+        return ''
+    pos += 4 + 2 + 32  # 握手头、版本、随机数
+    if pos >= end:
+        return ''
+    pos += 1 + buf[pos]  # session_id
+    if pos + 2 > end:
+        return ''
+    pos += 2 + _U16.unpack_from(buf, pos)[0]  # cipher_suites
+    if pos >= end:
+        return ''
+    pos += 1 + buf[pos]  # compression_methods
+    if pos + 2 > end:
+        return ''
+    extensions_end = min(end, pos + 2 + _U16.unpack_from(buf, pos)[0])
+    pos += 2
+
+    while pos + 4 <= extensions_end:
+        ext_type, ext_len = struct.unpack_from('>HH', buf, pos)
+        pos += 4
+        if ext_type == 0:
+            item, list_end = pos + 2, min(extensions_end, pos + ext_len)
+            while item + 3 <= list_end:
+                name_type = buf[item]
+                name_len = _U16.unpack_from(buf, item + 1)[0]
+                item += 3
+                if name_type == 0 and item + name_len <= list_end:
+                    return bytes(buf[item:item + name_len]).decode('ascii', errors='replace')
+                item += name_len
+            return ''
+        pos += ext_len
+    return ''
@@ -0,0 +1,316 @@
+"""
+异步端口扫描器
+目标只解析一次，所有端口用非阻塞connect并发探测；并发窗口按结果自适应调整：
+每个有响应的探测让窗口加1（类似TCP慢启动），出现超时则减半（每个超时周期最多减半一次），
+在丢包/限速的网络上自动放慢，在局域网上迅速放大到上限。
+"""
+
+import asyncio
+import errno
+import logging
+import socket
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 常见端口服务映射
+COMMON_PORTS = {
+    21: "FTP",
+    22: "SSH",
+    23: "Telnet",
+    25: "SMTP",
+    53: "DNS",
+    80: "HTTP",
+    110: "POP3",
+    143: "IMAP",
+    443: "HTTPS",
+    993: "IMAPS",
+    995: "POP3S",
+    8080: "HTTP-Alt",
+    8443: "HTTPS-Alt",
+    3389: "RDP",
+    5432: "PostgreSQL",
+    3306: "MySQL",
+    1433: "MSSQL",
+    6379: "Redis",
+    27017: "MongoDB"
+}
+
+# 并发窗口的初始值和下限
+INITIAL_WINDOW = 256
+MIN_WINDOW = 32
+# 窗口上限，另受进程文件描述符上限约束
+MAX_WINDOW = 4096
+# 为其他连接保留的文件描述符数
+RESERVED_FDS = 256
+BANNER_TIMEOUT = 1.0
+BANNER_BYTES = 1024
+# 不保留关闭端口明细时，过滤端口明细最多保留的条数（计数不受影响）
+FILTERED_SAMPLE_LIMIT = 100
+
+
+def get_service_name(port: int) -> str:
+    """获取端口对应的服务名称"""
+    return COMMON_PORTS.get(port, f"Port-{port}")
+
+
+def parse_port_spec(spec: str) -> List[int]:
+    """解析端口描述，如 "22,80,8000-8100" 或 "1-65535"，返回去重排序后的端口列表"""
+    ports = set()
+    for part in spec.replace(' ', '').split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, _, end = part.partition('-')
+            low, high = int(start), int(end)
+            if low > high:
+                low, high = high, low
+        else:
+            low = high = int(part)
+        if low < 1 or high > 65535:
+            raise ValueError(f"端口超出范围: {part}")
+        ports.update(range(low, high + 1))
+    return sorted(ports)
+
+
+def max_window() -> int:
+    """受文件描述符上限约束的最大并发数"""
+    if resource is None:
+        return MAX_WINDOW
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return MAX_WINDOW
+    return max(MIN_WINDOW, min(MAX_WINDOW, soft - RESERVED_FDS))
+
+
+class AdaptiveWindow:
+    """自适应并发窗口：有响应时加性增长，超时时乘性减小"""
+
+    def __init__(self, initial: int = INITIAL_WINDOW, minimum: int = MIN_WINDOW,
+                 maximum: Optional[int] = None, backoff_interval: float = 1.0):
+        self.maximum = maximum or max_window()
+        self.minimum = min(minimum, self.maximum)
+        self.limit = max(self.minimum, min(initial, self.maximum))
+        self.backoff_interval = backoff_interval
+        self.in_flight = 0
+        self.timeouts = 0
+        self.peak = self.limit
+        self._last_backoff = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, timed_out: bool):
+        async with self._condition:
+            self.in_flight -= 1
+            if timed_out:
+                self.timeouts += 1
+                now = time.monotonic()
+                # 同一批次的超时会集中到达，每个周期只减半一次
+                if now - self._last_backoff >= self.backoff_interval:
+                    self.limit = max(self.minimum, self.limit // 2)
+                    self._last_backoff = now
+            elif self.limit < self.maximum:
+                self.limit += 1
+                self.peak = max(self.peak, self.limit)
+            self._condition.notify_all()
+
+
+async def resolve_target(target: str) -> str:
+    """解析目标地址（只解析一次），优先IPv4"""
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(target, None, type=socket.SOCK_STREAM)
+    if not infos:
+        raise OSError(f"无法解析目标: {target}")
+    infos.sort(key=lambda info: info[0] != socket.AF_INET)
+    return infos[0][4][0]
+
+
+async def _read_banner(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, port: int) -> Optional[str]:
+    try:
+        if port in (80, 8080):
+            writer.write(b"GET / HTTP/1.0\r\n\r\n")
+            await writer.drain()
+        # FTP、SSH、SMTP等服务会主动发送欢迎信息
+        data = await asyncio.wait_for(reader.read(BANNER_BYTES), timeout=BANNER_TIMEOUT)
+    except (asyncio.TimeoutError, OSError):
+        return None
+    banner = data.decode('utf-8', errors='ignore').strip()
+    return banner[:200] if banner else None
+
+
+async def probe_tcp(ip: str, port: int, timeout: float, grab_banner: bool = True) -> Dict:
+    """非阻塞connect探测单个TCP端口"""
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=timeout)
+    except asyncio.TimeoutError:
+        return {"port": port, "status": "timeout", "service": get_service_name(port),
+                "response_time": round(timeout * 1000, 2)}
+    except ConnectionRefusedError:
+        return {"port": port, "status": "closed", "service": get_service_name(port),
+                "response_time": round((time.perf_counter() - started) * 1000, 2)}
+    except OSError as e:
+        if e.errno in (errno.EMFILE, errno.ENFILE):
+            raise
+        # 主机/网络不可达等ICMP错误
+        return {"port": port, "status": "filtered", "service": get_service_name(port), "response_time": 0}
+
+    response_time = round((time.perf_counter() - started) * 1000, 2)
+    if writer.get_extra_info('sockname') == writer.get_extra_info('peername'):
+        # 扫描本机临时端口时，本地端口恰好等于目标端口会形成TCP自连接，实际并无服务监听
+        writer.close()
+        return {"port": port, "status": "closed", "service": get_service_name(port),
+                "response_time": response_time}
+    try:
+        banner = await _read_banner(reader, writer, port) if grab_banner else None
+    finally:
+        writer.close()
+    return {"port": port, "status": "open", "service": get_service_name(port),
+            "response_time": response_time, "banner": banner}
+
+
+class _UDPProbe(asyncio.DatagramProtocol):
+    def __init__(self, done: asyncio.Future):
+        self.done = done
+
+    def datagram_received(self, data, addr):
+        if not self.done.done():
+            self.done.set_result("open")
+
+    def error_received(self, exc):
+        # 已连接的UDP套接字收到ICMP端口不可达时报ConnectionRefusedError
+        if not self.done.done():
+            self.done.set_result("closed" if isinstance(exc, ConnectionRefusedError) else "filtered")
+
+
+async def probe_udp(ip: str, port: int, timeout: float) -> Dict:
+    """发送UDP探测报文，收到ICMP端口不可达为closed，无响应时为open|filtered"""
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    started = time.perf_counter()
+    try:
+        transport, _ = await loop.create_datagram_endpoint(lambda: _UDPProbe(done), remote_addr=(ip, port))
+    except OSError:
+        return {"port": port, "status": "filtered", "service": get_service_name(port), "response_time": 0}
+    try:
+        # asyncio会直接丢弃空数据，发送一个字节的探测报文
+        transport.sendto(b"\x00")
+        status = await asyncio.wait_for(done, timeout=timeout)
+        response_time = round((time.perf_counter() - started) * 1000, 2)
+    except asyncio.TimeoutError:
+        status, response_time = "open|filtered", round(timeout * 1000, 2)
+    finally:
+        transport.close()
+    return {"port": port, "status": status, "service": get_service_name(port), "response_time": response_time}
+
+
+async def iter_scan(ip: str, ports: Sequence[int], scan_type: str = "tcp", timeout: float = 3,
+                    window: Optional[AdaptiveWindow] = None) -> AsyncIterator[Dict]:
+    """按完成顺序产出每个端口的探测结果
+
+    UDP探测的超时是正常结果（open|filtered），不参与窗口回退。
+    """
+    scan_type = scan_type.lower()
+    if scan_type == "tcp":
+        probe = probe_tcp
+    elif scan_type == "udp":
+        probe = probe_udp
+    else:
+        raise ValueError(f"不支持的扫描类型: {scan_type}")
+
+    window = window or AdaptiveWindow()
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def run(port: int):
+        try:
+            result = await probe(ip, port, timeout)
+        except Exception as e:
+            # 如文件描述符耗尽，按超时处理以缩小窗口
+            result = {"port": port, "status": "error", "service": get_service_name(port),
+                      "response_time": 0, "error": str(e)}
+        await window.release(timed_out=result["status"] in ("timeout", "error"))
+        await results.put(result)
+
+    async def dispatch():
+        for port in ports:
+            await window.acquire()
+            task = asyncio.create_task(run(port))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    tasks: set = set()
+    dispatcher = asyncio.create_task(dispatch())
+    try:
+        for _ in range(len(ports)):
+            yield await results.get()
+    finally:
+        dispatcher.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+
+async def scan_ports(target: str, ports: Sequence[int], scan_type: str = "tcp", timeout: float = 3,
+                     on_result: Optional[Callable[[Dict], None]] = None,
+                     include_closed: bool = True) -> Dict:
+    """扫描目标端口并汇总结果
+
+    on_result在每个端口完成时调用（用于流式返回）；端口很多时可以不保留关闭端口的明细，
+    此时过滤端口也只保留端口号最小的 FILTERED_SAMPLE_LIMIT 条明细。
+    """
+    started = time.time()
+    target_ip = await resolve_target(target)
+    window = AdaptiveWindow()
+
+    open_ports: List[Dict] = []
+    closed_ports: List[Dict] = []
+    filtered_ports: List[Dict] = []
+    closed_count = 0
+    filtered_count = 0
+    async for result in iter_scan(target_ip, ports, scan_type, timeout, window):
+        if result["status"] == "open":
+            open_ports.append(result)
+        elif result["status"] == "closed":
+            closed_count += 1
+            if include_closed:
+                closed_ports.append(result)
+        else:
+            filtered_count += 1
+            filtered_ports.append(result)
+            if not include_closed and len(filtered_ports) > FILTERED_SAMPLE_LIMIT * 2:
+                filtered_ports.sort(key=lambda r: r["port"])
+                del filtered_ports[FILTERED_SAMPLE_LIMIT:]
+        if on_result is not None:
+            on_result(result)
+
+    for group in (open_ports, closed_ports, filtered_ports):
+        group.sort(key=lambda r: r["port"])
+    if not include_closed:
+        del filtered_ports[FILTERED_SAMPLE_LIMIT:]
+    return {
+        "target": target,
+        "target_ip": target_ip,
+        "scan_type": scan_type,
+        "open_ports": open_ports,
+        "closed_ports": closed_ports,
+        "filtered_ports": filtered_ports,
+        "scan_duration": round(time.time() - started, 2),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "summary": {
+            "total_ports": len(ports),
+            "open_count": len(open_ports),
+            "closed_count": closed_count,
+            "filtered_count": filtered_count,
+            "peak_concurrency": window.peak,
+            "timeouts": window.timeouts
+        }
+    }
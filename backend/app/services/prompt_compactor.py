@@ -0,0 +1,298 @@
+"""
+AI分析prompt的抓包数据压缩
+把抓包摘要转换为紧凑的文本，而不是缩进的完整JSON，使prompt大小不随网站/连接数增长：
+- 各部分按诊断价值排序：概况、异常和诊断线索、性能指标、问题专项指标、网站性能表、其他数据
+- 网站性能用表格表示，按错误率和延迟排序，只列出预算内的前N个，其余汇总为一行
+- 其余数据压缩为单行JSON，超出预算时截断
+- 返回token估算，发送前即可知道prompt大小
+"""
+
+import json
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# 整个prompt的token预算（抓包数据部分使用扣除固定说明后的剩余部分）
+DEFAULT_TOKEN_BUDGET = int(os.getenv('AI_PROMPT_TOKEN_BUDGET', '4000'))
+# 抓包数据部分至少保留的预算
+MIN_DATA_BUDGET = 600
+# 预算不足时网站表也至少保留的行数
+MIN_SITE_ROWS = 3
+# 列表类数据（诊断线索、协议等）最多保留的条数
+MAX_LIST_ITEMS = 12
+TRUNCATED_MARK = '…(已截断)'
+
+_CJK = re.compile(r'[⺀-鿿가-힯豈-﫿＀-￯]')
+
+# 已由专门的部分表示的字段，不再出现在“其他数据”中
+_HANDLED_ENHANCED = {'basic_stats', 'network_behavior', 'performance_indicators', 'anomaly_detection',
+                     'http_analysis', 'issue_specific_insights', 'diagnostic_clues', 'parsing_method'}
+_HANDLED_INSIGHTS = {'website_performance', 'performance_issues', 'response_summary', 'diagnostic_hints',
+                     'relevant_metrics', 'targeted_analysis'}
+_SKIPPED_SUMMARY = {'enhanced_analysis', 'statistics', 'sample_packets', 'analysis_time', 'parsing_method'}
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符约1个token，其余字符约4个一个token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _num(value: Any) -> str:
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else f"{value:.1f}"
+    return str(value)
+
+
+def _bytes(size: float) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{_num(round(size, 1))}{unit}"
+        size /= 1024
+    return f"{_num(round(size, 1))}GB"
+
+
+def _prune(value: Any, max_items: int = MAX_LIST_ITEMS) -> Any:
+    """递归截短过长的列表和字典，标注省略的条数"""
+    if isinstance(value, dict):
+        items = list(value.items())
+        pruned = {k: _prune(v, max_items) for k, v in items[:max_items]}
+        if len(items) > max_items:
+            pruned['…'] = f"另有{len(items) - max_items}项"
+        return pruned
+    if isinstance(value, (list, tuple, set)):
+        items = list(value)
+        pruned = [_prune(v, max_items) for v in items[:max_items]]
+        if len(items) > max_items:
+            pruned.append(f"…另有{len(items) - max_items}项")
+        return pruned
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+def _compact_json(value: Any) -> str:
+    return json.dumps(_prune(value), ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _truncate(text: str, budget: int) -> str:
+    """按token预算截断文本"""
+    if budget <= 0:
+        return ''
+    if estimate_tokens(text) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + TRUNCATED_MARK
+
+
+def _overview(summary: Dict, enhanced: Dict) -> List[str]:
+    stats = enhanced.get('basic_stats') or summary.get('statistics') or {}
+    lines = []
+    parts = []
+    duration = (stats.get('time_range') or {}).get('duration') or stats.get('duration')
+    if duration:
+        parts.append(f"时长{_num(round(duration, 1))}秒")
+    if stats.get('total_packets') is not None:
+        parts.append(f"{stats['total_packets']}包")
+    volume = (stats.get('data_volume') or {})
+    total_bytes = volume.get('total_bytes') or stats.get('total_bytes')
+    if total_bytes:
+        parts.append(_bytes(total_bytes))
+    if volume.get('avg_rate'):
+        parts.append(f"平均{_bytes(volume['avg_rate'])}/s")
+    sizes = stats.get('packet_sizes') or {}
+    if sizes.get('avg'):
+        parts.append(f"包长{_num(sizes.get('min', 0))}/{_num(round(sizes['avg'], 1))}/{_num(sizes.get('max', 0))}(最小/平均/最大)")
+    destinations = ((enhanced.get('network_behavior') or {}).get('connection_summary') or {}).get('unique_destinations')
+    if destinations is not None:
+        parts.append(f"{destinations}个目的地址")
+    if parts:
+        lines.append('- ' + '，'.join(parts))
+    protocols = stats.get('protocols') or {}
+    if protocols:
+        top = sorted(protocols.items(), key=lambda item: item[1], reverse=True)
+        text = ' '.join(f"{name}:{count}" for name, count in top[:MAX_LIST_ITEMS])
+        if len(top) > MAX_LIST_ITEMS:
+            text += f" 其他:{sum(count for _, count in top[MAX_LIST_ITEMS:])}"
+        lines.append(f"- 协议: {text}")
+    for key in ('error', 'parsing_method'):
+        value = summary.get(key) or enhanced.get(key)
+        if value:
+            lines.append(f"- {'解析错误' if key == 'error' else '解析方式'}: {value}")
+    return lines
+
+
+def _findings(enhanced: Dict, insights: Dict) -> List[str]:
+    """异常和诊断线索，错误类排在前面，去重后最多保留 MAX_LIST_ITEMS 条"""
+    anomalies = enhanced.get('anomaly_detection') or {}
+    ordered = (list(anomalies.get('error_indicators') or []) +
+               list(anomalies.get('security_concerns') or []) +
+               list(insights.get('performance_issues') or []) +
+               list(anomalies.get('performance_issues') or []) +
+               list(anomalies.get('suspicious_patterns') or []) +
+               list(enhanced.get('diagnostic_clues') or []) +
+               list(insights.get('diagnostic_hints') or []))
+    unique = list(dict.fromkeys(str(item) for item in ordered if item))
+    lines = [f"- {item}" for item in unique[:MAX_LIST_ITEMS]]
+    if len(unique) > MAX_LIST_ITEMS:
+        lines.append(f"- …另有{len(unique) - MAX_LIST_ITEMS}条")
+    return lines
+
+
+def _metrics(enhanced: Dict, insights: Dict) -> List[str]:
+    lines = []
+    performance = enhanced.get('performance_indicators') or {}
+    latency = performance.get('latency_indicators') or {}
+    if latency:
+        lines.append(f"- TCP RTT(ms): 平均{_num(round(latency.get('avg_rtt_ms', 0), 1))} "
+                     f"最小{_num(round(latency.get('min_rtt_ms', 0), 1))} "
+                     f"最大{_num(round(latency.get('max_rtt_ms', 0), 1))} 样本{latency.get('rtt_samples', 0)}")
+    errors = performance.get('error_rates') or {}
+    if errors:
+        lines.append(f"- 重传{errors.get('retransmissions', 0)} 快速重传{errors.get('fast_retransmissions', 0)} "
+                     f"重复ACK{errors.get('duplicate_acks', 0)}")
+    for key, label in (('response_summary', '请求汇总'), ('relevant_metrics', '专项指标')):
+        if insights.get(key):
+            lines.append(f"- {label}: {_compact_json(insights[key])}")
+    return lines
+
+
+def site_score(performance: Dict) -> float:
+    """网站的诊断价值：出错的、延迟高的、延迟波动大的、解析到多个IP的排在前面"""
+    requests = performance.get('requests') or {}
+    rtt = performance.get('tcp_rtt') or {}
+    avg = rtt.get('avg_ms', 0) or 0
+    spread = max(0, (rtt.get('max_ms', 0) or 0) - avg)
+    return (requests.get('error_rate_percent', 0) * 20 + requests.get('errors', 0) * 5 +
+            avg + spread * 0.5 + (20 if len(performance.get('ips') or []) > 1 else 0))
+
+
+SITE_TABLE_HEADER = "域名|协议|IP数|RTT平均/最小/最大ms|样本|访问次数|请求|错误率%|错误码"
+
+
+def _site_row(domain: str, performance: Dict, visits: Optional[int]) -> str:
+    rtt = performance.get('tcp_rtt') or {}
+    requests = performance.get('requests') or {}
+    rtt_text = (f"{_num(rtt.get('avg_ms', 0))}/{_num(rtt.get('min_ms', 0))}/{_num(rtt.get('max_ms', 0))}"
+                if rtt else '-')
+    codes = requests.get('error_codes') or {}
+    code_text = ','.join(f"{code}x{count}" for code, count in codes.items()) or '-'
+    return '|'.join([
+        domain,
+        str(performance.get('protocol', '-')),
+        str(len(performance.get('ips') or [])),
+        rtt_text,
+        str(rtt.get('samples', 0)),
+        str(visits if visits is not None else '-'),
+        str(requests.get('total', 0)),
+        _num(requests.get('error_rate_percent', 0)),
+        code_text
+    ])
+
+
+def _site_aggregate(rest: List[Tuple[str, Dict]], visits: Dict[str, int]) -> str:
+    rtts = [p['tcp_rtt']['avg_ms'] for _, p in rest if (p.get('tcp_rtt') or {}).get('avg_ms')]
+    total_requests = sum((p.get('requests') or {}).get('total', 0) for _, p in rest)
+    total_errors = sum((p.get('requests') or {}).get('errors', 0) for _, p in rest)
+    total_visits = sum(visits.get(domain, 0) for domain, _ in rest)
+    text = f"其余{len(rest)}个网站"
+    if rtts:
+        text += f": RTT平均{_num(round(sum(rtts) / len(rtts), 1))}ms 最大{_num(max(rtts))}ms"
+    return text + f"，访问{total_visits}次，请求{total_requests}，错误{total_errors}"
+
+
+def _other_data(summary: Dict, enhanced: Dict, insights: Dict) -> Dict:
+    other = {}
+    targeted = insights.get('targeted_analysis')
+    if targeted:
+        other['专项分析'] = targeted
+    for key, value in enhanced.items():
+        if key not in _HANDLED_ENHANCED and value:
+            other[key] = value
+    for key, value in insights.items():
+        if key not in _HANDLED_INSIGHTS and value and key not in other:
+            other[key] = value
+    http = enhanced.get('http_analysis') or {}
+    for key, value in http.items():
+        if key not in ('websites_accessed', 'connection_summary', 'basic_summary') and value:
+            other[f"http_{key}"] = value
+    for key, value in summary.items():
+        if key not in _SKIPPED_SUMMARY and key != 'error' and value and not isinstance(value, (int, float)):
+            other[key] = value
+    return other
+
+
+def compact_capture_summary(summary: Dict, budget: int) -> Tuple[str, Dict]:
+    """把抓包摘要压缩为预算内的文本，返回 (文本, 统计信息)
+
+    统计信息为 {"estimated_tokens", "budget", "sites_total", "sites_shown", "truncated"}
+    """
+    enhanced = summary.get('enhanced_analysis') or {}
+    insights = enhanced.get('issue_specific_insights') or {}
+    truncated = False
+
+    sections: List[str] = []
+    for title, lines in (('概况', _overview(summary, enhanced)),
+                         ('异常与诊断线索', _findings(enhanced, insights)),
+                         ('性能指标', _metrics(enhanced, insights))):
+        if lines:
+            sections.append(f"[{title}]\n" + '\n'.join(lines))
+    text = '\n'.join(sections)
+    used = estimate_tokens(text)
+
+    # 网站性能表：按诊断价值排序，预算内尽量多列，其余汇总
+    visits = (enhanced.get('http_analysis') or {}).get('websites_accessed') or {}
+    performance = insights.get('website_performance') or {}
+    sites = sorted(performance.items(), key=lambda item: site_score(item[1]), reverse=True)
+    visit_only = [(domain, count) for domain, count in visits.items() if domain not in performance]
+    shown = 0
+    if sites:
+        rows = [f"[网站性能 共{len(sites)}个，按问题严重程度排序]", SITE_TABLE_HEADER]
+        table_budget = max(0, budget - used)
+        table_tokens = estimate_tokens('\n'.join(rows))
+        for domain, perf in sites:
+            row = _site_row(domain, perf, visits.get(domain))
+            row_tokens = estimate_tokens(row) + 1
+            if shown >= MIN_SITE_ROWS and table_tokens + row_tokens > table_budget * 0.8:
+                break
+            rows.append(row)
+            table_tokens += row_tokens
+            shown += 1
+        if shown < len(sites):
+            rows.append(_site_aggregate(sites[shown:], visits))
+            truncated = True
+        text += '\n' + '\n'.join(rows)
+        used = estimate_tokens(text)
+    if visit_only:
+        visit_only.sort(key=lambda item: item[1], reverse=True)
+        line = '[访问的网站(SNI次数)]\n' + ' '.join(f"{domain}:{count}" for domain, count in visit_only[:MAX_LIST_ITEMS])
+        if len(visit_only) > MAX_LIST_ITEMS:
+            line += f" 其余{len(visit_only) - MAX_LIST_ITEMS}个"
+        text += '\n' + line
+        used = estimate_tokens(text)
+
+    other = _other_data(summary, enhanced, insights)
+    if other:
+        encoded = _compact_json(other)
+        remaining = budget - used - 10
+        clipped = _truncate(encoded, remaining)
+        if clipped != encoded:
+            truncated = True
+        if clipped:
+            text += '\n[其他数据]\n' + clipped
+
+    info = {
+        "estimated_tokens": estimate_tokens(text),
+        "budget": budget,
+        "sites_total": len(sites),
+        "sites_shown": shown,
+        "truncated": truncated
+    }
+    return text, info
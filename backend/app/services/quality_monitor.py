@@ -0,0 +1,584 @@
+"""
+后台网络质量监控
+多个目标并发探测，每个目标按分辨率（1s/1m/1h）各保存一个固定容量的环形缓冲区，
+列用array存储（时间戳、延迟、抖动、丢包等），查询任意时间窗口无需扫描或访问磁盘。
+原始样本只在内存中保留最近一段时间，1m/1h汇总在每个周期结束时写入SQLite，重启后恢复。
+
+探测在进程内完成：有权限时用ICMP回显（原始套接字或Linux的ping套接字），否则测TCP建连时间，
+不再每次都启动ping进程。
+"""
+
+import asyncio
+import logging
+import math
+import os
+import random
+import socket
+import sqlite3
+import statistics
+import struct
+import threading
+import time
+from array import array
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.services.traceroute_engine import ICMP_ECHO_REPLY, build_echo_request
+
+logger = logging.getLogger(__name__)
+
+NAN = float('nan')
+
+# 分辨率 -> (秒数, 环形缓冲区容量)；1s为原始样本（实际间隔由探测间隔决定）
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    '1s': (1, 3600),       # 最近1小时
+    '1m': (60, 1440),      # 最近1天
+    '1h': (3600, 24 * 30)  # 最近30天
+}
+ROLLUP_RESOLUTIONS = ('1m', '1h')
+COLUMNS = ('timestamp', 'latency', 'jitter', 'loss', 'min', 'max', 'sent', 'received')
+
+DEFAULT_INTERVAL = 1.0
+DEFAULT_PROBES = 3
+DEFAULT_TIMEOUT = 1.0
+DEFAULT_TCP_PORT = 443
+# 目标地址重新解析的间隔（秒）
+RESOLVE_INTERVAL = 300
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                               'data', 'network_quality.db')
+
+
+class RingBuffer:
+    """固定容量的列式环形缓冲区，按时间递增追加"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self._start = 0
+        self._columns: Dict[str, array] = {
+            name: array('I' if name in ('sent', 'received') else 'd', [0] * capacity) for name in COLUMNS
+        }
+
+    def append(self, row: Dict[str, float]):
+        index = (self._start + self.size) % self.capacity
+        for name, column in self._columns.items():
+            column[index] = row[name]
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+
+    def _physical(self, logical: int) -> int:
+        return (self._start + logical) % self.capacity
+
+    def _bisect(self, ts: float) -> int:
+        """第一个时间戳 >= ts 的逻辑位置"""
+        timestamps = self._columns['timestamp']
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            if timestamps[self._physical(mid)] < ts:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def window(self, start: Optional[float] = None, end: Optional[float] = None,
+               limit: Optional[int] = None) -> Dict[str, list]:
+        """返回 [start, end] 内的数据，按列组织；limit限制为最近的若干条"""
+        first = self._bisect(start) if start is not None else 0
+        last = self._bisect(math.nextafter(end, math.inf)) if end is not None else self.size
+        if limit is not None:
+            first = max(first, last - limit)
+        indexes = [self._physical(i) for i in range(first, last)]
+        return {name: [_clean(column[i]) for i in indexes] for name, column in self._columns.items()}
+
+    def last(self) -> Optional[Dict[str, float]]:
+        if not self.size:
+            return None
+        index = self._physical(self.size - 1)
+        return {name: _clean(column[index]) for name, column in self._columns.items()}
+
+
+def _clean(value):
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+def summarize_rtts(timestamp: float, rtts: List[Optional[float]]) -> Dict[str, float]:
+    """把一次探测（若干个回显）汇总为一个样本：平均延迟、抖动（标准差）、丢包率"""
+    received = [rtt for rtt in rtts if rtt is not None]
+    return {
+        'timestamp': timestamp,
+        'latency': round(statistics.mean(received), 3) if received else NAN,
+        'jitter': round(statistics.stdev(received), 3) if len(received) > 1 else (0.0 if received else NAN),
+        'loss': round((len(rtts) - len(received)) / len(rtts) * 100, 2) if rtts else NAN,
+        'min': min(received) if received else NAN,
+        'max': max(received) if received else NAN,
+        'sent': len(rtts),
+        'received': len(received)
+    }
+
+
+@dataclass
+class _Bucket:
+    """一个汇总周期内的累加值"""
+    start: float
+    sent: int = 0
+    received: int = 0
+    latency_sum: float = 0.0
+    jitter_sum: float = 0.0
+    jitter_count: int = 0
+    minimum: float = math.inf
+    maximum: float = -math.inf
+
+    def add(self, row: Dict[str, float]):
+        self.sent += int(row['sent'])
+        self.received += int(row['received'])
+        if row['received']:
+            # 延迟按收到的回复数加权
+            self.latency_sum += row['latency'] * row['received']
+            self.minimum = min(self.minimum, row['min'])
+            self.maximum = max(self.maximum, row['max'])
+        if not math.isnan(row['jitter']):
+            self.jitter_sum += row['jitter']
+            self.jitter_count += 1
+
+    def to_row(self) -> Dict[str, float]:
+        return {
+            'timestamp': self.start,
+            'latency': round(self.latency_sum / self.received, 3) if self.received else NAN,
+            'jitter': round(self.jitter_sum / self.jitter_count, 3) if self.jitter_count else NAN,
+            'loss': round((self.sent - self.received) / self.sent * 100, 2) if self.sent else NAN,
+            'min': self.minimum if self.received else NAN,
+            'max': self.maximum if self.received else NAN,
+            'sent': self.sent,
+            'received': self.received
+        }
+
+    @classmethod
+    def from_row(cls, row: Dict[str, float]) -> '_Bucket':
+        """由停止时保存的未完成汇总恢复累加值（抖动按一个样本计）"""
+        bucket = cls(row['timestamp'], sent=int(row['sent']), received=int(row['received']))
+        if bucket.received:
+            bucket.latency_sum = row['latency'] * bucket.received
+            bucket.minimum, bucket.maximum = row['min'], row['max']
+        if not math.isnan(row['jitter']):
+            bucket.jitter_sum, bucket.jitter_count = row['jitter'], 1
+        return bucket
+
+
+class IcmpPinger:
+    """共用一个ICMP套接字发送回显请求，按 (地址, 序号) 把回复交给等待中的探测"""
+
+    def __init__(self):
+        self._sock: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._raw = False
+        self._identifier = random.getrandbits(16)
+        self._sequence = random.getrandbits(16)
+        self._pending: Dict[Tuple[str, int], Tuple[asyncio.Future, float]] = {}
+
+    @staticmethod
+    def available() -> bool:
+        for sock_type in (socket.SOCK_RAW, socket.SOCK_DGRAM):
+            try:
+                socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP).close()
+                return True
+            except OSError:
+                continue
+        return False
+
+    def _open(self, loop: asyncio.AbstractEventLoop):
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self._raw = True
+        except OSError:
+            # 非特权的ping套接字，内核会改写回显ID
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self._raw = False
+        sock.setblocking(False)
+        loop.add_reader(sock.fileno(), self._on_readable)
+        self._sock = sock
+        self._loop = loop
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, address = self._sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            received = time.perf_counter()
+            offset = (data[0] & 0x0f) * 4 if self._raw else 0
+            if len(data) < offset + 8 or data[offset] != ICMP_ECHO_REPLY:
+                continue
+            identifier, sequence = struct.unpack_from('!HH', data, offset + 4)
+            if self._raw and identifier != self._identifier:
+                continue
+            pending = self._pending.get((address[0], sequence))
+            if pending and not pending[0].done():
+                pending[0].set_result(round((received - pending[1]) * 1000, 3))
+
+    async def ping(self, ip: str, timeout: float) -> Optional[float]:
+        """发送一次回显请求，返回往返时间（毫秒），超时返回None"""
+        loop = asyncio.get_running_loop()
+        if self._sock is None or self._loop is not loop:
+            # 套接字的读回调注册在创建它的事件循环上
+            self.close()
+            self._open(loop)
+        self._sequence = (self._sequence + 1) & 0xffff
+        key = (ip, self._sequence)
+        future = loop.create_future()
+        self._pending[key] = (future, time.perf_counter())
+        try:
+            self._sock.sendto(build_echo_request(self._identifier, self._sequence), (ip, 0))
+            return await asyncio.wait_for(future, timeout=timeout)
+        except (asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            self._pending.pop(key, None)
+
+    def close(self):
+        if self._sock is not None:
+            if not self._loop.is_closed():
+                self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+            self._pending.clear()
+
+
+async def tcp_ping(ip: str, port: int, timeout: float) -> Optional[float]:
+    """TCP建连时间（毫秒）；被拒绝也说明目标可达"""
+    started = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=timeout)
+        writer.close()
+    except ConnectionRefusedError:
+        pass
+    except (asyncio.TimeoutError, OSError):
+        return None
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+@dataclass
+class MonitorTarget:
+    target: str
+    interval: float = DEFAULT_INTERVAL
+    probes: int = DEFAULT_PROBES
+    method: str = 'auto'  # auto, icmp, tcp
+    port: int = DEFAULT_TCP_PORT
+    ip: Optional[str] = None
+    resolved_at: float = 0.0
+    error: Optional[str] = None
+    buffers: Dict[str, RingBuffer] = field(default_factory=lambda: {
+        name: RingBuffer(capacity) for name, (_, capacity) in RESOLUTIONS.items()})
+    buckets: Dict[str, _Bucket] = field(default_factory=dict)
+    task: Optional[asyncio.Task] = None
+
+    def config(self) -> Dict:
+        return {'target': self.target, 'interval': self.interval, 'probes': self.probes,
+                'method': self.method, 'port': self.port}
+
+
+Listener = Callable[[str, str, Dict], None]
+
+
+class NetworkQualityMonitor:
+    """后台质量监控：管理目标、探测循环、环形缓冲区和汇总持久化"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.targets: Dict[str, MonitorTarget] = {}
+        self._listeners: List[Listener] = []
+        self._pinger = IcmpPinger()
+        self._icmp_available: Optional[bool] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._running = False
+
+    # ----- 持久化 -----
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS targets (
+                    target TEXT PRIMARY KEY,
+                    interval REAL NOT NULL,
+                    probes INTEGER NOT NULL,
+                    method TEXT NOT NULL,
+                    port INTEGER NOT NULL
+                )
+            ''')
+            # 汇总数据按 (目标, 分辨率, 时间) 聚簇存储，不需要额外的rowid
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS rollups (
+                    target TEXT NOT NULL,
+                    resolution INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    latency REAL,
+                    jitter REAL,
+                    loss REAL,
+                    min REAL,
+                    max REAL,
+                    sent INTEGER NOT NULL,
+                    received INTEGER NOT NULL,
+                    PRIMARY KEY (target, resolution, ts)
+                ) WITHOUT ROWID
+            ''')
+        return self._conn
+
+    def _save_rollup(self, target: str, resolution: str, row: Dict[str, float]):
+        seconds, capacity = RESOLUTIONS[resolution]
+        values = [None if isinstance(row[name], float) and math.isnan(row[name]) else row[name]
+                  for name in COLUMNS[1:]]
+        with self._lock:
+            db = self._db()
+            db.execute('INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                       (target, seconds, int(row['timestamp']), *values))
+            # 超出缓冲区覆盖范围的旧数据不再需要
+            db.execute('DELETE FROM rollups WHERE target=? AND resolution=? AND ts<?',
+                       (target, seconds, int(row['timestamp']) - seconds * capacity))
+
+    def _load(self):
+        with self._lock:
+            db = self._db()
+            rows = db.execute('SELECT target, interval, probes, method, port FROM targets').fetchall()
+            for target, interval, probes, method, port in rows:
+                if target not in self.targets:
+                    self.targets[target] = MonitorTarget(target, interval, probes, method, port)
+            now = time.time()
+            for name in ROLLUP_RESOLUTIONS:
+                seconds, capacity = RESOLUTIONS[name]
+                current_start = math.floor(now / seconds) * seconds
+                for monitor_target in self.targets.values():
+                    history = db.execute(
+                        'SELECT ts, latency, jitter, loss, min, max, sent, received FROM rollups '
+                        'WHERE target=? AND resolution=? ORDER BY ts DESC LIMIT ?',
+                        (monitor_target.target, seconds, capacity)).fetchall()
+                    rows = [{column: NAN if value is None else value for column, value in zip(COLUMNS, values)}
+                            for values in reversed(history)]
+                    # 上次停止时保存的当前周期汇总尚未结束，恢复为累加值继续汇总
+                    if rows and rows[-1]['timestamp'] == current_start:
+                        partial = rows.pop()
+                        if name not in monitor_target.buckets:
+                            monitor_target.buckets[name] = _Bucket.from_row(partial)
+                    buffer = monitor_target.buffers[name]
+                    if buffer.size:
+                        continue
+                    for row in rows:
+                        buffer.append(row)
+
+    # ----- 目标管理 -----
+
+    async def start(self):
+        """加载已保存的目标和历史汇总，启动探测"""
+        if self._running:
+            return
+        await asyncio.to_thread(self._load)
+        self._running = True
+        for monitor_target in self.targets.values():
+            self._start_target(monitor_target)
+        logger.info(f"网络质量监控已启动，目标 {len(self.targets)} 个")
+
+    async def stop(self):
+        self._running = False
+        tasks = [t.task for t in self.targets.values() if t.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for monitor_target in self.targets.values():
+            monitor_target.task = None
+        self._flush_buckets()
+        self._pinger.close()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _flush_buckets(self):
+        """保存未完成的1m/1h汇总，重启后在同一周期内继续累加，周期已过则作为该周期的汇总"""
+        for monitor_target in self.targets.values():
+            for name, bucket in monitor_target.buckets.items():
+                try:
+                    self._save_rollup(monitor_target.target, name, bucket.to_row())
+                except sqlite3.Error as e:
+                    logger.error(f"保存质量汇总失败: {e}")
+
+    def _start_target(self, monitor_target: MonitorTarget):
+        if self._running and monitor_target.task is None:
+            monitor_target.task = asyncio.create_task(self._run_target(monitor_target))
+
+    def add_target(self, target: str, interval: float = DEFAULT_INTERVAL, probes: int = DEFAULT_PROBES,
+                   method: str = 'auto', port: int = DEFAULT_TCP_PORT) -> MonitorTarget:
+        """添加（或更新）监控目标并持久化"""
+        if method not in ('auto', 'icmp', 'tcp'):
+            raise ValueError(f"不支持的探测方式: {method}")
+        monitor_target = self.targets.get(target)
+        if monitor_target is None:
+            monitor_target = self.targets[target] = MonitorTarget(target)
+        monitor_target.interval = max(0.2, interval)
+        monitor_target.probes = max(1, min(10, probes))
+        monitor_target.method = method
+        monitor_target.port = port
+        with self._lock:
+            self._db().execute('INSERT OR REPLACE INTO targets VALUES (?, ?, ?, ?, ?)',
+                               (target, monitor_target.interval, monitor_target.probes, method, port))
+        self._start_target(monitor_target)
+        return monitor_target
+
+    async def remove_target(self, target: str) -> bool:
+        monitor_target = self.targets.pop(target, None)
+        if monitor_target is None:
+            return False
+        if monitor_target.task:
+            monitor_target.task.cancel()
+            await asyncio.gather(monitor_target.task, return_exceptions=True)
+        with self._lock:
+            db = self._db()
+            db.execute('DELETE FROM targets WHERE target=?', (target,))
+            db.execute('DELETE FROM rollups WHERE target=?', (target,))
+        return True
+
+    # ----- 订阅 -----
+
+    def add_listener(self, listener: Listener):
+        """listener(目标, 分辨率, 数据行) 在每个新样本/汇总产生时同步调用"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _publish(self, target: str, resolution: str, row: Dict[str, float]):
+        data = {name: _clean(value) for name, value in row.items()}
+        for listener in list(self._listeners):
+            try:
+                listener(target, resolution, data)
+            except Exception as e:
+                logger.warning(f"质量监控订阅回调失败: {e}")
+
+    # ----- 探测 -----
+
+    async def _resolve(self, monitor_target: MonitorTarget) -> str:
+        now = time.monotonic()
+        if monitor_target.ip is None or now - monitor_target.resolved_at > RESOLVE_INTERVAL:
+            loop = asyncio.get_running_loop()
+            infos = await loop.getaddrinfo(monitor_target.target, None, family=socket.AF_INET,
+                                           type=socket.SOCK_STREAM)
+            monitor_target.ip = infos[0][4][0]
+            monitor_target.resolved_at = now
+        return monitor_target.ip
+
+    def _use_icmp(self, method: str) -> bool:
+        if method == 'tcp':
+            return False
+        if self._icmp_available is None:
+            self._icmp_available = IcmpPinger.available()
+        if method == 'icmp' and not self._icmp_available:
+            raise PermissionError("没有发送ICMP的权限")
+        return self._icmp_available
+
+    async def measure(self, target: str, probes: int = DEFAULT_PROBES, method: str = 'auto',
+                      port: int = DEFAULT_TCP_PORT, timeout: float = DEFAULT_TIMEOUT,
+                      spacing: float = 0.1, ip: Optional[str] = None) -> Dict[str, float]:
+        """对目标做一次探测（probes个回显，间隔spacing秒发出），返回汇总样本"""
+        if ip is None:
+            loop = asyncio.get_running_loop()
+            infos = await loop.getaddrinfo(target, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+            ip = infos[0][4][0]
+        timestamp = time.time()
+        use_icmp = self._use_icmp(method)
+
+        async def one(index: int) -> Optional[float]:
+            await asyncio.sleep(index * spacing)
+            if use_icmp:
+                return await self._pinger.ping(ip, timeout)
+            return await tcp_ping(ip, port, timeout)
+
+        rtts = await asyncio.gather(*[one(i) for i in range(probes)])
+        return summarize_rtts(timestamp, list(rtts))
+
+    def record(self, monitor_target: MonitorTarget, row: Dict[str, float]):
+        """写入一个原始样本，并在跨越周期边界时产出1m/1h汇总"""
+        monitor_target.buffers['1s'].append(row)
+        self._publish(monitor_target.target, '1s', row)
+        for name in ROLLUP_RESOLUTIONS:
+            seconds = RESOLUTIONS[name][0]
+            bucket_start = math.floor(row['timestamp'] / seconds) * seconds
+            bucket = monitor_target.buckets.get(name)
+            if bucket is not None and bucket.start != bucket_start:
+                rollup = bucket.to_row()
+                monitor_target.buffers[name].append(rollup)
+                self._publish(monitor_target.target, name, rollup)
+                try:
+                    self._save_rollup(monitor_target.target, name, rollup)
+                except sqlite3.Error as e:
+                    logger.error(f"保存质量汇总失败: {e}")
+                bucket = None
+            if bucket is None:
+                bucket = monitor_target.buckets[name] = _Bucket(bucket_start)
+            bucket.add(row)
+
+    async def _run_target(self, monitor_target: MonitorTarget):
+        """按固定节拍探测，单次探测变慢不会让后续节拍漂移"""
+        next_tick = time.monotonic()
+        while True:
+            try:
+                ip = await self._resolve(monitor_target)
+                timeout = min(DEFAULT_TIMEOUT, monitor_target.interval)
+                spacing = min(0.1, monitor_target.interval / (monitor_target.probes * 2))
+                row = await self.measure(monitor_target.target, monitor_target.probes, monitor_target.method,
+                                         monitor_target.port, timeout, spacing, ip=ip)
+                monitor_target.error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 解析失败等情况记为全部丢包
+                if monitor_target.error != str(e):
+                    logger.warning(f"质量监控探测失败 {monitor_target.target}: {e}")
+                monitor_target.error = str(e)
+                monitor_target.ip = None
+                row = summarize_rtts(time.time(), [None] * monitor_target.probes)
+            self.record(monitor_target, row)
+
+            next_tick += monitor_target.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    # ----- 查询 -----
+
+    def query(self, target: str, resolution: str = '1s', start: Optional[float] = None,
+              end: Optional[float] = None, limit: Optional[int] = None) -> Dict:
+        """返回时间窗口内的数据（列式），目标不存在时抛出KeyError"""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"不支持的分辨率: {resolution}")
+        monitor_target = self.targets[target]
+        return {
+            'target': target,
+            'resolution': resolution,
+            'series': monitor_target.buffers[resolution].window(start, end, limit)
+        }
+
+    def status(self) -> List[Dict]:
+        result = []
+        for monitor_target in self.targets.values():
+            result.append({
+                **monitor_target.config(),
+                'ip': monitor_target.ip,
+                'running': monitor_target.task is not None and not monitor_target.task.done(),
+                'error': monitor_target.error,
+                'latest': monitor_target.buffers['1s'].last(),
+                'samples': {name: buffer.size for name, buffer in monitor_target.buffers.items()}
+            })
+        return result
+
+
+quality_monitor = NetworkQualityMonitor()
@@ -0,0 +1,294 @@
+"""
+网站截图服务
+- 常驻的无头浏览器：首次截图时启动，空闲一段时间后关闭以释放内存（树莓派上每次启动需数秒、数百MB）
+- 同时打开的浏览器上下文数有上限，其余截图请求排队，队列过长时直接拒绝
+- 截图结果按 (URL, 是否整页) 缓存一段时间，同一页面的并发请求只渲染一次
+- 图片文件以内容哈希命名，相同内容只存一份；截图目录总大小超过上限时删除最旧的文件
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SCREENSHOT_DIR = Path(__file__).parent.parent.parent / "data" / "website_screenshots"
+SCREENSHOT_URL_PREFIX = "/static/website_screenshots"
+# 同时渲染的页面数
+MAX_CONTEXTS = 2
+# 排队等待的截图请求上限
+MAX_QUEUE = 16
+# 浏览器空闲多久后关闭（秒）
+IDLE_TIMEOUT = 300
+NAVIGATION_TIMEOUT_MS = 15000
+VIEWPORT = {"width": 1280, "height": 800}
+# 截图缓存时间（秒）
+CACHE_TTL = 600
+CACHE_SIZE = 256
+# 截图目录的磁盘占用上限
+MAX_DISK_BYTES = 200 * 1024 * 1024
+CHROMIUM_ARGS = ['--disable-dev-shm-usage', '--disable-gpu']
+
+
+class ScreenshotQueueFull(RuntimeError):
+    """截图请求排队过多"""
+
+
+class BrowserPool:
+    """常驻的无头Chromium，限制同时打开的上下文数"""
+
+    def __init__(self, max_contexts: int = MAX_CONTEXTS, max_queue: int = MAX_QUEUE,
+                 idle_timeout: float = IDLE_TIMEOUT):
+        self.max_contexts = max_contexts
+        self.max_queue = max_queue
+        self.idle_timeout = idle_timeout
+        self._playwright = None
+        self._browser = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._launch_lock: Optional[asyncio.Lock] = None
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+        self.active = 0
+        self.waiting = 0
+        self.launches = 0
+        self.rendered = 0
+
+    def _primitives(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_contexts)
+            self._launch_lock = asyncio.Lock()
+        return self._semaphore, self._launch_lock
+
+    async def _ensure_browser(self):
+        _, launch_lock = self._primitives()
+        async with launch_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+            await self._shutdown()
+            from playwright.async_api import async_playwright
+
+            started = time.time()
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=True, args=CHROMIUM_ARGS)
+            self.launches += 1
+            logger.info(f"无头浏览器已启动，用时 {time.time() - started:.2f}秒")
+            return self._browser
+
+    async def render(self, url: str, full_page: bool = True,
+                     timeout_ms: int = NAVIGATION_TIMEOUT_MS) -> bytes:
+        """打开页面并返回PNG截图数据"""
+        semaphore, _ = self._primitives()
+        if self.waiting >= self.max_queue and semaphore.locked():
+            raise ScreenshotQueueFull(f"截图队列已满（{self.waiting} 个请求等待中）")
+        self._cancel_idle_timer()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            browser = await self._ensure_browser()
+            context = await browser.new_context(viewport=VIEWPORT)
+            try:
+                page = await context.new_page()
+                await page.goto(url, timeout=timeout_ms)
+                data = await page.screenshot(full_page=full_page)
+            finally:
+                await context.close()
+            self.rendered += 1
+            return data
+        finally:
+            self.active -= 1
+            semaphore.release()
+            if self.active == 0 and self.waiting == 0:
+                self._start_idle_timer()
+
+    def _cancel_idle_timer(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+    def _start_idle_timer(self):
+        self._cancel_idle_timer()
+        if self._browser is None:
+            return
+        loop = asyncio.get_running_loop()
+        self._idle_handle = loop.call_later(self.idle_timeout, lambda: asyncio.ensure_future(self._close_if_idle()))
+
+    async def _close_if_idle(self):
+        self._idle_handle = None
+        if self.active == 0 and self.waiting == 0 and self._browser is not None:
+            logger.info("无头浏览器空闲，关闭以释放内存")
+            _, launch_lock = self._primitives()
+            async with launch_lock:
+                await self._shutdown()
+
+    async def _shutdown(self):
+        browser, playwright = self._browser, self._playwright
+        self._browser = self._playwright = None
+        try:
+            if browser is not None:
+                await browser.close()
+        except Exception as e:
+            logger.warning(f"关闭浏览器失败: {e}")
+        try:
+            if playwright is not None:
+                await playwright.stop()
+        except Exception as e:
+            logger.warning(f"停止playwright失败: {e}")
+
+    async def close(self):
+        self._cancel_idle_timer()
+        await self._shutdown()
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._browser is not None,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_contexts": self.max_contexts,
+            "launches": self.launches,
+            "rendered": self.rendered
+        }
+
+
+class ScreenshotService:
+    """带缓存和磁盘上限的截图服务
+
+    renderer(url, full_page) 返回PNG数据，默认使用常驻浏览器池。
+    """
+
+    def __init__(self, directory: Path = SCREENSHOT_DIR,
+                 renderer: Optional[Callable[[str, bool], Awaitable[bytes]]] = None,
+                 ttl: float = CACHE_TTL, max_bytes: int = MAX_DISK_BYTES,
+                 url_prefix: str = SCREENSHOT_URL_PREFIX):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.pool = BrowserPool() if renderer is None else None
+        self.renderer = renderer or self.pool.render
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.url_prefix = url_prefix
+        # (URL, 是否整页) -> (截图时间, 文件名)
+        self._cache: 'OrderedDict[Tuple[str, bool], Tuple[float, str]]' = OrderedDict()
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.prune()
+
+    def _lookup(self, key: Tuple[str, bool]) -> Optional[Tuple[float, str]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        created, filename = entry
+        if time.time() - created >= self.ttl or not (self.directory / filename).exists():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _result(self, filename: str, created: float, cached: bool) -> Dict:
+        return {
+            "filename": filename,
+            "path": str(self.directory / filename),
+            "url": f"{self.url_prefix}/{filename}",
+            "hash": filename.rsplit('.', 1)[0],
+            "created": created,
+            "cached": cached
+        }
+
+    async def capture(self, url: str, full_page: bool = True) -> Dict:
+        """返回截图信息 {"filename", "path", "url", "hash", "created", "cached"}"""
+        key = (url, full_page)
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return self._result(entry[1], entry[0], True)
+
+        async def render():
+            self.misses += 1
+            data = await self.renderer(url, full_page)
+            filename = self._store(data)
+            created = time.time()
+            self._cache[key] = (created, filename)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+            return filename, created
+
+        (filename, created), shared = await self._flight.do(key, render)
+        if shared:
+            # 同一页面正在渲染，等待了同一结果
+            self.hits += 1
+            return self._result(filename, created, True)
+        self.prune(keep={filename})
+        return self._result(filename, created, False)
+
+    def _store(self, data: bytes) -> str:
+        """以内容哈希为文件名保存，相同内容只保存一份"""
+        filename = f"{hashlib.sha256(data).hexdigest()[:32]}.png"
+        path = self.directory / filename
+        if path.exists():
+            os.utime(path)
+        else:
+            tmp = path.with_suffix('.tmp')
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return filename
+
+    def prune(self, keep: Optional[set] = None) -> int:
+        """删除最旧的文件直到目录总大小不超过上限，返回删除的文件数"""
+        keep = keep or set()
+        files = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or not entry.name.endswith('.png'):
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.name))
+            total += stat.st_size
+        removed = 0
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if name in keep:
+                continue
+            try:
+                os.remove(self.directory / name)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"截图目录超过 {self.max_bytes // (1024 * 1024)}MB，已删除 {removed} 个旧文件")
+        return removed
+
+    def disk_usage(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory)
+                   if entry.is_file() and entry.name.endswith('.png'))
+
+    def stats(self) -> Dict:
+        stats = {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_usage": self.disk_usage(),
+            "max_disk_bytes": self.max_bytes,
+            "ttl": self.ttl
+        }
+        if self.pool is not None:
+            stats["browser"] = self.pool.stats()
+        return stats
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+
+
+screenshot_service = ScreenshotService()
@@ -0,0 +1,53 @@
+"""
+并发请求合并（single flight）
+同一键的并发调用只执行一次，其余调用等待同一结果：
+- 执行者出错时所有等待者收到同一异常
+- 执行者被取消时，等待者（自身没有被取消）中的一个接手重新执行，其余继续等待
+- 每个事件循环各自执行，不跨循环等待
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """按键合并进行中的异步调用"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """返回 (结果, 是否等待了其他调用的结果)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            future = self._inflight.get(key)
+            if future is None or future.get_loop() is not loop:
+                break
+            # asyncio.wait不会取消future：本调用被取消时抛出CancelledError，
+            # 执行者被取消时正常返回，据此区分两种情况（不依赖3.11+的Task.cancelling）
+            await asyncio.wait({future})
+            if future.cancelled():
+                # 执行者被取消而本调用没有：接手执行
+                continue
+            return future.result(), True
+
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            value = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        future.set_result(value)
+        return value, False
@@ -0,0 +1,277 @@
+"""
+测速服务器选择
+- 可用的speedtest命令只探测一次并缓存（候选命令并发探测；未找到时只缓存较短时间，安装后可手动失效）
+- 服务器列表带TTL缓存，同时到达的请求共用同一次获取
+- 从距离最近的N个候选服务器中并发测量TCP建连延迟，选延迟最低的服务器，
+  不必每次测速前都运行一遍 `speedtest-cli --list`
+"""
+
+import asyncio
+import logging
+import os
+import re
+import socket
+import subprocess
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from app.services.command_runner import run_command
+
+logger = logging.getLogger(__name__)
+
+# 按优先级排列的候选命令
+COMMAND_CANDIDATES: List[List[str]] = [
+    ['speedtest-cli'],
+    ['python3', '-m', 'speedtest'],
+    ['python', '-m', 'speedtest'],
+    ['/usr/local/bin/speedtest-cli'],
+    [os.path.expanduser('~/.local/bin/speedtest-cli')],
+]
+VERSION_TIMEOUT = 10
+LIST_TIMEOUT = 30
+# 未找到命令/获取列表失败时的缓存时间（秒），避免每次请求都重新探测
+NEGATIVE_TTL = 60
+# 服务器列表缓存时间（秒）
+CATALOGUE_TTL = 3600
+# 参与延迟探测的候选服务器数、每个服务器的建连次数和超时
+PROBE_CANDIDATES = 5
+PROBE_ATTEMPTS = 3
+PROBE_TIMEOUT = 2.0
+
+# "1234) Sponsor (City, Country) [12.34 km]"
+_LIST_LINE = re.compile(r'^\s*(\d+)\)\s+(.+?)\s+\((.+)\)\s+\[([\d.]+)\s*(km|mi)\]')
+
+
+class SpeedtestCommandCache:
+    """缓存可用的speedtest命令"""
+
+    def __init__(self, candidates: Sequence[Sequence[str]] = COMMAND_CANDIDATES,
+                 negative_ttl: float = NEGATIVE_TTL):
+        self.candidates = [list(cmd) for cmd in candidates]
+        self.negative_ttl = negative_ttl
+        self._command: Optional[List[str]] = None
+        self._checked_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+
+    async def _probe(self, cmd: List[str]) -> bool:
+        try:
+            # 版本探测互不影响，不占用speedtest的并发名额
+            result = await run_command(cmd + ['--version'], timeout=VERSION_TIMEOUT, tool='speedtest-version')
+        except (subprocess.TimeoutExpired, OSError):
+            return False
+        return result.returncode == 0
+
+    async def _resolve(self) -> Optional[List[str]]:
+        results = await asyncio.gather(*[self._probe(cmd) for cmd in self.candidates])
+        command = next((cmd for cmd, ok in zip(self.candidates, results) if ok), None)
+        self._command = command
+        self._checked_at = time.monotonic()
+        if command:
+            print(f"  ✅ 找到 speedtest-cli: {' '.join(command)}")
+        else:
+            print("  ❌ 未找到 speedtest-cli")
+        return command
+
+    async def get(self) -> Optional[List[str]]:
+        """返回可用命令，未找到时返回None"""
+        if self._command is not None:
+            return list(self._command)
+        if self._checked_at and time.monotonic() - self._checked_at < self.negative_ttl:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._inflight is None or self._inflight.done() or self._inflight.get_loop() is not loop:
+            self._inflight = asyncio.ensure_future(self._resolve())
+        command = await asyncio.shield(self._inflight)
+        return list(command) if command else None
+
+    def invalidate(self):
+        """安装或卸载speedtest-cli后调用，下次重新探测"""
+        self._command = None
+        self._checked_at = 0.0
+        self._inflight = None
+
+
+def parse_server_list(output: str) -> List[Dict]:
+    """解析 `speedtest-cli --list` 的输出，按距离排序；列表中没有服务器主机地址"""
+    servers = []
+    for line in output.splitlines():
+        match = _LIST_LINE.match(line)
+        if not match:
+            continue
+        distance = float(match.group(4))
+        if match.group(5) == 'mi':
+            distance *= 1.609344
+        servers.append({
+            "id": match.group(1),
+            "name": match.group(2),
+            "location": match.group(3),
+            "distance": round(distance, 2),
+            "host": None
+        })
+    servers.sort(key=lambda s: s["distance"])
+    return servers
+
+
+def _fetch_with_module() -> List[Dict]:
+    """用speedtest模块获取服务器列表（包含主机地址，可做延迟探测），在线程中运行"""
+    import speedtest
+
+    client = speedtest.Speedtest(secure=True)
+    servers = []
+    for group in client.get_servers().values():
+        for server in group:
+            servers.append({
+                "id": str(server.get("id")),
+                "name": server.get("sponsor", "Unknown"),
+                "location": f"{server.get('name', 'Unknown')}, {server.get('country', 'Unknown')}",
+                "distance": round(float(server.get("d", 0)), 2),
+                "host": server.get("host")
+            })
+    servers.sort(key=lambda s: s["distance"])
+    return servers
+
+
+async def fetch_server_list(commands: Optional[SpeedtestCommandCache] = None) -> List[Dict]:
+    """获取服务器列表：优先speedtest模块，失败时解析 `--list` 的输出"""
+    try:
+        servers = await asyncio.to_thread(_fetch_with_module)
+        if servers:
+            return servers
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning(f"speedtest模块获取服务器列表失败: {e}")
+
+    base_cmd = await (commands or command_cache).get()
+    if not base_cmd:
+        return []
+    try:
+        result = await run_command(base_cmd + ['--list'], timeout=LIST_TIMEOUT, tool='speedtest-cli')
+    except (subprocess.TimeoutExpired, OSError) as e:
+        logger.warning(f"获取服务器列表失败: {e}")
+        return []
+    if result.returncode != 0:
+        logger.warning(f"获取服务器列表失败: {result.stderr.strip()}")
+        return []
+    return parse_server_list(result.stdout)
+
+
+class ServerCatalogue:
+    """带TTL的服务器列表缓存"""
+
+    def __init__(self, fetcher: Optional[Callable[[], Awaitable[List[Dict]]]] = None,
+                 ttl: float = CATALOGUE_TTL, negative_ttl: float = NEGATIVE_TTL):
+        self.fetcher = fetcher or fetch_server_list
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._servers: List[Dict] = []
+        self._fetched_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+
+    def _fresh(self) -> bool:
+        if not self._fetched_at:
+            return False
+        ttl = self.ttl if self._servers else self.negative_ttl
+        return time.monotonic() - self._fetched_at < ttl
+
+    async def _refresh(self) -> List[Dict]:
+        started = time.time()
+        servers = await self.fetcher()
+        self._servers = servers
+        self._fetched_at = time.monotonic()
+        print(f"✅ 获取到 {len(servers)} 个测速服务器，用时 {time.time() - started:.2f}秒")
+        return servers
+
+    async def get(self, refresh: bool = False) -> List[Dict]:
+        """返回按距离排序的服务器列表（副本）"""
+        if not refresh and self._fresh():
+            return [dict(s) for s in self._servers]
+        loop = asyncio.get_running_loop()
+        if self._inflight is None or self._inflight.done() or self._inflight.get_loop() is not loop:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        servers = await asyncio.shield(self._inflight)
+        return [dict(s) for s in servers]
+
+    def info(self) -> Dict:
+        return {
+            "cached": self._fresh(),
+            "age": round(time.monotonic() - self._fetched_at, 1) if self._fetched_at else None,
+            "ttl": self.ttl,
+            "count": len(self._servers)
+        }
+
+    def invalidate(self):
+        self._servers = []
+        self._fetched_at = 0.0
+        self._inflight = None
+
+
+def split_host(host: str, default_port: int = 8080) -> tuple:
+    """拆分 "host:port"（支持 "[v6]:port"）"""
+    if host.startswith('['):
+        address, _, rest = host[1:].partition(']')
+        return address, int(rest[1:]) if rest.startswith(':') else default_port
+    if host.count(':') == 1:
+        address, _, port = host.partition(':')
+        return address, int(port)
+    return host, default_port
+
+
+async def probe_latency(host: str, attempts: int = PROBE_ATTEMPTS,
+                        timeout: float = PROBE_TIMEOUT) -> Optional[float]:
+    """测量到服务器的TCP建连延迟（毫秒，取多次中的最小值）；不可达返回None
+
+    只解析一次域名，建连时间不包含DNS。
+    """
+    address, port = split_host(host)
+    loop = asyncio.get_running_loop()
+    try:
+        infos = await asyncio.wait_for(
+            loop.getaddrinfo(address, port, type=socket.SOCK_STREAM), timeout=timeout)
+    except (asyncio.TimeoutError, OSError):
+        return None
+    if not infos:
+        return None
+    ip = infos[0][4][0]
+
+    best = None
+    for _ in range(max(1, attempts)):
+        started = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=timeout)
+        except (asyncio.TimeoutError, OSError):
+            continue
+        elapsed = (time.perf_counter() - started) * 1000
+        writer.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2) if best is not None else None
+
+
+async def rank_servers(servers: Sequence[Dict], candidates: int = PROBE_CANDIDATES,
+                       attempts: int = PROBE_ATTEMPTS, timeout: float = PROBE_TIMEOUT) -> List[Dict]:
+    """并发探测距离最近的candidates个服务器，按延迟排序返回（不可达的排在最后）
+
+    没有主机地址的服务器（来自 `--list`）无法探测，latency为None，按距离排序。
+    """
+    selected = [dict(s) for s in servers[:max(1, candidates)]]
+    latencies = await asyncio.gather(*[
+        probe_latency(s["host"], attempts, timeout) if s.get("host") else asyncio.sleep(0)
+        for s in selected
+    ])
+    for server, latency in zip(selected, latencies):
+        server["latency"] = latency
+    selected.sort(key=lambda s: (s["latency"] is None, s["latency"] or 0, s["distance"]))
+    return selected
+
+
+async def select_best_server(candidates: int = PROBE_CANDIDATES) -> Optional[Dict]:
+    """从缓存的服务器列表中选择延迟最低的服务器，没有可用服务器时返回None"""
+    servers = await server_catalogue.get()
+    if not servers:
+        return None
+    ranked = await rank_servers(servers, candidates)
+    return ranked[0]
+
+
+command_cache = SpeedtestCommandCache()
+server_catalogue = ServerCatalogue()
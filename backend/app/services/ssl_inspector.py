@@ -0,0 +1,408 @@
+"""
+异步SSL/TLS证书检查
+在事件循环上完成 DNS解析 -> TCP连接 -> TLS握手，分别计时；证书直接在进程内按DER解析，
+不再调用openssl命令。解析结果按SHA-256指纹缓存，批量检查共用同一CA/证书的主机时只解析一次。
+"""
+
+import asyncio
+import datetime
+import hashlib
+import logging
+import socket
+import ssl
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 443
+DEFAULT_TIMEOUT = 10.0
+# 批量检查时同时进行的握手数
+DEFAULT_CONCURRENCY = 64
+PARSE_CACHE_SIZE = 1024
+
+# 名称属性
+NAME_ATTRIBUTES = {
+    '2.5.4.3': 'CN', '2.5.4.4': 'SN', '2.5.4.5': 'serialNumber', '2.5.4.6': 'C', '2.5.4.7': 'L',
+    '2.5.4.8': 'ST', '2.5.4.9': 'street', '2.5.4.10': 'O', '2.5.4.11': 'OU', '2.5.4.42': 'GN',
+    '1.2.840.113549.1.9.1': 'emailAddress', '0.9.2342.19200300.100.1.25': 'DC',
+}
+# 签名算法（命名与openssl一致）
+SIGNATURE_ALGORITHMS = {
+    '1.2.840.113549.1.1.4': 'md5WithRSAEncryption',
+    '1.2.840.113549.1.1.5': 'sha1WithRSAEncryption',
+    '1.2.840.113549.1.1.10': 'rsassaPss',
+    '1.2.840.113549.1.1.11': 'sha256WithRSAEncryption',
+    '1.2.840.113549.1.1.12': 'sha384WithRSAEncryption',
+    '1.2.840.113549.1.1.13': 'sha512WithRSAEncryption',
+    '1.2.840.10045.4.1': 'ecdsa-with-SHA1',
+    '1.2.840.10045.4.3.2': 'ecdsa-with-SHA256',
+    '1.2.840.10045.4.3.3': 'ecdsa-with-SHA384',
+    '1.2.840.10045.4.3.4': 'ecdsa-with-SHA512',
+    '1.3.101.112': 'ED25519',
+    '1.3.101.113': 'ED448',
+}
+PUBLIC_KEY_ALGORITHMS = {
+    '1.2.840.113549.1.1.1': 'rsaEncryption',
+    '1.2.840.10045.2.1': 'id-ecPublicKey',
+    '1.3.101.112': 'ED25519',
+    '1.3.101.113': 'ED448',
+}
+# 椭圆曲线 -> 密钥长度
+CURVE_SIZES = {
+    '1.2.840.10045.3.1.7': 256,
+    '1.3.132.0.34': 384,
+    '1.3.132.0.35': 521,
+}
+EDWARDS_KEY_SIZES = {'ED25519': 256, 'ED448': 456}
+OID_SUBJECT_ALT_NAME = '2.5.29.17'
+
+
+class DERError(ValueError):
+    """DER编码错误"""
+
+
+def _read_tlv(data: bytes, pos: int) -> Tuple[int, int, int]:
+    """读取一个TLV，返回 (标签, 内容起点, 内容终点)"""
+    if pos + 2 > len(data):
+        raise DERError("数据越界")
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        count = length & 0x7f
+        if count == 0 or count > 4 or pos + count > len(data):
+            raise DERError("长度编码无效")
+        length = int.from_bytes(data[pos:pos + count], 'big')
+        pos += count
+    end = pos + length
+    if end > len(data):
+        raise DERError("内容越界")
+    return tag, pos, end
+
+
+def _children(data: bytes, start: int, end: int) -> List[Tuple[int, int, int]]:
+    """列出构造类型内的所有子元素"""
+    items = []
+    pos = start
+    while pos < end:
+        tag, content_start, content_end = _read_tlv(data, pos)
+        items.append((tag, content_start, content_end))
+        pos = content_end
+    return items
+
+
+def _decode_oid(raw: bytes) -> str:
+    if not raw:
+        raise DERError("空OID")
+    first = raw[0]
+    parts = [min(first // 40, 2), first - min(first // 40, 2) * 40]
+    value = 0
+    for byte in raw[1:]:
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            parts.append(value)
+            value = 0
+    return '.'.join(str(p) for p in parts)
+
+
+def _decode_string(tag: int, raw: bytes) -> str:
+    if tag == 0x1e:
+        return raw.decode('utf-16-be', errors='replace')
+    if tag == 0x1c:
+        return raw.decode('utf-32-be', errors='replace')
+    if tag == 0x14:
+        return raw.decode('latin-1')
+    return raw.decode('utf-8', errors='replace')
+
+
+def _decode_name(data: bytes, start: int, end: int) -> str:
+    """Name -> "C = US, O = Example, CN = example.com"（与openssl输出格式一致）"""
+    parts = []
+    for _, set_start, set_end in _children(data, start, end):
+        for _, attr_start, attr_end in _children(data, set_start, set_end):
+            attr = _children(data, attr_start, attr_end)
+            if len(attr) < 2:
+                continue
+            oid = _decode_oid(data[attr[0][1]:attr[0][2]])
+            tag, value_start, value_end = attr[1]
+            value = _decode_string(tag, data[value_start:value_end])
+            parts.append(f"{NAME_ATTRIBUTES.get(oid, oid)} = {value}")
+    return ', '.join(parts)
+
+
+def _decode_time(tag: int, raw: bytes) -> datetime.datetime:
+    text = raw.decode('ascii').rstrip('Z')
+    if tag == 0x17:
+        # UTCTime：两位年份，50以下为20xx
+        year = int(text[:2])
+        text = f"{2000 + year if year < 50 else 1900 + year}{text[2:]}"
+    return datetime.datetime.strptime(text[:14], '%Y%m%d%H%M%S')
+
+
+def _public_key_info(data: bytes, start: int, end: int) -> Tuple[str, int]:
+    algorithm, key = _children(data, start, end)[:2]
+    algorithm_items = _children(data, algorithm[1], algorithm[2])
+    oid = _decode_oid(data[algorithm_items[0][1]:algorithm_items[0][2]])
+    name = PUBLIC_KEY_ALGORITHMS.get(oid, oid)
+    if name == 'rsaEncryption':
+        # BIT STRING的第一个字节是未使用位数，之后是 SEQUENCE { modulus, publicExponent }
+        _, seq_start, seq_end = _read_tlv(data, key[1] + 1)
+        _, mod_start, mod_end = _children(data, seq_start, seq_end)[0]
+        return name, int.from_bytes(data[mod_start:mod_end], 'big').bit_length()
+    if name == 'id-ecPublicKey' and len(algorithm_items) > 1:
+        curve = _decode_oid(data[algorithm_items[1][1]:algorithm_items[1][2]])
+        return name, CURVE_SIZES.get(curve, 0)
+    return name, EDWARDS_KEY_SIZES.get(name, 0)
+
+
+def _subject_alt_names(data: bytes, start: int, end: int) -> List[str]:
+    names = []
+    _, seq_start, seq_end = _read_tlv(data, start)
+    for tag, value_start, value_end in _children(data, seq_start, seq_end):
+        raw = data[value_start:value_end]
+        if tag == 0x82:  # dNSName
+            names.append(raw.decode('ascii', errors='replace'))
+        elif tag == 0x87 and len(raw) in (4, 16):  # iPAddress
+            names.append(socket.inet_ntop(socket.AF_INET if len(raw) == 4 else socket.AF_INET6, raw))
+    return names
+
+
+def parse_certificate_der(cert_der: bytes) -> Dict[str, Any]:
+    """解析DER编码的X.509证书，字段与原openssl解析结果一致"""
+    _, cert_start, cert_end = _read_tlv(cert_der, 0)
+    tbs, signature_algorithm = _children(cert_der, cert_start, cert_end)[:2]
+    fields = _children(cert_der, tbs[1], tbs[2])
+    if fields and fields[0][0] == 0xa0:  # [0] version
+        fields = fields[1:]
+    serial, _, issuer, validity, subject, spki = fields[:6]
+
+    sig_oid_tlv = _children(cert_der, signature_algorithm[1], signature_algorithm[2])[0]
+    sig_oid = _decode_oid(cert_der[sig_oid_tlv[1]:sig_oid_tlv[2]])
+    not_before_tlv, not_after_tlv = _children(cert_der, validity[1], validity[2])[:2]
+    not_before = _decode_time(not_before_tlv[0], cert_der[not_before_tlv[1]:not_before_tlv[2]])
+    not_after = _decode_time(not_after_tlv[0], cert_der[not_after_tlv[1]:not_after_tlv[2]])
+    public_key_algorithm, key_size = _public_key_info(cert_der, spki[1], spki[2])
+
+    san_domains: List[str] = []
+    for tag, ext_start, ext_end in fields[6:]:
+        if tag != 0xa3:  # [3] extensions
+            continue
+        _, exts_start, exts_end = _read_tlv(cert_der, ext_start)
+        for _, item_start, item_end in _children(cert_der, exts_start, exts_end):
+            parts = _children(cert_der, item_start, item_end)
+            if _decode_oid(cert_der[parts[0][1]:parts[0][2]]) == OID_SUBJECT_ALT_NAME:
+                # 值是OCTET STRING包裹的GeneralNames
+                san_domains = _subject_alt_names(cert_der, parts[-1][1], parts[-1][2])
+
+    serial_hex = cert_der[serial[1]:serial[2]].hex()
+    return {
+        'subject': _decode_name(cert_der, subject[1], subject[2]),
+        'issuer': _decode_name(cert_der, issuer[1], issuer[2]),
+        'serial_number': ':'.join(serial_hex[i:i + 2] for i in range(0, len(serial_hex), 2)),
+        'not_before': not_before.strftime('%b %d %H:%M:%S %Y GMT'),
+        'not_after': not_after.strftime('%b %d %H:%M:%S %Y GMT'),
+        'signature_algorithm': SIGNATURE_ALGORITHMS.get(sig_oid, sig_oid),
+        'public_key_algorithm': public_key_algorithm,
+        'key_size': key_size,
+        'fingerprint_sha1': hashlib.sha1(cert_der).hexdigest().upper(),
+        'fingerprint_sha256': hashlib.sha256(cert_der).hexdigest().upper(),
+        'san_domains': san_domains
+    }
+
+
+class CertificateParseCache:
+    """按SHA-256指纹缓存证书解析结果（LRU）"""
+
+    def __init__(self, max_size: int = PARSE_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, cert_der: bytes) -> Dict[str, Any]:
+        fingerprint = hashlib.sha256(cert_der).hexdigest()
+        with self._lock:
+            cached = self._items.get(fingerprint)
+            if cached is not None:
+                self._items.move_to_end(fingerprint)
+                self.hits += 1
+                return {**cached, 'san_domains': list(cached['san_domains'])}
+            self.misses += 1
+
+        try:
+            info = parse_certificate_der(cert_der)
+        except (DERError, ValueError, IndexError) as e:
+            logger.warning(f"证书解析失败: {e}")
+            info = {
+                'subject': "Unknown",
+                'issuer': "Unknown",
+                'serial_number': "Unknown",
+                'not_before': "Unknown",
+                'not_after': "Unknown",
+                'signature_algorithm': "Unknown",
+                'public_key_algorithm': "Unknown",
+                'key_size': 0,
+                'fingerprint_sha1': hashlib.sha1(cert_der).hexdigest().upper(),
+                'fingerprint_sha256': fingerprint.upper(),
+                'san_domains': []
+            }
+
+        with self._lock:
+            self._items[fingerprint] = info
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return {**info, 'san_domains': list(info['san_domains'])}
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._items), 'hits': self.hits, 'misses': self.misses}
+
+
+parse_cache = CertificateParseCache()
+
+
+def parse_target(target: str, default_port: int = DEFAULT_PORT) -> Tuple[str, int]:
+    """解析 "host"、"host:port"、"[::1]:443" 形式的目标"""
+    target = target.strip()
+    if target.startswith('['):
+        host, _, rest = target[1:].partition(']')
+        port = rest.lstrip(':')
+        return host, int(port) if port else default_port
+    if target.count(':') == 1:
+        host, port = target.split(':')
+        return host, int(port)
+    return target, default_port
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        socket.inet_pton(socket.AF_INET6 if ':' in host else socket.AF_INET, host)
+        return True
+    except OSError:
+        return False
+
+
+def _make_context() -> ssl.SSLContext:
+    # 只做检查不做校验，与原实现一致；整个进程共用一个上下文
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+_context: Optional[ssl.SSLContext] = None
+
+
+def get_ssl_context() -> ssl.SSLContext:
+    global _context
+    if _context is None:
+        _context = _make_context()
+    return _context
+
+
+def _chain_der(ssl_object) -> List[bytes]:
+    """获取对端发送的证书链
+
+    Python 3.13+ 的SSLObject提供公开的get_unverified_chain；3.10~3.12只有底层_ssl对象上的同名方法
+    """
+    get_chain = getattr(ssl_object, 'get_unverified_chain', None)
+    if get_chain is None:
+        get_chain = getattr(getattr(ssl_object, '_sslobj', None), 'get_unverified_chain', None)
+    if get_chain is None:
+        return []
+    chain = []
+    for cert in get_chain() or []:
+        if isinstance(cert, (bytes, bytearray)):
+            chain.append(bytes(cert))
+        elif hasattr(cert, 'public_bytes'):
+            chain.append(cert.public_bytes(ssl._ssl.ENCODING_DER))
+    return chain
+
+
+async def inspect_certificate(hostname: str, port: int = DEFAULT_PORT, check_chain: bool = True,
+                              timeout: float = DEFAULT_TIMEOUT,
+                              cache: Optional[CertificateParseCache] = None) -> Dict[str, Any]:
+    """检查单个目标的证书，返回证书、协议、加密套件以及各阶段耗时
+
+    失败时抛出异常，消息为中文描述。
+    """
+    cache = cache or parse_cache
+    loop = asyncio.get_running_loop()
+    start_time = time.perf_counter()
+    writer = None
+    try:
+        try:
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(hostname, port, type=socket.SOCK_STREAM), timeout=timeout)
+        except socket.gaierror as e:
+            raise Exception(f"域名解析失败: {e}")
+        infos.sort(key=lambda info: info[0] != socket.AF_INET)
+        ip_address = infos[0][4][0]
+        dns_done = time.perf_counter()
+
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, port), timeout=timeout)
+        connect_done = time.perf_counter()
+
+        server_hostname = None if _is_ip(hostname) else hostname
+        await asyncio.wait_for(
+            writer.start_tls(get_ssl_context(), server_hostname=server_hostname), timeout=timeout)
+        handshake_done = time.perf_counter()
+
+        ssl_object = writer.get_extra_info('ssl_object')
+        cert_der = ssl_object.getpeercert(binary_form=True)
+        if not cert_der:
+            raise Exception("服务器未提供证书")
+        ssl_version = ssl_object.version()
+        cipher = ssl_object.cipher()
+        chain_der = _chain_der(ssl_object) if check_chain else []
+    except asyncio.TimeoutError:
+        raise Exception("连接超时")
+    except ssl.SSLError as e:
+        raise Exception(f"SSL 错误: {e}")
+    except OSError as e:
+        raise Exception(f"连接失败: {e}")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    # 证书链第一个是服务器证书本身
+    certificate_chain = [cache.parse(der) for der in chain_der[1:]]
+    return {
+        "hostname": hostname,
+        "ip_address": ip_address,
+        "port": port,
+        "ssl_version": ssl_version,
+        "cipher_suite": cipher[0] if cipher else "Unknown",
+        "certificate": cache.parse(cert_der),
+        "certificate_chain": certificate_chain,
+        "connection_info": {
+            "dns_time": round((dns_done - start_time) * 1000, 2),
+            "connect_time": round((connect_done - dns_done) * 1000, 2),
+            "handshake_time": round((handshake_done - connect_done) * 1000, 2),
+            "total_time": round((time.perf_counter() - start_time) * 1000, 2)
+        },
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+async def inspect_many(targets: Sequence[Tuple[str, int]], check_chain: bool = False,
+                       timeout: float = DEFAULT_TIMEOUT,
+                       concurrency: int = DEFAULT_CONCURRENCY) -> List[Dict[str, Any]]:
+    """并发检查多个目标，按输入顺序返回；单个目标失败不影响其他目标
+
+    每项为 {'hostname', 'port', 'success', 'data'|'error'}。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def inspect(hostname: str, port: int) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                data = await inspect_certificate(hostname, port, check_chain, timeout)
+                return {'hostname': hostname, 'port': port, 'success': True, 'data': data}
+            except Exception as e:
+                return {'hostname': hostname, 'port': port, 'success': False, 'error': str(e)}
+
+    return await asyncio.gather(*[inspect(hostname, port) for hostname, port in targets])
@@ -0,0 +1,314 @@
+"""
+流式抓包分析
+tcpdump把pcap写到标准输出，一边落盘一边喂给行缓冲的tshark，
+解析出的字段实时装载进列式数据包表并更新增量统计，
+抓包结束时数据已全部解析完毕，无需再次读取pcap文件
+"""
+
+import os
+import signal
+import subprocess
+import threading
+import time
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+from app.services.packet_table import PacketTable
+from app.services.pcap_field_extractor import TSHARK_FIELDS, build_tshark_command
+
+logger = logging.getLogger(__name__)
+
+# 每装载多少行更新一次增量统计
+AGGREGATE_BATCH_SIZE = 256
+# 从tcpdump标准输出读取的块大小
+PUMP_CHUNK_SIZE = 64 * 1024
+# tshark错误输出最多保留的字符数
+DECODER_STDERR_LIMIT = 4096
+
+
+class IncrementalPacketStats:
+    """增量统计：只处理上次更新之后新装载的行"""
+
+    def __init__(self):
+        self.processed = 0
+        self.total_bytes = 0
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.protocol_codes: Counter = Counter()
+        self.rtt_sum = 0.0
+        self.rtt_count = 0
+        self.rtt_min: Optional[float] = None
+        self.rtt_max: Optional[float] = None
+        self.retransmissions = 0
+        self.dns_failures = 0
+        self.slow_dns_queries = 0
+        # 站点 -> [IP编码集合, RTT总和(ms), RTT样本数, 请求数, 错误数]
+        self.sites: Dict[str, list] = {}
+
+    def update(self, table: PacketTable, end: Optional[int] = None):
+        """处理 [processed, end) 范围内的新行"""
+        start = self.processed
+        end = len(table) if end is None else end
+        if end <= start:
+            return
+
+        lengths = table.length[start:end]
+        self.total_bytes += sum(lengths)
+        times = table.valid(table.time_epoch[start:end])
+        if times:
+            if self.first_ts is None:
+                self.first_ts = min(times)
+            self.last_ts = max(times)
+
+        self.protocol_codes.update(table.protocols[start:end])
+
+        rtts = [rtt * 1000 for rtt in table.ack_rtt[start:end] if rtt > 0]
+        if rtts:
+            self.rtt_sum += sum(rtts)
+            self.rtt_count += len(rtts)
+            low, high = min(rtts), max(rtts)
+            self.rtt_min = low if self.rtt_min is None else min(self.rtt_min, low)
+            self.rtt_max = high if self.rtt_max is None else max(self.rtt_max, high)
+
+        self.retransmissions += sum(table.retransmission[start:end])
+        self.dns_failures += sum(1 for code in table.dns_resp_code[start:end] if code > 0)
+        self.slow_dns_queries += sum(1 for t in table.dns_time[start:end] if t > 1.0)
+
+        self._update_sites(table, start, end)
+        self.processed = end
+
+    def _update_sites(self, table: PacketTable, start: int, end: int):
+        """按HTTP Host / TLS SNI累积站点性能"""
+        for i in range(start, end):
+            code = table.http_host[i] or table.tls_sni[i]
+            if not code:
+                continue
+            site = self.sites.get(table.strings[code])
+            if site is None:
+                site = self.sites[table.strings[code]] = [set(), 0.0, 0, 0, 0]
+            if table.dst_ip[i]:
+                site[0].add(table.dst_ip[i])
+            rtt = table.ack_rtt[i]
+            if not rtt > 0:
+                rtt = table.initial_rtt[i]
+            if rtt > 0:
+                site[1] += rtt * 1000
+                site[2] += 1
+            if table.http_method[i]:
+                site[3] += 1
+            if 400 <= table.http_response_code[i] < 600:
+                site[4] += 1
+
+    def snapshot(self, table: PacketTable, top_sites: int = 10) -> Dict:
+        """当前统计的只读快照"""
+        protocols: Dict[str, int] = {}
+        for code, count in self.protocol_codes.items():
+            stack = table.protocol_stacks[code]
+            if stack:
+                top = stack.split(':')[-1].upper()
+                protocols[top] = protocols.get(top, 0) + count
+
+        sites = sorted(self.sites.items(), key=lambda item: item[1][2] + item[1][3], reverse=True)
+        return {
+            'packets': self.processed,
+            'total_bytes': self.total_bytes,
+            'duration': (self.last_ts - self.first_ts) if self.first_ts is not None else 0,
+            'protocols': protocols,
+            'rtt': {
+                'avg_ms': round(self.rtt_sum / self.rtt_count, 1) if self.rtt_count else None,
+                'min_ms': round(self.rtt_min, 1) if self.rtt_min is not None else None,
+                'max_ms': round(self.rtt_max, 1) if self.rtt_max is not None else None,
+                'samples': self.rtt_count
+            },
+            'retransmissions': self.retransmissions,
+            'dns': {
+                'failures': self.dns_failures,
+                'slow_queries': self.slow_dns_queries
+            },
+            'top_sites': [
+                {
+                    'site': name,
+                    'ips': [table.addresses[c] for c in list(data[0])[:5]],
+                    'avg_rtt_ms': round(data[1] / data[2], 1) if data[2] else None,
+                    'requests': data[3],
+                    'errors': data[4]
+                }
+                for name, data in sites[:top_sites]
+            ]
+        }
+
+
+class StreamingCaptureSession:
+    """一次流式抓包会话：tcpdump -> (pcap文件, tshark) -> 列式表 + 增量统计"""
+
+    def __init__(self, capture_cmd: str, tshark_cmd: str, pcap_file: str,
+                 fields: Sequence[str] = TSHARK_FIELDS,
+                 decoder_cmd: Optional[List[str]] = None):
+        self.capture_cmd = capture_cmd
+        self.pcap_file = pcap_file
+        self.fields = list(fields)
+        self.decoder_cmd = decoder_cmd or build_tshark_command(
+            tshark_cmd, '-', self.fields, line_buffered=True)
+
+        self.table = PacketTable()
+        self.stats = IncrementalPacketStats()
+        self._load = self.table.make_loader(self.fields)
+        self._lock = threading.Lock()
+        self._capture_proc: Optional[subprocess.Popen] = None
+        self._decoder_proc: Optional[subprocess.Popen] = None
+        self._threads: List[threading.Thread] = []
+        self.bytes_captured = 0
+        self.started_at: Optional[float] = None
+        self.capture_error: Optional[str] = None
+        # tshark没有完整解析全部数据时的原因，此时列式表不完整，应改为从pcap文件解析
+        self.decoder_error: Optional[str] = None
+        self.decoder_returncode: Optional[int] = None
+        self._decoder_lost = False
+        self._decoder_stderr = ''
+
+    def start(self):
+        """启动tcpdump和tshark，以及转发数据、读取解析结果和tshark错误输出的线程"""
+        self.started_at = time.time()
+        self._decoder_proc = subprocess.Popen(
+            self.decoder_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, text=False)
+        # 独立进程组，停止时连同shell派生的子进程（sudo/tcpdump）一起终止
+        self._capture_proc = subprocess.Popen(
+            self.capture_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True)
+
+        self._threads = [
+            threading.Thread(target=self._pump, name='capture-pump', daemon=True),
+            threading.Thread(target=self._read_decoder, name='capture-decoder', daemon=True),
+            threading.Thread(target=self._read_decoder_stderr, name='capture-decoder-stderr', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def degraded(self) -> bool:
+        """tshark提前退出、出错或被强制结束，流式解析结果不完整"""
+        return self.decoder_error is not None
+
+    def is_capture_running(self) -> bool:
+        return self._capture_proc is not None and self._capture_proc.poll() is None
+
+    def stop(self, timeout: float = 10) -> PacketTable:
+        """停止抓包并等待解析完成，返回列式表
+
+        解析不完整时（见degraded）decoder_error记录原因，返回的表只包含已解析的部分。
+        """
+        proc = self._capture_proc
+        if proc is not None:
+            exited_early = proc.poll() is not None
+            if not exited_early:
+                self._signal_capture(signal.SIGTERM)
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._signal_capture(signal.SIGKILL)
+                proc.wait()
+            stderr = proc.stderr.read().decode(errors='replace') if proc.stderr else ''
+            if exited_early and proc.returncode != 0:
+                self.capture_error = stderr.strip() or f"returncode={proc.returncode}"
+
+        for thread in self._threads:
+            thread.join(timeout)
+        decoder = self._decoder_proc
+        if decoder is not None:
+            killed = decoder.poll() is None
+            if killed:
+                decoder.kill()
+                decoder.wait()
+                for thread in self._threads:
+                    thread.join(1)
+            self.decoder_returncode = decoder.returncode
+            self.decoder_error = self._check_decoder(killed, timeout)
+            if self.decoder_error:
+                logger.warning(f"tshark流式解析不完整: {self.decoder_error}")
+
+        with self._lock:
+            self.stats.update(self.table)
+        logger.info(f"流式抓包结束: {len(self.table)} 个包, {self.bytes_captured} 字节")
+        return self.table
+
+    def _check_decoder(self, killed: bool, timeout: float) -> Optional[str]:
+        """解析进程的问题描述，正常结束时返回None"""
+        stderr = self._decoder_stderr.strip()
+        if killed:
+            return f"tshark在{timeout}秒内未结束，已强制终止"
+        if self.decoder_returncode != 0:
+            return stderr or f"tshark returncode={self.decoder_returncode}"
+        if self._decoder_lost:
+            return stderr or "tshark解析进程提前退出"
+        return None
+
+    def _signal_capture(self, sig: int):
+        """向抓包进程组发送信号"""
+        try:
+            os.killpg(self._capture_proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            self._capture_proc.send_signal(sig)
+
+    def snapshot(self) -> Dict:
+        """抓包过程中的部分结果"""
+        with self._lock:
+            self.stats.update(self.table)
+            partial = self.stats.snapshot(self.table)
+        partial['bytes_captured'] = self.bytes_captured
+        partial['elapsed_seconds'] = round(time.time() - self.started_at, 1) if self.started_at else 0
+        return partial
+
+    def _pump(self):
+        """把tcpdump输出同时写入pcap文件和tshark标准输入"""
+        decoder_stdin = self._decoder_proc.stdin
+        source = self._capture_proc.stdout
+        try:
+            with open(self.pcap_file, 'wb') as pcap_out:
+                while True:
+                    chunk = source.read1(PUMP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    pcap_out.write(chunk)
+                    self.bytes_captured += len(chunk)
+                    if decoder_stdin is not None:
+                        try:
+                            decoder_stdin.write(chunk)
+                            decoder_stdin.flush()
+                        except (BrokenPipeError, OSError):
+                            logger.warning("tshark解析进程已退出，后续数据只写入文件")
+                            self._decoder_lost = True
+                            decoder_stdin = None
+        except Exception as e:
+            logger.error(f"抓包数据转发失败: {str(e)}")
+            self._decoder_lost = True
+        finally:
+            if decoder_stdin is not None:
+                try:
+                    decoder_stdin.close()
+                except OSError:
+                    pass
+
+    def _read_decoder(self):
+        """逐行读取tshark输出，装载进列式表并批量更新增量统计"""
+        pending = 0
+        for raw in self._decoder_proc.stdout:
+            line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+            if not line:
+                continue
+            with self._lock:
+                self._load(line.split('\t'))
+                pending += 1
+                if pending >= AGGREGATE_BATCH_SIZE:
+                    self.stats.update(self.table)
+                    pending = 0
+        self._decoder_proc.stdout.close()
+
+    def _read_decoder_stderr(self):
+        """读完tshark错误输出（避免管道写满），只保留开头部分用于报告"""
+        stderr = self._decoder_proc.stderr
+        for raw in stderr:
+            if len(self._decoder_stderr) < DECODER_STDERR_LIMIT:
+                self._decoder_stderr += raw.decode('utf-8', errors='replace')[:DECODER_STDERR_LIMIT]
+        stderr.close()
@@ -0,0 +1,384 @@
+"""
+抓包任务存储
+任务元数据和分析结果持久化到SQLite，内存中只保留少量最近访问的结果（LRU），
+并按过期时间、任务数量和抓包文件总大小清理旧任务及其pcap文件，
+长时间运行时内存占用保持平稳，服务重启后任务仍可查询。
+"""
+
+import os
+import copy
+import json
+import time
+import sqlite3
+import threading
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 已结束任务的保留时间（秒）
+TASK_TTL_SECONDS = 7 * 24 * 3600
+# 最多保留的任务数
+MAX_TASKS = 200
+# 抓包目录中pcap文件的总大小上限
+MAX_CAPTURE_BYTES = 512 * 1024 * 1024
+# 内存中缓存的任务结果数
+HOT_RESULT_CACHE_SIZE = 8
+# 两次自动清理的最小间隔（秒）
+CLEANUP_INTERVAL = 60
+
+# 未结束的任务状态，清理时跳过；服务重启后这些任务已无人执行，标记为错误
+ACTIVE_STATUSES = ('pending', 'queued', 'capturing', 'processing', 'ai_analyzing')
+
+
+class TaskStore(ABC):
+    """任务存储接口
+
+    任务是一个字典：status/error/created_at/pcap_file/progress/request/result，
+    以及调用方自定义的其它字段。get返回的是副本，修改后需调用update写回。
+    """
+
+    def __init__(self, capture_dir: Optional[str] = None,
+                 ttl_seconds: float = TASK_TTL_SECONDS,
+                 max_tasks: int = MAX_TASKS,
+                 max_capture_bytes: int = MAX_CAPTURE_BYTES):
+        self.capture_dir = capture_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_tasks = max_tasks
+        self.max_capture_bytes = max_capture_bytes
+        self._last_cleanup = 0.0
+
+    @abstractmethod
+    def create(self, task_id: str, task: Dict):
+        """保存新任务"""
+
+    @abstractmethod
+    def get(self, task_id: str, include_result: bool = True) -> Optional[Dict]:
+        """返回任务副本，不存在时返回None；include_result为False时不加载分析结果"""
+
+    @abstractmethod
+    def update(self, task_id: str, **fields) -> bool:
+        """更新任务字段，任务不存在时返回False"""
+
+    @abstractmethod
+    def delete(self, task_id: str):
+        """删除任务（不删除pcap文件）"""
+
+    @abstractmethod
+    def list_tasks(self) -> List[Dict]:
+        """所有任务的元数据（不含结果），按创建时间从旧到新排列"""
+
+    def recover_interrupted_tasks(self) -> int:
+        """服务启动时调用：上次运行中未完成的任务已无人执行，标记为错误"""
+        interrupted = [t['task_id'] for t in self.list_tasks() if t.get('status') in ACTIVE_STATUSES]
+        for task_id in interrupted:
+            self.update(task_id, status='error', error='服务重启，任务已中断')
+        if interrupted:
+            logger.warning(f"{len(interrupted)} 个未完成的任务因服务重启被标记为错误")
+        return len(interrupted)
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id, include_result=False) is not None
+
+    def __len__(self) -> int:
+        return len(self.list_tasks())
+
+    # ---- 清理 ----
+
+    def maybe_cleanup(self):
+        """距离上次清理超过间隔时执行一次清理"""
+        if time.time() - self._last_cleanup >= CLEANUP_INTERVAL:
+            try:
+                self.cleanup()
+            except Exception as e:
+                logger.error(f"清理任务存储失败: {str(e)}")
+
+    def cleanup(self) -> Dict:
+        """按TTL、任务数量和pcap总大小清理，返回清理统计"""
+        self._last_cleanup = now = time.time()
+        stats = {'expired_tasks': 0, 'evicted_tasks': 0, 'removed_pcaps': 0, 'freed_bytes': 0}
+
+        tasks = self.list_tasks()
+        finished = [t for t in tasks if t.get('status') not in ACTIVE_STATUSES]
+        overflow = max(0, len(tasks) - self.max_tasks)
+        for index, task in enumerate(finished):
+            if now - task.get('updated_at', now) > self.ttl_seconds:
+                stats['expired_tasks'] += 1
+            elif index < overflow:
+                stats['evicted_tasks'] += 1
+            else:
+                continue
+            stats['freed_bytes'] += self._remove_file(task.get('pcap_file'))
+            self.delete(task['task_id'])
+
+        self._enforce_capture_dir_limit(now, stats)
+        if any(stats.values()):
+            logger.info(f"任务存储清理完成: {stats}")
+        return stats
+
+    def _enforce_capture_dir_limit(self, now: float, stats: Dict):
+        """删除过期的孤立pcap，并在总大小超限时从最旧的文件开始删除"""
+        if not self.capture_dir or not os.path.isdir(self.capture_dir):
+            return
+
+        owners = {}
+        active_files = set()
+        for task in self.list_tasks():
+            pcap_file = task.get('pcap_file')
+            if pcap_file:
+                owners[os.path.abspath(pcap_file)] = task['task_id']
+            if task.get('status') in ACTIVE_STATUSES:
+                active_files.add(os.path.abspath(os.path.join(self.capture_dir, f"{task['task_id']}.pcap")))
+                if pcap_file:
+                    active_files.add(os.path.abspath(pcap_file))
+
+        files = []
+        for name in os.listdir(self.capture_dir):
+            if not name.endswith(('.pcap', '.pcapng')):
+                continue
+            path = os.path.abspath(os.path.join(self.capture_dir, name))
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if path in active_files:
+                continue
+            orphan_expired = path not in owners and now - mtime > self.ttl_seconds
+            if not orphan_expired and total <= self.max_capture_bytes:
+                continue
+            freed = self._remove_file(path)
+            if not freed:
+                continue
+            total -= freed
+            stats['removed_pcaps'] += 1
+            stats['freed_bytes'] += freed
+            if path in owners:
+                self.update(owners[path], pcap_file=None)
+
+    @staticmethod
+    def _remove_file(path: Optional[str]) -> int:
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except OSError as e:
+            logger.warning(f"删除抓包文件失败: {path}, {str(e)}")
+            return 0
+
+
+class MemoryTaskStore(TaskStore):
+    """纯内存实现，不做持久化，主要用于测试和调试"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._tasks: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def create(self, task_id: str, task: Dict):
+        with self._lock:
+            self._tasks[task_id] = dict(task, task_id=task_id, updated_at=time.time())
+        self.maybe_cleanup()
+
+    def get(self, task_id: str, include_result: bool = True) -> Optional[Dict]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            task = dict(task)
+        if not include_result:
+            task.pop('result', None)
+        return task
+
+    def update(self, task_id: str, **fields) -> bool:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return False
+            task.update(fields, updated_at=time.time())
+            return True
+
+    def delete(self, task_id: str):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+    def list_tasks(self) -> List[Dict]:
+        with self._lock:
+            tasks = [dict(t, has_result=bool(t.get('result')),
+                          has_capture_summary=bool((t.get('result') or {}).get('capture_summary')))
+                     for t in self._tasks.values()]
+        for task in tasks:
+            task.pop('result', None)
+        return sorted(tasks, key=lambda t: t.get('created_at') or '')
+
+
+class SQLiteTaskStore(TaskStore):
+    """SQLite实现：结果以JSON落盘，内存只缓存最近访问的少量结果"""
+
+    COLUMNS = ('status', 'error', 'created_at', 'pcap_file', 'progress')
+    JSON_COLUMNS = ('request', 'result')
+
+    def __init__(self, db_path: str, hot_results: int = HOT_RESULT_CACHE_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        self.db_path = db_path
+        self.hot_results = hot_results
+        self._results: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    created_at TEXT,
+                    updated_at REAL NOT NULL,
+                    pcap_file TEXT,
+                    progress INTEGER,
+                    request TEXT,
+                    result TEXT,
+                    extra TEXT
+                )
+            ''')
+
+    def recover_interrupted_tasks(self) -> int:
+        placeholders = ','.join('?' * len(ACTIVE_STATUSES))
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE tasks SET status='error', error=?, updated_at=? WHERE status IN ({placeholders})",
+                ('服务重启，任务已中断', time.time(), *ACTIVE_STATUSES))
+        if cursor.rowcount:
+            logger.warning(f"{cursor.rowcount} 个未完成的任务因服务重启被标记为错误")
+        return cursor.rowcount
+
+    def create(self, task_id: str, task: Dict):
+        columns, extra = self._split_fields(task)
+        columns.setdefault('status', 'pending')
+        names = ['task_id', 'updated_at', 'extra', *columns]
+        values = [task_id, time.time(), json.dumps(extra, ensure_ascii=False, default=str), *columns.values()]
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO tasks ({','.join(names)}) VALUES ({','.join('?' * len(names))})",
+                values)
+            self._results.pop(task_id, None)
+        self.maybe_cleanup()
+
+    def get(self, task_id: str, include_result: bool = True) -> Optional[Dict]:
+        with self._lock:
+            cached = task_id in self._results
+            select = 'result' if include_result and not cached else 'NULL AS result'
+            row = self._conn.execute(
+                f"SELECT task_id, status, error, created_at, updated_at, pcap_file, progress, "
+                f"request, extra, {select} FROM tasks WHERE task_id=?", (task_id,)).fetchone()
+            if row is None:
+                return None
+
+            task = self._row_to_task(row)
+            if include_result:
+                if cached:
+                    self._results.move_to_end(task_id)
+                    result = self._results[task_id]
+                else:
+                    result = json.loads(row['result']) if row['result'] else None
+                    if result is not None:
+                        self._remember_result(task_id, result)
+                # 返回副本：调用方修改结果不会改动热缓存中（未持久化）的数据
+                task['result'] = copy.deepcopy(result)
+            return task
+
+    def update(self, task_id: str, **fields) -> bool:
+        columns, extra = self._split_fields(fields)
+        with self._lock:
+            if extra:
+                row = self._conn.execute("SELECT extra FROM tasks WHERE task_id=?", (task_id,)).fetchone()
+                if row is None:
+                    return False
+                merged = json.loads(row['extra']) if row['extra'] else {}
+                merged.update(extra)
+                columns['extra'] = json.dumps(merged, ensure_ascii=False, default=str)
+
+            assignments = ', '.join(f"{name}=?" for name in columns)
+            cursor = self._conn.execute(
+                f"UPDATE tasks SET {assignments + ', ' if assignments else ''}updated_at=? WHERE task_id=?",
+                (*columns.values(), time.time(), task_id))
+            if 'result' in fields:
+                if fields['result'] is None:
+                    self._results.pop(task_id, None)
+                else:
+                    self._remember_result(task_id, fields['result'])
+            return cursor.rowcount > 0
+
+    def delete(self, task_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM tasks WHERE task_id=?", (task_id,))
+            self._results.pop(task_id, None)
+
+    def list_tasks(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id, status, error, created_at, updated_at, pcap_file, progress, request, extra, "
+                "result IS NOT NULL AS has_result, "
+                "json_extract(result, '$.capture_summary') IS NOT NULL AS has_capture_summary "
+                "FROM tasks ORDER BY created_at, updated_at").fetchall()
+        tasks = []
+        for row in rows:
+            task = self._row_to_task(row)
+            task['has_result'] = bool(row['has_result'])
+            task['has_capture_summary'] = bool(row['has_capture_summary'])
+            tasks.append(task)
+        return tasks
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---- 内部辅助 ----
+
+    def _split_fields(self, fields: Dict):
+        """拆分为数据库列和存入extra的自定义字段"""
+        columns, extra = {}, {}
+        for key, value in fields.items():
+            if key in self.COLUMNS:
+                columns[key] = value
+            elif key in self.JSON_COLUMNS:
+                columns[key] = None if value is None else json.dumps(value, ensure_ascii=False, default=str)
+            elif key not in ('task_id', 'updated_at'):
+                extra[key] = value
+        return columns, extra
+
+    def _row_to_task(self, row: sqlite3.Row) -> Dict:
+        task = json.loads(row['extra']) if row['extra'] else {}
+        task.update({
+            'task_id': row['task_id'],
+            'status': row['status'],
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'pcap_file': row['pcap_file'],
+            'request': json.loads(row['request']) if row['request'] else None,
+        })
+        if row['progress'] is not None:
+            task['progress'] = row['progress']
+        return task
+
+    def _remember_result(self, task_id: str, result: Dict):
+        self._results[task_id] = result
+        self._results.move_to_end(task_id)
+        while len(self._results) > self.hot_results:
+            self._results.popitem(last=False)
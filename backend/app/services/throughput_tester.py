@@ -0,0 +1,234 @@
+"""
+进程内HTTP吞吐量测试
+多条并行HTTP连接同时下载/上传，按固定时长传输而不是固定文件大小：
+- 每个方向先经过预热期（TCP慢启动），预热期的数据不计入结果
+- 每秒采样一次总吞吐量，可通过回调实时推送
+- 每条连接复用keep-alive，一次请求传完后立即发起下一次，直到时间结束
+单条TCP连接加1MB文件在百兆以上的链路上跑不满带宽，也不需要再启动speedtest-cli进程。
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+
+import aiohttp
+
+from app.services.speedtest_servers import probe_latency
+
+logger = logging.getLogger(__name__)
+
+# 默认测速端点：下载端点按bytes参数返回指定大小的数据，上传端点接收并丢弃请求体
+DEFAULT_DOWNLOAD_URLS = ["https://speed.cloudflare.com/__down?bytes=25000000"]
+DEFAULT_UPLOAD_URL = "https://speed.cloudflare.com/__up"
+DEFAULT_STREAMS = 4
+MAX_STREAMS = 32
+DEFAULT_DURATION = 10.0
+DEFAULT_WARMUP = 2.0
+SAMPLE_INTERVAL = 1.0
+# 单次上传请求的大小，传完后在同一连接上发起下一次
+UPLOAD_REQUEST_BYTES = 25 * 1024 * 1024
+UPLOAD_CHUNK = 64 * 1024
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+# 连接出错后重试前的等待时间（秒）
+RETRY_DELAY = 0.5
+MAX_ERRORS = 10
+USER_AGENT = 'Mozilla/5.0 (compatible; smart-diagnosis-speedtest)'
+
+
+class _Meter:
+    """累计各连接传输的字节数"""
+
+    def __init__(self, streams: int):
+        self.total = 0
+        self.stream_bytes = [0] * streams
+        self.errors: List[str] = []
+
+    def add(self, stream_id: int, size: int):
+        self.total += size
+        self.stream_bytes[stream_id] += size
+
+    def error(self, message: str):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+
+async def _download_stream(session: aiohttp.ClientSession, url: str, stream_id: int, meter: _Meter):
+    headers = {'Cache-Control': 'no-cache', 'Accept-Encoding': 'identity'}
+    while True:
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status != 200:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=response.status,
+                        message=response.reason or '')
+                async for chunk in response.content.iter_any():
+                    meter.add(stream_id, len(chunk))
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            meter.error(f"下载连接{stream_id}: {str(e) or type(e).__name__}")
+            await asyncio.sleep(RETRY_DELAY)
+
+
+async def _upload_body(stream_id: int, meter: _Meter, payload: bytes):
+    sent = 0
+    while sent < UPLOAD_REQUEST_BYTES:
+        chunk = payload[:UPLOAD_REQUEST_BYTES - sent]
+        yield chunk
+        # 生成器恢复执行时，上一块已写入套接字缓冲区（aiohttp会等待drain）
+        sent += len(chunk)
+        meter.add(stream_id, len(chunk))
+
+
+async def _upload_stream(session: aiohttp.ClientSession, url: str, stream_id: int, meter: _Meter):
+    # 随机数据，避免中间设备压缩
+    payload = os.urandom(UPLOAD_CHUNK)
+    headers = {'Content-Type': 'application/octet-stream'}
+    while True:
+        try:
+            async with session.post(url, data=_upload_body(stream_id, meter, payload), headers=headers) as response:
+                await response.read()
+                if response.status >= 400:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=response.status,
+                        message=response.reason or '')
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            meter.error(f"上传连接{stream_id}: {str(e) or type(e).__name__}")
+            await asyncio.sleep(RETRY_DELAY)
+
+
+def _mbps(size: int, seconds: float) -> float:
+    return round(size * 8 / seconds / 1_000_000, 2) if seconds > 0 else 0.0
+
+
+async def measure_throughput(
+    direction: str,
+    urls: Sequence[str],
+    streams: int = DEFAULT_STREAMS,
+    duration: float = DEFAULT_DURATION,
+    warmup: float = DEFAULT_WARMUP,
+    interval: float = SAMPLE_INTERVAL,
+    on_sample: Optional[Callable[[Dict], None]] = None,
+    session: Optional[aiohttp.ClientSession] = None,
+) -> Dict:
+    """测量单个方向（download/upload）的吞吐量
+
+    streams条连接轮流分配到urls上；duration包含预热时间。每个采样点为
+    {"direction", "t", "mbps", "warmup"}，预热期的采样只用于展示，不参与结果计算。
+    """
+    if direction not in ('download', 'upload'):
+        raise ValueError(f"不支持的测试方向: {direction}")
+    if not urls:
+        raise ValueError("未指定测速地址")
+    streams = max(1, min(int(streams), MAX_STREAMS))
+    warmup = max(0.0, min(warmup, duration - interval))
+
+    own_session = session is None
+    if own_session:
+        session = create_session(streams)
+    meter = _Meter(streams)
+    worker = _download_stream if direction == 'download' else _upload_stream
+    samples: List[Dict] = []
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(worker(session, urls[i % len(urls)], i, meter)) for i in range(streams)]
+    warmup_bytes, warmup_at = 0, started
+    try:
+        tick = 0
+        last_bytes, last_at = 0, started
+        while True:
+            tick += 1
+            scheduled = min(tick * interval, duration)
+            await asyncio.sleep(max(0.0, started + scheduled - time.perf_counter()))
+            now = time.perf_counter()
+            total = meter.total
+            elapsed = now - started
+            sample = {
+                "direction": direction,
+                "t": round(elapsed, 2),
+                "mbps": _mbps(total - last_bytes, now - last_at),
+                "warmup": scheduled <= warmup + 1e-9
+            }
+            samples.append(sample)
+            if on_sample is not None:
+                on_sample(sample)
+            if sample["warmup"]:
+                warmup_bytes, warmup_at = total, now
+            last_bytes, last_at = total, now
+            if scheduled >= duration:
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if own_session:
+            await session.close()
+
+    finished = last_at
+    measured = meter.total - warmup_bytes
+    measured_samples = [s["mbps"] for s in samples if not s["warmup"]]
+    return {
+        "direction": direction,
+        "mbps": _mbps(measured, finished - warmup_at),
+        "bytes": meter.total,
+        "measured_bytes": measured,
+        "duration": round(finished - started, 2),
+        "measured_duration": round(finished - warmup_at, 2),
+        "warmup": warmup,
+        "streams": streams,
+        "stream_bytes": meter.stream_bytes,
+        "peak_mbps": max(measured_samples) if measured_samples else 0.0,
+        "samples": samples,
+        "errors": meter.errors
+    }
+
+
+def create_session(streams: int) -> aiohttp.ClientSession:
+    """每条测速连接一个连接池名额，不自动解压，以统计线上实际传输的字节"""
+    connector = aiohttp.TCPConnector(limit=streams, limit_per_host=streams, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, auto_decompress=False,
+                                 headers={'User-Agent': USER_AGENT})
+
+
+async def run_throughput_test(
+    download_urls: Optional[Sequence[str]] = None,
+    upload_url: Optional[str] = None,
+    streams: int = DEFAULT_STREAMS,
+    duration: float = DEFAULT_DURATION,
+    warmup: float = DEFAULT_WARMUP,
+    download: bool = True,
+    upload: bool = True,
+    on_sample: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    """依次测量延迟、下载和上传，返回
+    {"server", "latency", "download", "upload", "download_speed", "upload_speed"}（速度单位Mbps）
+    """
+    download_urls = list(download_urls or DEFAULT_DOWNLOAD_URLS)
+    upload_url = upload_url or DEFAULT_UPLOAD_URL
+    parsed = urlparse(download_urls[0] if download else upload_url)
+    port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    host = f"[{parsed.hostname}]:{port}" if parsed.hostname and ':' in parsed.hostname else f"{parsed.hostname}:{port}"
+    latency = await probe_latency(host)
+
+    result = {
+        "server": parsed.hostname,
+        "latency": latency,
+        "download": None,
+        "upload": None,
+        "download_speed": 0.0,
+        "upload_speed": 0.0
+    }
+    streams = max(1, min(int(streams), MAX_STREAMS))
+    async with create_session(streams) as session:
+        if download:
+            result["download"] = await measure_throughput(
+                'download', download_urls, streams, duration, warmup, on_sample=on_sample, session=session)
+            result["download_speed"] = result["download"]["mbps"]
+        if upload:
+            result["upload"] = await measure_throughput(
+                'upload', [upload_url], streams, duration, warmup, on_sample=on_sample, session=session)
+            result["upload_speed"] = result["upload"]["mbps"]
+    return result
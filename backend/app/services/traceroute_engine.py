@@ -0,0 +1,479 @@
+"""
+异步路由追踪引擎
+所有TTL的探测包一次性发出，ICMP超时/不可达回复在事件循环上异步收集，
+一次完整追踪的耗时约等于一个探测超时，而不是逐跳等待。
+
+接收ICMP回复有两种方式：
+- 原始套接字（root或CAP_NET_RAW）：收到所有ICMP报文，按其中携带的原始报文头匹配探测，支持UDP/ICMP/TCP
+- Linux的IP_RECVERR错误队列（无需特权）：ICMP错误挂到发出探测的UDP/ICMP套接字上，支持UDP/ICMP
+两者都不可用时（如非root的macOS）由调用方退回系统traceroute命令。
+"""
+
+import asyncio
+import errno
+import logging
+import random
+import socket
+import struct
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_HOPS = 30
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_PROBES = 3
+# UDP探测的起始目的端口（与traceroute一致）
+UDP_BASE_PORT = 33434
+TCP_DEFAULT_PORT = 80
+# 每一轮探测之间的间隔，避免同一路由器同时收到多个探测而触发ICMP限速
+ROUND_INTERVAL = 0.05
+REVERSE_DNS_TIMEOUT = 1.0
+REVERSE_DNS_CACHE_TTL = 300
+
+METHODS = ('udp', 'icmp', 'tcp')
+
+# Linux常量，socket模块未必导出
+SOL_IP = getattr(socket, 'SOL_IP', 0)
+IP_RECVERR = getattr(socket, 'IP_RECVERR', 11)
+MSG_ERRQUEUE = getattr(socket, 'MSG_ERRQUEUE', 0x2000)
+SO_EE_ORIGIN_ICMP = 2
+
+ICMP_ECHO_REPLY = 0
+ICMP_DEST_UNREACH = 3
+ICMP_ECHO_REQUEST = 8
+ICMP_TIME_EXCEEDED = 11
+
+
+class TracerouteUnavailable(Exception):
+    """当前系统/权限下无法进行进程内路由追踪"""
+
+
+@dataclass
+class _Probe:
+    ttl: int
+    index: int
+    sent_at: float = 0.0
+    rtt: Optional[float] = None
+    responder: Optional[str] = None
+    reached: bool = False
+    # 目的不可达（非端口不可达）等终止原因
+    unreachable: Optional[str] = None
+
+
+@dataclass
+class _Hop:
+    ttl: int
+    probes: List[_Probe] = field(default_factory=list)
+    emitted: bool = False
+
+    @property
+    def complete(self) -> bool:
+        return all(p.rtt is not None for p in self.probes)
+
+    @property
+    def reached(self) -> bool:
+        return any(p.reached for p in self.probes)
+
+    def to_dict(self, hostname: Optional[str] = None) -> Dict:
+        rtts = [p.rtt for p in self.probes]
+        answered = [rtt for rtt in rtts if rtt is not None]
+        responder = next((p.responder for p in self.probes if p.responder), None)
+        result = {
+            'hop': self.ttl,
+            'ip': responder or '*',
+            'hostname': hostname,
+            'rtt1': rtts[0] if len(rtts) > 0 else None,
+            'rtt2': rtts[1] if len(rtts) > 1 else None,
+            'rtt3': rtts[2] if len(rtts) > 2 else None,
+            'avg_rtt': round(sum(answered) / len(answered), 3) if answered else None,
+            'status': 'success' if answered else 'timeout'
+        }
+        unreachable = next((p.unreachable for p in self.probes if p.unreachable), None)
+        if unreachable:
+            result['unreachable'] = unreachable
+        return result
+
+
+def icmp_checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def build_echo_request(identifier: int, sequence: int, payload: bytes = b'smart-diagnosis') -> bytes:
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    checksum = icmp_checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, identifier, sequence) + payload
+
+
+def parse_icmp_packet(packet: bytes) -> Optional[Dict]:
+    """解析原始套接字收到的IPv4+ICMP报文
+
+    返回 {'source', 'type', 'code', ...}；超时/不可达报文额外带出其中引用的原始报文的
+    'inner_protocol'、'inner_dst'、'inner_src_port'、'inner_dst_port'（UDP/TCP）
+    或 'inner_id'、'inner_seq'（ICMP）；回显应答带 'id'、'seq'。
+    """
+    if len(packet) < 20:
+        return None
+    ihl = (packet[0] & 0x0f) * 4
+    if len(packet) < ihl + 8:
+        return None
+    icmp_type, code = packet[ihl], packet[ihl + 1]
+    result = {'source': socket.inet_ntoa(packet[12:16]), 'type': icmp_type, 'code': code}
+    if icmp_type == ICMP_ECHO_REPLY:
+        result['id'], result['seq'] = struct.unpack_from('!HH', packet, ihl + 4)
+        return result
+    if icmp_type not in (ICMP_TIME_EXCEEDED, ICMP_DEST_UNREACH):
+        return result
+
+    inner = packet[ihl + 8:]
+    if len(inner) < 20:
+        return result
+    inner_ihl = (inner[0] & 0x0f) * 4
+    if len(inner) < inner_ihl + 8:
+        return result
+    protocol = inner[9]
+    result['inner_protocol'] = protocol
+    result['inner_dst'] = socket.inet_ntoa(inner[16:20])
+    if protocol in (socket.IPPROTO_UDP, socket.IPPROTO_TCP):
+        result['inner_src_port'], result['inner_dst_port'] = struct.unpack_from('!HH', inner, inner_ihl)
+    elif protocol == socket.IPPROTO_ICMP:
+        result['inner_id'], result['inner_seq'] = struct.unpack_from('!HH', inner, inner_ihl + 4)
+    return result
+
+
+def parse_extended_error(ancdata) -> Optional[Dict]:
+    """解析IP_RECVERR控制消息（struct sock_extended_err + 出错地址）"""
+    for level, msg_type, data in ancdata:
+        if level != SOL_IP or msg_type != IP_RECVERR or len(data) < 16:
+            continue
+        ee_errno, origin, icmp_type, code = struct.unpack_from('=IBBB', data)
+        offender = None
+        if len(data) >= 24 and struct.unpack_from('=H', data, 16)[0] == socket.AF_INET:
+            offender = socket.inet_ntoa(data[20:24])
+        return {'errno': ee_errno, 'origin': origin, 'type': icmp_type, 'code': code, 'source': offender}
+    return None
+
+
+def raw_socket_permitted() -> bool:
+    try:
+        socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP).close()
+        return True
+    except OSError:
+        return False
+
+
+def errqueue_supported(method: str) -> bool:
+    if not sys.platform.startswith('linux') or method == 'tcp':
+        return False
+    if method == 'icmp':
+        try:
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP).close()
+        except OSError:
+            return False
+    return True
+
+
+_reverse_cache: Dict[str, Tuple[float, Optional[str]]] = {}
+
+
+async def reverse_lookup(ip: str, timeout: float = REVERSE_DNS_TIMEOUT) -> Optional[str]:
+    """异步反向解析，结果短期缓存"""
+    cached = _reverse_cache.get(ip)
+    if cached and time.monotonic() - cached[0] < REVERSE_DNS_CACHE_TTL:
+        return cached[1]
+    loop = asyncio.get_running_loop()
+    try:
+        host, _ = await asyncio.wait_for(loop.getnameinfo((ip, 0), socket.NI_NAMEREQD), timeout=timeout)
+    except (asyncio.TimeoutError, OSError):
+        host = None
+    if host == ip:
+        host = None
+    _reverse_cache[ip] = (time.monotonic(), host)
+    return host
+
+
+class TracerouteEngine:
+    """单次路由追踪"""
+
+    def __init__(self, target_ip: str, max_hops: int = DEFAULT_MAX_HOPS, method: str = 'udp',
+                 timeout: float = DEFAULT_TIMEOUT, probes: int = DEFAULT_PROBES,
+                 port: Optional[int] = None, use_raw: Optional[bool] = None):
+        if method not in METHODS:
+            raise ValueError(f"不支持的探测方式: {method}")
+        self.target_ip = target_ip
+        self.max_hops = max_hops
+        self.method = method
+        self.timeout = timeout
+        self.probes_per_hop = max(1, min(3, probes))
+        self.port = port or (TCP_DEFAULT_PORT if method == 'tcp' else UDP_BASE_PORT)
+        if use_raw is None:
+            use_raw = raw_socket_permitted()
+        if not use_raw and not errqueue_supported(method):
+            raise TracerouteUnavailable(f"当前权限下无法进行{method.upper()}路由追踪")
+        self.use_raw = use_raw
+
+        self.hops = [_Hop(ttl) for ttl in range(1, max_hops + 1)]
+        self._probes: Dict[int, _Probe] = {}
+        # 同一进程内可能同时有多个追踪，回显ID随机选取以免互相串扰
+        self._identifier = random.getrandbits(16)
+        self._sender: Optional[socket.socket] = None
+        self._sending = True
+        self._dest_ttl: Optional[int] = None
+        self._on_complete: Optional[Callable[[_Hop], None]] = None
+        self._done = asyncio.Event()
+        self._sockets: List[socket.socket] = []
+        self._tasks: List[asyncio.Task] = []
+
+    # ----- 探测结果 -----
+
+    def _record(self, key: int, responder: Optional[str], reached: bool, received: float,
+                unreachable: Optional[str] = None):
+        probe = self._probes.get(key)
+        if probe is None or probe.rtt is not None:
+            return
+        probe.rtt = round((received - probe.sent_at) * 1000, 3)
+        probe.responder = responder
+        probe.reached = reached
+        probe.unreachable = unreachable
+        if (reached or unreachable) and (self._dest_ttl is None or probe.ttl < self._dest_ttl):
+            self._dest_ttl = probe.ttl
+        self._check_progress()
+
+    def _relevant_hops(self) -> List[_Hop]:
+        return self.hops[:self._dest_ttl] if self._dest_ttl else self.hops
+
+    def _check_progress(self):
+        relevant = self._relevant_hops()
+        for hop in relevant:
+            if not hop.emitted and len(hop.probes) == self.probes_per_hop and hop.complete:
+                hop.emitted = True
+                if self._on_complete:
+                    self._on_complete(hop)
+        if not self._sending and all(hop.emitted for hop in relevant):
+            self._done.set()
+
+    # ----- 接收 -----
+
+    def _handle_raw(self, sock: socket.socket):
+        while True:
+            try:
+                packet = sock.recv(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            received = time.perf_counter()
+            info = parse_icmp_packet(packet)
+            if info is None:
+                continue
+            if info['type'] == ICMP_ECHO_REPLY:
+                if self.method == 'icmp' and info['id'] == self._identifier and info['source'] == self.target_ip:
+                    self._record(info['seq'], info['source'], True, received)
+                continue
+            if info.get('inner_dst') != self.target_ip:
+                continue
+            key = self._inner_key(info)
+            if key is None:
+                continue
+            self._record_icmp_error(key, info['source'], info['type'], info['code'], received)
+
+    def _inner_key(self, info: Dict) -> Optional[int]:
+        protocol = info.get('inner_protocol')
+        if self.method == 'udp' and protocol == socket.IPPROTO_UDP:
+            # 只认本次追踪的发送套接字发出的探测
+            if self._sender is None or info['inner_src_port'] != self._sender.getsockname()[1]:
+                return None
+            return info['inner_dst_port']
+        if self.method == 'tcp' and protocol == socket.IPPROTO_TCP:
+            return info['inner_src_port']
+        if self.method == 'icmp' and protocol == socket.IPPROTO_ICMP and info['inner_id'] == self._identifier:
+            return info['inner_seq']
+        return None
+
+    def _record_icmp_error(self, key: int, source: Optional[str], icmp_type: int, code: int, received: float):
+        if icmp_type == ICMP_TIME_EXCEEDED:
+            self._record(key, source, False, received)
+        elif icmp_type == ICMP_DEST_UNREACH:
+            # 端口不可达（code 3）说明探测已到达目标；其他不可达说明路径在此中断
+            if code == 3 or source == self.target_ip:
+                self._record(key, source, True, received)
+            else:
+                self._record(key, source, False, received, unreachable=f"ICMP不可达(code {code})")
+
+    def _handle_errqueue(self, sock: socket.socket):
+        while True:
+            try:
+                data, ancdata, _, address = sock.recvmsg(512, 512, MSG_ERRQUEUE)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break
+            received = time.perf_counter()
+            error = parse_extended_error(ancdata)
+            if error is None or error['origin'] != SO_EE_ORIGIN_ICMP:
+                continue
+            if self.method == 'udp':
+                key = address[1] if address else None
+            else:
+                # ping套接字返回原始ICMP回显请求头
+                key = struct.unpack_from('!H', data, 6)[0] if len(data) >= 8 else None
+            if key is not None:
+                self._record_icmp_error(key, error['source'], error['type'], error['code'], received)
+
+        # 普通数据：ICMP回显应答或目标返回的UDP数据
+        while True:
+            try:
+                data, address = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # 开启IP_RECVERR后错误也会通过recv报告一次，错误详情已从错误队列读取
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                continue
+            received = time.perf_counter()
+            if address[0] != self.target_ip:
+                continue
+            if self.method == 'icmp' and len(data) >= 8 and data[0] == ICMP_ECHO_REPLY:
+                self._record(struct.unpack_from('!H', data, 6)[0], address[0], True, received)
+            elif self.method == 'udp':
+                self._record(address[1], address[0], True, received)
+
+    # ----- 发送 -----
+
+    def _open_socket(self, family_type: int, proto: int = 0) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, family_type, proto)
+        sock.setblocking(False)
+        self._sockets.append(sock)
+        return sock
+
+    def _setup(self, loop: asyncio.AbstractEventLoop) -> Optional[socket.socket]:
+        """创建接收/发送套接字，返回UDP/ICMP探测共用的发送套接字（TCP为每个探测单独建连接）"""
+        if self.use_raw:
+            raw = self._open_socket(socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            loop.add_reader(raw.fileno(), self._handle_raw, raw)
+            if self.method == 'udp':
+                return self._open_socket(socket.SOCK_DGRAM)
+            if self.method == 'icmp':
+                return raw
+            return None
+
+        proto = socket.IPPROTO_ICMP if self.method == 'icmp' else 0
+        sender = self._open_socket(socket.SOCK_DGRAM, proto)
+        sender.setsockopt(SOL_IP, IP_RECVERR, 1)
+        loop.add_reader(sender.fileno(), self._handle_errqueue, sender)
+        return sender
+
+    def _send(self, sender: Optional[socket.socket], probe: _Probe, key: int):
+        if self.method == 'tcp':
+            self._tasks.append(asyncio.create_task(self._tcp_probe(probe)))
+            return
+        sender.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, probe.ttl)
+        if self.method == 'udp':
+            packet, address = b'\x00' * 12, (self.target_ip, key)
+        else:
+            packet, address = build_echo_request(self._identifier, key), (self.target_ip, 0)
+        probe.sent_at = time.perf_counter()
+        try:
+            sender.sendto(packet, address)
+        except OSError as e:
+            # 开启IP_RECVERR后，之前探测收到的ICMP错误会在下一次send时报告一次（详情在错误队列中），重发即可
+            if e.errno not in (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH):
+                raise
+            sender.sendto(packet, address)
+
+    async def _tcp_probe(self, probe: _Probe):
+        """按TTL发起非阻塞connect（由内核发送SYN），以本地端口匹配ICMP超时；建连成功或被拒即到达目标"""
+        loop = asyncio.get_running_loop()
+        sock = self._open_socket(socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, probe.ttl)
+        sock.bind(('0.0.0.0', 0))
+        key = sock.getsockname()[1]
+        self._probes[key] = probe
+        probe.sent_at = time.perf_counter()
+        try:
+            await loop.sock_connect(sock, (self.target_ip, self.port))
+            self._record(key, self.target_ip, True, time.perf_counter())
+        except ConnectionRefusedError:
+            self._record(key, self.target_ip, True, time.perf_counter())
+        except OSError:
+            # 中间路由的ICMP超时由原始套接字记录
+            pass
+        finally:
+            sock.close()
+
+    async def run(self, on_hop: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """执行追踪，按完成顺序回调每一跳（已带反向解析的主机名），返回按跳数排序的结果"""
+        loop = asyncio.get_running_loop()
+        lookups: List[asyncio.Task] = []
+        results: Dict[int, Dict] = {}
+
+        async def finish_hop(hop: _Hop):
+            data = hop.to_dict()
+            if data['ip'] != '*':
+                data['hostname'] = await reverse_lookup(data['ip'])
+            results[hop.ttl] = data
+            if on_hop:
+                on_hop(data)
+
+        self._on_complete = lambda hop: lookups.append(asyncio.create_task(finish_hop(hop)))
+        sender = self._sender = self._setup(loop)
+        try:
+            sequence = 0
+            for index in range(self.probes_per_hop):
+                for hop in self.hops:
+                    if self._dest_ttl and hop.ttl > self._dest_ttl:
+                        break
+                    probe = _Probe(hop.ttl, index)
+                    hop.probes.append(probe)
+                    if self.method == 'udp':
+                        key = self.port + sequence
+                    else:
+                        key = sequence
+                    sequence += 1
+                    if self.method != 'tcp':
+                        self._probes[key] = probe
+                    self._send(sender, probe, key)
+                if index + 1 < self.probes_per_hop:
+                    await asyncio.sleep(ROUND_INTERVAL)
+            self._sending = False
+            self._check_progress()
+
+            try:
+                await asyncio.wait_for(self._done.wait(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            for sock in self._sockets:
+                if sock.type != socket.SOCK_STREAM:
+                    loop.remove_reader(sock.fileno())
+            for task in self._tasks:
+                task.cancel()
+            for sock in self._sockets:
+                sock.close()
+
+        # 超时未回复的跳也输出
+        for hop in self._relevant_hops():
+            if hop.probes and not hop.emitted:
+                hop.emitted = True
+                lookups.append(asyncio.create_task(finish_hop(hop)))
+        if lookups:
+            await asyncio.gather(*lookups)
+        return [results[ttl] for ttl in sorted(results)]
+
+    @property
+    def reached(self) -> bool:
+        return self._dest_ttl is not None and self.hops[self._dest_ttl - 1].reached
+
+
+async def resolve_ipv4(target: str) -> str:
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(target, None, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    return infos[0][4][0]
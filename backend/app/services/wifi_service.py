@@ -5,6 +5,8 @@ import time
 import platform
 from typing import Dict, List, Optional
 
+from app.services.command_runner import run_command
+
 class WiFiService:
     def __init__(self):
         self.system_type = platform.system().lower()
@@ -28,7 +30,7 @@ class WiFiService:
         """在Linux系统上获取WiFi信号强度"""
         try:
             # 使用iwconfig获取WiFi信息
-            result = subprocess.run(['iwconfig'], capture_output=True, text=True)
+            result = await run_command(['iwconfig'], timeout=10)
             if result.returncode != 0:
                 # 尝试使用iw命令
                 return await self._get_linux_iw_signal()
@@ -49,7 +51,7 @@ class WiFiService:
         """使用iw命令获取WiFi信息（现代Linux系统）"""
         try:
             # 获取无线接口
-            interfaces_result = subprocess.run(['iw', 'dev'], capture_output=True, text=True)
+            interfaces_result = await run_command(['iw', 'dev'], timeout=10)
             if interfaces_result.returncode != 0:
                 raise Exception("无法获取无线接口列表")
             
@@ -61,12 +63,12 @@ class WiFiService:
             interface = interface_match.group(1)
             
             # 获取连接信息
-            link_result = subprocess.run(['iw', interface, 'link'], capture_output=True, text=True)
+            link_result = await run_command(['iw', interface, 'link'], timeout=10)
             if link_result.returncode != 0 or 'Not connected' in link_result.stdout:
                 raise Exception("WiFi未连接")
             
             # 获取信号强度
-            scan_result = subprocess.run(['iw', interface, 'scan'], capture_output=True, text=True)
+            scan_result = await run_command(['iw', interface, 'scan'], timeout=15, tool='wifi_scan')
             
             return self._parse_iw_output(link_result.stdout, scan_result.stdout, interface)
             
@@ -100,8 +102,7 @@ class WiFiService:
                 return cached_data
             
             # 执行system_profiler命令
-            result = subprocess.run(['system_profiler', 'SPAirPortDataType'], 
-                                  capture_output=True, text=True, timeout=10)
+            result = await run_command(['system_profiler', 'SPAirPortDataType'], timeout=10)
             
             if result.returncode != 0:
                 raise Exception("system_profiler命令执行失败")
@@ -251,8 +252,7 @@ class WiFiService:
         """使用系统命令获取macOS WiFi信息"""
         try:
             # 首先检查ifconfig确认接口是否活跃
-            ifconfig_result = subprocess.run(['ifconfig', 'en0'], 
-                                           capture_output=True, text=True)
+            ifconfig_result = await run_command(['ifconfig', 'en0'], timeout=10)
             
             if ifconfig_result.returncode != 0:
                 raise Exception("无法访问en0接口")
@@ -262,8 +262,7 @@ class WiFiService:
                 raise Exception("en0接口未激活")
             
             # 尝试使用networksetup命令获取WiFi信息
-            networksetup_result = subprocess.run(['networksetup', '-getairportnetwork', 'en0'], 
-                                                capture_output=True, text=True)
+            networksetup_result = await run_command(['networksetup', '-getairportnetwork', 'en0'], timeout=10)
             
             ssid = "Connected Network"  # 默认值
             
@@ -278,8 +277,7 @@ class WiFiService:
                 # 尝试从系统信息获取网络名称
                 try:
                     # 尝试获取当前网络服务名称
-                    services_result = subprocess.run(['networksetup', '-listnetworkserviceorder'], 
-                                                   capture_output=True, text=True)
+                    services_result = await run_command(['networksetup', '-listnetworkserviceorder'], timeout=10)
                     if 'Wi-Fi' in services_result.stdout:
                         ssid = "WiFi Network (Auto-detected)"
                     else:
@@ -505,12 +503,7 @@ class WiFiService:
             
             interface = interfaces[0]  # 使用第一个无线接口
             
-            result = subprocess.run(
-                ['iwlist', interface, 'scan'], 
-                capture_output=True, 
-                text=True, 
-                timeout=15
-            )
+            result = await run_command(['iwlist', interface, 'scan'], timeout=15, tool='wifi_scan')
             
             if result.returncode == 0:
                 return self._parse_iwlist_output(result.stdout)
@@ -531,12 +524,7 @@ class WiFiService:
             
             interface = interfaces[0]  # 使用第一个无线接口
             
-            result = subprocess.run(
-                ['iw', interface, 'scan'], 
-                capture_output=True, 
-                text=True, 
-                timeout=15
-            )
+            result = await run_command(['iw', interface, 'scan'], timeout=15, tool='wifi_scan')
             
             if result.returncode == 0:
                 return self._parse_iw_scan_output(result.stdout)
@@ -550,12 +538,7 @@ class WiFiService:
     async def _get_wireless_interfaces(self) -> List[str]:
         """获取无线网络接口列表"""
         try:
-            result = subprocess.run(
-                ['iwconfig'], 
-                capture_output=True, 
-                text=True, 
-                timeout=5
-            )
+            result = await run_command(['iwconfig'], timeout=5)
             
             interfaces = []
             for line in result.stdout.split('\n'):
@@ -708,12 +691,7 @@ class WiFiService:
             
             for airport_path in airport_paths:
                 try:
-                    result = subprocess.run(
-                        [airport_path, "-s"], 
-                        capture_output=True, 
-                        text=True, 
-                        timeout=10
-                    )
+                    result = await run_command([airport_path, "-s"], timeout=10, tool='wifi_scan')
                     
                     if result.returncode == 0 and result.stdout:
                         return self._parse_airport_scan_output(result.stdout)
@@ -730,12 +708,7 @@ class WiFiService:
     async def _scan_with_system_profiler(self) -> List[Dict]:
         """使用system_profiler扫描WiFi网络"""
         try:
-            result = subprocess.run(
-                ['system_profiler', 'SPAirPortDataType'], 
-                capture_output=True, 
-                text=True, 
-                timeout=15
-            )
+            result = await run_command(['system_profiler', 'SPAirPortDataType'], timeout=15)
             
             if result.returncode == 0:
                 return self._parse_system_profiler_networks(result.stdout)
@@ -56,13 +56,13 @@ async def demo_capture_and_analysis():
         task_id = f"demo_{int(time.time())}_{i}"
         
         # 初始化任务状态
-        tasks[task_id] = {
+        tasks.create(task_id, {
             'status': 'pending',
             'result': None,
             'error': None,
             'created_at': datetime.now().isoformat(),
             'request': test_case['request'].dict()
-        }
+        })
         
         try:
             print(f"⏳ 开始执行抓包任务: {task_id}")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+测试用的本地AI提供商
+aiohttp服务模拟OpenAI兼容接口（/<前缀>/chat/completions）和Anthropic接口（/<前缀>/messages），
+每个路径前缀的行为可单独配置，请求体带 stream=true 时按SSE逐块输出。
+供 test_llm_client、test_llm_router、test_ai_stream 共用。
+"""
+
+import asyncio
+import json
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from app.config.ai_config import AIProviderConfig
+
+DEFAULT_REPLY = json.dumps({'diagnosis': 'ok', 'severity': 'low'})
+
+
+class MockLLMProvider:
+    """routes: 路径前缀 -> 行为
+        delay: 响应前等待的秒数
+        status: 非200时返回该状态码，响应内容为 error_text
+        content: 回复文本；Anthropic接口可以是字符串列表（多个text块）
+        chunk_size / chunk_delay: 流式输出时每块的字符数和间隔
+        api_key: 设置后校验请求头中的密钥，不匹配返回401
+
+    记录收到的请求、每个前缀在响应前被客户端断开的次数、同时进行的最大请求数和使用的连接。
+    """
+
+    def __init__(self, routes: Dict[str, Dict]):
+        self.routes = routes
+        self.requests: List[Dict] = []
+        self.disconnected: Dict[str, int] = {}
+        self.active = 0
+        self.max_active = 0
+        self.transports = set()
+        self.base = ''
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> 'MockLLMProvider':
+        app = web.Application()
+        app.router.add_post('/{prefix}/chat/completions', self._chat)
+        app.router.add_post('/{prefix}/messages', self._messages)
+        self._runner = web.AppRunner(app, access_log=None, handler_cancellation=True)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base = f"http://127.0.0.1:{port}"
+        return self
+
+    async def close(self):
+        await self._runner.cleanup()
+
+    def count(self, prefix: str) -> int:
+        return sum(1 for request in self.requests if request['prefix'] == prefix)
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for request in self.requests:
+            counts[request['prefix']] = counts.get(request['prefix'], 0) + 1
+        return counts
+
+    async def _accept(self, request: web.Request, auth_ok) -> tuple:
+        """记录请求并按配置等待，返回 (行为, 请求体, 错误响应)"""
+        prefix = request.match_info['prefix']
+        behaviour = self.routes.get(prefix, {})
+        body = await request.json()
+        self.transports.add(request.transport)
+        self.requests.append({'prefix': prefix, 'path': request.path, 'headers': dict(request.headers), 'body': body})
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(behaviour.get('delay', 0))
+        except asyncio.CancelledError:
+            self.disconnected[prefix] = self.disconnected.get(prefix, 0) + 1
+            raise
+        finally:
+            self.active -= 1
+        api_key = behaviour.get('api_key')
+        if api_key is not None and not auth_ok(request, api_key):
+            return behaviour, body, web.json_response({'error': 'unauthorized'}, status=401)
+        status = behaviour.get('status', 200)
+        if status != 200:
+            return behaviour, body, web.Response(status=status, text=behaviour.get('error_text', 'failure'))
+        return behaviour, body, None
+
+    @staticmethod
+    def _text(behaviour: Dict) -> str:
+        content = behaviour.get('content', DEFAULT_REPLY)
+        return ''.join(content) if isinstance(content, list) else content
+
+    @staticmethod
+    def _chunks(behaviour: Dict) -> List[str]:
+        text = MockLLMProvider._text(behaviour)
+        size = behaviour.get('chunk_size', 12)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    async def _send_events(self, request: web.Request, behaviour: Dict, events: List[str]) -> web.StreamResponse:
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        await response.write(b': keep-alive\n\n')
+        for event in events:
+            await asyncio.sleep(behaviour.get('chunk_delay', 0.02))
+            await response.write(event.encode('utf-8'))
+        await response.write_eof()
+        return response
+
+    async def _chat(self, request: web.Request):
+        behaviour, body, error = await self._accept(
+            request, lambda r, key: r.headers.get('Authorization') == f'Bearer {key}')
+        if error is not None:
+            return error
+        if not body.get('stream'):
+            return web.json_response({'choices': [{'message': {'content': self._text(behaviour)}}]})
+        events = [f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]}, ensure_ascii=False)}\n\n"
+                  for chunk in self._chunks(behaviour)]
+        events.append('data: [DONE]\n\n')
+        return await self._send_events(request, behaviour, events)
+
+    async def _messages(self, request: web.Request):
+        behaviour, body, error = await self._accept(request, lambda r, key: r.headers.get('x-api-key') == key)
+        if error is not None:
+            return error
+        if not body.get('stream'):
+            content = behaviour.get('content', DEFAULT_REPLY)
+            blocks = content if isinstance(content, list) else [content]
+            return web.json_response({'content': [{'type': 'text', 'text': text} for text in blocks]})
+        events = ['event: message_start\ndata: {"type": "message_start"}\n\n']
+        for chunk in self._chunks(behaviour):
+            data = {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': chunk}}
+            events.append(f"event: content_block_delta\ndata: {json.dumps(data, ensure_ascii=False)}\n\n")
+        events.append('event: message_stop\ndata: {"type": "message_stop"}\n\n')
+        return await self._send_events(request, behaviour, events)
+
+
+class MockConfigManager:
+    """只包含指定提供商配置的AI配置管理器"""
+
+    def __init__(self, providers: Dict[str, AIProviderConfig], current: str = 'openrouter'):
+        self.providers = providers
+        self.current_provider = current
+
+    @classmethod
+    def for_mock(cls, base: str, current: str = 'openrouter', fallback_model: str = '',
+                 names: tuple = ('openrouter', 'openai')) -> 'MockConfigManager':
+        """每个提供商指向模拟服务上同名的路径前缀，备用模型只配置给当前提供商"""
+        return cls({
+            name: AIProviderConfig(name=name, base_url=f"{base}/{name}", api_key='test-key', model=f"{name}-model",
+                                   fallback_model=fallback_model if name == current else '')
+            for name in names
+        }, current)
+
+    def get_current_config(self):
+        return self.providers.get(self.current_provider)
+
+    def validate_config(self, provider):
+        return provider in self.providers
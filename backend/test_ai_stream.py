@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+测试流式AI分析
+用本地aiohttp服务模拟按SSE逐块输出的提供商（OpenAI兼容格式和Anthropic格式），验证增量JSON解析、
+收到第一块输出前的故障转移，以及 /analyze-ai/stream 在完整响应到达之前就发出诊断字段
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app.api.capture as capture_api
+import app.services.ai_analysis_service as ai_analysis_module
+from app.config.ai_config import AIProviderConfig
+from app.services.analysis_cache import AnalysisCache
+from app.services.ai_analysis_service import get_ai_analysis_service
+from app.services.incremental_json import IncrementalJSONParser
+from app.services.llm_client import LLMClientPool, llm_clients
+from app.services.llm_router import LLMRouter
+from app.services.task_store import MemoryTaskStore
+from mock_llm_provider import MockConfigManager, MockLLMProvider
+
+ANALYSIS = {
+    'diagnosis': 'DNS解析缓慢，部分请求超过 "800ms"',
+    'severity': 'high',
+    'root_cause': '上游DNS服务器响应慢',
+    'recommendations': ['更换DNS服务器', '启用本地缓存 {dnsmasq}'],
+    'technical_details': '平均解析耗时 800ms\n最大 2.1s',
+    'confidence': 85
+}
+# 模型输出：说明文字 + 代码块中的JSON，按约12个字符切块
+REPLY = '分析如下：\n```json\n' + json.dumps(ANALYSIS, ensure_ascii=False, indent=2) + '\n```'
+CHUNKS = [REPLY[i:i + 12] for i in range(0, len(REPLY), 12)]
+
+
+async def start_mock_stream_provider(chunk_delay: float = 0.02, failing: tuple = ()) -> MockLLMProvider:
+    """各提供商按SSE逐块输出REPLY，failing 中的路径前缀返回503"""
+    routes = {prefix: {'content': REPLY, 'chunk_size': 12, 'chunk_delay': chunk_delay}
+              for prefix in ('openrouter', 'openai', 'v1')}
+    for prefix in failing:
+        routes[prefix] = {'status': 503, 'error_text': 'overloaded'}
+    return await MockLLMProvider(routes).start()
+
+
+def test_incremental_parser_emits_fields_as_completed():
+    """测试字段在值闭合时立即返回，不受切块位置、字符串中的括号和转义影响"""
+    for size in (1, 5, 64, len(REPLY)):
+        parser = IncrementalJSONParser()
+        fields = []
+        for i in range(0, len(REPLY), size):
+            fields.extend(parser.feed(REPLY[i:i + size]))
+        assert dict(fields) == ANALYSIS, (size, fields)
+        assert [key for key, _ in fields] == list(ANALYSIS)
+        assert parser.finished
+
+    # diagnosis的值闭合后、整个对象完成之前就已返回
+    parser = IncrementalJSONParser()
+    head = REPLY[:REPLY.index('"severity"')]
+    assert parser.feed(head) == [('diagnosis', ANALYSIS['diagnosis'])]
+    assert not parser.finished
+
+    # null值的字段同样返回
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"next_steps": null, "confidence": null}') == [('next_steps', None), ('confidence', None)]
+    print("✅ 增量JSON解析测试通过")
+
+
+def test_client_stream_and_router_failover():
+    """测试两种SSE格式逐块返回文本，以及首选提供商出错时流式请求转到下一个"""
+
+    async def scenario():
+        provider = await start_mock_stream_provider(failing=('openrouter',))
+        pool = LLMClientPool()
+        try:
+            openai_config = MockConfigManager.for_mock(provider.base).providers['openai']
+            openai_chunks = [c async for c in pool.get('openai', openai_config).stream('问题')]
+            anthropic_config = AIProviderConfig(name='Mock', base_url=provider.base, api_key='test-key',
+                                                model='mock-model')
+            anthropic_chunks = [c async for c in pool.get('anthropic', anthropic_config).stream('问题')]
+
+            router = LLMRouter(pool)
+            routed = [item async for item in router.stream('问题', MockConfigManager.for_mock(provider.base))]
+            stats = router.stats()
+        finally:
+            await pool.close()
+            await provider.close()
+        return openai_chunks, anthropic_chunks, routed, stats, provider.requests
+
+    openai_chunks, anthropic_chunks, routed, stats, requests = asyncio.run(scenario())
+    assert openai_chunks == CHUNKS and anthropic_chunks == CHUNKS
+    assert all(r['body']['stream'] is True for r in requests)
+    assert {(name, model) for name, model, _ in routed} == {('openai', 'openai-model')}
+    assert ''.join(text for _, _, text in routed) == REPLY
+    assert stats['openrouter/openrouter-model']['errors'] == 1
+    assert stats['openai/openai-model']['successes'] == 1
+    print("✅ 流式客户端与故障转移测试通过")
+
+
+def test_stream_endpoint_sends_fields_before_full_response():
+    """测试SSE接口在完整响应到达之前发出诊断字段，结果写入任务，再次请求直接返回缓存"""
+    service = get_ai_analysis_service()
+    original_cache = ai_analysis_module.analysis_cache
+    original_config = service.ai_config
+    original_tasks = capture_api.tasks
+
+    async def read_events(response):
+        events = []
+        started = time.perf_counter()
+        async for chunk in response.body_iterator:
+            for block in chunk.strip().split('\n\n'):
+                lines = dict(line.split(': ', 1) for line in block.split('\n'))
+                events.append((lines['event'], json.loads(lines['data']), time.perf_counter() - started))
+        return events
+
+    async def scenario():
+        provider = await start_mock_stream_provider(chunk_delay=0.03)
+        service.ai_config = MockConfigManager.for_mock(provider.base)
+        capture_api.tasks.create('task-1', {
+            'status': 'done', 'progress': 100,
+            'request': {'issue_type': 'website_access', 'user_description': '网页慢'},
+            'result': {'capture_summary': {'statistics': {'total_packets': 100}, 'enhanced_analysis': {}}}
+        })
+        request = {'task_id': 'task-1', 'filtered_domains': [], 'latency_filter': 'all'}
+        try:
+            response = await capture_api.stream_ai_analysis(request)
+            assert response.media_type == 'text/event-stream'
+            assert capture_api.tasks.get('task-1')['status'] == 'ai_analyzing'
+            events = await read_events(response)
+            task = capture_api.tasks.get('task-1')
+            cached_events = await read_events(await capture_api.stream_ai_analysis(request))
+        finally:
+            await llm_clients.close()
+            await provider.close()
+        return events, cached_events, task, provider.requests
+
+    with tempfile.TemporaryDirectory() as directory:
+        ai_analysis_module.analysis_cache = AnalysisCache(directory)
+        capture_api.tasks = MemoryTaskStore()
+        try:
+            events, cached_events, task, requests = asyncio.run(scenario())
+        finally:
+            ai_analysis_module.analysis_cache = original_cache
+            service.ai_config = original_config
+            capture_api.tasks = original_tasks
+
+    names = [name for name, _, _ in events]
+    assert names[0] == 'start' and names[-1] == 'result'
+    assert ''.join(data['text'] for name, data, _ in events if name == 'delta') == REPLY
+    fields = {data['key']: (data['value'], at) for name, data, at in events if name == 'field'}
+    result_at = events[-1][2]
+    # 诊断字段在整个响应结束之前就已送达
+    assert fields['diagnosis'][0] == ANALYSIS['diagnosis']
+    assert fields['diagnosis'][1] < result_at / 2, (fields['diagnosis'][1], result_at)
+    assert fields['severity'][0] == 'high' and fields['recommendations'][0] == ANALYSIS['recommendations']
+
+    result = events[-1][1]
+    assert result['success'] and not result['cached'] and result['routing']['streamed']
+    assert result['analysis']['diagnosis'] == ANALYSIS['diagnosis']
+    assert task['status'] == 'done' and task['result']['ai_analysis']['analysis'] == result['analysis']
+
+    # 相同输入再次请求：直接返回缓存的字段和结果，不再请求提供商
+    assert len(requests) == 1
+    assert [name for name, _, _ in cached_events][-1] == 'result'
+    assert cached_events[-1][1]['cached']
+    print(f"✅ 流式接口测试通过（首个字段 {fields['diagnosis'][1]:.2f}秒，完整结果 {result_at:.2f}秒）")
+
+
+def test_client_disconnect_cancels_provider_request():
+    """测试客户端中途断开时关闭提供商连接、释放并发名额，任务恢复为可重新分析的状态"""
+    service = get_ai_analysis_service()
+    original_cache = ai_analysis_module.analysis_cache
+    original_config = service.ai_config
+    original_tasks = capture_api.tasks
+
+    async def scenario():
+        provider = await start_mock_stream_provider(chunk_delay=0.05)
+        service.ai_config = MockConfigManager.for_mock(provider.base)
+        capture_api.tasks.create('task-2', {
+            'status': 'done', 'request': {},
+            'result': {'capture_summary': {'statistics': {'total_packets': 100}}}
+        })
+        try:
+            response = await capture_api.stream_ai_analysis({'task_id': 'task-2'})
+            received = 0
+            async for _ in response.body_iterator:
+                received += 1
+                if received == 5:
+                    break
+            await response.body_iterator.aclose()
+            client = llm_clients.get('openrouter', service.ai_config.providers['openrouter'])
+            return client.stats(), capture_api.tasks.get('task-2')
+        finally:
+            await llm_clients.close()
+            await provider.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        ai_analysis_module.analysis_cache = AnalysisCache(directory)
+        capture_api.tasks = MemoryTaskStore()
+        try:
+            stats, task = asyncio.run(scenario())
+        finally:
+            ai_analysis_module.analysis_cache = original_cache
+            service.ai_config = original_config
+            capture_api.tasks = original_tasks
+
+    assert stats['requests'] == 1 and stats['active'] == 0
+    assert task['status'] == 'done' and 'ai_analysis' not in task['result']
+    print("✅ 客户端断开测试通过")
+
+
+def test_failed_stream_marks_task_error():
+    """测试所有提供商都失败时，result事件为失败结果，任务与轮询方式一样标记为错误"""
+    service = get_ai_analysis_service()
+    original_cache = ai_analysis_module.analysis_cache
+    original_config = service.ai_config
+    original_tasks = capture_api.tasks
+
+    async def scenario():
+        provider = await start_mock_stream_provider(failing=('openrouter', 'openai'))
+        service.ai_config = MockConfigManager.for_mock(provider.base)
+        capture_api.tasks.create('task-3', {
+            'status': 'done', 'request': {},
+            'result': {'capture_summary': {'statistics': {'total_packets': 100}}}
+        })
+        try:
+            response = await capture_api.stream_ai_analysis({'task_id': 'task-3'})
+            chunks = [chunk async for chunk in response.body_iterator]
+            return chunks, capture_api.tasks.get('task-3')
+        finally:
+            await llm_clients.close()
+            await provider.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        ai_analysis_module.analysis_cache = AnalysisCache(directory)
+        capture_api.tasks = MemoryTaskStore()
+        try:
+            chunks, task = asyncio.run(scenario())
+        finally:
+            ai_analysis_module.analysis_cache = original_cache
+            service.ai_config = original_config
+            capture_api.tasks = original_tasks
+
+    assert chunks[-1].startswith('event: result\n')
+    result = json.loads(chunks[-1].split('data: ', 1)[1])
+    assert not result['success'] and '503' in result['error']
+    assert task['status'] == 'error' and '503' in task['error']
+    assert task['result']['ai_analysis']['success'] is False
+    print("✅ 分析失败标记任务错误测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试流式AI分析\n")
+    test_incremental_parser_emits_fields_as_completed()
+    test_client_stream_and_router_failover()
+    test_stream_endpoint_sends_fields_before_full_response()
+    test_client_disconnect_cancels_provider_request()
+    test_failed_stream_marks_task_error()
+    print("\n🎉 所有测试完成")
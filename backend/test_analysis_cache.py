@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+测试AI分析结果缓存
+验证结果持久化到磁盘、LRU淘汰、过期失效、并发相同请求只调用一次提供商，
+以及前端切换回之前的筛选条件时直接返回缓存的分析结果
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app.api.ai as ai_api
+import app.api.capture as capture_api
+import app.services.ai_analysis_service as ai_analysis_module
+from app.services.analysis_cache import AnalysisCache, cache_key
+from app.services.ai_analysis_service import get_ai_analysis_service
+from app.services.single_flight import SingleFlight
+from app.services.task_store import MemoryTaskStore
+
+ANALYSIS = {
+    'diagnosis': '部分网站响应缓慢',
+    'severity': 'medium',
+    'root_cause': 'CDN节点拥塞',
+    'recommendations': ['更换DNS服务器'],
+    'technical_details': '平均响应 900ms',
+    'confidence': 80
+}
+
+
+def make_summary() -> dict:
+    websites = {f'site{i}.example.com': 10 + i for i in range(4)}
+    performance = {
+        domain: {
+            'ips': [f'10.0.0.{i}'],
+            'tcp_rtt': {'avg_ms': 50.0 + i * 300, 'min_ms': 20.0, 'max_ms': 80.0 + i * 300, 'samples': 8},
+            'requests': {'total': count, 'errors': 0, 'error_rate_percent': 0, 'error_codes': {}},
+            'protocol': 'HTTPS'
+        }
+        for i, (domain, count) in enumerate(websites.items())
+    }
+    return {
+        'statistics': {'total_packets': 500},
+        'enhanced_analysis': {
+            'http_analysis': {'websites_accessed': websites},
+            'issue_specific_insights': {'website_performance': performance}
+        }
+    }
+
+
+def test_disk_persistence_lru_and_ttl():
+    """测试结果写入磁盘后重启可命中、超过条目上限淘汰最久未用的、过期结果不再返回"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = AnalysisCache(directory, ttl=60, max_entries=2)
+        assert cache_key('a', {'x': 1, 'y': 2}) == cache_key('a', {'y': 2, 'x': 1})
+        cache.put('a', {'value': 1})
+        cache.put('b', {'value': 2})
+        assert cache.get('a') == {'value': 1}
+        # a刚被使用，写入c时淘汰b
+        cache.put('c', {'value': 3})
+        assert cache.get('b') is None
+        assert sorted(os.listdir(directory)) == ['a.json', 'c.json']
+
+        # 新实例（模拟服务重启）从磁盘恢复
+        reloaded = AnalysisCache(directory, ttl=60, max_entries=2)
+        assert reloaded.get('a') == {'value': 1} and reloaded.get('c') == {'value': 3}
+
+        expiring = AnalysisCache(directory, ttl=0.2, max_entries=2)
+        time.sleep(0.3)
+        assert expiring.get('a') is None
+        assert expiring.get('c', ttl=60) == {'value': 3}
+        assert not os.path.exists(os.path.join(directory, 'a.json'))
+    print("✅ 磁盘持久化、LRU淘汰与过期测试通过")
+
+
+def test_concurrent_requests_share_one_call():
+    """测试相同键的并发请求只调用一次，失败结果不缓存"""
+
+    async def scenario():
+        with tempfile.TemporaryDirectory() as directory:
+            cache = AnalysisCache(directory)
+            calls = 0
+
+            async def factory():
+                nonlocal calls
+                calls += 1
+                await asyncio.sleep(0.1)
+                return {'success': True, 'calls': calls}
+
+            results = await asyncio.gather(*[cache.get_or_create('same', factory) for _ in range(5)])
+            again = await cache.get_or_create('same', factory)
+
+            async def failing():
+                return {'success': False}
+
+            await cache.get_or_create('bad', failing, should_cache=lambda r: r['success'])
+            return calls, results, again, cache.get('bad'), cache.stats()
+
+    calls, results, again, bad, stats = asyncio.run(scenario())
+    assert calls == 1
+    assert all(value == {'success': True, 'calls': 1} for value, _ in results)
+    assert sorted(cached for _, cached in results) == [False, True, True, True, True]
+    assert again == ({'success': True, 'calls': 1}, True)
+    assert bad is None
+    assert stats['shared'] == 4 and stats['misses'] == 2 and stats['hits'] == 1
+    print("✅ 并发请求去重测试通过")
+
+
+def test_owner_cancelled_waiter_takes_over():
+    """测试执行者被取消时等待者接手执行而不是收到取消，等待者自己被取消时不影响执行者，
+    执行出错时等待者收到同一异常"""
+
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(len(calls))
+            await asyncio.sleep(0.1)
+            return len(calls)
+
+        owner = asyncio.ensure_future(flight.do('key', work))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.ensure_future(flight.do('key', work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        results = await asyncio.gather(*waiters)
+        takeover_calls = list(calls)
+
+        async def failing():
+            await asyncio.sleep(0.05)
+            raise ValueError('provider down')
+
+        errors = await asyncio.gather(flight.do('bad', failing), flight.do('bad', failing), return_exceptions=True)
+
+        # 等待者自己被取消：收到取消，不影响执行者
+        slow_owner = asyncio.ensure_future(flight.do('slow', work))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(flight.do('slow', work))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        slow_result = await slow_owner
+        return owner.cancelled(), takeover_calls, results, errors, len(flight), waiter.cancelled(), slow_result
+
+    owner_cancelled, calls, results, errors, inflight, waiter_cancelled, slow_result = asyncio.run(scenario())
+    assert owner_cancelled
+    assert waiter_cancelled and slow_result == (3, False)
+    # 第一次执行被取消，一个等待者接手执行了第二次，其余等待者共享其结果
+    assert len(calls) == 2
+    assert sorted(shared for _, shared in results) == [False, True, True]
+    assert all(value == 2 for value, _ in results)
+    assert all(isinstance(e, ValueError) and str(e) == 'provider down' for e in errors)
+    assert inflight == 0
+    print("✅ 执行者取消后接手测试通过")
+
+
+def test_filter_toggle_returns_cached_analysis():
+    """测试来回切换筛选条件时，之前分析过的组合不再调用提供商"""
+    service = get_ai_analysis_service()
+    original_cache = ai_analysis_module.analysis_cache
+    original_call = service._call_ai_api
+    original_tasks = capture_api.tasks
+    prompts = []
+
+    async def fake_call(prompt):
+        prompts.append(prompt)
+        return {'content': json.dumps(ANALYSIS, ensure_ascii=False), 'provider': 'openrouter',
+                'model': 'mock-model', 'latency': 0.01, 'hedged': False, 'attempts': []}
+
+    async def scenario():
+        summary = make_summary()
+        first = await service.analyze_network_issue('website_access', summary, '网页慢',
+                                                     ['site1.example.com', 'site3.example.com'], 'all')
+        other = await service.analyze_network_issue('website_access', summary, '网页慢',
+                                                     ['site0.example.com'], 'all')
+        # 切换回第一组筛选条件（域名顺序不同）
+        back = await service.analyze_network_issue('website_access', summary, '网页慢',
+                                                   ['site3.example.com', 'site1.example.com'], 'all')
+
+        capture_api.tasks.create('task-1', {
+            'status': 'done', 'progress': 100,
+            'request': {'issue_type': 'website_access', 'user_description': '网页慢'},
+            'result': {'capture_summary': summary}
+        })
+        response = await capture_api.start_ai_analysis({
+            'task_id': 'task-1', 'filtered_domains': ['site0.example.com'], 'latency_filter': 'all'
+        })
+        return first, other, back, response, capture_api.tasks.get('task-1')
+
+    with tempfile.TemporaryDirectory() as directory:
+        ai_analysis_module.analysis_cache = AnalysisCache(directory)
+        service._call_ai_api = fake_call
+        capture_api.tasks = MemoryTaskStore()
+        try:
+            first, other, back, response, task = asyncio.run(scenario())
+        finally:
+            ai_analysis_module.analysis_cache = original_cache
+            service._call_ai_api = original_call
+            capture_api.tasks = original_tasks
+
+    assert first['success'] and not first['cached']
+    assert not other['cached']
+    assert back['cached'] and back['analysis'] == first['analysis']
+    assert len(prompts) == 2
+    assert response['cached'] and task['status'] == 'done'
+    assert task['result']['ai_analysis']['analysis']['diagnosis'] == ANALYSIS['diagnosis']
+    print("✅ 切换筛选条件命中缓存测试通过")
+
+
+def test_diagnosis_refresh_and_budget_key():
+    """测试诊断请求带refresh时重新诊断并更新缓存，prompt token预算变化时缓存键不同"""
+    original_cache = ai_api.analysis_cache
+    original_manager = ai_api.mcp_manager
+
+    class FakeManager:
+        client = object()
+
+        def __init__(self):
+            self.calls = 0
+
+        async def diagnose_network_issue(self, issue):
+            self.calls += 1
+            return {'success': True, 'run': self.calls}
+
+    manager = FakeManager()
+
+    async def scenario():
+        first = await ai_api.diagnose_network_issue(ai_api.DiagnosisRequest(issue_description='网页打不开'))
+        again = await ai_api.diagnose_network_issue(ai_api.DiagnosisRequest(issue_description='网页打不开'))
+        fresh = await ai_api.diagnose_network_issue(
+            ai_api.DiagnosisRequest(issue_description='网页打不开', refresh=True))
+        after = await ai_api.diagnose_network_issue(ai_api.DiagnosisRequest(issue_description='网页打不开'))
+        return first, again, fresh, after
+
+    with tempfile.TemporaryDirectory() as directory:
+        ai_api.analysis_cache = AnalysisCache(directory)
+        ai_api.mcp_manager = manager
+        try:
+            first, again, fresh, after = asyncio.run(scenario())
+        finally:
+            ai_api.analysis_cache = original_cache
+            ai_api.mcp_manager = original_manager
+
+    assert not first['cached'] and again['cached'] and again['data']['run'] == 1
+    assert not fresh['cached'] and fresh['data']['run'] == 2
+    # 刷新后的结果替换了旧缓存
+    assert after['cached'] and after['data']['run'] == 2 and manager.calls == 2
+
+    service = get_ai_analysis_service()
+    original_budget = service.prompt_token_budget
+    try:
+        key = service.analysis_cache_key('website_access', make_summary())
+        service.prompt_token_budget = original_budget * 2
+        assert service.analysis_cache_key('website_access', make_summary()) != key
+    finally:
+        service.prompt_token_budget = original_budget
+    print("✅ 诊断刷新与token预算缓存键测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试AI分析结果缓存\n")
+    test_disk_persistence_lru_and_ttl()
+    test_concurrent_requests_share_one_call()
+    test_owner_cancelled_waiter_takes_over()
+    test_filter_toggle_returns_cached_analysis()
+    test_diagnosis_refresh_and_budget_key()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+测试抓包任务调度器
+验证同一网卡的抓包排队、队列位置查询以及进程池分析
+"""
+
+import sys
+import os
+import time
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.capture_scheduler import CaptureScheduler
+
+
+def test_capture_queue_per_interface():
+    """测试同一网卡的抓包按顺序排队，不同网卡互不影响"""
+    scheduler = CaptureScheduler(analysis_workers=1, captures_per_interface=1)
+    release = asyncio.Event()
+    started = []
+
+    async def fake_capture(task_id, interface):
+        async with scheduler.capture_slot(task_id, interface):
+            started.append(task_id)
+            await release.wait()
+
+    async def scenario():
+        jobs = [asyncio.create_task(fake_capture(task_id, iface))
+                for task_id, iface in [('a', 'eth0'), ('b', 'eth0'), ('c', 'eth0'), ('d', 'wlan0')]]
+        await asyncio.sleep(0.05)
+
+        assert started == ['a', 'd']
+        assert scheduler.queue_position('a') is None
+        assert scheduler.queue_position('b')['position'] == 1
+        queue = scheduler.queue_position('c')
+        assert queue == {'stage': 'capture', 'resource': 'eth0', 'position': 2, 'waiting': 2}
+
+        release.set()
+        await asyncio.gather(*jobs)
+        assert started == ['a', 'd', 'b', 'c']
+        assert scheduler.queue_position('c') is None
+
+    asyncio.run(scenario())
+    print("✅ 网卡抓包排队测试通过")
+
+
+def test_analysis_runs_in_process_pool():
+    """测试分析函数在独立进程中执行，调度器线程中的提交立即返回"""
+    scheduler = CaptureScheduler(analysis_workers=2)
+    try:
+        async def analyze(task_id):
+            return await scheduler.run_analysis(task_id, os.getpid)
+
+        started = time.time()
+        futures = [scheduler.submit(f't{i}', analyze(f't{i}')) for i in range(3)]
+        assert time.time() - started < 1
+        pids = {future.result(timeout=60) for future in futures}
+        assert os.getpid() not in pids
+        assert 1 <= len(pids) <= 2
+    finally:
+        scheduler.shutdown()
+    print(f"✅ 进程池分析测试通过（工作进程 {len(pids)} 个）")
+
+
+if __name__ == "__main__":
+    print("🧪 测试抓包任务调度器\n")
+    test_capture_queue_per_interface()
+    test_analysis_runs_in_process_pool()
+    print("\n🎉 所有测试完成")
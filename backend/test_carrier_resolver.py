@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+测试按运营商DNS解析的网站可访问性对比
+用本地假DNS服务器（各自返回不同地址）和本地HTTP服务，验证每个运营商用自己的DNS解析、
+HTTP请求连接解析出的地址，以及各运营商并发测试
+"""
+
+import sys
+import os
+import time
+import struct
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+
+from app.services.carrier_resolver import CarrierSessionPool
+import app.api.network as network_api
+
+
+class FakeDNS(asyncio.DatagramProtocol):
+    """对任意域名的A查询返回固定地址；address为None时返回NXDOMAIN"""
+
+    def __init__(self, address):
+        self.address = address
+        self.queries = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        transaction_id = data[:2]
+        pos = 12
+        labels = []
+        while data[pos]:
+            labels.append(data[pos + 1:pos + 1 + data[pos]].decode())
+            pos += 1 + data[pos]
+        qtype = struct.unpack_from('>H', data, pos + 1)[0]
+        question = data[12:pos + 5]
+        self.queries.append(('.'.join(labels), qtype))
+
+        if self.address is None:
+            header = transaction_id + struct.pack('>HHHHH', 0x8183, 1, 0, 0, 0)
+            self.transport.sendto(header + question, addr)
+        elif qtype == 1:
+            header = transaction_id + struct.pack('>HHHHH', 0x8180, 1, 1, 0, 0)
+            answer = b'\xc0\x0c' + struct.pack('>HHIH', 1, 1, 30, 4) + bytes(map(int, self.address.split('.')))
+            self.transport.sendto(header + question + answer, addr)
+        else:
+            header = transaction_id + struct.pack('>HHHHH', 0x8180, 1, 0, 0, 0)
+            self.transport.sendto(header + question, addr)
+
+
+async def start_fake_dns(ip: str, port: int, address):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(lambda: FakeDNS(address), local_addr=(ip, port))
+    return transport, protocol
+
+
+async def start_site(delay: float):
+    async def index(request: web.Request):
+        await asyncio.sleep(delay)
+        return web.Response(text=f"<html><body>hello from {request.host}</body></html>", content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/', index)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+def test_carriers_resolve_with_own_dns_concurrently():
+    """测试各运营商使用自己的DNS服务器解析，并发测试且解析结果按TTL缓存"""
+
+    async def scenario():
+        runner, http_port = await start_site(delay=0.3)
+        # 所有假DNS服务器使用同一端口、不同回环地址
+        started_dns = {'127.0.0.11': await start_fake_dns('127.0.0.11', 0, '127.0.0.1')}
+        dns_port = started_dns['127.0.0.11'][0].get_extra_info('sockname')[1]
+        servers = {
+            '127.0.0.12': '127.0.0.1',
+            '127.0.0.13': '127.0.0.2',   # 解析到没有服务的地址
+            '127.0.0.14': None,          # NXDOMAIN
+        }
+        for ip, address in servers.items():
+            started_dns[ip] = await start_fake_dns(ip, dns_port, address)
+
+        configs = [
+            {"name": "运营商A", "dns_servers": ["127.0.0.11"], "description": ""},
+            {"name": "运营商B", "dns_servers": ["127.0.0.12"], "description": ""},
+            {"name": "运营商C", "dns_servers": ["127.0.0.13"], "description": ""},
+            {"name": "运营商D", "dns_servers": ["127.0.0.14", "127.0.0.11"], "description": ""},
+        ]
+        url = f"http://carrier-site.test:{http_port}/"
+        original = network_api.carrier_sessions
+        network_api.carrier_sessions = CarrierSessionPool(dns_port=dns_port)
+        try:
+            started = time.time()
+            results = await network_api.compare_carriers(url, configs)
+            elapsed = time.time() - started
+            again = await network_api.compare_carriers(url, configs[:1])
+        finally:
+            await network_api.carrier_sessions.close()
+            network_api.carrier_sessions = original
+            for transport, _ in started_dns.values():
+                transport.close()
+            await runner.cleanup()
+        queries = {ip: protocol.queries for ip, (_, protocol) in started_dns.items()}
+        return results, elapsed, again, queries
+
+    results, elapsed, again, queries = asyncio.run(scenario())
+    a, b, c, d = results
+    assert [r['carrier'] for r in results] == ['运营商A', '运营商B', '运营商C', '运营商D']
+
+    assert a['accessible'] and b['accessible'] and a['status_code'] == 200
+    assert a['ip_address'] == '127.0.0.1' and a['dns_server'] == '127.0.0.11' and a['dns_time'] is not None
+    assert b['dns_server'] == '127.0.0.12'
+
+    # 运营商C的DNS返回了没有服务的地址，HTTP请求确实连接了该地址
+    assert not c['accessible'] and c['ip_address'] == '127.0.0.2'
+    assert '连接错误' in c['error']
+
+    # NXDOMAIN是权威结果，不再尝试备用服务器
+    assert not d['accessible'] and 'DNS解析失败' in d['error'] and d['resolved_ips'] == []
+
+    # 两个可访问的运营商各耗时0.3秒，并发执行
+    assert elapsed < 0.55, elapsed
+
+    # 解析结果按TTL缓存：显式解析和建连共用一次查询（A和AAAA各一次）
+    assert sorted(qtype for _, qtype in queries['127.0.0.11']) == [1, 28]
+    assert all(name == 'carrier-site.test' for name, _ in queries['127.0.0.11'])
+    assert again[0]['accessible'] and again[0]['dns_server'] == '127.0.0.11'
+    print(f"✅ 运营商DNS对比测试通过（4个运营商并发用时 {elapsed:.2f}秒）")
+
+
+if __name__ == "__main__":
+    print("🧪 测试按运营商DNS解析的网站可访问性对比\n")
+    test_carriers_resolve_with_own_dns_concurrently()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+测试异步命令执行器
+验证不阻塞事件循环、超时/取消时杀掉整个进程组、输出截断、按工具限流以及客户端断开取消
+"""
+
+import sys
+import os
+import time
+import asyncio
+import subprocess
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import command_runner
+from app.services.command_runner import run_command, run_until_disconnected
+from app.services.network_service import NetworkService
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # 已退出但未被回收的僵尸进程视为已结束
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().split()[2] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def test_does_not_block_event_loop():
+    """测试命令执行期间其他协程照常运行"""
+    async def scenario():
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.time())
+                await asyncio.sleep(0.1)
+
+        result, _ = await asyncio.gather(
+            run_command([sys.executable, '-c', 'import time; time.sleep(0.5); print("done")']),
+            ticker())
+        assert result.returncode == 0 and result.stdout.strip() == 'done'
+        assert len(ticks) == 5 and ticks[-1] - ticks[0] < 0.7
+
+        try:
+            await run_command(['definitely-not-a-command-xyz'])
+            assert False, "应抛出FileNotFoundError"
+        except FileNotFoundError:
+            pass
+
+    asyncio.run(scenario())
+    print("✅ 非阻塞执行测试通过")
+
+
+def test_timeout_kills_process_group():
+    """测试超时后连同子进程一起杀掉，并抛出subprocess.TimeoutExpired"""
+    marker = f'/tmp/command_runner_child_{os.getpid()}'
+    script = ('import subprocess, time; '
+              f'p = subprocess.Popen(["sleep", "30"]); open("{marker}", "w").write(str(p.pid)); '
+              'time.sleep(30)')
+
+    async def scenario():
+        started = time.time()
+        try:
+            await run_command([sys.executable, '-c', script], timeout=0.5)
+            assert False, "应抛出TimeoutExpired"
+        except subprocess.TimeoutExpired:
+            pass
+        assert time.time() - started < 3
+
+        with open(marker) as f:
+            child = int(f.read())
+        os.remove(marker)
+        await asyncio.sleep(0.2)
+        assert not pid_alive(child), "子进程应随进程组一起被杀掉"
+
+    asyncio.run(scenario())
+    print("✅ 超时终止测试通过")
+
+
+def test_traceroute_test_does_not_block_event_loop():
+    """测试后台路由跟踪测试执行traceroute期间事件循环照常运行"""
+    with tempfile.TemporaryDirectory() as tmp:
+        fake_traceroute = os.path.join(tmp, 'traceroute')
+        with open(fake_traceroute, 'w') as f:
+            f.write('#!/bin/sh\nsleep 0.5\necho "traceroute to example.com"\necho " 1  192.168.1.1  1.0 ms"\n')
+        os.chmod(fake_traceroute, 0o755)
+        original_path = os.environ['PATH']
+        os.environ['PATH'] = tmp + os.pathsep + original_path
+
+        async def scenario():
+            ticks = []
+
+            async def ticker():
+                for _ in range(5):
+                    ticks.append(time.time())
+                    await asyncio.sleep(0.1)
+
+            service = NetworkService()
+            await asyncio.gather(ticker(), service.run_traceroute('t1', 'example.com'))
+            return ticks, service.test_results['t1']
+
+        try:
+            ticks, result = asyncio.run(scenario())
+        finally:
+            os.environ['PATH'] = original_path
+
+    assert result['status'] == 'completed' and result['results']['hops'] == ['1  192.168.1.1  1.0 ms']
+    assert ticks[-1] - ticks[0] < 0.7
+    print("✅ 路由跟踪测试非阻塞执行测试通过")
+
+
+def test_cancel_and_disconnect_kill_process():
+    """测试客户端断开时取消请求并杀掉命令"""
+    class FakeRequest:
+        class url:
+            path = '/api/network/speed_test'
+
+        def __init__(self):
+            self.disconnected = False
+
+        async def is_disconnected(self):
+            return self.disconnected
+
+    async def scenario():
+        request = FakeRequest()
+        marker = f'/tmp/command_runner_{os.getpid()}'
+        script = f'import os, time; open("{marker}", "w").write(str(os.getpid())); time.sleep(30)'
+        job = asyncio.create_task(run_until_disconnected(
+            request, run_command([sys.executable, '-c', script], timeout=60)))
+        await asyncio.sleep(0.5)
+        with open(marker) as f:
+            pid = int(f.read())
+        os.remove(marker)
+        assert pid_alive(pid)
+
+        request.disconnected = True
+        try:
+            await asyncio.wait_for(job, timeout=3)
+            assert False, "应被取消"
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0.2)
+        assert not pid_alive(pid), "客户端断开后命令进程应被杀掉"
+
+        # 直接取消命令：返回前进程已被回收，不留僵尸进程
+        job = asyncio.create_task(run_command([sys.executable, '-c', script], timeout=60))
+        await asyncio.sleep(0.5)
+        with open(marker) as f:
+            pid = int(f.read())
+        os.remove(marker)
+        job.cancel()
+        try:
+            await job
+            assert False, "应被取消"
+        except asyncio.CancelledError:
+            pass
+        assert not os.path.exists(f'/proc/{pid}'), "被取消的命令进程应已被回收"
+
+    asyncio.run(scenario())
+    print("✅ 断开取消测试通过")
+
+
+def test_output_limit_and_tool_concurrency():
+    """测试输出超过上限被截断，同名工具按配置串行执行"""
+    async def scenario():
+        result = await run_command([sys.executable, '-c', 'print("x" * 100000)'], max_output=1000)
+        assert result.truncated and len(result.stdout) == 1000 and result.returncode == 0
+
+        command_runner.TOOL_CONCURRENCY['serial_tool'] = 1
+        try:
+            cmd = [sys.executable, '-c', 'import time; time.sleep(0.3)']
+            started = time.time()
+            await asyncio.gather(*[run_command(cmd, tool='serial_tool') for _ in range(3)])
+            serial = time.time() - started
+            started = time.time()
+            await asyncio.gather(*[run_command(cmd) for _ in range(3)])
+            parallel = time.time() - started
+        finally:
+            del command_runner.TOOL_CONCURRENCY['serial_tool']
+        assert serial >= 0.9 and parallel < serial
+        return serial, parallel
+
+    serial, parallel = asyncio.run(scenario())
+    print(f"✅ 输出截断与工具限流测试通过（串行 {serial:.2f}秒，并行 {parallel:.2f}秒）")
+
+
+if __name__ == "__main__":
+    print("🧪 测试异步命令执行器\n")
+    test_does_not_block_event_loop()
+    test_timeout_kills_process_group()
+    test_traceroute_test_does_not_block_event_loop()
+    test_cancel_and_disconnect_kill_process()
+    test_output_limit_and_tool_concurrency()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+测试进程内DNS查询引擎
+用本地假DNS服务器验证报文构造/解析、多服务器并发、无响应服务器只占一次超时以及百分位统计
+"""
+
+import sys
+import os
+import time
+import socket
+import struct
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.dns_query import build_query, parse_response, benchmark, percentile
+
+
+def encode_name(name):
+    return b''.join(bytes([len(p)]) + p.encode() for p in name.split('.')) + b'\x00'
+
+
+def make_response(query: bytes, delay_tag: str) -> bytes:
+    """应答查询：A记录经CNAME（压缩指针）指向1.2.3.4，MX返回一条记录，nx.开头返回NXDOMAIN"""
+    transaction_id = struct.unpack_from('>H', query)[0]
+    pos = 12
+    labels = []
+    while query[pos]:
+        labels.append(query[pos + 1:pos + 1 + query[pos]].decode())
+        pos += 1 + query[pos]
+    qtype = struct.unpack_from('>H', query, pos + 1)[0]
+    question = query[12:pos + 5]
+    name = '.'.join(labels)
+
+    if name.startswith('nx.'):
+        return struct.pack('>HHHHHH', transaction_id, 0x8183, 1, 0, 0, 0) + question
+    if qtype == 15:
+        answers = [b'\xc0\x0c' + struct.pack('>HHIH', 15, 1, 300, 2 + len(encode_name('mail.' + name)))
+                   + struct.pack('>H', 10) + encode_name('mail.' + name)]
+    else:
+        target = encode_name(f'{delay_tag}.cdn.net')
+        answers = [
+            b'\xc0\x0c' + struct.pack('>HHIH', 5, 1, 60, len(target)) + target,
+            # 指向上一条CNAME的目标名（问题区12字节头 + 问题 + 前一条记录的12字节固定部分）
+            struct.pack('>H', 0xc000 | (12 + len(question) + 12)) + struct.pack('>HHIH', 1, 1, 60, 4)
+            + socket.inet_aton('1.2.3.4'),
+        ]
+    header = struct.pack('>HHHHHH', transaction_id, 0x8180, 1, len(answers), 0, 0)
+    return header + question + b''.join(answers)
+
+
+class FakeDNS(asyncio.DatagramProtocol):
+    def __init__(self, delay):
+        self.delay = delay
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        # 第一次查询（冷缓存）额外慢一些
+        delay = self.delay * (3 if self.queries == 1 else 1)
+        asyncio.get_running_loop().call_later(
+            delay, self.transport.sendto, make_response(data, 'edge'), addr)
+
+
+def test_build_and_parse():
+    """测试查询报文格式以及压缩指针/CNAME/MX解析"""
+    query = build_query(0x1234, 'www.example.com', 'AAAA')
+    assert query[:2] == b'\x12\x34' and query[2:4] == b'\x01\x00'
+    assert encode_name('www.example.com') + b'\x00\x1c\x00\x01' in query
+
+    response = parse_response(make_response(build_query(7, 'example.com', 'A'), 'edge'))
+    assert response['id'] == 7 and response['rcode'] == 0
+    assert [a['type'] for a in response['answers']] == ['CNAME', 'A']
+    assert response['answers'][0]['value'] == 'edge.cdn.net'
+    assert response['answers'][1] == {'name': 'edge.cdn.net', 'type': 'A', 'ttl': 60, 'value': '1.2.3.4'}
+
+    mx = parse_response(make_response(build_query(8, 'example.com', 'MX'), 'edge'))
+    assert mx['answers'][0]['value'] == '10 mail.example.com'
+    assert percentile([1, 2, 3, 4], 50) == 2.5 and percentile([], 95) is None
+    print("✅ 报文构造与解析测试通过")
+
+
+def test_concurrent_benchmark():
+    """测试多个服务器并发查询，无响应服务器不拖慢整体，统计冷/热缓存和百分位"""
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+
+        servers = []
+        for address, delay in [('127.0.0.1', 0.02), ('127.0.0.2', 0.05)]:
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda delay=delay: FakeDNS(delay), local_addr=(address, port))
+            servers.append((transport, protocol))
+
+        try:
+            started = time.time()
+            results = await benchmark(['127.0.0.1', '127.0.0.2', '127.0.0.3'],
+                                      ['example.com', 'nx.example.com'], ['A', 'MX'],
+                                      repeat=3, timeout=0.5, port=port)
+            elapsed = time.time() - started
+        finally:
+            for transport, _ in servers:
+                transport.close()
+        return results, elapsed
+
+    results, elapsed = asyncio.run(scenario())
+
+    # 每个服务器4个 (域名, 类型) 组合各查询3次，同一组合的重复查询依次进行；
+    # 无响应服务器最长链为3次超时（1.5秒），串行执行则需要6秒
+    assert elapsed < 2.5, f"查询未并发执行，耗时 {elapsed:.2f}秒"
+    fast = results['127.0.0.1']
+    assert fast['stats']['queries'] == 12 and fast['stats']['successful'] == 6
+    a_record = next(s for s in fast['samples'] if s['domain'] == 'example.com' and s['query_type'] == 'A')
+    assert a_record['resolved_ips'] == ['1.2.3.4']
+    nx = next(s for s in fast['samples'] if s['domain'] == 'nx.example.com')
+    assert nx['status'] == 'error' and nx['rcode_name'] == 'NXDOMAIN'
+
+    slow = results['127.0.0.2']['stats']
+    assert slow['p50'] > fast['stats']['p50']
+    assert slow['p95'] >= slow['p50'] and slow['p99'] >= slow['p95']
+    assert slow['cold_avg'] > slow['warm_avg']
+
+    dead = results['127.0.0.3']['stats']
+    assert dead['successful'] == 0 and dead['timeouts'] == 12
+    print(f"✅ 并发基准测试通过（36次查询耗时 {elapsed:.2f}秒）")
+
+
+if __name__ == "__main__":
+    print("🧪 测试DNS查询引擎\n")
+    test_build_and_parse()
+    test_concurrent_benchmark()
+    print("\n🎉 所有测试完成")
@@ -8,6 +8,18 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.services.game_traffic_analyzer import GameTrafficAnalyzer
+from app.services.packet_table import PacketTable
+
+FIELDS = ['ip.src', 'ip.dst', 'udp.srcport', 'udp.dstport', 'frame.len', 'frame.time_relative', 'frame.protocols']
+
+
+def packet_table(packets, protocols='eth:ethertype:ip:udp:data'):
+    """把模拟的数据包转换为列式数据包表"""
+    return PacketTable.from_rows(FIELDS, [
+        [p['src_ip'], p['dst_ip'], str(p['src_port']), str(p['dst_port']), str(p['size']), str(p['time']), protocols]
+        for p in packets
+    ])
+
 
 def test_web_traffic_filtering():
     """测试网页流量过滤"""
@@ -31,7 +43,7 @@ def test_web_traffic_filtering():
     ] * 20  # 重复20次模拟高频游戏流量
     
     print("🌐 测试网页流量（HTTPS/QUIC）:")
-    web_flows = analyzer._analyze_traffic_patterns(web_packets)
+    web_flows = analyzer._identify_game_traffic(packet_table(web_packets, 'eth:ethertype:ip:udp:quic'))
     print(f"   检测到 {len(web_flows)} 个游戏流量")
     
     if len(web_flows) > 0:
@@ -40,7 +52,7 @@ def test_web_traffic_filtering():
             print(f"   流量 {flow['src_port']}->{flow['dst_port']}: {'游戏' if is_game else '非游戏'}")
     
     print("\n🎮 测试真实游戏流量:")
-    game_flows = analyzer._analyze_traffic_patterns(game_packets)
+    game_flows = analyzer._identify_game_traffic(packet_table(game_packets))
     print(f"   检测到 {len(game_flows)} 个流量")
     
     if len(game_flows) > 0:
@@ -79,23 +91,25 @@ def test_traffic_pattern_calculation():
     
     # 高频小包流量（游戏特征）
     game_like_packets = [
-        {'src_ip': '192.168.1.100', 'dst_ip': '111.13.101.208', 'size': 120, 'time': i * 0.1}
+        {'src_ip': '192.168.1.100', 'dst_ip': '111.13.101.208', 'src_port': 12345, 'dst_port': 7000,
+         'size': 120, 'time': i * 0.1}
         for i in range(50)  # 50个包，5秒内
     ]
     
     # 低频大包流量（网页特征）
     web_like_packets = [
-        {'src_ip': '192.168.1.100', 'dst_ip': '172.64.147.26', 'size': 1200, 'time': i * 1.0}
+        {'src_ip': '192.168.1.100', 'dst_ip': '172.64.147.26', 'src_port': 54321, 'dst_port': 443,
+         'size': 1200, 'time': i * 1.0}
         for i in range(10)  # 10个包，10秒内
     ]
     
     print("🎮 游戏类流量模式:")
-    game_pattern = analyzer._calculate_traffic_pattern(game_like_packets)
+    game_pattern = analyzer._aggregate_udp_flows(packet_table(game_like_packets))[0]['pattern']
     print(f"   平均包大小: {game_pattern.avg_packet_size:.1f} 字节")
     print(f"   包频率: {game_pattern.packet_frequency:.1f} 包/秒")
     
     print("\n🌐 网页类流量模式:")
-    web_pattern = analyzer._calculate_traffic_pattern(web_like_packets)
+    web_pattern = analyzer._aggregate_udp_flows(packet_table(web_like_packets))[0]['pattern']
     print(f"   平均包大小: {web_pattern.avg_packet_size:.1f} 字节")
     print(f"   包频率: {web_pattern.packet_frequency:.1f} 包/秒")
     
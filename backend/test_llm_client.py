@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+测试AI提供商的常驻异步客户端
+用本地aiohttp服务模拟OpenAI兼容接口和Anthropic接口，验证连接复用、并发上限、
+错误处理，以及AI分析在等待提供商响应时不阻塞事件循环
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.config.ai_config import AIProviderConfig
+from app.services.ai_analysis_service import AIAnalysisService
+from app.services.llm_client import LLMAPIError, LLMClientPool, llm_clients
+from mock_llm_provider import MockConfigManager, MockLLMProvider
+
+ANALYSIS = {
+    'diagnosis': 'DNS解析缓慢',
+    'severity': 'medium',
+    'root_cause': '上游DNS服务器响应慢',
+    'recommendations': ['更换DNS服务器'],
+    'technical_details': '平均解析耗时 800ms',
+    'confidence': 85
+}
+
+
+async def start_mock_provider(delay: float = 0.2) -> MockLLMProvider:
+    """/v1 下为需要密钥的OpenAI兼容接口和Anthropic接口，/broken 下返回500"""
+    return await MockLLMProvider({
+        'v1': {'delay': delay, 'api_key': 'test-key', 'content': json.dumps(ANALYSIS, ensure_ascii=False)},
+        'broken': {'status': 500, 'error_text': 'upstream overloaded'}
+    }).start()
+
+
+def make_config(base_url: str, **kwargs) -> AIProviderConfig:
+    return AIProviderConfig(name='Mock', base_url=base_url, api_key='test-key', model='mock-model', **kwargs)
+
+
+def test_pooled_client_limits_concurrency():
+    """测试并发请求不超过上限、复用连接，等待期间事件循环不被阻塞"""
+
+    async def scenario():
+        provider = await start_mock_provider(delay=0.2)
+        pool = LLMClientPool(max_concurrency=2)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        try:
+            client = pool.get('openai', make_config(f"{provider.base}/v1"))
+            assert pool.get('openai', make_config(f"{provider.base}/v1")) is client
+            started = time.perf_counter()
+            replies = await asyncio.gather(*[client.complete(f"问题{i}") for i in range(6)])
+            elapsed = time.perf_counter() - started
+            stats = client.stats()
+        finally:
+            ticking.cancel()
+            await pool.close()
+            await provider.close()
+        return replies, elapsed, provider, ticks, stats
+
+    replies, elapsed, provider, ticks, stats = asyncio.run(scenario())
+    assert all(json.loads(reply) == ANALYSIS for reply in replies)
+    assert provider.max_active == 2
+    assert len(provider.transports) <= 2
+    # 6个请求、每批2个、每个0.2秒
+    assert 0.55 < elapsed < 1.0, elapsed
+    assert ticks > elapsed / 0.01 * 0.5, ticks
+    assert stats['requests'] == 6 and stats['errors'] == 0 and stats['active'] == 0
+    body = provider.requests[0]['body']
+    assert body['model'] == 'mock-model' and body['messages'][0]['role'] == 'user'
+    print(f"✅ 连接池与并发上限测试通过（6个请求用时 {elapsed:.2f}秒，使用 {len(provider.transports)} 条连接）")
+
+
+def test_anthropic_format_and_errors():
+    """测试Anthropic接口格式，以及错误状态码转换为LLMAPIError"""
+
+    async def scenario():
+        provider = await start_mock_provider(delay=0)
+        provider.routes['v1']['content'] = ['hello ', 'world']
+        pool = LLMClientPool()
+        try:
+            text = await pool.get('anthropic', make_config(provider.base)).complete('你好')
+            try:
+                await pool.get('openrouter', make_config(f"{provider.base}/broken")).complete('你好')
+                error = None
+            except LLMAPIError as e:
+                error = e
+        finally:
+            await pool.close()
+            await provider.close()
+        return text, error, provider
+
+    text, error, provider = asyncio.run(scenario())
+    assert text == 'hello world'
+    request = provider.requests[0]
+    assert request['path'] == '/v1/messages'
+    assert request['headers']['anthropic-version'] and 'Authorization' not in request['headers']
+    assert error is not None and error.status == 500 and error.provider == 'openrouter'
+    assert 'OpenRouter API错误: 500' in str(error)
+    print("✅ Anthropic格式与错误处理测试通过")
+
+
+def test_analysis_service_awaits_pooled_client():
+    """测试AI分析服务通过常驻客户端调用提供商并解析结果"""
+
+    async def scenario():
+        provider = await start_mock_provider(delay=0.05)
+        service = AIAnalysisService()
+        service.ai_config = MockConfigManager({'openrouter': make_config(f"{provider.base}/v1")})
+        summary = {'statistics': {'total_packets': 10}, 'enhanced_analysis': {}}
+        try:
+            first = await service.analyze_network_issue('website_access', summary, '网页打开慢', use_cache=False)
+            second = await service.analyze_network_issue('website_access', summary, '网页打开慢', use_cache=False)
+        finally:
+            await llm_clients.close()
+            await provider.close()
+        return first, second, provider
+
+    first, second, provider = asyncio.run(scenario())
+    assert first['success'] and second['success'], first
+    assert first['analysis']['diagnosis'] == 'DNS解析缓慢'
+    assert first['ai_provider'] == 'openrouter'
+    assert len(provider.transports) == 1
+    assert provider.requests[0]['headers']['X-Title'] == 'Network Packet Analysis'
+    print("✅ AI分析服务异步调用测试通过")
+
+
+def test_close_clients_of_all_loops():
+    """测试退出时同时关闭其他线程事件循环（抓包调度器）中的客户端"""
+    pool = LLMClientPool()
+    other_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=other_loop.run_forever, daemon=True)
+    thread.start()
+
+    async def create_client():
+        return pool.get('openai', make_config('http://127.0.0.1:9/v1'))
+
+    async def scenario():
+        other = asyncio.run_coroutine_threadsafe(create_client(), other_loop).result()
+        own = pool.get('openai', make_config('http://127.0.0.1:9/v1'))
+        assert other is not own
+        await pool.close()
+        return other, own
+
+    try:
+        other, own = asyncio.run(scenario())
+    finally:
+        other_loop.call_soon_threadsafe(other_loop.stop)
+        thread.join()
+        other_loop.close()
+    assert other._client.is_closed and own._client.is_closed
+    assert pool.stats() == []
+    print("✅ 关闭所有事件循环的客户端测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试AI提供商的常驻异步客户端\n")
+    test_pooled_client_limits_concurrency()
+    test_anthropic_format_and_errors()
+    test_analysis_service_awaits_pooled_client()
+    test_close_clients_of_all_loops()
+    print("\n🎉 所有测试完成")
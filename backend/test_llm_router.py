@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+测试AI请求的对冲与故障转移
+用本地aiohttp服务模拟多个提供商（各自的延迟和故障可配置），验证超过p90延迟时发出对冲请求、
+落后的请求被取消、出错时转到下一个提供商，以及统计数据影响路由顺序
+"""
+
+import sys
+import os
+import time
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.llm_client import LLMClientPool
+from app.services.llm_router import FAILURE_THRESHOLD, MIN_SAMPLES, LLMRouter
+from mock_llm_provider import DEFAULT_REPLY, MockConfigManager, MockLLMProvider
+
+REPLY = DEFAULT_REPLY
+
+
+def test_hedge_after_p90_and_cancel_loser():
+    """测试首选提供商超过其p90延迟后发出对冲请求，取先返回的结果并取消落后的请求"""
+
+    async def scenario():
+        provider = await MockLLMProvider({
+            'openrouter': {'delay': 2.0},
+            'openai': {'delay': 0.1}
+        }).start()
+        router = LLMRouter(LLMClientPool())
+        config_manager = MockConfigManager.for_mock(provider.base)
+        # 历史延迟约0.2秒，p90按0.2秒计算（最短对冲等待1秒）
+        stats = router._route_stats('openrouter/openrouter-model')
+        for _ in range(MIN_SAMPLES):
+            stats.record_success(0.2)
+        try:
+            started = time.perf_counter()
+            result = await router.complete('问题', config_manager)
+            elapsed = time.perf_counter() - started
+            await asyncio.sleep(0.1)
+        finally:
+            await router.clients.close()
+            await provider.close()
+        return result, elapsed, provider, router.stats()
+
+    result, elapsed, provider, stats = asyncio.run(scenario())
+    assert result['provider'] == 'openai' and result['hedged'] and result['content'] == REPLY
+    assert 1.0 < elapsed < 1.6, elapsed
+    statuses = {a['route']: a['status'] for a in result['attempts']}
+    assert statuses == {'openai/openai-model': 'success', 'openrouter/openrouter-model': 'cancelled'}
+    # 落后的请求被真正取消：服务端看到客户端断开
+    assert provider.disconnected.get('openrouter') == 1
+    assert stats['openrouter/openrouter-model']['cancelled'] == 1
+    assert stats['openai/openai-model']['successes'] == 1
+    print(f"✅ 对冲请求测试通过（用时 {elapsed:.2f}秒）")
+
+
+def test_failover_on_error_and_invalid_response():
+    """测试首选提供商出错或返回无效内容时立即转到下一个，连续出错后降级"""
+
+    async def scenario():
+        provider = await MockLLMProvider({
+            'openrouter': {'status': 503},
+            'openai': {'delay': 0.05}
+        }).start()
+        router = LLMRouter(LLMClientPool())
+        config_manager = MockConfigManager.for_mock(provider.base)
+        try:
+            results = []
+            for _ in range(3):
+                results.append(await router.complete('问题', config_manager))
+            routes_after_failures = [f"{p}/{c.model}" for p, c in router.routes(config_manager)]
+            fourth = await router.complete('问题', config_manager)
+        finally:
+            await router.clients.close()
+            await provider.close()
+        return results, routes_after_failures, fourth, provider, router.stats()
+
+    results, routes_after_failures, fourth, provider, stats = asyncio.run(scenario())
+    assert all(r['provider'] == 'openai' and not r['hedged'] for r in results)
+    assert results[0]['latency'] < 0.5
+    assert [a['status'] for a in results[0]['attempts']] == ['error', 'success']
+    assert '503' in results[0]['attempts'][0]['error']
+    # 连续3次出错后降级，之后直接使用正常的提供商
+    assert routes_after_failures[0] == 'openai/openai-model'
+    assert stats['openrouter/openrouter-model']['cooling_down']
+    assert stats['openrouter/openrouter-model']['error_rate'] == 1.0
+    assert [a['route'] for a in fourth['attempts']] == ['openai/openai-model']
+    assert provider.count('openrouter') == FAILURE_THRESHOLD
+
+    async def invalid_scenario():
+        provider = await MockLLMProvider({
+            'openrouter': {'content': '抱歉，我无法回答'},
+            'openai': {}
+        }).start()
+        router = LLMRouter(LLMClientPool())
+        try:
+            return await router.complete('问题', MockConfigManager.for_mock(provider.base),
+                                         validate=lambda text: '{' in text)
+        finally:
+            await router.clients.close()
+            await provider.close()
+
+    result = asyncio.run(invalid_scenario())
+    assert result['provider'] == 'openai'
+    assert '无效' in result['attempts'][0]['error']
+    print("✅ 故障转移与降级测试通过")
+
+
+def test_fallback_model_and_all_failed():
+    """测试同一提供商的备用模型参与路由，全部失败时抛出最后的错误"""
+
+    async def scenario():
+        provider = await MockLLMProvider({
+            'openrouter': {'status': 500},
+            'openai': {'status': 429}
+        }).start()
+        router = LLMRouter(LLMClientPool())
+        config_manager = MockConfigManager.for_mock(provider.base, fallback_model='small-model')
+        routes = [f"{p}/{c.model}" for p, c in router.routes(config_manager)]
+        try:
+            await router.complete('问题', config_manager)
+            error = None
+        except Exception as e:
+            error = e
+        finally:
+            await router.clients.close()
+            await provider.close()
+        return routes, error, provider
+
+    routes, error, provider = asyncio.run(scenario())
+    assert routes == ['openrouter/openrouter-model', 'openrouter/small-model', 'openai/openai-model']
+    assert error is not None and '429' in str(error)
+    assert provider.counts() == {'openrouter': 2, 'openai': 1}
+    print("✅ 备用模型与全部失败测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试AI请求的对冲与故障转移\n")
+    test_hedge_after_p90_and_cancel_loser()
+    test_failover_on_error_and_invalid_response()
+    test_fallback_model_and_all_failed()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+测试MCP批量调用调度
+验证滑动窗口（慢调用不拖住整批）、按服务器限流、优先级以及按完成顺序产出结果
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+import textwrap
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.mcp.client import MCPClient
+from app.mcp.config import MCPConfig, MCPServerConfig
+
+# 每个请求独立处理，按参数中的delay延迟后应答
+FAKE_SERVER = textwrap.dedent('''
+    import sys, json, asyncio
+
+    async def handle(request):
+        if request["method"] == "initialize":
+            result = {}
+        else:
+            args = request["params"]["arguments"]
+            await asyncio.sleep(args.get("delay", 0))
+            result = {"echo": args.get("value")}
+        sys.stdout.write(json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": result}) + "\\n")
+        sys.stdout.flush()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        tasks = []
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            request = json.loads(line)
+            if "id" in request:
+                tasks.append(asyncio.create_task(handle(request)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+''')
+
+
+def run(scenario, **server_options):
+    with tempfile.TemporaryDirectory() as tmp:
+        script = os.path.join(tmp, 'fake_server.py')
+        with open(script, 'w') as f:
+            f.write(FAKE_SERVER)
+
+        async def main():
+            client = MCPClient(MCPConfig(servers={
+                name: MCPServerConfig(name=name, description=name, command=sys.executable,
+                                      args=[script], **server_options.get(name, {}))
+                for name in ('a', 'b')
+            }))
+            await client.initialize()
+            try:
+                await scenario(client)
+            finally:
+                await client.shutdown()
+
+        asyncio.run(main())
+
+
+def call(server, value, delay, priority=0):
+    return {'server': server, 'tool': 'echo', 'args': {'value': value, 'delay': delay},
+            'priority': priority}
+
+
+def test_slow_call_does_not_stall_batch():
+    """测试窗口中一个慢调用占位时，其余调用继续流转，结果按完成顺序产出"""
+    async def scenario(client):
+        requests = [call('a', 'slow', 1.0)] + [call('b', i, 0.1) for i in range(5)]
+        order = []
+        started = time.time()
+        async for index, response in client.iter_batch_call(requests, max_concurrent=2):
+            assert response.success and response.data == {'echo': requests[index]['args']['value']}
+            order.append(index)
+        elapsed = time.time() - started
+
+        assert order[-1] == 0, "慢调用应最后完成"
+        assert elapsed < 1.4, f"慢调用拖住了整批，耗时 {elapsed:.2f}秒"
+
+        results = await client.batch_call(requests + [{'server': 'a'}], max_concurrent=2)
+        assert [r.data for r in results[:6]] == [{'echo': r['args']['value']} for r in requests]
+        assert not results[6].success and '无效请求' in results[6].error
+        print(f"✅ 滑动窗口测试通过（耗时 {elapsed:.2f}秒）")
+
+    run(scenario)
+
+
+def test_per_server_cap_and_priority():
+    """测试单个服务器的并发上限与优先级，受限服务器不占用其他服务器的名额"""
+    async def scenario(client):
+        requests = [call('a', f'a{i}', 0.3, priority=i) for i in range(3)]
+        requests += [call('b', f'b{i}', 0.3) for i in range(3)]
+        finished = {}
+        started = time.time()
+        async for index, response in client.iter_batch_call(requests, max_concurrent=10):
+            finished[response.data['echo']] = time.time() - started
+
+        assert max(finished[f'b{i}'] for i in range(3)) < 0.6, "b的调用应同时执行"
+        assert finished['a2'] < finished['a1'] < finished['a0'], "a按优先级串行执行"
+        assert finished['a0'] >= 0.85
+        print("✅ 服务器限流与优先级测试通过")
+
+    run(scenario, a={'max_concurrent': 1})
+
+
+if __name__ == "__main__":
+    print("🧪 测试MCP批量调用调度\n")
+    test_slow_call_does_not_stall_batch()
+    test_per_server_cap_and_priority()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+测试MCP诊断计划的依赖图执行
+用假客户端模拟各诊断工具的耗时，验证独立步骤并发、关键步骤失败跳过依赖步骤以及进度事件
+"""
+
+import sys
+import os
+import time
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.mcp.client import MCPResponse
+from app.mcp.manager import MCPManager
+
+STEP_DELAY = 0.2
+
+
+class FakeClient:
+    """每个工具调用耗时STEP_DELAY，指定的工具返回失败"""
+
+    def __init__(self, failing_tools=()):
+        self.failing_tools = set(failing_tools)
+        self.calls = []
+
+    async def call_tool(self, server_name, tool_name, args, timeout=None):
+        self.calls.append(tool_name)
+        await asyncio.sleep(STEP_DELAY)
+        if tool_name in self.failing_tools:
+            return MCPResponse(success=False, error='模拟失败', server=server_name,
+                               execution_time=STEP_DELAY)
+        return MCPResponse(success=True, data={}, server=server_name, execution_time=STEP_DELAY)
+
+
+def run_diagnosis(issue, client):
+    manager = MCPManager()
+    original = manager.client
+    manager.client = client
+    events = []
+    try:
+        started = time.time()
+        result = asyncio.run(manager.diagnose_network_issue(issue, on_progress=events.append))
+        return result, events, time.time() - started
+    finally:
+        manager.client = original
+
+
+def test_independent_steps_run_concurrently():
+    """测试总耗时取决于最长依赖链而不是步骤耗时之和"""
+    client = FakeClient()
+    result, events, elapsed = run_diagnosis('WiFi信号差，网页打开慢，DNS解析失败', client)
+
+    steps = result['diagnosis_results']
+    assert result['success'] and len(steps) == 9
+    assert all(step['success'] for step in steps.values())
+    assert list(steps)[0] == 'basic_connectivity', "结果按计划顺序返回"
+    # 最长依赖链为两步（basic_connectivity→dns_check，wifi_scan→wifi_interference）
+    assert elapsed < STEP_DELAY * 4, f"独立步骤未并发执行，耗时 {elapsed:.2f}秒"
+
+    started = [e['step'] for e in events if e['type'] == 'step_started']
+    assert started.index('dns_check') > started.index('current_wifi')
+    completed = [e for e in events if e['type'] == 'step_completed']
+    assert len(completed) == 9 and completed[-1]['completed'] == 9 and completed[-1]['total'] == 9
+    print(f"✅ 并发执行测试通过（{len(steps)} 个步骤耗时 {elapsed:.2f}秒）")
+
+
+def test_critical_failure_skips_dependents():
+    """测试外网检查失败时跳过依赖外网的步骤，本地检查照常执行"""
+    client = FakeClient(failing_tools={'check_internet_connectivity'})
+    result, events, _ = run_diagnosis('DNS解析失败，ping丢包', client)
+
+    steps = result['diagnosis_results']
+    assert not steps['basic_connectivity']['success']
+    assert steps['dns_check']['skipped'] and steps['ping_test']['skipped']
+    assert steps['gateway_info']['success'] and steps['gateway_performance']['success']
+    assert 'check_dns_resolution' not in client.calls
+
+    skipped = {e['step'] for e in events if e['type'] == 'step_skipped'}
+    assert skipped == {'dns_check', 'ping_test'}
+    print("✅ 关键步骤失败跳过测试通过")
+
+
+def test_bandwidth_runs_after_latency_steps():
+    """测试带宽测试和抓包在延迟类测量完成后才开始，不与其同时运行"""
+    client = FakeClient()
+    result, events, _ = run_diagnosis('网页打开慢，ping丢包', client)
+
+    assert all(step['success'] for step in result['diagnosis_results'].values())
+    position = {(e['type'], e['step']): i for i, e in enumerate(events)}
+    for load_step in ('bandwidth_test', 'traffic_analysis'):
+        for latency_step in ('ping_test', 'gateway_performance'):
+            assert position[('step_completed', latency_step)] < position[('step_started', load_step)]
+    print("✅ 带宽测试排在延迟测量之后测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试诊断计划依赖图执行\n")
+    test_independent_steps_run_concurrently()
+    test_critical_failure_skips_dependents()
+    test_bandwidth_runs_after_latency_steps()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+测试MCP客户端的stdio多路复用
+用一个乱序应答的假服务器验证：并发调用按id拿到各自的结果、同时在途、超时后迟到的响应被丢弃
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+import textwrap
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.mcp.client import MCPClient
+from app.mcp.config import MCPConfig, MCPServerConfig
+
+# 每个请求在独立协程中处理，按参数中的delay延迟后应答，因此响应顺序与请求顺序无关
+FAKE_SERVER = textwrap.dedent('''
+    import sys, json, asyncio
+
+    async def handle(line, lock):
+        request = json.loads(line)
+        if "id" not in request:
+            return
+        if request["method"] == "initialize":
+            sys.stdout.write(json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": {}}) + "\\n")
+            sys.stdout.flush()
+            return
+        args = request["params"]["arguments"]
+        await asyncio.sleep(args.get("delay", 0))
+        if args.get("fail"):
+            response = {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -1, "message": "boom"}}
+        else:
+            response = {"jsonrpc": "2.0", "id": request["id"], "result": {"echo": args["value"]}}
+        async with lock:
+            sys.stdout.write(json.dumps({"jsonrpc": "2.0", "method": "notifications/message"}) + "\\n")
+            sys.stdout.write(json.dumps(response) + "\\n")
+            sys.stdout.flush()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        lock = asyncio.Lock()
+        tasks = []
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            sys.stderr.write("log line\\n" * 100)
+            tasks.append(asyncio.create_task(handle(line, lock)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+''')
+
+
+async def start_client(script_path):
+    config = MCPConfig(servers={
+        'fake': MCPServerConfig(name='fake', description='乱序应答测试服务器',
+                                command=sys.executable, args=[script_path], timeout=10)
+    })
+    client = MCPClient(config)
+    await client.initialize()
+    assert 'fake' in client.active_servers
+    return client
+
+
+def run_with_server(scenario):
+    with tempfile.TemporaryDirectory() as tmp:
+        script_path = os.path.join(tmp, 'fake_server.py')
+        with open(script_path, 'w') as f:
+            f.write(FAKE_SERVER)
+
+        async def main():
+            client = await start_client(script_path)
+            try:
+                await scenario(client)
+            finally:
+                await client.shutdown()
+
+        asyncio.run(main())
+
+
+def test_concurrent_calls_are_correlated():
+    """测试并发调用乱序返回时仍各自拿到正确结果，且总耗时接近最慢的一个"""
+    async def scenario(client):
+        delays = [0.8, 0.2, 0.5, 0.1, 0.6, 0.3]
+        started = time.time()
+        responses = await asyncio.gather(*[
+            client.call_tool('fake', 'echo', {'value': i, 'delay': delay})
+            for i, delay in enumerate(delays)
+        ])
+        elapsed = time.time() - started
+
+        assert [r.data for r in responses] == [{'echo': i} for i in range(len(delays))]
+        assert all(r.success for r in responses)
+        assert elapsed < sum(delays) / 2, f"调用未并行执行，耗时 {elapsed:.2f}秒"
+
+        failed = await client.call_tool('fake', 'echo', {'value': 0, 'fail': True})
+        assert not failed.success and failed.error == 'boom'
+        assert client.active_servers['fake']['connection'].stderr_tail
+        print(f"✅ 并发调用关联测试通过（{len(delays)} 个调用耗时 {elapsed:.2f}秒）")
+
+    run_with_server(scenario)
+
+
+def test_timeout_does_not_poison_connection():
+    """测试超时的调用被移出等待表，其迟到响应不会被后续调用误收"""
+    async def scenario(client):
+        connection = client.active_servers['fake']['connection']
+        slow = await client.call_tool('fake', 'echo', {'value': 'slow', 'delay': 0.5}, timeout=0.1)
+        assert not slow.success and '超时' in slow.error
+        assert connection.in_flight == 0
+
+        fast = await client.call_tool('fake', 'echo', {'value': 'fast', 'delay': 0.6})
+        assert fast.success and fast.data == {'echo': 'fast'}
+
+        # 停止服务器时在途请求立即失败
+        pending = asyncio.create_task(client.call_tool('fake', 'echo', {'value': 'x', 'delay': 5}))
+        await asyncio.sleep(0.1)
+        await client.stop_server('fake')
+        response = await asyncio.wait_for(pending, timeout=2)
+        assert not response.success
+        print("✅ 超时取消测试通过")
+
+    run_with_server(scenario)
+
+
+if __name__ == "__main__":
+    print("🧪 测试MCP stdio多路复用\n")
+    test_concurrent_calls_are_correlated()
+    test_timeout_does_not_poison_connection()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+测试MCP服务器池
+验证并行启动、以initialize握手判定就绪、按需启动、空闲回收以及启动失败的快速返回
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+import textwrap
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.mcp.client import MCPClient
+from app.mcp.config import MCPConfig, MCPServerConfig
+
+# 启动时先模拟导入耗时，再应答initialize和tools/call
+FAKE_SERVER = textwrap.dedent('''
+    import sys, json, time, os
+    time.sleep(float(sys.argv[1]))
+    for line in sys.stdin:
+        request = json.loads(line)
+        if "id" not in request:
+            continue
+        if request["method"] == "initialize":
+            result = {"protocolVersion": "2024-11-05", "capabilities": {"tools": {}},
+                      "serverInfo": {"name": "fake", "version": "0.1"}}
+        else:
+            result = {"pid": os.getpid()}
+        print(json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": result}), flush=True)
+''')
+
+
+def server_config(name, script, startup_delay=0.0, **kwargs):
+    return MCPServerConfig(name=name, description=name, command=sys.executable,
+                           args=[script, str(startup_delay)], **kwargs)
+
+
+def run(scenario):
+    with tempfile.TemporaryDirectory() as tmp:
+        script = os.path.join(tmp, 'fake_server.py')
+        with open(script, 'w') as f:
+            f.write(FAKE_SERVER)
+        asyncio.run(scenario(script))
+
+
+def test_parallel_start_with_handshake():
+    """测试多个服务器并行启动，就绪时间取决于握手而不是固定等待"""
+    async def scenario(script):
+        client = MCPClient(MCPConfig(servers={
+            f's{i}': server_config(f's{i}', script, startup_delay=0.5) for i in range(3)
+        }))
+        started = time.time()
+        await client.initialize()
+        elapsed = time.time() - started
+        try:
+            assert set(client.active_servers) == {'s0', 's1', 's2'}
+            assert elapsed < 1.4, f"服务器未并行启动，耗时 {elapsed:.2f}秒"
+            assert client.active_servers['s0']['server_info']['server'] == {'name': 'fake', 'version': '0.1'}
+        finally:
+            await client.shutdown()
+        print(f"✅ 并行启动测试通过（3个服务器耗时 {elapsed:.2f}秒）")
+
+    run(scenario)
+
+
+def test_lazy_start_and_idle_shutdown():
+    """测试按需启动的服务器首次调用时启动，空闲超时后停止，再次调用时重新启动"""
+    async def scenario(script):
+        client = MCPClient(MCPConfig(servers={
+            'lazy': server_config('lazy', script, lazy_start=True, idle_timeout=2)
+        }))
+        await client.initialize()
+        try:
+            assert 'lazy' not in client.active_servers
+            assert (await client.get_server_status('lazy'))['status'] == 'idle'
+            assert 'lazy' in await client.list_servers()
+
+            first, second = await asyncio.gather(
+                client.call_tool('lazy', 'whoami', {}),
+                client.call_tool('lazy', 'whoami', {}))
+            assert first.success and first.data == second.data, "并发的首次调用应只启动一个进程"
+
+            await asyncio.sleep(3.5)
+            assert 'lazy' not in client.active_servers, "空闲超时后应停止进程"
+
+            third = await client.call_tool('lazy', 'whoami', {})
+            assert third.success and third.data != first.data
+        finally:
+            await client.shutdown()
+        print("✅ 按需启动与空闲回收测试通过")
+
+    run(scenario)
+
+
+def test_failed_start_returns_quickly():
+    """测试启动即退出的服务器不会等到握手超时"""
+    async def scenario(script):
+        broken = MCPServerConfig(name='broken', description='broken', command=sys.executable,
+                                 args=['-c', 'import sys; sys.stderr.write("boom\\n"); sys.exit(3)'])
+        client = MCPClient(MCPConfig(servers={'broken': broken}))
+        started = time.time()
+        await client.initialize()
+        assert 'broken' not in client.active_servers
+        assert time.time() - started < 5
+        response = await client.call_tool('broken', 'anything', {})
+        assert not response.success
+        await client.shutdown()
+        print("✅ 启动失败测试通过")
+
+    run(scenario)
+
+
+if __name__ == "__main__":
+    print("🧪 测试MCP服务器池\n")
+    test_parallel_start_with_handshake()
+    test_lazy_start_and_idle_shutdown()
+    test_failed_start_returns_quickly()
+    print("\n🎉 所有测试完成")
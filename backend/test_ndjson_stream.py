@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+测试NDJSON流式输出
+验证事件到达即输出、任务结束后输出结果行，以及生成器关闭时取消后台任务
+"""
+
+import sys
+import os
+import json
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.api.port_scan import PortScanRequest, stream_port_scan
+from app.services.ndjson_stream import stream_ndjson
+
+
+def test_events_then_result():
+    """测试事件按顺序逐行输出，最后一行为结果，任务异常由result_line处理"""
+
+    async def work(emit, fail=False):
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            emit({"type": "step", "index": i})
+        if fail:
+            raise RuntimeError("boom")
+        return {"total": 3}
+
+    def result_line(task):
+        try:
+            return {"type": "result", "success": True, "data": task.result()}
+        except Exception as e:
+            return {"type": "result", "success": False, "details": str(e)}
+
+    async def collect(fail):
+        return [json.loads(line) async for line in stream_ndjson(lambda emit: work(emit, fail), result_line)]
+
+    lines = asyncio.run(collect(False))
+    assert [line.get("index") for line in lines[:3]] == [0, 1, 2]
+    assert lines[-1] == {"type": "result", "success": True, "data": {"total": 3}}
+    failed = asyncio.run(collect(True))
+    assert len(failed) == 4 and failed[-1]["details"] == "boom"
+    print("✅ 事件与结果行测试通过")
+
+
+def test_close_cancels_task():
+    """测试客户端断开（生成器关闭）时后台任务被取消"""
+
+    async def scenario():
+        state = {"cancelled": False}
+
+        async def work(emit):
+            emit({"type": "started"})
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+        stream = stream_ndjson(work, lambda task: {"type": "result"})
+        first = await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0)
+        return json.loads(first), state
+
+    first, state = asyncio.run(scenario())
+    assert first == {"type": "started"} and state["cancelled"]
+    print("✅ 关闭生成器取消任务测试通过")
+
+
+def test_port_scan_stream_over_loopback():
+    """测试端口扫描的流式接口：开放端口逐行输出，最后一行为扫描结果"""
+
+    async def scenario():
+        server = await asyncio.start_server(lambda r, w: w.close(), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            request = PortScanRequest(target='127.0.0.1', ports=[port], timeout=1)
+            return port, [json.loads(line) async for line in stream_port_scan(request, [port], False)]
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    port, lines = asyncio.run(scenario())
+    assert lines[0]["type"] == "open" and lines[0]["port"] == port
+    assert lines[-1]["type"] == "result" and lines[-1]["success"]
+    print("✅ 端口扫描流式接口测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试NDJSON流式输出\n")
+    test_events_then_result()
+    test_close_cancels_task()
+    test_port_scan_stream_over_loopback()
+    print("\n🎉 所有测试完成")
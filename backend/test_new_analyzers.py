@@ -9,6 +9,18 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.services.game_traffic_analyzer import GameTrafficAnalyzer
 from app.services.interconnection_analyzer import InterconnectionAnalyzer
+from app.services.packet_table import PacketTable
+
+FIELDS = ['ip.src', 'ip.dst', 'udp.srcport', 'udp.dstport', 'frame.len', 'frame.time_relative', 'frame.protocols']
+
+
+def packet_table(packets, protocols='eth:ethertype:ip:udp:data'):
+    """把模拟的数据包转换为列式数据包表"""
+    return PacketTable.from_rows(FIELDS, [
+        [p['src_ip'], p['dst_ip'], str(p['src_port']), str(p['dst_port']), str(p['size']), str(p['time']), protocols]
+        for p in packets
+    ])
+
 
 def test_game_analyzer():
     """测试游戏流量分析器"""
@@ -94,11 +106,11 @@ def test_game_traffic_patterns():
     ]
     
     print("\n🎮 游戏流量测试:")
-    game_flows = analyzer._analyze_traffic_patterns(game_packets)
+    game_flows = analyzer._identify_game_traffic(packet_table(game_packets))
     print(f"  检测到 {len(game_flows)} 个游戏流量")
     
     print("\n🌐 网页流量测试:")
-    web_flows = analyzer._analyze_traffic_patterns(web_packets)
+    web_flows = analyzer._identify_game_traffic(packet_table(web_packets))
     print(f"  检测到 {len(web_flows)} 个游戏流量")
     
     print("✅ 流量模式识别测试完成\n")
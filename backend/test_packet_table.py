@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+测试列式数据包表
+验证类型化列、字符串驻留以及游戏/互联互通分析器的列式聚合
+"""
+
+import sys
+import os
+import math
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.packet_table import PacketTable
+from app.services.game_traffic_analyzer import GameTrafficAnalyzer
+from app.services.interconnection_analyzer import InterconnectionAnalyzer
+
+FIELDS = ['frame.time_relative', 'frame.len', 'frame.protocols', 'ip.src', 'ip.dst',
+          'tcp.dstport', 'tcp.analysis.ack_rtt', 'udp.srcport', 'udp.dstport', 'dns.resp.code']
+
+
+def udp_rows(src, dst, sport, dport, size, count, start=0.0, step=0.05):
+    """生成一条双向UDP流"""
+    rows = []
+    for i in range(count):
+        t = f"{start + i * step:.3f}"
+        if i % 2 == 0:
+            rows.append([t, str(size), 'eth:ethertype:ip:udp:data', src, dst, '', '', str(sport), str(dport), ''])
+        else:
+            rows.append([t, str(size), 'eth:ethertype:ip:udp:data', dst, src, '', '', str(dport), str(sport), ''])
+    return rows
+
+
+def test_typed_columns():
+    """测试列类型和缺失值约定"""
+    table = PacketTable.from_rows(FIELDS, [
+        ['0.5', '60', 'eth:ethertype:ip:tcp', '10.0.0.1', '10.0.0.2', '443', '0.012', '', '', ''],
+        ['0.6', '90', 'eth:ethertype:ip:udp:dns', '10.0.0.1', '8.8.8.8', '', '', '5353', '53', '3'],
+    ])
+
+    assert len(table) == 2
+    assert table.time_relative.typecode == 'd'
+    assert table.length.typecode == 'I'
+    assert table.tcp_dstport.tolist() == [443, 0]
+    assert table.ack_rtt[0] == 0.012 and math.isnan(table.ack_rtt[1])
+    assert table.dns_resp_code.tolist() == [-1, 3]
+
+    # 相同IP只驻留一次
+    assert table.src_ip[0] == table.src_ip[1]
+    assert table.addresses[table.dst_ip[1]] == '8.8.8.8'
+    assert table.top_protocol_counts() == {'TCP': 1, 'DNS': 1}
+    print(f"✅ 类型化列测试通过（列数据 {table.nbytes()} 字节）")
+
+
+def test_game_flow_aggregation():
+    """测试游戏分析器基于列式表的流聚合"""
+    rows = udp_rows('192.168.1.100', '111.13.101.208', 12345, 7000, 120, 80)
+    rows += udp_rows('192.168.1.100', '172.64.147.26', 54321, 443, 1200, 30)
+    table = PacketTable.from_rows(FIELDS, rows)
+
+    analyzer = GameTrafficAnalyzer()
+    flows = analyzer._aggregate_udp_flows(table)
+    assert sorted(f['packet_count'] for f in flows) == [30, 80]
+
+    game_flows = analyzer._identify_game_traffic(table)
+    assert len(game_flows) == 1
+    assert game_flows[0]['dst_ip'] == '111.13.101.208'
+
+    result = analyzer.analyze_game_traffic(table)
+    assert result['game_traffic_detected']
+    assert result['analysis_summary']['china_mobile_servers'] == 1
+    print("✅ 游戏流聚合测试通过")
+
+
+def test_interconnection_aggregation():
+    """测试互联互通分析器按目标IP聚合"""
+    rows = [
+        [str(i * 0.1), '60', 'eth:ethertype:ip:tcp', '192.168.1.100', '116.211.167.14',
+         '443', '0.080' if i % 2 else '', '', '', '']
+        for i in range(12)
+    ]
+    table = PacketTable.from_rows(FIELDS, rows)
+
+    analyzer = InterconnectionAnalyzer()
+    connections = analyzer._analyze_network_connections(table)
+    stats = connections['116.211.167.14']
+    assert stats['packet_count'] == 12
+    assert stats['latency_samples'] == 6
+
+    servers = analyzer._identify_remote_servers(connections)
+    assert servers[0]['isp_type'] == 'china_telecom'
+    assert round(servers[0]['avg_latency'], 1) == 80.0
+    print("✅ 互联互通聚合测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试列式数据包表\n")
+    test_typed_columns()
+    test_game_flow_aggregation()
+    test_interconnection_aggregation()
+    print("\n🎉 所有测试完成")
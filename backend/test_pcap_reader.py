@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+测试原生pcap解析器
+用struct手工构造pcap/pcapng文件，验证协议解码、TCP/DNS分析字段以及无tshark时的增强分析
+"""
+
+import sys
+import os
+import math
+import socket
+import struct
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.pcap_reader import read_pcap
+from app.api import capture
+
+CLIENT = '192.168.1.100'
+SERVER = '93.184.216.34'
+RESOLVER = '8.8.8.8'
+
+
+def ethernet(payload: bytes, ethertype: int = 0x0800) -> bytes:
+    return b'\x02' * 6 + b'\x04' * 6 + struct.pack('>H', ethertype) + payload
+
+
+def ipv4(src: str, dst: str, proto: int, payload: bytes) -> bytes:
+    header = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(payload), 0, 0, 64, proto, 0,
+                         socket.inet_aton(src), socket.inet_aton(dst))
+    return header + payload
+
+
+def tcp(src, dst, sport, dport, seq, ack, flags, payload=b''):
+    header = struct.pack('>HHIIHHHH', sport, dport, seq, ack, (5 << 12) | flags, 65535, 0, 0)
+    return ethernet(ipv4(src, dst, 6, header + payload))
+
+
+def udp(src, dst, sport, dport, payload):
+    header = struct.pack('>HHHH', sport, dport, 8 + len(payload), 0)
+    return ethernet(ipv4(src, dst, 17, header + payload))
+
+
+def dns_message(transaction_id: int, name: str, response: bool = False, rcode: int = 0) -> bytes:
+    flags = (0x8180 | rcode) if response else 0x0100
+    qname = b''.join(bytes([len(p)]) + p.encode() for p in name.split('.')) + b'\x00'
+    return struct.pack('>HHHHHH', transaction_id, flags, 1, 0, 0, 0) + qname + b'\x00\x01\x00\x01'
+
+
+def client_hello(server_name: str) -> bytes:
+    name = server_name.encode()
+    sni = struct.pack('>HBH', len(name) + 3, 0, len(name)) + name
+    extensions = struct.pack('>HH', 0, len(sni)) + sni
+    body = (b'\x03\x03' + b'\x00' * 32 + b'\x00' + struct.pack('>H', 2) + b'\x13\x01'
+            + b'\x01\x00' + struct.pack('>H', len(extensions)) + extensions)
+    handshake = b'\x01' + len(body).to_bytes(3, 'big') + body
+    return b'\x16\x03\x01' + struct.pack('>H', len(handshake)) + handshake
+
+
+def sample_frames():
+    """(时间, 帧) 列表：TLS握手+重传、DNS查询/响应、HTTP请求"""
+    hello = client_hello('example.com')
+    http = b'GET / HTTP/1.1\r\nHost: www.example.cn\r\nAccept: */*\r\n\r\n'
+    return [
+        (100.000, tcp(CLIENT, SERVER, 50000, 443, 1000, 0, 0x02)),
+        (100.030, tcp(SERVER, CLIENT, 443, 50000, 5000, 1001, 0x12)),
+        (100.031, tcp(CLIENT, SERVER, 50000, 443, 1001, 5001, 0x10)),
+        (100.032, tcp(CLIENT, SERVER, 50000, 443, 1001, 5001, 0x18, hello)),
+        (100.062, tcp(SERVER, CLIENT, 443, 50000, 5001, 1001 + len(hello), 0x10)),
+        (100.500, tcp(CLIENT, SERVER, 50000, 443, 1001, 5001, 0x18, hello)),
+        (101.000, udp(CLIENT, RESOLVER, 40000, 53, dns_message(0x1234, 'missing.example.com'))),
+        (101.050, udp(RESOLVER, CLIENT, 53, 40000, dns_message(0x1234, 'missing.example.com', True, 3))),
+        (102.000, tcp(CLIENT, SERVER, 50001, 80, 1, 1, 0x18, http)),
+    ]
+
+
+def write_pcap(path, frames, truncate_last: bool = False):
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for ts, frame in frames:
+            sec, usec = int(ts), round((ts - int(ts)) * 1e6)
+            f.write(struct.pack('<IIII', sec, usec, len(frame), len(frame)))
+            f.write(frame)
+        if truncate_last:
+            f.write(struct.pack('<IIII', 103, 0, 60, 60) + b'\x00' * 10)
+
+
+def write_pcapng(path, frames):
+    """纳秒时间精度的pcapng文件"""
+    def block(block_type, body):
+        body += b'\x00' * (-len(body) % 4)
+        length = len(body) + 12
+        return struct.pack('<II', block_type, length) + body + struct.pack('<I', length)
+
+    with open(path, 'wb') as f:
+        f.write(block(0x0a0d0d0a, struct.pack('<IHHq', 0x1a2b3c4d, 1, 0, -1)))
+        tsresol = struct.pack('<HHB', 9, 1, 9) + b'\x00' * 3 + struct.pack('<HH', 0, 0)
+        f.write(block(1, struct.pack('<HHI', 1, 0, 65535) + tsresol))
+        for ts, frame in frames:
+            stamp = round(ts * 1e9)
+            f.write(block(6, struct.pack('<IIIII', 0, stamp >> 32, stamp & 0xffffffff,
+                                         len(frame), len(frame)) + frame))
+
+
+def test_decode_pcap():
+    """测试pcap解码出与tshark相同语义的列"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sample.pcap')
+        write_pcap(path, sample_frames(), truncate_last=True)
+        table = read_pcap(path)
+
+    assert len(table) == 9, "截断的最后一条记录应被忽略"
+    stacks = [table.protocol_stacks[code] for code in table.protocols]
+    assert stacks[0] == 'eth:ethertype:ip:tcp'
+    assert stacks[3] == 'eth:ethertype:ip:tcp:tls'
+    assert stacks[6] == 'eth:ethertype:ip:udp:dns'
+    assert stacks[8] == 'eth:ethertype:ip:tcp:http'
+    assert table.addresses[table.dst_ip[0]] == SERVER
+    assert table.tcp_flags[1] == 0x12
+
+    # TCP分析
+    assert round(table.initial_rtt[2], 3) == 0.031
+    assert round(table.ack_rtt[4], 3) == 0.030
+    assert table.retransmission.tolist() == [0, 0, 0, 0, 0, 1, 0, 0, 0]
+    assert math.isnan(table.ack_rtt[0])
+
+    # 应用层
+    assert table.strings[table.tls_sni[3]] == 'example.com'
+    assert table.strings[table.dns_qry_name[6]] == 'missing.example.com'
+    assert table.dns_resp_code[6] == -1 and table.dns_resp_code[7] == 3
+    assert round(table.dns_time[7], 3) == 0.050
+    assert table.strings[table.http_method[8]] == 'GET'
+    assert table.strings[table.http_host[8]] == 'www.example.cn'
+    print(f"✅ pcap解码测试通过（{len(table)} 个包）")
+
+
+def test_pcapng_matches_pcap():
+    """测试pcapng与pcap解析结果一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        pcap_path = os.path.join(tmp, 'sample.pcap')
+        pcapng_path = os.path.join(tmp, 'sample.pcapng')
+        write_pcap(pcap_path, sample_frames())
+        write_pcapng(pcapng_path, sample_frames())
+        legacy, ng = read_pcap(pcap_path), read_pcap(pcapng_path)
+
+    assert len(ng) == len(legacy)
+    assert ng.protocols.tolist() == legacy.protocols.tolist()
+    assert ng.retransmission.tolist() == legacy.retransmission.tolist()
+    assert [round(t, 6) for t in ng.time_relative] == [round(t, 6) for t in legacy.time_relative]
+    print("✅ pcapng解析测试通过")
+
+
+def test_enhanced_analysis_without_tshark():
+    """测试tshark不可用时增强分析使用原生解析器"""
+    original = capture.get_tshark_command
+    capture.get_tshark_command = lambda *args, **kwargs: None
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'sample.pcap')
+            write_pcap(path, sample_frames())
+            summary = capture.preprocess_pcap(path, 'dns_resolution')
+            dns = capture.analyze_dns_issues(path)
+    finally:
+        capture.get_tshark_command = original
+
+    assert summary['parsing_method'] == 'native_pcap_analysis'
+    assert summary['enhanced_analysis']['basic_stats']['total_packets'] == 9
+    assert dns['failed_queries'] == 1 and dns['dns_queries'] == 1
+    print("✅ 无tshark增强分析测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试原生pcap解析器\n")
+    test_decode_pcap()
+    test_pcapng_matches_pcap()
+    test_enhanced_analysis_without_tshark()
+    print("\n🎉 所有测试完成")
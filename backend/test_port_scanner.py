@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+测试异步端口扫描器
+在本机开放几个端口，验证范围扫描、banner读取、自适应窗口以及UDP关闭端口识别
+"""
+
+import sys
+import os
+import time
+import socket
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import port_scanner
+from app.services.port_scanner import FILTERED_SAMPLE_LIMIT, AdaptiveWindow, parse_port_spec, scan_ports, iter_scan
+
+
+def test_parse_port_spec():
+    """测试端口范围解析"""
+    assert parse_port_spec("22, 80,8000-8002,80") == [22, 80, 8000, 8001, 8002]
+    assert len(parse_port_spec("1-65535")) == 65535
+    try:
+        parse_port_spec("0-10")
+        assert False, "应拒绝超出范围的端口"
+    except ValueError:
+        pass
+    print("✅ 端口范围解析测试通过")
+
+
+def test_adaptive_window():
+    """测试有响应时窗口增长，同一周期内的多次超时只减半一次"""
+    async def scenario():
+        window = AdaptiveWindow(initial=64, minimum=8, maximum=128, backoff_interval=10)
+        for _ in range(10):
+            await window.acquire()
+            await window.release(timed_out=False)
+        assert window.limit == 74 and window.peak == 74
+
+        for _ in range(5):
+            await window.acquire()
+            await window.release(timed_out=True)
+        assert window.limit == 37 and window.timeouts == 5
+
+        # 窗口已满时acquire等待
+        window.limit = 1
+        await window.acquire()
+        waiter = asyncio.create_task(window.acquire())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        await window.release(timed_out=False)
+        await asyncio.wait_for(waiter, timeout=1)
+
+    asyncio.run(scenario())
+    print("✅ 自适应窗口测试通过")
+
+
+def test_scan_local_range():
+    """测试扫描本机一段端口范围，开放端口带banner，关闭端口快速返回"""
+    async def scenario():
+        async def greet(reader, writer):
+            writer.write(b"SSH-2.0-FakeServer\r\n")
+            await writer.drain()
+            writer.close()
+
+        servers = [await asyncio.start_server(greet, '127.0.0.1', 0) for _ in range(3)]
+        open_ports = sorted(s.sockets[0].getsockname()[1] for s in servers)
+        low, high = max(1, open_ports[0] - 1000), min(65535, open_ports[-1] + 1000)
+        ports = parse_port_spec(f"{low}-{high}")
+
+        found = []
+        started = time.time()
+        try:
+            data = await scan_ports('localhost', ports, timeout=2,
+                                    on_result=lambda r: r['status'] == 'open' and found.append(r['port']),
+                                    include_closed=False)
+        finally:
+            for server in servers:
+                server.close()
+        return data, open_ports, found, time.time() - started, len(ports)
+
+    data, open_ports, found, elapsed, total = asyncio.run(scenario())
+    assert data['target_ip'] == '127.0.0.1'
+    # 本机其他服务也可能在这段范围内监听
+    scanned = {r['port']: r for r in data['open_ports']}
+    assert set(open_ports) <= set(scanned)
+    assert set(found) == set(scanned), "开放端口应在扫描过程中逐个回调"
+    assert all(scanned[port]['banner'] == 'SSH-2.0-FakeServer' for port in open_ports)
+    assert data['summary']['closed_count'] + len(scanned) + data['summary']['filtered_count'] == total
+    assert data['closed_ports'] == []
+    assert data['summary']['peak_concurrency'] > 256
+    print(f"✅ 本机范围扫描测试通过（{total} 个端口耗时 {elapsed:.2f}秒）")
+
+
+def test_udp_closed_port():
+    """测试本机UDP关闭端口通过ICMP端口不可达识别为closed"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    async def scenario():
+        return [r async for r in iter_scan('127.0.0.1', [port], 'udp', timeout=1)]
+
+    results = asyncio.run(scenario())
+    assert results[0]['status'] == 'closed'
+    print("✅ UDP端口探测测试通过")
+
+
+def test_filtered_ports_sample():
+    """测试不保留关闭端口明细时，过滤端口只保留有限的明细但计数完整"""
+    ports = list(range(1, FILTERED_SAMPLE_LIMIT * 3 + 1))
+
+    async def probe_timeout(ip, port, timeout):
+        return {"port": port, "status": "timeout", "service": "", "response_time": timeout * 1000}
+
+    original_probe = port_scanner.probe_tcp
+    port_scanner.probe_tcp = probe_timeout
+    try:
+        data = asyncio.run(scan_ports('127.0.0.1', ports, timeout=0.3, include_closed=False))
+    finally:
+        port_scanner.probe_tcp = original_probe
+    assert data['summary']['filtered_count'] == len(ports)
+    assert [r['port'] for r in data['filtered_ports']] == ports[:FILTERED_SAMPLE_LIMIT]
+    print("✅ 过滤端口明细限制测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试异步端口扫描器\n")
+    test_parse_port_spec()
+    test_adaptive_window()
+    test_scan_local_range()
+    test_udp_closed_port()
+    test_filtered_ports_sample()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+测试AI分析prompt的抓包数据压缩
+构造包含大量网站的抓包摘要，验证prompt大小受token预算限制、按诊断价值保留网站、
+其余网站汇总，以及域名筛选后的prompt
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.ai_analysis_service import AIAnalysisService
+from app.services.prompt_compactor import compact_capture_summary, estimate_tokens
+
+
+def make_summary(site_count: int) -> dict:
+    """模拟website_access抓包摘要：大部分网站正常，少数出错或延迟高"""
+    performance = {}
+    visits = {}
+    for i in range(site_count):
+        domain = f"site{i:03d}.example.com"
+        performance[domain] = {
+            'ips': [f"10.0.{i // 250}.{i % 250}"],
+            'tcp_rtt': {'avg_ms': 20.0 + i % 7, 'min_ms': 15.0, 'max_ms': 40.0, 'samples': 12},
+            'requests': {'total': 0, 'errors': 0, 'error_rate_percent': 0, 'error_codes': {}},
+            'protocol': 'HTTPS',
+            'access_duration_seconds': 1.5
+        }
+        visits[domain] = 30 - i % 30
+    performance['broken.example.com'] = {
+        'ips': ['10.9.0.1'], 'tcp_rtt': {'avg_ms': 35.0, 'min_ms': 30.0, 'max_ms': 50.0, 'samples': 4},
+        'requests': {'total': 20, 'errors': 8, 'error_rate_percent': 40.0, 'error_codes': {'502': 8}},
+        'protocol': 'HTTP', 'access_duration_seconds': 3.0
+    }
+    performance['slow.example.com'] = {
+        'ips': ['10.9.0.2', '10.9.0.3'], 'tcp_rtt': {'avg_ms': 480.0, 'min_ms': 200.0, 'max_ms': 1200.0, 'samples': 9},
+        'requests': {'total': 0, 'errors': 0, 'error_rate_percent': 0, 'error_codes': {}},
+        'protocol': 'HTTPS', 'access_duration_seconds': 8.0
+    }
+    return {
+        'enhanced_analysis': {
+            'basic_stats': {
+                'total_packets': 52000,
+                'protocols': {'TCP': 30000, 'TLS': 15000, 'DNS': 4000, 'UDP': 3000},
+                'time_range': {'start': 1700000000.0, 'end': 1700000030.0, 'duration': 30.0},
+                'packet_sizes': {'min': 54, 'max': 1514, 'avg': 812.4},
+                'data_volume': {'total_bytes': 42244800, 'avg_rate': 1408160.0}
+            },
+            'network_behavior': {'connection_summary': {'unique_destinations': site_count + 2}},
+            'performance_indicators': {
+                'latency_indicators': {'avg_rtt_ms': 31.2, 'min_rtt_ms': 0.4, 'max_rtt_ms': 1200.0, 'rtt_samples': 9000},
+                'error_rates': {'retransmissions': 140, 'duplicate_acks': 60, 'fast_retransmissions': 12}
+            },
+            'anomaly_detection': {'error_indicators': ['DNS查询失败: 3 次'], 'performance_issues': [],
+                                  'suspicious_patterns': [], 'security_concerns': []},
+            'http_analysis': {'websites_accessed': visits, 'connection_summary': {'total_websites': site_count + 2}},
+            'issue_specific_insights': {
+                'website_performance': performance,
+                'performance_issues': ['📡 slow.example.com: 网络延迟高 (平均480.0ms)',
+                                       '❌ broken.example.com: 错误率高 (40.0%)'],
+                'response_summary': {'websites_accessed': site_count + 2, 'total_requests': 20, 'total_errors': 8}
+            },
+            'diagnostic_clues': ['🐌 检测到高延迟网站'],
+            'parsing_method': 'native_pcap_analysis'
+        },
+        'statistics': {'total_packets': 52000},
+        'file_size': 45000000
+    }
+
+
+def test_compaction_respects_budget_and_ranks_sites():
+    """测试网站很多时压缩结果不超过预算，问题网站排在最前，其余汇总"""
+    summary = make_summary(300)
+    raw_tokens = estimate_tokens(json.dumps(summary, indent=2, ensure_ascii=False))
+    text, info = compact_capture_summary(summary, budget=1500)
+
+    assert info['estimated_tokens'] <= 1500, info
+    assert raw_tokens > 10 * info['estimated_tokens'], (raw_tokens, info)
+    assert info['sites_total'] == 302 and 3 <= info['sites_shown'] < 302 and info['truncated']
+
+    lines = text.split('\n')
+    header = lines.index('域名|协议|IP数|RTT平均/最小/最大ms|样本|访问次数|请求|错误率%|错误码')
+    assert lines[header + 1].startswith('broken.example.com|HTTP|1|35/30/50|4|-|20|40|502x8')
+    assert lines[header + 2].startswith('slow.example.com|HTTPS|2|480/200/1200')
+    assert f"其余{302 - info['sites_shown']}个网站" in text
+    assert 'DNS查询失败: 3 次' in text and '重传140' in text and '时长30秒' in text
+    print(f"✅ 预算与排序测试通过（原始JSON约 {raw_tokens} tokens，压缩后 {info['estimated_tokens']} tokens，"
+          f"列出 {info['sites_shown']}/{info['sites_total']} 个网站）")
+
+
+def test_small_capture_keeps_everything():
+    """测试数据量小时完整保留所有网站和未识别的数据"""
+    summary = make_summary(3)
+    summary['enhanced_analysis']['network_quality'] = {'avg_rtt': 45.5, 'packet_loss_rate': 0.02}
+    text, info = compact_capture_summary(summary, budget=4000)
+    assert info['sites_shown'] == info['sites_total'] == 5 and not info['truncated']
+    assert '其余' not in text
+    assert '"network_quality":{"avg_rtt":45.5,"packet_loss_rate":0.02}' in text
+    print("✅ 小数据完整保留测试通过")
+
+
+def test_prompt_budget_and_filters():
+    """测试完整prompt的token估算在预算附近，域名筛选后只包含筛选的网站"""
+    service = AIAnalysisService()
+    service.prompt_token_budget = 3000
+    summary = make_summary(500)
+
+    prompt, stats = service._build_analysis_prompt('website_access', summary, '网页打开慢')
+    assert stats['prompt_tokens'] == estimate_tokens(prompt)
+    assert stats['prompt_tokens'] <= 3000 * 1.05, stats
+    assert '"diagnosis"' in prompt and 'broken.example.com' in prompt
+
+    prompt, stats = service._build_analysis_prompt('website_access', summary, None,
+                                                   filtered_domains=['slow.example.com', 'site001.example.com'])
+    assert stats['sites_total'] == 2 and not stats['truncated']
+    assert 'slow.example.com|' in prompt and 'broken.example.com|' not in prompt
+    assert service._generate_analysis_prompt('website_access', summary) == \
+        service._build_analysis_prompt('website_access', summary)[0]
+    print(f"✅ prompt预算与筛选测试通过（500个网站的prompt约 {estimate_tokens(prompt)} tokens）")
+
+
+if __name__ == "__main__":
+    print("🧪 测试AI分析prompt的抓包数据压缩\n")
+    test_compaction_respects_budget_and_ranks_sites()
+    test_small_capture_keeps_everything()
+    test_prompt_budget_and_filters()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+测试后台网络质量监控
+验证环形缓冲区窗口查询、1m汇总与持久化恢复、多目标并发探测以及WebSocket订阅推送
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.quality_monitor import NetworkQualityMonitor, RingBuffer, summarize_rtts
+import app.api.network_quality as network_quality_api
+
+
+def test_ring_buffer_window():
+    """测试环形缓冲区覆盖最旧数据后，按时间窗口查询仍然正确"""
+    buffer = RingBuffer(5)
+    for ts in range(1, 9):
+        buffer.append(summarize_rtts(float(ts), [ts * 1.0, None]))
+    assert buffer.size == 5
+    series = buffer.window()
+    assert series['timestamp'] == [4.0, 5.0, 6.0, 7.0, 8.0]
+    assert series['latency'] == [4.0, 5.0, 6.0, 7.0, 8.0] and series['loss'] == [50.0] * 5
+    assert buffer.window(5, 7)['timestamp'] == [5.0, 6.0, 7.0]
+    assert buffer.window(limit=2)['timestamp'] == [7.0, 8.0]
+    assert buffer.window(100)['timestamp'] == []
+
+    lost = summarize_rtts(9.0, [None, None])
+    buffer.append(lost)
+    assert buffer.last()['latency'] is None and buffer.last()['loss'] == 100.0
+    print("✅ 环形缓冲区窗口查询测试通过")
+
+
+def test_rollups_persist_and_reload():
+    """测试跨分钟边界时产出1m汇总、写入SQLite，重启后从数据库恢复"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'quality.db')
+
+        async def first_run():
+            monitor = NetworkQualityMonitor(db_path)
+            published = []
+            monitor.add_listener(lambda target, resolution, row: published.append((resolution, row)))
+            monitor_target = monitor.add_target('192.0.2.10', interval=1)
+            base = 1_700_000_040.0  # 整分钟
+            for i in range(60):
+                monitor.record(monitor_target, summarize_rtts(base + i, [10.0, 20.0] if i % 2 else [30.0, None]))
+            monitor.record(monitor_target, summarize_rtts(base + 60, [5.0]))
+            await monitor.stop()
+            return published, base
+
+        published, base = asyncio.run(first_run())
+        rollups = [row for resolution, row in published if resolution == '1m']
+        assert len(rollups) == 1
+        rollup = rollups[0]
+        assert rollup['timestamp'] == base
+        assert rollup['sent'] == 120 and rollup['received'] == 90
+        assert rollup['loss'] == 25.0
+        # 按回复数加权：30个样本各2个回复（均值15），30个样本各1个回复（30）
+        assert rollup['latency'] == 20.0
+        assert (rollup['min'], rollup['max']) == (10.0, 30.0)
+
+        async def second_run():
+            monitor = NetworkQualityMonitor(db_path)
+            await monitor.start()
+            try:
+                return monitor.query('192.0.2.10', '1m')
+            finally:
+                await monitor.stop()
+
+        restored = asyncio.run(second_run())
+        # 停止时未完成的那一分钟也已保存，其周期早已结束，作为该分钟的汇总恢复
+        assert restored['series']['timestamp'] == [base, base + 60]
+        assert restored['series']['latency'] == [rollup['latency'], 5.0]
+    print("✅ 汇总持久化与恢复测试通过")
+
+
+def test_partial_rollup_resumes_after_restart():
+    """测试停止时保存当前小时未完成的汇总，重启后继续累加而不是丢弃"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'quality.db')
+        hour = int(time.time() // 3600) * 3600
+
+        async def first_run():
+            monitor = NetworkQualityMonitor(db_path)
+            monitor_target = monitor.add_target('192.0.2.20', interval=1)
+            for i in range(3):
+                monitor.record(monitor_target, summarize_rtts(hour + i, [10.0, None]))
+            await monitor.stop()
+
+        async def second_run():
+            monitor = NetworkQualityMonitor(db_path)
+            await monitor.start()
+            try:
+                monitor_target = monitor.targets['192.0.2.20']
+                return monitor_target.buckets['1h'], monitor.query('192.0.2.20', '1h')
+            finally:
+                await monitor.stop()
+
+        asyncio.run(first_run())
+        bucket, restored = asyncio.run(second_run())
+
+    assert bucket.start == hour and (bucket.sent, bucket.received) == (6, 3)
+    assert bucket.to_row()['latency'] == 10.0
+    # 未结束的汇总不作为历史数据返回
+    assert restored['series']['timestamp'] == []
+    print("✅ 未完成汇总重启后继续测试通过")
+
+
+def test_background_probing_and_subscription():
+    """测试多目标并发后台探测，订阅者收到实时样本"""
+    class FakeWebSocket:
+        def __init__(self):
+            self.messages = []
+
+        async def send_json(self, message):
+            self.messages.append(message)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        async def scenario():
+            monitor = NetworkQualityMonitor(os.path.join(tmp, 'quality.db'))
+            original, network_quality_api.quality_monitor = network_quality_api.quality_monitor, monitor
+            servers = [await asyncio.start_server(lambda r, w: w.close(), host, 0)
+                       for host in ('127.0.0.1', '127.0.0.2')]
+            websocket = FakeWebSocket()
+            subscription = network_quality_api.QualitySubscription(websocket)
+            try:
+                await monitor.start()
+                for server in servers:
+                    host, port = server.sockets[0].getsockname()
+                    monitor.add_target(host, interval=0.2, probes=2, method='tcp', port=port)
+                await subscription.handle({"action": "subscribe", "targets": ["127.0.0.2"]})
+                await asyncio.sleep(1.1)
+                await subscription.handle({"action": "query", "target": "127.0.0.1", "limit": 3})
+                started = time.perf_counter()
+                series = monitor.query('127.0.0.1', '1s')['series']
+                query_time = time.perf_counter() - started
+                return monitor.status(), series, websocket.messages, query_time
+            finally:
+                subscription.close()
+                await monitor.stop()
+                for server in servers:
+                    server.close()
+                network_quality_api.quality_monitor = original
+
+        status, series, messages, query_time = asyncio.run(scenario())
+
+    assert {s['target'] for s in status} == {'127.0.0.1', '127.0.0.2'}
+    assert all(s['running'] and s['samples']['1s'] >= 4 for s in status)
+    assert len(series['timestamp']) >= 4 and all(loss == 0 for loss in series['loss'])
+    assert all(latency is not None and latency < 100 for latency in series['latency'])
+    assert query_time < 0.01
+
+    assert messages[0]['type'] == 'network_quality_subscribed'
+    updates = [m for m in messages if m['type'] == 'network_quality_update']
+    assert len(updates) >= 4 and all(m['data']['target'] == '127.0.0.2' for m in updates)
+    queried = [m for m in messages if m['type'] == 'network_quality_series']
+    assert len(queried) == 1 and len(queried[0]['data']['series']['timestamp']) == 3
+    print(f"✅ 后台探测与订阅推送测试通过（推送 {len(updates)} 条）")
+
+
+if __name__ == "__main__":
+    print("🧪 测试后台网络质量监控\n")
+    test_ring_buffer_window()
+    test_rollups_persist_and_reload()
+    test_partial_rollup_resumes_after_restart()
+    test_background_probing_and_subscription()
+    print("\n🎉 所有测试完成")
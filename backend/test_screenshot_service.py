@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+测试网站截图缓存
+用替代渲染函数代替无头浏览器，验证缓存命中与TTL过期、并发请求合并、内容哈希去重、
+磁盘占用上限以及渲染失败的处理
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.screenshot_service import ScreenshotService
+
+
+class FakeRenderer:
+    """按URL返回固定内容的PNG数据，记录渲染次数"""
+
+    def __init__(self, delay: float = 0.05, size: int = 1000):
+        self.delay = delay
+        self.size = size
+        self.calls = []
+        self.fail = False
+
+    async def __call__(self, url: str, full_page: bool) -> bytes:
+        self.calls.append((url, full_page))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("页面加载超时")
+        seed = url.encode() if not url.endswith('/same') else b'same'
+        return b'\x89PNG' + (seed * self.size)[:self.size - 4]
+
+
+def png_files(directory: str) -> list:
+    return sorted(name for name in os.listdir(directory) if name.endswith('.png'))
+
+
+def test_cache_hit_and_ttl():
+    """测试TTL内重复截图直接返回缓存，过期后重新渲染；相同内容只保存一份文件"""
+    with tempfile.TemporaryDirectory() as tmp:
+        renderer = FakeRenderer()
+        service = ScreenshotService(tmp, renderer=renderer, ttl=0.3)
+
+        async def scenario():
+            first = await service.capture("https://example.com/")
+            second = await service.capture("https://example.com/")
+            other_mode = await service.capture("https://example.com/", full_page=False)
+            await asyncio.sleep(0.35)
+            expired = await service.capture("https://example.com/")
+            a = await service.capture("https://a.example/same")
+            b = await service.capture("https://b.example/same")
+            return first, second, other_mode, expired, a, b
+
+        first, second, other_mode, expired, a, b = asyncio.run(scenario())
+        files = png_files(tmp)
+        stats = service.stats()
+
+    assert not first['cached'] and second['cached'] and second['filename'] == first['filename']
+    assert first['url'] == f"/static/website_screenshots/{first['filename']}"
+    assert not other_mode['cached'] and not expired['cached']
+    assert len(renderer.calls) == 5
+    # 内容相同的截图共用同一文件
+    assert a['filename'] == b['filename'] and len(files) == 2
+    assert stats['hits'] == 1 and stats['misses'] == 5 and stats['disk_usage'] == 2000
+    print("✅ 截图缓存与TTL测试通过")
+
+
+def test_concurrent_requests_render_once():
+    """测试同一页面的并发截图请求只渲染一次"""
+    with tempfile.TemporaryDirectory() as tmp:
+        renderer = FakeRenderer(delay=0.2)
+        service = ScreenshotService(tmp, renderer=renderer)
+
+        async def scenario():
+            started = time.time()
+            results = await asyncio.gather(*[service.capture("https://example.com/") for _ in range(5)])
+            return results, time.time() - started
+
+        results, elapsed = asyncio.run(scenario())
+
+    assert len(renderer.calls) == 1 and elapsed < 0.35
+    assert len({r['filename'] for r in results}) == 1
+    assert sum(1 for r in results if not r['cached']) == 1
+    print("✅ 并发请求合并测试通过")
+
+
+def test_disk_cap():
+    """测试截图目录超过上限时删除最旧的文件，被删除的缓存项重新渲染"""
+    with tempfile.TemporaryDirectory() as tmp:
+        # 启动前遗留的旧文件
+        with open(os.path.join(tmp, 'old.png'), 'wb') as f:
+            f.write(b'x' * 2500)
+        os.utime(os.path.join(tmp, 'old.png'), (time.time() - 3600, time.time() - 3600))
+
+        renderer = FakeRenderer(delay=0, size=1000)
+        service = ScreenshotService(tmp, renderer=renderer, max_bytes=3000)
+        assert 'old.png' in png_files(tmp)
+
+        async def scenario():
+            shots = []
+            for i in range(5):
+                shots.append(await service.capture(f"https://site{i}.example/"))
+                # 保证文件修改时间有先后
+                await asyncio.sleep(0.02)
+            again = await service.capture("https://site0.example/")
+            latest = await service.capture("https://site4.example/")
+            return shots, again, latest
+
+        shots, again, latest = asyncio.run(scenario())
+        files = png_files(tmp)
+        usage = service.disk_usage()
+
+    assert 'old.png' not in files and usage <= 3000 and len(files) == 3
+    assert not again['cached'] and latest['cached']
+    assert len(renderer.calls) == 6
+    print(f"✅ 磁盘占用上限测试通过（{usage} 字节）")
+
+
+def test_render_failure():
+    """测试渲染失败时所有等待者收到错误，失败结果不缓存"""
+    with tempfile.TemporaryDirectory() as tmp:
+        renderer = FakeRenderer(delay=0.1)
+        renderer.fail = True
+        service = ScreenshotService(tmp, renderer=renderer)
+
+        async def scenario():
+            results = await asyncio.gather(*[service.capture("https://example.com/") for _ in range(3)],
+                                           return_exceptions=True)
+            renderer.fail = False
+            retry = await service.capture("https://example.com/")
+            return results, retry
+
+        results, retry = asyncio.run(scenario())
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert not retry['cached'] and len(renderer.calls) == 2
+    print("✅ 渲染失败处理测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试网站截图缓存\n")
+    test_cache_hit_and_ttl()
+    test_concurrent_requests_render_once()
+    test_disk_cap()
+    test_render_failure()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+测试单次tshark字段提取引擎
+验证增强分析只调用一次tshark，各分析器共享同一份字段表
+"""
+
+import io
+import sys
+import os
+import subprocess
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import pcap_field_extractor
+from app.services.packet_table import PacketTable
+from app.services.pcap_field_extractor import TSHARK_FIELDS, extract_pcap_fields
+from app.api import capture
+
+
+class FakePopen:
+    """模拟tshark进程，stdout为预置文本"""
+
+    def __init__(self, cmd, stdout_text='', stderr_text='', returncode=0):
+        self.args = cmd
+        self.stdout = io.StringIO(stdout_text)
+        self.stderr = io.StringIO(stderr_text)
+        self.returncode = returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def kill(self):
+        pass
+
+
+def make_row(**values):
+    """按TSHARK_FIELDS顺序构造一行"""
+    return [values.get(field, '') for field in TSHARK_FIELDS]
+
+
+SAMPLE_ROWS = [
+    make_row(**{'frame.time_epoch': '100.0', 'frame.time_relative': '0.0', 'frame.len': '74',
+                'frame.protocols': 'eth:ethertype:ip:tcp', 'ip.src': '192.168.1.10',
+                'ip.dst': '93.184.216.34', 'tcp.srcport': '50000', 'tcp.dstport': '443',
+                'tcp.analysis.initial_rtt': '0.030'}),
+    make_row(**{'frame.time_epoch': '100.5', 'frame.time_relative': '0.5', 'frame.len': '517',
+                'frame.protocols': 'eth:ethertype:ip:tcp:tls', 'ip.src': '192.168.1.10',
+                'ip.dst': '93.184.216.34', 'tcp.srcport': '50000', 'tcp.dstport': '443',
+                'tcp.analysis.ack_rtt': '0.040',
+                'tls.handshake.extensions_server_name': 'example.com'}),
+    make_row(**{'frame.time_epoch': '101.0', 'frame.time_relative': '1.0', 'frame.len': '80',
+                'frame.protocols': 'eth:ethertype:ip:udp:dns', 'ip.src': '192.168.1.10',
+                'ip.dst': '8.8.8.8', 'udp.srcport': '5353', 'udp.dstport': '53',
+                'dns.qry.name': 'bad.example', 'dns.resp.code': '3', 'dns.time': '1.5'}),
+    make_row(**{'frame.time_epoch': '102.0', 'frame.time_relative': '2.0', 'frame.len': '120',
+                'frame.protocols': 'eth:ethertype:ip:udp:data', 'ip.src': '192.168.1.10',
+                'ip.dst': '111.13.101.208', 'udp.srcport': '12345', 'udp.dstport': '7000'}),
+    make_row(**{'frame.time_epoch': '102.5', 'frame.time_relative': '2.5', 'frame.len': '1200',
+                'frame.protocols': 'eth:ethertype:ip:udp:quic', 'ip.src': '192.168.1.10',
+                'ip.dst': '172.64.147.26', 'udp.srcport': '54321', 'udp.dstport': '443'}),
+]
+
+
+def test_protocol_filter():
+    """测试按协议栈过滤（替代tshark -Y）"""
+    table = PacketTable.from_rows(TSHARK_FIELDS, SAMPLE_ROWS)
+
+    tcp_mask = table.protocol_mask(require=('tcp',))
+    assert [table.addresses[c] for c in table.take(table.dst_ip, tcp_mask)] == ['93.184.216.34'] * 2
+
+    game_mask = table.protocol_mask(require=('udp',), exclude=('quic', 'dns'))
+    assert [table.addresses[c] for c in table.take(table.dst_ip, game_mask)] == ['111.13.101.208']
+    print("✅ 协议过滤测试通过")
+
+
+def test_analyzers_share_table():
+    """测试各分析器基于同一份字段表计算"""
+    table = PacketTable.from_rows(TSHARK_FIELDS, SAMPLE_ROWS)
+
+    stats = capture.get_basic_packet_stats(table)
+    assert stats['total_packets'] == 5
+    assert stats['protocols']['DNS'] == 1
+    assert stats['time_range']['duration'] == 2.5
+
+    anomalies = capture.detect_network_anomalies(table)
+    assert anomalies['error_indicators'] == ["DNS查询失败: 1 次"]
+    assert anomalies['performance_issues'] == ["DNS慢查询: 1 次"]
+
+    http = capture.analyze_http_traffic(table)
+    assert http['websites_accessed'] == {'example.com': 1}
+
+    insights = capture.analyze_http_specific_issues(table)
+    site = insights['website_performance']['example.com']
+    assert site['ips'] == ['93.184.216.34']
+    assert site['tcp_rtt']['avg_ms'] == 40.0
+    print("✅ 共享字段表分析测试通过")
+
+
+def test_enhanced_analysis_runs_tshark_once():
+    """测试增强分析只对pcap执行一次tshark解析"""
+    calls = []
+    stdout = '\n'.join('\t'.join(row) for row in SAMPLE_ROWS) + '\n'
+
+    def fake_run(cmd, *args, **kwargs):
+        calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, 'TShark 4.0', '')
+
+    def fake_popen(cmd, *args, **kwargs):
+        calls.append(cmd)
+        return FakePopen(cmd, stdout)
+
+    original_run = subprocess.run
+    original_popen = subprocess.Popen
+    subprocess.run = fake_run
+    subprocess.Popen = fake_popen
+    try:
+        capture.get_tshark_command(refresh=True)
+        analysis = capture.get_enhanced_pcap_analysis('/tmp/fake.pcap', 'game_lag')
+    finally:
+        subprocess.run = original_run
+        subprocess.Popen = original_popen
+        capture.get_tshark_command(refresh=True)
+
+    dissect_calls = [c for c in calls if '-r' in c]
+    assert len(dissect_calls) == 1, f"期望1次tshark解析，实际{len(dissect_calls)}次"
+    assert analysis['basic_stats']['total_packets'] == 5
+    assert 'relevant_metrics' in analysis['issue_specific_insights']
+    print(f"✅ 单次解析测试通过（tshark -r 调用 {len(dissect_calls)} 次）")
+
+
+def test_invalid_field_retry():
+    """测试tshark不支持某字段时自动剔除后重试"""
+    attempts = []
+
+    def fake_popen(cmd, *args, **kwargs):
+        attempts.append(cmd)
+        if 'tls.handshake.extensions_server_name' in cmd:
+            return FakePopen(cmd, '', "tshark: Some fields aren't valid:\n\ttls.handshake.extensions_server_name\n", 1)
+        return FakePopen(cmd, '1.0\t60\n')
+
+    original_popen = pcap_field_extractor.subprocess.Popen
+    pcap_field_extractor.subprocess.Popen = fake_popen
+    try:
+        table = extract_pcap_fields('tshark', '/tmp/fake.pcap',
+                                    fields=['frame.time_epoch', 'frame.len',
+                                            'tls.handshake.extensions_server_name'])
+    finally:
+        pcap_field_extractor.subprocess.Popen = original_popen
+
+    assert len(attempts) == 2
+    assert list(table.length) == [60]
+    assert list(table.tls_sni) == [0]
+    print("✅ 无效字段重试测试通过")
+
+
+def test_large_stderr_does_not_block():
+    """测试tshark在输出数据前写出大量stderr时不会因管道写满而卡住"""
+    with tempfile.TemporaryDirectory() as tmp:
+        fake_tshark = os.path.join(tmp, 'tshark')
+        with open(fake_tshark, 'w') as f:
+            f.write('#!/bin/sh\n'
+                    'head -c 1000000 /dev/zero | tr "\\0" "w" >&2\n'
+                    'printf "1.0\\t60\\n2.0\\t70\\n"\n')
+        os.chmod(fake_tshark, 0o755)
+        table = extract_pcap_fields(fake_tshark, '/tmp/fake.pcap',
+                                    fields=['frame.time_epoch', 'frame.len'], timeout=5)
+
+    assert list(table.length) == [60, 70]
+    print("✅ 大量stderr输出测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试单次tshark字段提取引擎\n")
+    test_protocol_filter()
+    test_analyzers_share_table()
+    test_enhanced_analysis_runs_tshark_once()
+    test_invalid_field_retry()
+    test_large_stderr_does_not_block()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+测试测速服务器选择
+验证 `--list` 输出解析、speedtest命令缓存、服务器列表TTL缓存，以及按TCP建连延迟选择服务器
+"""
+
+import sys
+import os
+import stat
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import speedtest_servers
+from app.services.speedtest_servers import (
+    ServerCatalogue, SpeedtestCommandCache, parse_server_list, rank_servers, split_host
+)
+import app.api.speed_test as speed_test_api
+
+LIST_OUTPUT = """Retrieving speedtest.net configuration...
+ 5145) Beijing Unicom (Beijing, China) [12.34 km]
+ 3633) China Telecom (Shanghai, China) [1068.20 km]
+27594) Example ISP (Tianjin, China) [5.00 mi]
+garbage line
+"""
+
+# 记录调用参数并输出JSON结果的假speedtest-cli
+FAKE_SPEEDTEST = """#!/bin/sh
+echo "$@" >> "{log}"
+if [ "$1" = "--version" ]; then echo "speedtest-cli 2.1.3"; exit 0; fi
+echo '{{"download": 94000000, "upload": 41000000, "ping": 12.5, "server": {{"id": "2", "name": "Local", "country": "CN", "sponsor": "Test", "d": 1.0}}, "client": {{"ip": "127.0.0.1", "isp": "Loopback"}}}}'
+"""
+
+
+def write_fake_speedtest(directory: str) -> tuple:
+    log = os.path.join(directory, 'calls.log')
+    path = os.path.join(directory, 'speedtest-cli')
+    with open(path, 'w') as f:
+        f.write(FAKE_SPEEDTEST.format(log=log))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path, log
+
+
+def read_calls(log: str) -> list:
+    if not os.path.exists(log):
+        return []
+    with open(log) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def test_parse_server_list():
+    """测试解析 `speedtest-cli --list` 输出并按距离排序"""
+    servers = parse_server_list(LIST_OUTPUT)
+    assert [s['id'] for s in servers] == ['27594', '5145', '3633']
+    assert servers[0]['distance'] == 8.05 and servers[0]['location'] == 'Tianjin, China'
+    assert servers[1]['name'] == 'Beijing Unicom' and servers[1]['host'] is None
+    assert split_host('speed.example.com:8080') == ('speed.example.com', 8080)
+    assert split_host('[2001:db8::1]:443') == ('2001:db8::1', 443)
+    assert split_host('speed.example.com') == ('speed.example.com', 8080)
+    print("✅ 服务器列表解析测试通过")
+
+
+def test_command_cache():
+    """测试候选命令并发探测一次后缓存，未找到时短时间内不重复探测"""
+    with tempfile.TemporaryDirectory() as tmp:
+        fake, log = write_fake_speedtest(tmp)
+        missing = os.path.join(tmp, 'missing-speedtest')
+
+        async def scenario():
+            cache = SpeedtestCommandCache([[missing], [fake]])
+            first = await asyncio.gather(cache.get(), cache.get(), cache.get())
+            second = await cache.get()
+
+            empty = SpeedtestCommandCache([[missing]], negative_ttl=60)
+            none_first = await empty.get()
+            checked_at = empty._checked_at
+            none_second = await empty.get()
+            return first, second, none_first, none_second, checked_at == empty._checked_at
+
+        first, second, none_first, none_second, not_reprobed = asyncio.run(scenario())
+
+    assert first == [[fake]] * 3 and second == [fake]
+    assert none_first is None and none_second is None and not_reprobed
+    print("✅ speedtest命令缓存测试通过")
+
+
+def test_catalogue_ttl():
+    """测试服务器列表在TTL内只获取一次，并发请求共用同一次获取"""
+    calls = []
+
+    async def fetcher():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return parse_server_list(LIST_OUTPUT)
+
+    async def scenario():
+        catalogue = ServerCatalogue(fetcher, ttl=0.3)
+        results = await asyncio.gather(*[catalogue.get() for _ in range(5)])
+        results[0][0]['name'] = 'modified'
+        cached = await catalogue.get()
+        info = catalogue.info()
+        await asyncio.sleep(0.35)
+        expired = await catalogue.get()
+        forced = await catalogue.get(refresh=True)
+        return results, cached, info, expired, forced
+
+    results, cached, info, expired, forced = asyncio.run(scenario())
+    assert all(len(r) == 3 for r in results)
+    assert cached[0]['name'] == 'Example ISP'
+    assert info['cached'] and info['count'] == 3
+    assert len(expired) == 3 and len(forced) == 3
+    assert len(calls) == 3
+    print("✅ 服务器列表TTL缓存测试通过")
+
+
+async def _open_and_closed_ports():
+    server = await asyncio.start_server(lambda r, w: w.close(), '127.0.0.1', 0)
+    open_port = server.sockets[0].getsockname()[1]
+    probe = await asyncio.start_server(lambda r, w: w.close(), '127.0.0.1', 0)
+    closed_port = probe.sockets[0].getsockname()[1]
+    probe.close()
+    await probe.wait_closed()
+    return server, open_port, closed_port
+
+
+def test_rank_servers():
+    """测试并发探测候选服务器延迟，不可达和没有主机地址的排在最后"""
+
+    async def scenario():
+        server, open_port, closed_port = await _open_and_closed_ports()
+        try:
+            candidates = [
+                {"id": "1", "name": "Closed", "location": "", "distance": 1.0, "host": f"127.0.0.1:{closed_port}"},
+                {"id": "2", "name": "Local", "location": "", "distance": 2.0, "host": f"127.0.0.1:{open_port}"},
+                {"id": "3", "name": "NoHost", "location": "", "distance": 3.0, "host": None},
+                {"id": "4", "name": "Far", "location": "", "distance": 4.0, "host": "127.0.0.1:1"},
+            ]
+            ranked = await rank_servers(candidates, candidates=3, attempts=2, timeout=0.5)
+        finally:
+            server.close()
+        return ranked
+
+    ranked = asyncio.run(scenario())
+    assert [s['id'] for s in ranked] == ['2', '1', '3']
+    assert ranked[0]['latency'] is not None and ranked[0]['latency'] < 100
+    assert ranked[1]['latency'] is None and ranked[2]['latency'] is None
+    print(f"✅ 服务器延迟探测测试通过（本地 {ranked[0]['latency']}ms）")
+
+
+def test_run_speedtest_cli_uses_best_server():
+    """测试测速时使用缓存的命令和延迟最低的服务器，不再运行 --list"""
+    with tempfile.TemporaryDirectory() as tmp:
+        fake, log = write_fake_speedtest(tmp)
+
+        async def scenario():
+            server, open_port, closed_port = await _open_and_closed_ports()
+
+            async def fetcher():
+                return [
+                    {"id": "1", "name": "Nearest", "location": "A", "distance": 1.0, "host": f"127.0.0.1:{closed_port}"},
+                    {"id": "2", "name": "Local", "location": "B", "distance": 2.0, "host": f"127.0.0.1:{open_port}"},
+                ]
+
+            original_commands = speed_test_api.command_cache
+            original_catalogue = speedtest_servers.server_catalogue
+            speed_test_api.command_cache = SpeedtestCommandCache([[fake]])
+            speedtest_servers.server_catalogue = ServerCatalogue(fetcher)
+            try:
+                first = await speed_test_api.run_speedtest_cli(test_type="download")
+                second = await speed_test_api.run_speedtest_cli(server_id="5145")
+            finally:
+                speed_test_api.command_cache = original_commands
+                speedtest_servers.server_catalogue = original_catalogue
+                server.close()
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        calls = read_calls(log)
+
+    assert first['download_speed'] == 94.0 and first['upload_speed'] == 41.0 and first['ping'] == 12.5
+    assert calls == ['--version', '--json --secure --server 2 --no-upload', '--json --secure --server 5145']
+    print("✅ 测速服务器选择测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试测速服务器选择\n")
+    test_parse_server_list()
+    test_command_cache()
+    test_catalogue_ttl()
+    test_rank_servers()
+    test_run_speedtest_cli_uses_best_server()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+测试批量SSL证书检查
+用cryptography生成测试证书，在本机启动多个TLS服务，验证DER解析、指纹缓存、并发检查和分阶段计时
+"""
+
+import sys
+import os
+import ssl
+import time
+import asyncio
+import datetime
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from app.services.ssl_inspector import (CertificateParseCache, inspect_certificate, inspect_many,
+                                        parse_certificate_der, parse_target)
+
+
+def make_certificate(key, common_name, days=90, issuer=None):
+    """issuer为 (签发者证书, 签发者私钥)，默认自签名"""
+    name = x509.Name([
+        x509.NameAttribute(NameOID.COUNTRY_NAME, 'CN'),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, '测试组织'),
+        x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+    ])
+    issuer_cert, issuer_key = issuer or (None, key)
+    now = datetime.datetime(2026, 1, 1)
+    return (x509.CertificateBuilder()
+            .subject_name(name).issuer_name(issuer_cert.subject if issuer_cert else name)
+            .public_key(key.public_key())
+            .serial_number(0x1234abcd)
+            .not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=days))
+            .add_extension(x509.SubjectAlternativeName([
+                x509.DNSName(common_name), x509.DNSName(f'*.{common_name}'),
+                x509.IPAddress(__import__('ipaddress').ip_address('127.0.0.1'))]), critical=False)
+            .sign(issuer_key, hashes.SHA256()))
+
+
+def test_parse_der():
+    """测试进程内DER解析与cryptography结果一致"""
+    rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    cert = make_certificate(rsa_key, 'example.com')
+    info = parse_certificate_der(cert.public_bytes(serialization.Encoding.DER))
+    assert info['subject'] == 'C = CN, O = 测试组织, CN = example.com'
+    assert info['subject'] == info['issuer']
+    assert info['serial_number'] == '12:34:ab:cd'
+    assert info['not_before'] == 'Jan 01 00:00:00 2026 GMT'
+    assert info['not_after'] == 'Apr 01 00:00:00 2026 GMT'
+    assert info['signature_algorithm'] == 'sha256WithRSAEncryption'
+    assert info['public_key_algorithm'] == 'rsaEncryption' and info['key_size'] == 2048
+    assert info['san_domains'] == ['example.com', '*.example.com', '127.0.0.1']
+    assert info['fingerprint_sha256'] == cert.fingerprint(hashes.SHA256()).hex().upper()
+
+    ec_cert = make_certificate(ec.generate_private_key(ec.SECP384R1()), 'ec.example.com')
+    info = parse_certificate_der(ec_cert.public_bytes(serialization.Encoding.DER))
+    assert info['public_key_algorithm'] == 'id-ecPublicKey' and info['key_size'] == 384
+    assert info['signature_algorithm'] == 'ecdsa-with-SHA256'
+    print("✅ DER证书解析测试通过")
+
+
+def test_parse_cache():
+    """测试相同证书只解析一次，返回值互不影响"""
+    cert = make_certificate(ec.generate_private_key(ec.SECP256R1()), 'cache.example.com')
+    der = cert.public_bytes(serialization.Encoding.DER)
+    cache = CertificateParseCache(max_size=2)
+    first = cache.parse(der)
+    first['san_domains'].append('changed')
+    second = cache.parse(der)
+    assert 'changed' not in second['san_domains']
+    assert cache.stats() == {'size': 1, 'hits': 1, 'misses': 1}
+
+    broken = cache.parse(b'\x30\x03\x02\x01')
+    assert broken['subject'] == 'Unknown' and broken['fingerprint_sha256']
+    print("✅ 指纹解析缓存测试通过")
+
+
+def test_parse_target():
+    """测试目标地址解析"""
+    assert parse_target('example.com') == ('example.com', 443)
+    assert parse_target('example.com:8443') == ('example.com', 8443)
+    assert parse_target('[::1]:9443') == ('::1', 9443)
+    assert parse_target('::1') == ('::1', 443)
+    print("✅ 目标地址解析测试通过")
+
+
+def test_batch_inspection():
+    """测试并发检查多个本机TLS服务，失败目标不影响其他目标"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    cert = make_certificate(key, 'localhost')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert_path, key_path = os.path.join(tmp, 'cert.pem'), os.path.join(tmp, 'key.pem')
+        with open(cert_path, 'wb') as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+        with open(key_path, 'wb') as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                      serialization.NoEncryption()))
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+
+        async def scenario():
+            async def handle(reader, writer):
+                await reader.read()
+                writer.close()
+
+            async def not_tls(reader, writer):
+                # 不响应握手，0.3秒后断开
+                await asyncio.sleep(0.3)
+                writer.close()
+
+            servers = [await asyncio.start_server(handle, '127.0.0.1', 0, ssl=context) for _ in range(20)]
+            plain = await asyncio.start_server(not_tls, '127.0.0.1', 0)
+            ports = [s.sockets[0].getsockname()[1] for s in servers]
+            silent_port = plain.sockets[0].getsockname()[1]
+            try:
+                single = await inspect_certificate('localhost', ports[0])
+                started = time.time()
+                results = await inspect_many([('127.0.0.1', port) for port in ports] +
+                                             [('127.0.0.1', silent_port), ('127.0.0.1', 1)], timeout=2)
+                elapsed = time.time() - started
+            finally:
+                for server in servers + [plain]:
+                    server.close()
+            return single, results, elapsed
+
+        single, results, elapsed = asyncio.run(scenario())
+
+    timings = single['connection_info']
+    assert single['ip_address'] == '127.0.0.1'
+    assert set(timings) == {'dns_time', 'connect_time', 'handshake_time', 'total_time'}
+    assert timings['total_time'] >= timings['dns_time'] + timings['connect_time'] + timings['handshake_time'] - 0.1
+    assert single['certificate']['subject'].endswith('CN = localhost')
+    assert single['ssl_version'].startswith('TLS')
+
+    assert all(r['success'] for r in results[:20])
+    assert results[20]['success'] is False and results[21]['success'] is False
+    assert [r['port'] for r in results[:20]] == [r['data']['port'] for r in results[:20]]
+    assert elapsed < 1.5, f"检查未并发执行，耗时 {elapsed:.2f}秒"
+    print(f"✅ 批量检查测试通过（{len(results)} 个目标耗时 {elapsed:.2f}秒）")
+
+
+def test_certificate_chain():
+    """测试服务器发送的中间证书出现在certificate_chain中"""
+    ca_key = ec.generate_private_key(ec.SECP256R1())
+    ca_cert = make_certificate(ca_key, 'intermediate.test')
+    key = ec.generate_private_key(ec.SECP256R1())
+    cert = make_certificate(key, 'localhost', issuer=(ca_cert, ca_key))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert_path, key_path = os.path.join(tmp, 'chain.pem'), os.path.join(tmp, 'key.pem')
+        with open(cert_path, 'wb') as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM) + ca_cert.public_bytes(serialization.Encoding.PEM))
+        with open(key_path, 'wb') as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                      serialization.NoEncryption()))
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+
+        async def scenario():
+            async def handle(reader, writer):
+                await reader.read()
+                writer.close()
+
+            server = await asyncio.start_server(handle, '127.0.0.1', 0, ssl=context)
+            try:
+                return await inspect_certificate('127.0.0.1', server.sockets[0].getsockname()[1])
+            finally:
+                server.close()
+
+        data = asyncio.run(scenario())
+
+    chain = data['certificate_chain']
+    assert len(chain) == 1 and chain[0]['subject'].endswith('CN = intermediate.test')
+    assert data['certificate']['issuer'] == chain[0]['subject']
+    print("✅ 证书链测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试批量SSL证书检查\n")
+    test_parse_der()
+    test_parse_cache()
+    test_parse_target()
+    test_batch_inspection()
+    test_certificate_chain()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+测试流式抓包分析
+用python脚本模拟tcpdump输出、用cat模拟tshark逐行解析，验证边抓包边统计
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app.api.capture as capture_api
+from app.services.packet_table import PacketTable
+from app.services.streaming_capture import IncrementalPacketStats, StreamingCaptureSession
+
+FIELDS = ['frame.time_epoch', 'frame.len', 'frame.protocols', 'ip.dst',
+          'tcp.analysis.ack_rtt', 'dns.resp.code', 'tls.handshake.extensions_server_name']
+
+ROWS = [
+    ['100.0', '517', 'eth:ethertype:ip:tcp:tls', '93.184.216.34', '0.040', '', 'example.com'],
+    ['100.2', '60', 'eth:ethertype:ip:tcp', '93.184.216.34', '0.020', '', ''],
+    ['100.4', '90', 'eth:ethertype:ip:udp:dns', '8.8.8.8', '', '2', ''],
+]
+
+
+def fake_capture_command(rows, linger: float = 30) -> str:
+    """模拟tcpdump：输出若干行后持续运行，直到被终止"""
+    payload = ''.join('\t'.join(row) + '\n' for row in rows)
+    script = (f"import sys, time; sys.stdout.write({payload!r}); sys.stdout.flush(); "
+              f"time.sleep({linger})")
+    return f'{sys.executable} -c "{script}"'
+
+
+def test_incremental_stats():
+    """测试增量统计分批更新的结果与一次性更新一致"""
+    table = PacketTable.from_rows(FIELDS, ROWS)
+
+    batched = IncrementalPacketStats()
+    batched.update(table, 1)
+    batched.update(table)
+    whole = IncrementalPacketStats()
+    whole.update(table)
+
+    assert batched.snapshot(table) == whole.snapshot(table)
+    snapshot = whole.snapshot(table)
+    assert snapshot['packets'] == 3
+    assert snapshot['rtt']['avg_ms'] == 30.0
+    assert snapshot['dns']['failures'] == 1
+    assert snapshot['top_sites'][0]['site'] == 'example.com'
+    print("✅ 增量统计测试通过")
+
+
+def test_partial_results_while_capturing():
+    """测试抓包进行中即可获得部分结果，停止后表已完整"""
+    with tempfile.TemporaryDirectory() as tmp:
+        pcap_file = os.path.join(tmp, 'stream.pcap')
+        session = StreamingCaptureSession(
+            fake_capture_command(ROWS), 'tshark', pcap_file,
+            fields=FIELDS, decoder_cmd=['cat'])
+        session.start()
+
+        deadline = time.time() + 5
+        partial = session.snapshot()
+        while partial['packets'] < len(ROWS) and time.time() < deadline:
+            time.sleep(0.05)
+            partial = session.snapshot()
+
+        assert session.is_capture_running(), "抓包进程应仍在运行"
+        assert partial['packets'] == 3
+        assert partial['protocols'] == {'TLS': 1, 'TCP': 1, 'DNS': 1}
+
+        started = time.time()
+        table = session.stop()
+        assert time.time() - started < 5
+        assert len(table) == 3
+        assert session.capture_error is None and not session.degraded
+        assert os.path.getsize(pcap_file) == session.bytes_captured > 0
+    print("✅ 流式部分结果测试通过")
+
+
+def test_capture_failure_reported():
+    """测试tcpdump启动即失败时返回错误信息"""
+    with tempfile.TemporaryDirectory() as tmp:
+        session = StreamingCaptureSession(
+            'echo "permission denied" >&2; exit 1', 'tshark',
+            os.path.join(tmp, 'fail.pcap'), fields=FIELDS, decoder_cmd=['cat'])
+        session.start()
+        deadline = time.time() + 5
+        while session.is_capture_running() and time.time() < deadline:
+            time.sleep(0.05)
+        session.stop()
+        assert 'permission denied' in session.capture_error
+    print("✅ 抓包失败报告测试通过")
+
+
+def test_decoder_exit_marks_degraded():
+    """测试tshark启动即退出时会话标记为解析不完整，流式抓包返回None以便从pcap文件重新解析"""
+    with tempfile.TemporaryDirectory() as tmp:
+        fake_tshark = os.path.join(tmp, 'tshark')
+        with open(fake_tshark, 'w') as f:
+            f.write('#!/bin/sh\necho "tshark: Some fields aren\'t valid" >&2\nexit 1\n')
+        os.chmod(fake_tshark, 0o755)
+
+        pcap_file = os.path.join(tmp, 'degraded.pcap')
+        session = StreamingCaptureSession(fake_capture_command(ROWS, linger=0.5), fake_tshark, pcap_file,
+                                          fields=FIELDS)
+        session.start()
+        deadline = time.time() + 5
+        while session.is_capture_running() and time.time() < deadline:
+            time.sleep(0.05)
+        table = session.stop()
+        assert len(table) == 0
+        assert session.degraded and session.decoder_returncode == 1
+        assert "aren't valid" in session.decoder_error
+        assert os.path.getsize(pcap_file) == session.bytes_captured > 0
+
+        original_command = capture_api.build_streaming_tcpdump_command
+        capture_api.build_streaming_tcpdump_command = lambda interface, filter_expr: fake_capture_command(ROWS, 0.5)
+        try:
+            request = capture_api.CaptureRequest(issue_type='slow', duration=1, interface='lo')
+            result = asyncio.run(capture_api.run_streaming_capture(
+                'task-degraded', request, os.path.join(tmp, 'task.pcap'), '', fake_tshark))
+        finally:
+            capture_api.build_streaming_tcpdump_command = original_command
+        assert result is None
+    print("✅ 解析进程退出降级测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试流式抓包分析\n")
+    test_incremental_stats()
+    test_partial_results_while_capturing()
+    test_capture_failure_reported()
+    test_decoder_exit_marks_degraded()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+测试抓包任务存储
+验证SQLite持久化、重启恢复、热结果LRU以及按TTL/总大小清理pcap文件
+"""
+
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.task_store import MemoryTaskStore, SQLiteTaskStore, TaskStore
+
+
+def new_task(status='pending'):
+    return {'status': status, 'result': None, 'error': None,
+            'created_at': '2025-01-01T00:00:00', 'request': {'issue_type': 'slow'}}
+
+
+def test_survives_restart():
+    """测试任务在重新打开数据库后仍可查询，未完成的任务标记为中断"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'tasks.db')
+        store = SQLiteTaskStore(db_path, capture_dir=tmp)
+        store.create('done-task', new_task())
+        store.update('done-task', status='done', pcap_file='/tmp/x.pcap',
+                     result={'capture_summary': {'file_size': 10}}, issue_type='slow')
+        store.create('running-task', new_task('capturing'))
+        store.close()
+
+        reopened = SQLiteTaskStore(db_path, capture_dir=tmp)
+        assert reopened.recover_interrupted_tasks() == 1
+        task = reopened.get('done-task')
+        assert task['status'] == 'done'
+        assert task['result']['capture_summary']['file_size'] == 10
+        assert task['issue_type'] == 'slow'
+        assert task['request'] == {'issue_type': 'slow'}
+
+        interrupted = reopened.get('running-task', include_result=False)
+        assert interrupted['status'] == 'error' and '中断' in interrupted['error']
+        assert 'result' not in interrupted
+        assert 'done-task' in reopened and 'missing' not in reopened
+        assert len(reopened) == 2
+        reopened.close()
+    print("✅ 重启恢复测试通过")
+
+
+def test_hot_result_cache_is_bounded():
+    """测试内存中只缓存少量最近访问的结果，get返回的是缓存结果的副本"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteTaskStore(os.path.join(tmp, 'tasks.db'), hot_results=2, capture_dir=tmp)
+        for i in range(5):
+            store.create(f't{i}', new_task())
+            store.update(f't{i}', status='done', result={'value': i})
+
+        assert list(store._results) == ['t3', 't4']
+        assert store.get('t0')['result'] == {'value': 0}
+        assert list(store._results) == ['t4', 't0']
+
+        # 修改返回的任务不影响缓存，重新读取仍是已保存的结果
+        for _ in range(2):
+            task = store.get('t4')
+            task['result']['value'] = 'changed'
+            task['status'] = 'changed'
+        assert store.get('t4')['result'] == {'value': 4} and store.get('t4')['status'] == 'done'
+        store.close()
+    print("✅ 热结果LRU测试通过")
+
+
+def test_eviction():
+    """测试TTL过期、任务数上限和pcap总大小上限"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteTaskStore(os.path.join(tmp, 'tasks.db'), capture_dir=tmp,
+                                ttl_seconds=3600, max_tasks=3, max_capture_bytes=2500)
+        for i in range(5):
+            pcap_file = os.path.join(tmp, f't{i}.pcap')
+            with open(pcap_file, 'wb') as f:
+                f.write(b'\0' * 1000)
+            os.utime(pcap_file, (1000 + i, 1000 + i))
+            store.create(f't{i}', dict(new_task(), created_at=f'2025-01-0{i + 1}T00:00:00'))
+            store.update(f't{i}', status='done', pcap_file=pcap_file, result={'i': i})
+
+        # t0已过期
+        store._conn.execute("UPDATE tasks SET updated_at=? WHERE task_id='t0'", (time.time() - 7200,))
+        # 孤立的过期pcap
+        orphan = os.path.join(tmp, 'orphan.pcap')
+        with open(orphan, 'wb') as f:
+            f.write(b'\0' * 10)
+        os.utime(orphan, (1, 1))
+
+        stats = store.cleanup()
+        assert stats['expired_tasks'] == 1
+        assert stats['evicted_tasks'] == 1
+        assert [t['task_id'] for t in store.list_tasks()] == ['t2', 't3', 't4']
+        assert not os.path.exists(orphan)
+
+        # 剩余3个1000字节的pcap超过2500字节上限，最旧的被删除但任务保留
+        assert not os.path.exists(os.path.join(tmp, 't2.pcap'))
+        assert store.get('t2', include_result=False)['pcap_file'] is None
+        assert os.path.exists(os.path.join(tmp, 't4.pcap'))
+        store.close()
+    print("✅ 清理策略测试通过")
+
+
+def test_memory_store():
+    """测试内存实现与SQLite实现接口一致"""
+    store = MemoryTaskStore(max_tasks=1)
+    store.create('a', new_task())
+    assert store.update('a', status='done', result={'capture_summary': {}})
+    assert not store.update('missing', status='done')
+    assert store.get('a', include_result=False).get('result') is None
+    assert store.list_tasks()[0]['has_result']
+    print("✅ 内存存储测试通过")
+
+
+def test_interface_is_abstract():
+    """测试TaskStore接口不能直接实例化，未实现全部方法的子类同样不能"""
+    class Partial(TaskStore):
+        def create(self, task_id, task):
+            pass
+
+    for cls in (TaskStore, Partial):
+        try:
+            cls()
+            raise AssertionError(f"{cls.__name__} 不应能实例化")
+        except TypeError:
+            pass
+    print("✅ 抽象接口测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试任务存储\n")
+    test_survives_restart()
+    test_hot_result_cache_is_bounded()
+    test_eviction()
+    test_memory_store()
+    test_interface_is_abstract()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+测试进程内HTTP吞吐量测试
+用本地aiohttp服务模拟测速端点，验证多连接并行传输、预热期剔除、每秒采样和出错重试
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+
+from app.services.throughput_tester import measure_throughput, run_throughput_test
+
+CHUNK = b'\0' * 65536
+
+
+async def start_local_speed_server(rate_per_connection: int = 0) -> tuple:
+    """本地测速服务：/__down?bytes=N 返回N字节，/__up 读取并丢弃请求体
+
+    rate_per_connection>0时按每秒字节数限速，模拟单连接带宽受限的链路。
+    """
+    connections = set()
+
+    async def down(request: web.Request):
+        size = int(request.query.get('bytes', 1024 * 1024))
+        connections.add(request.transport)
+        response = web.StreamResponse(headers={'Content-Length': str(size)})
+        await response.prepare(request)
+        sent = 0
+        try:
+            while sent < size:
+                chunk = CHUNK[:size - sent]
+                await response.write(chunk)
+                sent += len(chunk)
+                if rate_per_connection:
+                    await asyncio.sleep(len(chunk) / rate_per_connection)
+            await response.write_eof()
+        except ConnectionResetError:
+            # 测试时间结束，客户端断开
+            pass
+        return response
+
+    async def up(request: web.Request):
+        connections.add(request.transport)
+        received = 0
+        try:
+            async for chunk in request.content.iter_any():
+                received += len(chunk)
+                if rate_per_connection:
+                    await asyncio.sleep(len(chunk) / rate_per_connection)
+        except ConnectionResetError:
+            pass
+        return web.json_response({'received': received})
+
+    async def broken(request: web.Request):
+        return web.Response(status=503)
+
+    app = web.Application(client_max_size=0)
+    app.router.add_get('/__down', down)
+    app.router.add_post('/__up', up)
+    app.router.add_get('/broken', broken)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", connections
+
+
+def test_parallel_streams_scale_throughput():
+    """测试每连接限速时，4条并行连接的吞吐量约为单连接的4倍"""
+    rate = 2 * 1024 * 1024  # 每连接 2MB/s ≈ 16.8Mbps
+
+    async def scenario():
+        runner, base, connections = await start_local_speed_server(rate)
+        try:
+            url = f"{base}/__down?bytes=1000000"
+            single = await measure_throughput('download', [url], streams=1, duration=2.0, warmup=0.5, interval=0.5)
+            connections.clear()
+            multi = await measure_throughput('download', [url], streams=4, duration=2.0, warmup=0.5, interval=0.5)
+            return single, multi, len(connections)
+        finally:
+            await runner.cleanup()
+
+    single, multi, used_connections = asyncio.run(scenario())
+    assert single['errors'] == [] and multi['errors'] == []
+    assert 10 < single['mbps'] < 25, single['mbps']
+    assert multi['mbps'] > single['mbps'] * 3, (single['mbps'], multi['mbps'])
+    assert all(size > 0 for size in multi['stream_bytes'])
+    # 每条连接复用keep-alive，文件传完后在同一连接上继续请求
+    assert used_connections == 4
+    print(f"✅ 多连接吞吐量测试通过（单连接 {single['mbps']} Mbps，4连接 {multi['mbps']} Mbps）")
+
+
+def test_warmup_and_samples():
+    """测试预热期采样被标记且不计入结果，采样按时间间隔产出"""
+    received = []
+
+    async def scenario():
+        runner, base, _ = await start_local_speed_server(4 * 1024 * 1024)
+        try:
+            return await measure_throughput('download', [f"{base}/__down?bytes=4000000"], streams=2,
+                                            duration=2.0, warmup=1.0, interval=0.5, on_sample=received.append)
+        finally:
+            await runner.cleanup()
+
+    result = asyncio.run(scenario())
+    samples = result['samples']
+    assert received == samples and len(samples) == 4
+    assert [s['warmup'] for s in samples] == [True, True, False, False]
+    assert all(s['direction'] == 'download' for s in samples)
+    assert 0.9 < result['measured_duration'] < 1.2 and result['duration'] < 2.3
+    assert result['measured_bytes'] < result['bytes']
+    assert result['peak_mbps'] >= result['mbps'] * 0.9
+    print(f"✅ 预热期剔除与采样测试通过（{result['mbps']} Mbps）")
+
+
+def test_upload_and_full_run():
+    """测试上传方向和完整测速流程（延迟、下载、上传）"""
+
+    async def scenario():
+        runner, base, _ = await start_local_speed_server()
+        try:
+            return await run_throughput_test([f"{base}/__down?bytes=2000000"], f"{base}/__up",
+                                             streams=2, duration=1.0, warmup=0.5)
+        finally:
+            await runner.cleanup()
+
+    result = asyncio.run(scenario())
+    assert result['server'] == '127.0.0.1' and result['latency'] is not None
+    assert result['download_speed'] > 0 and result['upload_speed'] > 0
+    assert result['upload']['errors'] == [] and result['upload']['bytes'] > 0
+    assert result['upload']['streams'] == 2
+    print(f"✅ 上传与完整测速测试通过（下载 {result['download_speed']} Mbps，上传 {result['upload_speed']} Mbps）")
+
+
+def test_errors_are_reported():
+    """测试端点出错时记录错误并重试，结果为0而不是抛出异常"""
+
+    async def scenario():
+        runner, base, _ = await start_local_speed_server()
+        try:
+            return await measure_throughput('download', [f"{base}/broken"], streams=2, duration=1.0, warmup=0.5)
+        finally:
+            await runner.cleanup()
+
+    result = asyncio.run(scenario())
+    assert result['mbps'] == 0 and result['bytes'] == 0
+    assert len(result['errors']) >= 2 and '503' in result['errors'][0]
+    print("✅ 出错重试测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试进程内HTTP吞吐量测试\n")
+    test_parallel_streams_scale_throughput()
+    test_warmup_and_samples()
+    test_upload_and_full_run()
+    test_errors_are_reported()
+    print("\n🎉 所有测试完成")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+测试异步路由追踪引擎
+验证ICMP报文解析、所有TTL并行探测、逐跳流式输出、本机回环地址的真实追踪，
+以及系统 traceroute 命令（备用方案）输出的解析
+"""
+
+import sys
+import os
+import time
+import socket
+import struct
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app.services.traceroute_engine as engine_module
+from app.api.traceroute import parse_traceroute_output
+from app.services.traceroute_engine import (TracerouteEngine, errqueue_supported, parse_extended_error,
+                                            parse_icmp_packet, raw_socket_permitted)
+
+
+def ip_header(src, dst, protocol, payload_length):
+    return struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + payload_length, 0, 0, 64, protocol, 0,
+                       socket.inet_aton(src), socket.inet_aton(dst))
+
+
+def test_parse_icmp_packet():
+    """测试从ICMP超时报文中取出原始探测的端口/序号"""
+    udp = struct.pack('!HHHH', 40000, 33436, 20, 0)
+    inner = ip_header('192.168.1.10', '8.8.8.8', socket.IPPROTO_UDP, 8) + udp
+    icmp = struct.pack('!BBHI', 11, 0, 0, 0) + inner
+    info = parse_icmp_packet(ip_header('10.0.0.1', '192.168.1.10', socket.IPPROTO_ICMP, len(icmp)) + icmp)
+    assert info['source'] == '10.0.0.1' and info['type'] == 11
+    assert info['inner_dst'] == '8.8.8.8'
+    assert (info['inner_src_port'], info['inner_dst_port']) == (40000, 33436)
+
+    echo = struct.pack('!BBHHH', 8, 0, 0, 0x1234, 7)
+    inner = ip_header('192.168.1.10', '8.8.8.8', socket.IPPROTO_ICMP, 8) + echo
+    icmp = struct.pack('!BBHI', 11, 0, 0, 0) + inner
+    info = parse_icmp_packet(ip_header('10.0.0.2', '192.168.1.10', socket.IPPROTO_ICMP, len(icmp)) + icmp)
+    assert (info['inner_id'], info['inner_seq']) == (0x1234, 7)
+
+    reply = struct.pack('!BBHHH', 0, 0, 0, 0x1234, 9)
+    info = parse_icmp_packet(ip_header('8.8.8.8', '192.168.1.10', socket.IPPROTO_ICMP, 8) + reply)
+    assert info['type'] == 0 and (info['id'], info['seq']) == (0x1234, 9)
+    assert parse_icmp_packet(b'\x45') is None
+
+    # sock_extended_err: errno, origin=ICMP, type=11, code=0, pad, info, data, 出错地址sockaddr_in
+    error = struct.pack('=IBBBBII', 113, 2, 11, 0, 0, 0, 0) + \
+        struct.pack('=HH4s8x', socket.AF_INET, 0, socket.inet_aton('10.0.0.1'))
+    parsed = parse_extended_error([(engine_module.SOL_IP, engine_module.IP_RECVERR, error)])
+    assert parsed == {'errno': 113, 'origin': 2, 'type': 11, 'code': 0, 'source': '10.0.0.1'}
+    print("✅ ICMP报文解析测试通过")
+
+
+class SimulatedEngine(TracerouteEngine):
+    """模拟网络：第ttl跳的路由器在延迟后回复超时，第8跳为目标，第5跳不回复"""
+
+    DEST_TTL = 8
+    SILENT_TTL = 5
+
+    def _setup(self, loop):
+        return None
+
+    def _send(self, sender, probe, key):
+        probe.sent_at = time.perf_counter()
+        if probe.ttl == self.SILENT_TTL:
+            return
+        reached = probe.ttl >= self.DEST_TTL
+        responder = self.target_ip if reached else f'10.0.0.{probe.ttl}'
+        asyncio.get_running_loop().call_later(
+            0.01 * min(probe.ttl, self.DEST_TTL) + 0.1,
+            lambda: self._record(key, responder, reached, time.perf_counter()))
+
+
+def test_parallel_probing_and_streaming():
+    """测试所有TTL同时探测：总耗时约等于一个超时，已回复的跳先于超时的跳输出"""
+    for ttl in range(1, 31):
+        engine_module._reverse_cache[f'10.0.0.{ttl}'] = (time.monotonic(), f'router{ttl}.example')
+    engine_module._reverse_cache['203.0.113.9'] = (time.monotonic(), None)
+
+    async def scenario():
+        engine = SimulatedEngine('203.0.113.9', max_hops=30, timeout=0.5, use_raw=True)
+        streamed = []
+        started = time.time()
+        hops = await engine.run(lambda hop: streamed.append((hop['hop'], round(time.time() - started, 2))))
+        return engine, hops, streamed, time.time() - started
+
+    engine, hops, streamed, elapsed = asyncio.run(scenario())
+    assert engine.reached
+    assert [h['hop'] for h in hops] == list(range(1, 9))
+    assert hops[0]['hostname'] == 'router1.example' and hops[0]['rtt3'] is not None
+    assert hops[4]['status'] == 'timeout' and hops[4]['ip'] == '*'
+    assert hops[7]['ip'] == '203.0.113.9'
+    # 第5跳要等超时，其余各跳在回复到达后立即输出
+    assert streamed[-1][0] == 5
+    assert all(at < 0.4 for hop, at in streamed if hop != 5)
+    assert elapsed < 1.0, f"探测未并行进行，耗时 {elapsed:.2f}秒"
+    print(f"✅ 并行探测与逐跳输出测试通过（8 跳耗时 {elapsed:.2f}秒）")
+
+
+def test_loopback_trace():
+    """测试对本机回环地址的真实追踪（可用的探测方式都测一遍）"""
+    modes = []
+    if errqueue_supported('udp'):
+        modes.append(('udp', False))
+    if raw_socket_permitted():
+        modes += [('udp', True), ('icmp', True), ('tcp', True)]
+    if not modes:
+        print("⚠️ 当前系统无法进行进程内路由追踪，跳过")
+        return
+
+    async def scenario(method, use_raw):
+        server = await asyncio.start_server(lambda r, w: w.close(), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            engine = TracerouteEngine('127.0.0.1', max_hops=30, method=method, timeout=1, use_raw=use_raw,
+                                      port=port if method == 'tcp' else None)
+            started = time.time()
+            hops = await engine.run()
+            return engine, hops, time.time() - started
+        finally:
+            server.close()
+
+    for method, use_raw in modes:
+        engine, hops, elapsed = asyncio.run(scenario(method, use_raw))
+        assert engine.reached, f"{method} 未到达目标"
+        assert len(hops) == 1 and hops[0]['ip'] == '127.0.0.1' and hops[0]['status'] == 'success'
+        assert elapsed < 1.0
+    labels = [f"{method}/{'raw' if use_raw else 'errqueue'}" for method, use_raw in modes]
+    print(f"✅ 回环追踪测试通过（{', '.join(labels)}）")
+
+
+def test_parse_system_traceroute_output():
+    """测试解析 traceroute -n -q N 的输出：只有IP、探测次数不固定、部分探测超时"""
+    output = """traceroute to 8.8.8.8 (8.8.8.8), 30 hops max, 60 byte packets
+ 1  192.168.1.1  1.234 ms  1.567 ms  1.890 ms
+ 2  * * *
+ 3  10.0.0.1  5.102 ms *  5.331 ms
+ 4  *
+ 5  203.0.113.9  9.104 ms
+ 6  gw.example.net (198.51.100.7)  12.0 ms  12.4 ms  12.2 ms
+"""
+    for system in ('linux', 'darwin'):
+        hops = {hop.hop: hop for hop in parse_traceroute_output(output, system)}
+        assert sorted(hops) == [1, 2, 3, 4, 5, 6]
+        assert hops[1].ip == '192.168.1.1' and hops[1].hostname is None
+        assert (hops[1].rtt1, hops[1].rtt2, hops[1].rtt3) == (1.234, 1.567, 1.890)
+        assert hops[1].status == 'success' and hops[1].avg_rtt == 1.564
+        assert hops[2].status == 'timeout' and hops[4].status == 'timeout' and hops[4].ip == '*'
+        assert hops[3].ip == '10.0.0.1' and (hops[3].rtt1, hops[3].rtt2, hops[3].rtt3) == (5.102, 5.331, None)
+        assert hops[5].status == 'success' and hops[5].avg_rtt == 9.104
+        assert hops[6].ip == '198.51.100.7' and hops[6].hostname == 'gw.example.net'
+    print("✅ 系统traceroute输出解析测试通过")
+
+
+if __name__ == "__main__":
+    print("🧪 测试异步路由追踪引擎\n")
+    test_parse_icmp_packet()
+    test_parallel_probing_and_streaming()
+    test_loopback_trace()
+    test_parse_system_traceroute_output()
+    print("\n🎉 所有测试完成")